@@ -0,0 +1,133 @@
+"""
+Medicion de la latencia de una pagina liviana mientras se descargan fotos.
+
+Con la entrega desde Python, cada descarga de foto ocupa un thread del
+unico worker de gunicorn y las demas peticiones esperan. Con
+ARCHIVOS_MODO=x-accel la transferencia la hace nginx. Este script mide
+la latencia de --pagina sin carga y luego con --hilos-fotos descargas
+simultaneas de fotos, para comparar ambos modos contra el mismo servidor.
+
+Las fotos se toman del directorio local (--dir-fotos, por defecto fotos/),
+que debe tener el mismo contenido que el servidor. Tambien verifica que
+Range (206) y If-None-Match (304) funcionen.
+
+Uso:
+    python benchmark_archivos.py --url http://127.0.0.1:5000 \\
+        --cookie "session=<cookie de un administrador>" --hilos-fotos 16 --sondas 200
+"""
+import os
+import time
+import random
+import argparse
+import threading
+
+import requests
+
+from metricas_prueba import percentil, redondear
+
+EXTENSIONES_FOTO = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def listar_fotos(directorio: str, maximo: int):
+    """Rutas relativas de fotos del directorio local."""
+    fotos = []
+    for carpeta, _, archivos in os.walk(directorio):
+        for archivo in archivos:
+            if archivo.lower().endswith(EXTENSIONES_FOTO):
+                fotos.append(os.path.relpath(os.path.join(carpeta, archivo), directorio).replace(os.sep, '/'))
+    random.shuffle(fotos)
+    return fotos[:maximo]
+
+
+def _sesion(cookie: str) -> requests.Session:
+    sesion = requests.Session()
+    if cookie:
+        nombre, _, valor = cookie.partition('=')
+        sesion.cookies.set(nombre.strip(), valor.strip())
+    return sesion
+
+
+def medir_sondas(url: str, cookie: str, cantidad: int, intervalo_ms: float):
+    """Latencias (ms) de `cantidad` peticiones secuenciales a la pagina."""
+    sesion = _sesion(cookie)
+    latencias = []
+    for _ in range(cantidad):
+        t0 = time.perf_counter()
+        sesion.get(url, timeout=60, allow_redirects=False)
+        latencias.append((time.perf_counter() - t0) * 1000)
+        time.sleep(intervalo_ms / 1000)
+    return latencias
+
+
+def descargar_fotos(base: str, cookie: str, fotos, detener: threading.Event, stats: dict, lock):
+    """Descarga fotos en bucle (sin cache del cliente) hasta que se pida detener."""
+    sesion = _sesion(cookie)
+    while not detener.is_set():
+        foto = random.choice(fotos)
+        respuesta = sesion.get(f'{base}/foto/{foto}', timeout=120, allow_redirects=False)
+        with lock:
+            stats['descargas'] += 1
+            stats['bytes'] += len(respuesta.content)
+            stats['codigos'][respuesta.status_code] = stats['codigos'].get(respuesta.status_code, 0) + 1
+
+
+def verificar_condicionales(base: str, cookie: str, foto: str):
+    """Comprueba Range (206) y revalidacion con ETag (304) sobre una foto."""
+    sesion = _sesion(cookie)
+    completa = sesion.get(f'{base}/foto/{foto}', timeout=60, allow_redirects=False)
+    rango = sesion.get(f'{base}/foto/{foto}', headers={'Range': 'bytes=0-1023'}, timeout=60, allow_redirects=False)
+    etag = completa.headers.get('ETag')
+    revalidada = (sesion.get(f'{base}/foto/{foto}', headers={'If-None-Match': etag}, timeout=60,
+                             allow_redirects=False).status_code if etag else None)
+    print(f"Foto completa: {completa.status_code} ({len(completa.content)} bytes, "
+          f"Cache-Control: {completa.headers.get('Cache-Control')})")
+    print(f"Range 0-1023: {rango.status_code} ({len(rango.content)} bytes)")
+    print(f"If-None-Match: {revalidada if revalidada is not None else 'sin ETag'}")
+
+
+def _resumen(nombre: str, latencias):
+    print(f"  {nombre:<22} p50={redondear(percentil(latencias, 50))}ms "
+          f"p95={redondear(percentil(latencias, 95))}ms p99={redondear(percentil(latencias, 99))}ms "
+          f"max={redondear(max(latencias))}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latencia de paginas mientras se descargan fotos')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='URL base del servidor')
+    parser.add_argument('--cookie', default='', help='Cookie de sesion (nombre=valor)')
+    parser.add_argument('--pagina', default='/health', help='Ruta liviana a medir')
+    parser.add_argument('--dir-fotos', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fotos'))
+    parser.add_argument('--fotos', type=int, default=200, help='Fotos distintas a descargar')
+    parser.add_argument('--hilos-fotos', type=int, default=16, help='Descargas simultaneas')
+    parser.add_argument('--sondas', type=int, default=200, help='Peticiones a la pagina por fase')
+    parser.add_argument('--intervalo-ms', type=float, default=20, help='Pausa entre sondas')
+    args = parser.parse_args()
+
+    base = args.url.rstrip('/')
+    fotos = listar_fotos(args.dir_fotos, args.fotos)
+    if not fotos:
+        raise SystemExit(f'No hay fotos en {args.dir_fotos}')
+
+    verificar_condicionales(base, args.cookie, fotos[0])
+
+    print(f"\nSin carga ({args.sondas} sondas a {args.pagina}):")
+    _resumen('pagina', medir_sondas(base + args.pagina, args.cookie, args.sondas, args.intervalo_ms))
+
+    stats = {'descargas': 0, 'bytes': 0, 'codigos': {}}
+    lock = threading.Lock()
+    detener = threading.Event()
+    hilos = [threading.Thread(target=descargar_fotos, args=(base, args.cookie, fotos, detener, stats, lock),
+                              daemon=True) for _ in range(args.hilos_fotos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    latencias = medir_sondas(base + args.pagina, args.cookie, args.sondas, args.intervalo_ms)
+    detener.set()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    print(f"\nCon {args.hilos_fotos} descargas de fotos simultaneas:")
+    _resumen('pagina', latencias)
+    print(f"  fotos: {stats['descargas']} en {duracion:.1f}s -> {stats['descargas'] / duracion:.1f}/s, "
+          f"{stats['bytes'] / duracion / 1048576:.1f} MB/s, codigos {stats['codigos']}")
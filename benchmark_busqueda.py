@@ -0,0 +1,168 @@
+"""
+Medicion de la busqueda de clientes: LIKE sobre LOWER(...) (recorre la
+tabla completa) contra la columna normalizada con indice trigram
+(migracion 015) y contra la busqueda aproximada (operador <%).
+
+Crea un esquema aparte (bench_busqueda) con clientes sinteticos, con
+nombres con y sin tildes, y mide cada consulta varias veces por termino.
+Reporta p50/p95 en ms y si el plan usa el indice.
+
+Requiere la migracion 015 (extension pg_trgm y funcion normalizar_busqueda).
+
+Uso:
+    DATABASE_URL=postgresql://.../agua_pruebas \\
+    python benchmark_busqueda.py --clientes 50000 --repeticiones 30
+"""
+import time
+import argparse
+
+from metricas_prueba import percentil, redondear
+
+ESQUEMA = 'bench_busqueda'
+
+NOMBRES = ['José', 'María', 'Ramón', 'Inés', 'Andrés', 'Sofía', 'Martín', 'Lucía',
+           'Pedro', 'Juana', 'Raúl', 'Verónica', 'Héctor', 'Mónica', 'Iván', 'Begoña']
+APELLIDOS = ['Muñoz', 'González', 'Pérez', 'Núñez', 'Rodríguez', 'Fernández', 'Díaz',
+             'Martínez', 'Sánchez', 'Ibáñez', 'Gutiérrez', 'Rojas', 'Contreras', 'Araya']
+
+# (termino, descripcion)
+TERMINOS = [
+    ('munoz', 'sin tilde'),
+    ('Núñez', 'con tilde'),
+    ('gonzales', 'mal escrito'),
+    ('12345', 'parte de RUT'),
+    ('veronica iba', 'nombre y apellido')
+]
+
+
+def _sql_arreglo(valores) -> str:
+    return 'ARRAY[' + ', '.join("'" + v.replace("'", "''") + "'" for v in valores) + ']'
+
+
+def crear_datos(cursor, cantidad: int):
+    """Esquema y clientes sinteticos (una sola consulta set-based)."""
+    cursor.execute(f'DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE')
+    cursor.execute(f'CREATE SCHEMA {ESQUEMA}')
+    cursor.execute(f'''
+        CREATE TABLE {ESQUEMA}.clientes (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            nombre_completo TEXT,
+            rut TEXT,
+            telefono TEXT,
+            email TEXT,
+            busqueda TEXT GENERATED ALWAYS AS (
+                public.normalizar_busqueda(
+                    coalesce(nombre, '') || ' ' ||
+                    coalesce(nombre_completo, '') || ' ' ||
+                    coalesce(rut, '') || ' ' ||
+                    regexp_replace(coalesce(rut, ''), '[^0-9kK]', '', 'g') || ' ' ||
+                    coalesce(telefono, '') || ' ' ||
+                    coalesce(email, '')
+                )
+            ) STORED
+        )
+    ''')
+
+    nombres = _sql_arreglo(NOMBRES)
+    apellidos = _sql_arreglo(APELLIDOS)
+    cursor.execute(f'''
+        INSERT INTO {ESQUEMA}.clientes (nombre, nombre_completo, rut, telefono, email)
+        SELECT lower(n || ' ' || a1),
+               n || ' ' || a1 || ' ' || a2,
+               to_char(5000000 + g * 37 %% 20000000, 'FM99G999G999') || '-' || (g %% 10),
+               '+569' || lpad((g * 7919 %% 100000000)::text, 8, '0'),
+               'cliente' || g || '@ejemplo.cl'
+        FROM (
+            SELECT g,
+                   ({nombres})[1 + floor(random() * {len(NOMBRES)})::int] as n,
+                   ({apellidos})[1 + floor(random() * {len(APELLIDOS)})::int] as a1,
+                   ({apellidos})[1 + floor(random() * {len(APELLIDOS)})::int] as a2
+            FROM generate_series(1, %s) g
+        ) datos
+    ''', (cantidad,))
+    cursor.execute(f'''
+        CREATE INDEX idx_bench_clientes_busqueda_trgm
+        ON {ESQUEMA}.clientes USING GIN (busqueda gin_trgm_ops)
+    ''')
+    cursor.execute(f'ANALYZE {ESQUEMA}.clientes')
+
+
+def _consultas(termino: str):
+    """(nombre, sql, params) de cada variante de busqueda."""
+    from src.models import normalizar_busqueda
+
+    normalizado = normalizar_busqueda(termino)
+    patron = f'%{termino}%'
+    patron_normalizado = f'%{normalizado}%'
+    tabla = f'{ESQUEMA}.clientes c'
+    return [
+        ('LOWER LIKE (anterior)', f'''
+            SELECT c.id FROM {tabla}
+            WHERE LOWER(c.nombre) LIKE LOWER(%s) OR LOWER(c.nombre_completo) LIKE LOWER(%s)
+               OR LOWER(c.rut) LIKE LOWER(%s) OR LOWER(c.telefono) LIKE LOWER(%s)
+               OR LOWER(c.email) LIKE LOWER(%s)
+            ORDER BY c.nombre
+        ''', [patron] * 5),
+        ('trigram LIKE', f'''
+            SELECT c.id FROM {tabla}
+            WHERE c.busqueda LIKE %s
+            ORDER BY word_similarity(%s, c.busqueda) DESC, c.nombre
+        ''', [patron_normalizado, normalizado]),
+        ('trigram aproximada', f'''
+            SELECT c.id FROM {tabla}
+            WHERE (c.busqueda LIKE %s OR %s <% c.busqueda)
+            ORDER BY word_similarity(%s, c.busqueda) DESC, c.nombre
+        '''.replace('<%', '<%%'), [patron_normalizado, normalizado, normalizado])
+    ]
+
+
+def _usa_indice(cursor, sql: str, params) -> str:
+    cursor.execute('EXPLAIN ' + sql, params)
+    plan = ' '.join(str(list(fila.values())[0]) for fila in cursor.fetchall())
+    if 'Index Scan' in plan:
+        return 'indice'
+    return 'recorrido completo'
+
+
+def medir(cursor, repeticiones: int, similitud: float):
+    cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)", (str(similitud),))
+
+    for termino, descripcion in TERMINOS:
+        print(f'\n"{termino}" ({descripcion})')
+        for nombre, sql, params in _consultas(termino):
+            tiempos = []
+            filas = 0
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                cursor.execute(sql, params)
+                filas = len(cursor.fetchall())
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            print(f"  {nombre:<22} filas={filas:<6} p50={redondear(percentil(tiempos, 50))}ms "
+                  f"p95={redondear(percentil(tiempos, 95))}ms  [{_usa_indice(cursor, sql, params)}]")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Medicion de la busqueda con indices trigram')
+    parser.add_argument('--clientes', type=int, default=50000, help='Clientes sinteticos')
+    parser.add_argument('--repeticiones', type=int, default=30, help='Ejecuciones por consulta')
+    parser.add_argument('--similitud', type=float, default=0.5, help='BUSQUEDA_SIMILITUD_MINIMA')
+    parser.add_argument('--conservar', action='store_true', help='No eliminar el esquema de prueba')
+    args = parser.parse_args()
+
+    from src.database import get_connection
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        t0 = time.perf_counter()
+        crear_datos(cursor, args.clientes)
+        conn.commit()
+        print(f'{args.clientes} clientes creados en {time.perf_counter() - t0:.1f}s')
+        medir(cursor, args.repeticiones, args.similitud)
+    finally:
+        conn.rollback()
+        if not args.conservar:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE')
+            conn.commit()
+        conn.close()
@@ -0,0 +1,160 @@
+"""
+Build de archivos estaticos con huella de contenido y precompresion.
+
+Copia los CSS, JS, fuentes e imagenes de web/static a web/static/assets
+con el hash del contenido en el nombre (css/custom.css ->
+css/custom.1a2b3c4d.css), reescribe las referencias url(...) de los CSS a
+los nombres con hash y genera variantes .gz y .br (brotli, si el paquete
+esta instalado) de los archivos de texto. Escribe manifest.json, que la
+app usa para que url_for('static', ...) apunte a la version con hash y
+servirla con Cache-Control inmutable de un anio (web/static_assets.py),
+y reporte.txt con los tamanos.
+
+Ejecutar despues de compilar el CSS (build-css.sh) y en cada despliegue:
+    python build_static.py
+
+Sin manifest (desarrollo) la app sirve web/static tal cual.
+"""
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'web', 'static')
+ASSETS_DIR = os.path.join(STATIC_DIR, 'assets')
+
+EXTENSIONES = {'.css', '.js', '.woff2', '.woff', '.ttf', '.eot', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.ico'}
+# Se comprimen solo los formatos de texto (woff2 e imagenes ya vienen comprimidos)
+COMPRIMIBLES = {'.css', '.js', '.svg', '.ttf', '.eot', '.ico'}
+# Fuentes y herramientas que no se sirven
+EXCLUIDOS = {
+    'assets', 'css/src', 'css/build',
+    'fonts/fontawesome/svgs', 'fonts/fontawesome/sprites', 'fonts/fontawesome/metadata',
+    'fonts/fontawesome/less', 'fonts/fontawesome/scss', 'fonts/fontawesome/js'
+}
+# Bajo este tamano la compresion no compensa
+MINIMO_COMPRIMIR = 512
+
+URL_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _archivos_fuente():
+    """Rutas relativas (con /) de los archivos a publicar."""
+    for directorio, subdirs, archivos in os.walk(STATIC_DIR):
+        relativo = os.path.relpath(directorio, STATIC_DIR).replace(os.sep, '/')
+        subdirs[:] = [d for d in subdirs
+                      if (d if relativo == '.' else f'{relativo}/{d}') not in EXCLUIDOS]
+        for archivo in archivos:
+            if os.path.splitext(archivo)[1].lower() in EXTENSIONES:
+                yield archivo if relativo == '.' else f'{relativo}/{archivo}'
+
+
+def _nombre_con_hash(ruta: str, contenido: bytes) -> str:
+    base, extension = os.path.splitext(ruta)
+    return f'{base}.{hashlib.sha256(contenido).hexdigest()[:10]}{extension}'
+
+
+def _reescribir_css(ruta: str, contenido: bytes, manifest: dict) -> bytes:
+    """Cambia url(...) relativas por los nombres con hash."""
+    carpeta = os.path.dirname(ruta)
+
+    def reemplazar(coincidencia):
+        url = coincidencia.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return coincidencia.group(0)
+        limpia, sufijo = re.match(r'([^?#]*)(.*)', url).groups()
+        destino = os.path.normpath(os.path.join(carpeta, limpia)).replace(os.sep, '/')
+        if destino not in manifest:
+            return coincidencia.group(0)
+        nueva = os.path.relpath(manifest[destino], carpeta or '.').replace(os.sep, '/')
+        # El hash ya versiona el archivo: se descarta ?v=... pero se conserva #fragmento
+        fragmento = sufijo[sufijo.index('#'):] if '#' in sufijo else ''
+        return f'url({nueva}{fragmento})'
+
+    return URL_CSS.sub(reemplazar, contenido.decode('utf-8')).encode('utf-8')
+
+
+def _escribir(ruta_destino: str, contenido: bytes) -> dict:
+    """Escribe el archivo y sus variantes comprimidas. Retorna los tamanos."""
+    os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+    with open(ruta_destino, 'wb') as archivo:
+        archivo.write(contenido)
+
+    tamanos = {'original': len(contenido), 'gzip': None, 'brotli': None}
+    if os.path.splitext(ruta_destino)[1].lower() not in COMPRIMIBLES or len(contenido) < MINIMO_COMPRIMIR:
+        return tamanos
+
+    comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+    if len(comprimido) < len(contenido):
+        with open(ruta_destino + '.gz', 'wb') as archivo:
+            archivo.write(comprimido)
+        tamanos['gzip'] = len(comprimido)
+
+    if brotli is not None:
+        comprimido = brotli.compress(contenido, quality=11)
+        if len(comprimido) < len(contenido):
+            with open(ruta_destino + '.br', 'wb') as archivo:
+                archivo.write(comprimido)
+            tamanos['brotli'] = len(comprimido)
+    return tamanos
+
+
+def _kb(valor) -> str:
+    return f'{valor / 1024:.1f}' if valor is not None else '-'
+
+
+def construir() -> dict:
+    """Genera web/static/assets. Retorna el manifest."""
+    if os.path.isdir(ASSETS_DIR):
+        shutil.rmtree(ASSETS_DIR)
+
+    rutas = sorted(_archivos_fuente())
+    # Primero lo que no es CSS, para que los CSS puedan referenciar sus nombres con hash
+    rutas.sort(key=lambda r: r.endswith('.css'))
+
+    manifest = {}
+    reporte = []
+    for ruta in rutas:
+        with open(os.path.join(STATIC_DIR, ruta), 'rb') as archivo:
+            contenido = archivo.read()
+        if ruta.endswith('.css'):
+            contenido = _reescribir_css(ruta, contenido, manifest)
+
+        destino = _nombre_con_hash(ruta, contenido)
+        manifest[ruta] = destino
+        tamanos = _escribir(os.path.join(ASSETS_DIR, destino), contenido)
+        reporte.append((ruta, tamanos))
+
+    with open(os.path.join(ASSETS_DIR, 'manifest.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(manifest, archivo, indent=1, sort_keys=True)
+
+    lineas = [f"{'Archivo':<55} {'KB':>9} {'gzip KB':>9} {'br KB':>9}"]
+    total = {'original': 0, 'gzip': 0, 'brotli': 0}
+    for ruta, tamanos in sorted(reporte, key=lambda r: -r[1]['original']):
+        lineas.append(f"{ruta:<55} {_kb(tamanos['original']):>9} {_kb(tamanos['gzip']):>9} {_kb(tamanos['brotli']):>9}")
+        total['original'] += tamanos['original']
+        # Lo que no se comprime viaja con su tamano original
+        total['gzip'] += tamanos['gzip'] or tamanos['original']
+        total['brotli'] += tamanos['brotli'] or tamanos['gzip'] or tamanos['original']
+    lineas.append(f"{'TOTAL (' + str(len(reporte)) + ' archivos)':<55} {_kb(total['original']):>9} "
+                  f"{_kb(total['gzip']):>9} {_kb(total['brotli']) if brotli else '-':>9}")
+    if brotli is None:
+        lineas.append('Sin variantes .br: instalar el paquete brotli para generarlas.')
+
+    with open(os.path.join(ASSETS_DIR, 'reporte.txt'), 'w', encoding='utf-8') as archivo:
+        archivo.write('\n'.join(lineas) + '\n')
+    print('\n'.join(lineas))
+    return manifest
+
+
+if __name__ == '__main__':
+    construir()
+    print(f'Assets generados en {os.path.relpath(ASSETS_DIR, BASE_DIR)}')
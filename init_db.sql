@@ -33,6 +33,8 @@ CREATE TABLE IF NOT EXISTS lecturas (
     fecha_lectura DATE NOT NULL,
     foto_path TEXT NOT NULL,
     foto_nombre TEXT NOT NULL,
+    -- Sin foto: foto_path vacio o foto_nombre 'sin_foto'
+    tiene_foto BOOLEAN GENERATED ALWAYS AS (foto_path != '' AND foto_nombre != 'sin_foto') STORED,
     anio INTEGER NOT NULL,
     mes INTEGER NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -110,6 +112,12 @@ CREATE TABLE IF NOT EXISTS pagos (
     FOREIGN KEY (procesado_por) REFERENCES usuarios(id)
 );
 
+-- Ultimo correlativo de numero_pago (PAG-YYYYMM-XXXX) por mes
+CREATE TABLE IF NOT EXISTS contadores_pago (
+    periodo CHAR(6) PRIMARY KEY,          -- YYYYMM
+    ultimo INTEGER NOT NULL DEFAULT 0
+);
+
 -- Relacion pagos-boletas (muchos a muchos)
 CREATE TABLE IF NOT EXISTS pago_boletas (
     id SERIAL PRIMARY KEY,
@@ -161,24 +169,55 @@ CREATE TABLE IF NOT EXISTS envios_boletas (
     destinatario VARCHAR(100) NOT NULL,
     estado VARCHAR(20) NOT NULL DEFAULT 'enviado',
     mensaje_error TEXT,
+    mensaje_id VARCHAR(100),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (boleta_id) REFERENCES boletas(id) ON DELETE CASCADE,
     FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE SET NULL
 );
 
+-- Estados de entrega informados por el proveedor (webhook), uno por mensaje
+-- nivel: 1=fallido, 2=entregado, 3=leido (un estado nunca retrocede)
+CREATE TABLE IF NOT EXISTS estados_entrega_envio (
+    mensaje_id VARCHAR(100) PRIMARY KEY,
+    estado VARCHAR(20) NOT NULL CHECK (estado IN ('fallido', 'entregado', 'leido')),
+    nivel SMALLINT NOT NULL,
+    entregado_at TIMESTAMP,
+    leido_at TIMESTAMP,
+    error TEXT,
+    actualizado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Resumen de envios por boleta (1:1), mantenido al registrar cada envio
+-- envios_count/ultimo_envio: envios exitosos; ultimo_canal/ultimo_estado: ultimo intento
+CREATE TABLE IF NOT EXISTS resumen_envios_boleta (
+    boleta_id INTEGER PRIMARY KEY REFERENCES boletas(id) ON DELETE CASCADE,
+    envios_count INTEGER NOT NULL DEFAULT 0,
+    ultimo_envio TIMESTAMP,
+    ultimo_envio_id INTEGER REFERENCES envios_boletas(id) ON DELETE SET NULL,
+    ultimo_canal VARCHAR(20),
+    ultimo_estado VARCHAR(20),
+    ultimo_intento_at TIMESTAMP,
+    nivel_entrega SMALLINT
+);
+
 -- Índices
 CREATE INDEX IF NOT EXISTS idx_envios_boleta ON envios_boletas(boleta_id);
 CREATE INDEX IF NOT EXISTS idx_envios_usuario ON envios_boletas(usuario_id);
 CREATE INDEX IF NOT EXISTS idx_envios_fecha ON envios_boletas(created_at);
+CREATE INDEX IF NOT EXISTS idx_envios_mensaje ON envios_boletas(mensaje_id) WHERE mensaje_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_resumen_envios_enviadas ON resumen_envios_boleta(boleta_id) WHERE envios_count > 0;
+CREATE INDEX IF NOT EXISTS idx_resumen_envios_nivel ON resumen_envios_boleta(nivel_entrega, boleta_id) WHERE nivel_entrega IS NOT NULL;
 CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes(nombre);
 CREATE INDEX IF NOT EXISTS idx_medidores_cliente ON medidores(cliente_id);
 CREATE INDEX IF NOT EXISTS idx_lecturas_medidor ON lecturas(medidor_id);
 CREATE INDEX IF NOT EXISTS idx_lecturas_fecha ON lecturas(fecha_lectura);
 CREATE INDEX IF NOT EXISTS idx_lecturas_anio_mes ON lecturas(anio, mes);
+CREATE INDEX IF NOT EXISTS idx_lecturas_con_foto ON lecturas(anio, mes) WHERE tiene_foto;
+CREATE INDEX IF NOT EXISTS idx_lecturas_sin_foto ON lecturas(anio, mes) WHERE NOT tiene_foto;
 CREATE INDEX IF NOT EXISTS idx_boletas_lectura ON boletas(lectura_id);
 CREATE INDEX IF NOT EXISTS idx_boletas_medidor ON boletas(medidor_id);
 CREATE INDEX IF NOT EXISTS idx_boletas_pagada ON boletas(pagada);
-CREATE INDEX IF NOT EXISTS idx_boletas_periodo ON boletas(periodo_anio, periodo_mes);
+CREATE INDEX IF NOT EXISTS idx_boletas_periodo_id ON boletas(periodo_anio, periodo_mes, id);
 CREATE INDEX IF NOT EXISTS idx_usuarios_username ON usuarios(username);
 CREATE INDEX IF NOT EXISTS idx_pagos_cliente ON pagos(cliente_id);
 CREATE INDEX IF NOT EXISTS idx_pagos_estado ON pagos(estado);
@@ -244,7 +283,8 @@ INSERT INTO configuracion_sistema (clave, valor, descripcion, tipo) VALUES
 ('regla_periodo', 'mes_anterior', 'Regla: mes_lectura (periodo=mes de lectura), mes_anterior (periodo=mes anterior a lectura)', 'string'),
 ('dia_toma_lectura', '5', 'Dia habitual de toma de lecturas (1-28)', 'int'),
 ('crear_lecturas_faltantes', 'true', 'Crear lecturas automaticas para medidores sin lectura', 'boolean'),
-('valor_lectura_faltante', 'ultima', 'Valor para lecturas faltantes: ultima (copia ultima lectura), cero (valor 0)', 'string')
+('valor_lectura_faltante', 'ultima', 'Valor para lecturas faltantes: ultima (copia ultima lectura), cero (valor 0)', 'string'),
+('envio_automatico_whatsapp', 'false', 'Encolar el envio por WhatsApp de las boletas al generarlas', 'boolean')
 ON CONFLICT (clave) DO NOTHING;
 
 -- Insertar datos bancarios iniciales
@@ -280,8 +320,465 @@ CREATE TABLE IF NOT EXISTS log_envio_masivo (
     detalles JSONB,
     duracion_segundos NUMERIC(10,2),
     iniciado_por INTEGER REFERENCES usuarios(id),
+    clasificacion JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE INDEX IF NOT EXISTS idx_log_envio_masivo_fecha ON log_envio_masivo(fecha_ejecucion);
 CREATE INDEX IF NOT EXISTS idx_log_envio_masivo_periodo ON log_envio_masivo(periodo_anio, periodo_mes);
+
+-- Cola persistente de envios (outbox)
+CREATE TABLE IF NOT EXISTS cola_envios (
+    id SERIAL PRIMARY KEY,
+    canal VARCHAR(20) NOT NULL DEFAULT 'whatsapp',
+    boleta_id INTEGER REFERENCES boletas(id) ON DELETE CASCADE,
+    destinatario VARCHAR(100) NOT NULL,
+    mensaje TEXT,
+    usuario_id INTEGER REFERENCES usuarios(id) ON DELETE SET NULL,
+    log_envio_id INTEGER REFERENCES log_envio_masivo(id) ON DELETE SET NULL,
+    clave_idempotencia VARCHAR(150) UNIQUE NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente'
+        CHECK (estado IN ('pendiente', 'procesando', 'enviado', 'fallido')),
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    proximo_intento_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    bloqueado_hasta TIMESTAMP,
+    ultimo_error TEXT,
+    enviado_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cola_envios_activos
+    ON cola_envios(proximo_intento_at)
+    WHERE estado IN ('pendiente', 'procesando');
+CREATE INDEX IF NOT EXISTS idx_cola_envios_log ON cola_envios(log_envio_id);
+CREATE INDEX IF NOT EXISTS idx_cola_envios_boleta ON cola_envios(boleta_id);
+
+-- Resumen por periodo (anio, mes) para estadisticas sin recorrer las tablas.
+-- Los triggers de boletas, lecturas y pagos escriben deltas por fila en
+-- resumen_periodo_delta, consolidar_resumen_periodo() los suma aqui y
+-- reconstruir_resumen_periodo() lo recalcula completo. Los pagos se cuentan
+-- en el mes de su fecha_envio.
+CREATE TABLE IF NOT EXISTS resumen_periodo (
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    boletas_total INTEGER NOT NULL DEFAULT 0,
+    boletas_pagadas INTEGER NOT NULL DEFAULT 0,
+    boletas_en_revision INTEGER NOT NULL DEFAULT 0,
+    boletas_pendientes INTEGER NOT NULL DEFAULT 0,
+    boletas_sin_comprobante INTEGER NOT NULL DEFAULT 0,
+    monto_total NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pagado NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_en_revision NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pendiente NUMERIC(14,2) NOT NULL DEFAULT 0,
+    lecturas_total INTEGER NOT NULL DEFAULT 0,
+    lecturas_con_foto INTEGER NOT NULL DEFAULT 0,
+    lecturas_suma_m3 BIGINT NOT NULL DEFAULT 0,
+    pagos_total INTEGER NOT NULL DEFAULT 0,
+    pagos_aprobados INTEGER NOT NULL DEFAULT 0,
+    pagos_en_revision INTEGER NOT NULL DEFAULT 0,
+    pagos_rechazados INTEGER NOT NULL DEFAULT 0,
+    pagos_monto_total NUMERIC(14,2) NOT NULL DEFAULT 0,
+    actualizado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (anio, mes)
+);
+
+-- Deltas del resumen por periodo: los triggers solo agregan filas aqui (sin
+-- tocar una fila compartida) y consolidar_resumen_periodo() las suma a
+-- resumen_periodo. Los lectores suman ambas tablas.
+CREATE TABLE IF NOT EXISTS resumen_periodo_delta (
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    boletas_total INTEGER NOT NULL DEFAULT 0,
+    boletas_pagadas INTEGER NOT NULL DEFAULT 0,
+    boletas_en_revision INTEGER NOT NULL DEFAULT 0,
+    boletas_pendientes INTEGER NOT NULL DEFAULT 0,
+    boletas_sin_comprobante INTEGER NOT NULL DEFAULT 0,
+    monto_total NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pagado NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_en_revision NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pendiente NUMERIC(14,2) NOT NULL DEFAULT 0,
+    lecturas_total INTEGER NOT NULL DEFAULT 0,
+    lecturas_con_foto INTEGER NOT NULL DEFAULT 0,
+    lecturas_suma_m3 BIGINT NOT NULL DEFAULT 0,
+    pagos_total INTEGER NOT NULL DEFAULT 0,
+    pagos_aprobados INTEGER NOT NULL DEFAULT 0,
+    pagos_en_revision INTEGER NOT NULL DEFAULT 0,
+    pagos_rechazados INTEGER NOT NULL DEFAULT 0,
+    pagos_monto_total NUMERIC(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_resumen_periodo_delta ON resumen_periodo_delta(anio, mes);
+
+-- Agrega el aporte de una fila (signo = 1) o lo descuenta (signo = -1)
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_boleta(b boletas, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo_delta
+        (anio, mes, boletas_total, boletas_pagadas, boletas_en_revision, boletas_pendientes,
+         boletas_sin_comprobante, monto_total, monto_pagado, monto_en_revision, monto_pendiente)
+    VALUES (
+        b.periodo_anio, b.periodo_mes, signo,
+        CASE WHEN b.pagada = 2 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 1 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 0 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 2 AND (b.comprobante_path IS NULL OR b.comprobante_path = '') THEN signo ELSE 0 END,
+        signo * b.total,
+        CASE WHEN b.pagada = 2 THEN signo * b.total ELSE 0 END,
+        CASE WHEN b.pagada = 1 THEN signo * COALESCE(b.saldo_pendiente, b.total) ELSE 0 END,
+        CASE WHEN b.pagada != 2 THEN signo * COALESCE(b.saldo_pendiente, b.total) ELSE 0 END
+    );
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_lectura(l lecturas, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo_delta (anio, mes, lecturas_total, lecturas_con_foto, lecturas_suma_m3)
+    VALUES (
+        l.anio, l.mes, signo,
+        CASE WHEN l.tiene_foto THEN signo ELSE 0 END,
+        signo * l.lectura_m3
+    );
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_pago(p pagos, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo_delta
+        (anio, mes, pagos_total, pagos_aprobados, pagos_en_revision, pagos_rechazados, pagos_monto_total)
+    VALUES (
+        EXTRACT(YEAR FROM p.fecha_envio)::INTEGER, EXTRACT(MONTH FROM p.fecha_envio)::INTEGER, signo,
+        CASE WHEN p.estado = 'aprobado' THEN signo ELSE 0 END,
+        CASE WHEN p.estado = 'en_revision' THEN signo ELSE 0 END,
+        CASE WHEN p.estado = 'rechazado' THEN signo ELSE 0 END,
+        signo * p.monto_total
+    );
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_resumen_periodo() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'boletas' THEN
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_boleta(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_boleta(NEW, 1); END IF;
+    ELSIF TG_TABLE_NAME = 'lecturas' THEN
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_lectura(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_lectura(NEW, 1); END IF;
+    ELSE
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_pago(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_pago(NEW, 1); END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Los UPDATE solo disparan si cambia algo que el resumen cuenta
+DROP TRIGGER IF EXISTS trg_resumen_periodo_boletas ON boletas;
+CREATE TRIGGER trg_resumen_periodo_boletas AFTER INSERT OR DELETE ON boletas
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_boletas_upd ON boletas;
+CREATE TRIGGER trg_resumen_periodo_boletas_upd AFTER UPDATE ON boletas
+    FOR EACH ROW
+    WHEN ((OLD.periodo_anio, OLD.periodo_mes, OLD.pagada, OLD.total, OLD.saldo_pendiente, OLD.comprobante_path)
+          IS DISTINCT FROM
+          (NEW.periodo_anio, NEW.periodo_mes, NEW.pagada, NEW.total, NEW.saldo_pendiente, NEW.comprobante_path))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+DROP TRIGGER IF EXISTS trg_resumen_periodo_lecturas ON lecturas;
+CREATE TRIGGER trg_resumen_periodo_lecturas AFTER INSERT OR DELETE ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_lecturas_upd ON lecturas;
+CREATE TRIGGER trg_resumen_periodo_lecturas_upd AFTER UPDATE ON lecturas
+    FOR EACH ROW
+    WHEN ((OLD.anio, OLD.mes, OLD.lectura_m3, OLD.foto_path, OLD.foto_nombre)
+          IS DISTINCT FROM
+          (NEW.anio, NEW.mes, NEW.lectura_m3, NEW.foto_path, NEW.foto_nombre))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+DROP TRIGGER IF EXISTS trg_resumen_periodo_pagos ON pagos;
+CREATE TRIGGER trg_resumen_periodo_pagos AFTER INSERT OR DELETE ON pagos
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_pagos_upd ON pagos;
+CREATE TRIGGER trg_resumen_periodo_pagos_upd AFTER UPDATE ON pagos
+    FOR EACH ROW
+    WHEN ((OLD.fecha_envio, OLD.estado, OLD.monto_total)
+          IS DISTINCT FROM
+          (NEW.fecha_envio, NEW.estado, NEW.monto_total))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+-- Suma los deltas pendientes a resumen_periodo y los elimina; retorna los
+-- periodos actualizados. Un solo consolidador a la vez (advisory lock) y
+-- filas de periodo en orden (anio, mes)
+CREATE OR REPLACE FUNCTION consolidar_resumen_periodo() RETURNS INTEGER AS $$
+DECLARE
+    actualizados INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('resumen_periodo'));
+
+    WITH movidos AS (
+        DELETE FROM resumen_periodo_delta RETURNING *
+    )
+    INSERT INTO resumen_periodo AS r
+        (anio, mes, boletas_total, boletas_pagadas, boletas_en_revision, boletas_pendientes,
+         boletas_sin_comprobante, monto_total, monto_pagado, monto_en_revision, monto_pendiente,
+         lecturas_total, lecturas_con_foto, lecturas_suma_m3,
+         pagos_total, pagos_aprobados, pagos_en_revision, pagos_rechazados, pagos_monto_total)
+    SELECT anio, mes,
+           SUM(boletas_total), SUM(boletas_pagadas), SUM(boletas_en_revision), SUM(boletas_pendientes),
+           SUM(boletas_sin_comprobante), SUM(monto_total), SUM(monto_pagado), SUM(monto_en_revision),
+           SUM(monto_pendiente), SUM(lecturas_total), SUM(lecturas_con_foto), SUM(lecturas_suma_m3),
+           SUM(pagos_total), SUM(pagos_aprobados), SUM(pagos_en_revision), SUM(pagos_rechazados),
+           SUM(pagos_monto_total)
+    FROM movidos
+    GROUP BY anio, mes
+    ORDER BY anio, mes
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        boletas_total = r.boletas_total + EXCLUDED.boletas_total,
+        boletas_pagadas = r.boletas_pagadas + EXCLUDED.boletas_pagadas,
+        boletas_en_revision = r.boletas_en_revision + EXCLUDED.boletas_en_revision,
+        boletas_pendientes = r.boletas_pendientes + EXCLUDED.boletas_pendientes,
+        boletas_sin_comprobante = r.boletas_sin_comprobante + EXCLUDED.boletas_sin_comprobante,
+        monto_total = r.monto_total + EXCLUDED.monto_total,
+        monto_pagado = r.monto_pagado + EXCLUDED.monto_pagado,
+        monto_en_revision = r.monto_en_revision + EXCLUDED.monto_en_revision,
+        monto_pendiente = r.monto_pendiente + EXCLUDED.monto_pendiente,
+        lecturas_total = r.lecturas_total + EXCLUDED.lecturas_total,
+        lecturas_con_foto = r.lecturas_con_foto + EXCLUDED.lecturas_con_foto,
+        lecturas_suma_m3 = r.lecturas_suma_m3 + EXCLUDED.lecturas_suma_m3,
+        pagos_total = r.pagos_total + EXCLUDED.pagos_total,
+        pagos_aprobados = r.pagos_aprobados + EXCLUDED.pagos_aprobados,
+        pagos_en_revision = r.pagos_en_revision + EXCLUDED.pagos_en_revision,
+        pagos_rechazados = r.pagos_rechazados + EXCLUDED.pagos_rechazados,
+        pagos_monto_total = r.pagos_monto_total + EXCLUDED.pagos_monto_total,
+        actualizado_at = CURRENT_TIMESTAMP;
+    GET DIAGNOSTICS actualizados = ROW_COUNT;
+
+    RETURN actualizados;
+END
+$$ LANGUAGE plpgsql;
+
+-- Recalcula el resumen completo desde las tablas; retorna los periodos
+-- corregidos (insertados, cambiados o eliminados)
+CREATE OR REPLACE FUNCTION reconstruir_resumen_periodo() RETURNS INTEGER AS $$
+DECLARE
+    corregidos INTEGER;
+    eliminados INTEGER;
+BEGIN
+    -- Bloquea escrituras (no lecturas) mientras se recalcula, para no
+    -- mezclar el recalculo con deltas de transacciones concurrentes. Los
+    -- deltas ya escritos se consolidan primero, asi los periodos corregidos
+    -- son solo los que de verdad tenian diferencias
+    LOCK TABLE boletas, lecturas, pagos IN SHARE MODE;
+    PERFORM consolidar_resumen_periodo();
+
+    WITH bo AS (
+        SELECT periodo_anio as anio, periodo_mes as mes,
+               COUNT(*) as boletas_total,
+               COUNT(CASE WHEN pagada = 2 THEN 1 END) as boletas_pagadas,
+               COUNT(CASE WHEN pagada = 1 THEN 1 END) as boletas_en_revision,
+               COUNT(CASE WHEN pagada = 0 THEN 1 END) as boletas_pendientes,
+               COUNT(CASE WHEN pagada = 2 AND (comprobante_path IS NULL OR comprobante_path = '') THEN 1 END) as boletas_sin_comprobante,
+               SUM(total) as monto_total,
+               SUM(CASE WHEN pagada = 2 THEN total ELSE 0 END) as monto_pagado,
+               SUM(CASE WHEN pagada = 1 THEN COALESCE(saldo_pendiente, total) ELSE 0 END) as monto_en_revision,
+               SUM(CASE WHEN pagada != 2 THEN COALESCE(saldo_pendiente, total) ELSE 0 END) as monto_pendiente
+        FROM boletas
+        GROUP BY periodo_anio, periodo_mes
+    ),
+    le AS (
+        SELECT anio, mes, COUNT(*) as lecturas_total,
+               COUNT(CASE WHEN foto_path IS NOT NULL AND foto_path != '' AND foto_nombre != 'sin_foto' THEN 1 END) as lecturas_con_foto,
+               SUM(lectura_m3) as lecturas_suma_m3
+        FROM lecturas
+        GROUP BY anio, mes
+    ),
+    pa AS (
+        SELECT EXTRACT(YEAR FROM fecha_envio)::INTEGER as anio, EXTRACT(MONTH FROM fecha_envio)::INTEGER as mes,
+               COUNT(*) as pagos_total,
+               COUNT(CASE WHEN estado = 'aprobado' THEN 1 END) as pagos_aprobados,
+               COUNT(CASE WHEN estado = 'en_revision' THEN 1 END) as pagos_en_revision,
+               COUNT(CASE WHEN estado = 'rechazado' THEN 1 END) as pagos_rechazados,
+               SUM(monto_total) as pagos_monto_total
+        FROM pagos
+        GROUP BY 1, 2
+    ),
+    periodos AS (
+        SELECT anio, mes FROM bo UNION SELECT anio, mes FROM le UNION SELECT anio, mes FROM pa
+    )
+    INSERT INTO resumen_periodo AS r
+        (anio, mes, boletas_total, boletas_pagadas, boletas_en_revision, boletas_pendientes,
+         boletas_sin_comprobante, monto_total, monto_pagado, monto_en_revision, monto_pendiente,
+         lecturas_total, lecturas_con_foto, lecturas_suma_m3,
+         pagos_total, pagos_aprobados, pagos_en_revision, pagos_rechazados, pagos_monto_total)
+    SELECT pe.anio, pe.mes,
+           COALESCE(bo.boletas_total, 0), COALESCE(bo.boletas_pagadas, 0),
+           COALESCE(bo.boletas_en_revision, 0), COALESCE(bo.boletas_pendientes, 0),
+           COALESCE(bo.boletas_sin_comprobante, 0), COALESCE(bo.monto_total, 0),
+           COALESCE(bo.monto_pagado, 0), COALESCE(bo.monto_en_revision, 0), COALESCE(bo.monto_pendiente, 0),
+           COALESCE(le.lecturas_total, 0), COALESCE(le.lecturas_con_foto, 0), COALESCE(le.lecturas_suma_m3, 0),
+           COALESCE(pa.pagos_total, 0), COALESCE(pa.pagos_aprobados, 0), COALESCE(pa.pagos_en_revision, 0),
+           COALESCE(pa.pagos_rechazados, 0), COALESCE(pa.pagos_monto_total, 0)
+    FROM periodos pe
+    LEFT JOIN bo ON bo.anio = pe.anio AND bo.mes = pe.mes
+    LEFT JOIN le ON le.anio = pe.anio AND le.mes = pe.mes
+    LEFT JOIN pa ON pa.anio = pe.anio AND pa.mes = pe.mes
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        boletas_total = EXCLUDED.boletas_total,
+        boletas_pagadas = EXCLUDED.boletas_pagadas,
+        boletas_en_revision = EXCLUDED.boletas_en_revision,
+        boletas_pendientes = EXCLUDED.boletas_pendientes,
+        boletas_sin_comprobante = EXCLUDED.boletas_sin_comprobante,
+        monto_total = EXCLUDED.monto_total,
+        monto_pagado = EXCLUDED.monto_pagado,
+        monto_en_revision = EXCLUDED.monto_en_revision,
+        monto_pendiente = EXCLUDED.monto_pendiente,
+        lecturas_total = EXCLUDED.lecturas_total,
+        lecturas_con_foto = EXCLUDED.lecturas_con_foto,
+        lecturas_suma_m3 = EXCLUDED.lecturas_suma_m3,
+        pagos_total = EXCLUDED.pagos_total,
+        pagos_aprobados = EXCLUDED.pagos_aprobados,
+        pagos_en_revision = EXCLUDED.pagos_en_revision,
+        pagos_rechazados = EXCLUDED.pagos_rechazados,
+        pagos_monto_total = EXCLUDED.pagos_monto_total,
+        actualizado_at = CURRENT_TIMESTAMP
+    WHERE (r.boletas_total, r.boletas_pagadas, r.boletas_en_revision, r.boletas_pendientes,
+           r.boletas_sin_comprobante, r.monto_total, r.monto_pagado, r.monto_en_revision, r.monto_pendiente,
+           r.lecturas_total, r.lecturas_con_foto, r.lecturas_suma_m3,
+           r.pagos_total, r.pagos_aprobados, r.pagos_en_revision, r.pagos_rechazados, r.pagos_monto_total)
+          IS DISTINCT FROM
+          (EXCLUDED.boletas_total, EXCLUDED.boletas_pagadas, EXCLUDED.boletas_en_revision, EXCLUDED.boletas_pendientes,
+           EXCLUDED.boletas_sin_comprobante, EXCLUDED.monto_total, EXCLUDED.monto_pagado, EXCLUDED.monto_en_revision,
+           EXCLUDED.monto_pendiente, EXCLUDED.lecturas_total, EXCLUDED.lecturas_con_foto, EXCLUDED.lecturas_suma_m3,
+           EXCLUDED.pagos_total, EXCLUDED.pagos_aprobados, EXCLUDED.pagos_en_revision, EXCLUDED.pagos_rechazados,
+           EXCLUDED.pagos_monto_total);
+    GET DIAGNOSTICS corregidos = ROW_COUNT;
+
+    DELETE FROM resumen_periodo r
+    WHERE NOT EXISTS (SELECT 1 FROM boletas WHERE periodo_anio = r.anio AND periodo_mes = r.mes)
+      AND NOT EXISTS (SELECT 1 FROM lecturas WHERE anio = r.anio AND mes = r.mes)
+      AND NOT EXISTS (SELECT 1 FROM pagos
+                      WHERE fecha_envio >= make_date(r.anio, r.mes, 1)
+                        AND fecha_envio < make_date(r.anio, r.mes, 1) + INTERVAL '1 month');
+    GET DIAGNOSTICS eliminados = ROW_COUNT;
+
+    RETURN corregidos + eliminados;
+END
+$$ LANGUAGE plpgsql;
+
+-- Version por tabla: secuencia version_<tabla> incrementada al commit de
+-- cada transaccion que la modifica. La consultan los caches en memoria de
+-- los procesos web y los ETag de la cache HTTP. nextval no retiene
+-- bloqueos hasta el commit, asi no serializa las escrituras.
+CREATE OR REPLACE FUNCTION trg_version_datos() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('versiones.' || TG_TABLE_NAME, true) IS DISTINCT FROM '1' THEN
+        PERFORM nextval(('version_' || TG_TABLE_NAME)::regclass);
+        PERFORM set_config('versiones.' || TG_TABLE_NAME, '1', true);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['clientes', 'medidores', 'lecturas', 'boletas', 'resumen_envios_boleta',
+                             'pagos', 'configuracion_sistema', 'configuracion_boletas'] LOOP
+        EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I', 'version_' || t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_version_' || t, t);
+        EXECUTE format('CREATE CONSTRAINT TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I '
+                       'DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION trg_version_datos()',
+                       'trg_version_' || t, t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_version_' || t || '_truncate', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trg_version_datos()',
+                       'trg_version_' || t || '_truncate', t);
+    END LOOP;
+END
+$$;
+
+-- Busqueda de clientes y medidores: columna normalizada (minusculas, sin
+-- tildes) generada por la base de datos e indice trigram (pg_trgm) para
+-- LIKE '%termino%' y coincidencias aproximadas (<%).
+-- Si se cambia normalizar_busqueda hay que recalcular las columnas
+-- (UPDATE ... SET nombre = nombre) porque son STORED.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION normalizar_busqueda(texto TEXT) RETURNS TEXT AS $$
+    SELECT translate(lower(texto), 'áàäâãéèëêíìïîóòöôõúùüûñç', 'aaaaaeeeeiiiiooooouuuunc')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+ALTER TABLE clientes ADD COLUMN IF NOT EXISTS busqueda TEXT GENERATED ALWAYS AS (
+    normalizar_busqueda(
+        COALESCE(nombre, '') || ' ' || COALESCE(nombre_completo, '') || ' ' ||
+        COALESCE(rut, '') || ' ' || regexp_replace(COALESCE(rut, ''), '[^0-9kK]', '', 'g') || ' ' ||
+        COALESCE(telefono, '') || ' ' || COALESCE(email, '')
+    )
+) STORED;
+
+ALTER TABLE medidores ADD COLUMN IF NOT EXISTS busqueda TEXT GENERATED ALWAYS AS (
+    normalizar_busqueda(COALESCE(numero_medidor, '') || ' ' || COALESCE(direccion, ''))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_clientes_busqueda_trgm ON clientes USING gin (busqueda gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_medidores_busqueda_trgm ON medidores USING gin (busqueda gin_trgm_ops);
+
+-- Completitud de lecturas: un bitmap de meses con lectura por medidor y
+-- anio (bit 0 = enero ... bit 11 = diciembre), mantenido por trigger.
+-- Responde "que medidores no tienen todas las lecturas de la ventana
+-- [desde, hasta]" con operaciones de bits, sin contar lecturas.
+CREATE TABLE IF NOT EXISTS lecturas_medidor_anio (
+    medidor_id INTEGER NOT NULL REFERENCES medidores(id) ON DELETE CASCADE,
+    anio INTEGER NOT NULL,
+    meses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (medidor_id, anio)
+);
+
+CREATE OR REPLACE FUNCTION mascara_meses(desde_mes INTEGER, hasta_mes INTEGER) RETURNS INTEGER AS $$
+    SELECT CASE WHEN desde_mes > hasta_mes THEN 0
+                ELSE ((1 << hasta_mes) - 1) & ~((1 << (desde_mes - 1)) - 1) END
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION trg_lecturas_medidor_anio() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE lecturas_medidor_anio
+        SET meses = meses & ~(1 << (OLD.mes - 1))
+        WHERE medidor_id = OLD.medidor_id AND anio = OLD.anio;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO lecturas_medidor_anio AS lm (medidor_id, anio, meses)
+        VALUES (NEW.medidor_id, NEW.anio, 1 << (NEW.mes - 1))
+        ON CONFLICT (medidor_id, anio) DO UPDATE SET meses = lm.meses | EXCLUDED.meses;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_lecturas_medidor_anio ON lecturas;
+CREATE TRIGGER trg_lecturas_medidor_anio AFTER INSERT OR DELETE ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION trg_lecturas_medidor_anio();
+DROP TRIGGER IF EXISTS trg_lecturas_medidor_anio_upd ON lecturas;
+CREATE TRIGGER trg_lecturas_medidor_anio_upd AFTER UPDATE ON lecturas
+    FOR EACH ROW
+    WHEN ((OLD.medidor_id, OLD.anio, OLD.mes) IS DISTINCT FROM (NEW.medidor_id, NEW.anio, NEW.mes))
+    EXECUTE FUNCTION trg_lecturas_medidor_anio();
+
+-- Medidores a los que les falta al menos una lectura entre
+-- (desde_anio, desde_mes) y (hasta_anio, hasta_mes), ambos incluidos
+CREATE OR REPLACE FUNCTION medidores_incompletos(desde_anio INTEGER, desde_mes INTEGER,
+                                                 hasta_anio INTEGER, hasta_mes INTEGER)
+RETURNS TABLE (medidor_id INTEGER) AS $$
+    SELECT m.id
+    FROM medidores m
+    CROSS JOIN LATERAL (
+        SELECT a.anio,
+               mascara_meses(CASE WHEN a.anio = desde_anio THEN desde_mes ELSE 1 END,
+                             CASE WHEN a.anio = hasta_anio THEN hasta_mes ELSE 12 END) as requeridos
+        FROM generate_series(desde_anio, hasta_anio) AS a(anio)
+    ) v
+    LEFT JOIN lecturas_medidor_anio lm ON lm.medidor_id = m.id AND lm.anio = v.anio
+    GROUP BY m.id
+    HAVING bool_or((COALESCE(lm.meses, 0) & v.requeridos) <> v.requeridos)
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,19 @@
+"""
+Utilidades de medicion compartidas por los servidores simulados
+(stub_mensajes_api.py, stub_smtp.py) y los scripts de prueba y benchmark.
+"""
+from typing import Optional
+
+
+def percentil(valores, p: float) -> Optional[float]:
+    """Percentil p (0-100) por rango mas cercano, o None si no hay valores."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def redondear(valor: Optional[float]) -> Optional[float]:
+    """Redondea a un decimal conservando None."""
+    return round(valor, 1) if valor is not None else None
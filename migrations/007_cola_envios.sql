@@ -0,0 +1,32 @@
+-- Migracion: Cola persistente de envios (outbox) para WhatsApp
+-- Fecha: 2026-10-18
+-- Descripcion: Los envios se encolan y un worker los procesa con
+--              SELECT ... FOR UPDATE SKIP LOCKED, reintentos y backoff.
+
+CREATE TABLE IF NOT EXISTS cola_envios (
+    id SERIAL PRIMARY KEY,
+    canal VARCHAR(20) NOT NULL DEFAULT 'whatsapp',
+    boleta_id INTEGER REFERENCES boletas(id) ON DELETE CASCADE,
+    destinatario VARCHAR(100) NOT NULL,
+    mensaje TEXT,
+    usuario_id INTEGER REFERENCES usuarios(id) ON DELETE SET NULL,
+    log_envio_id INTEGER REFERENCES log_envio_masivo(id) ON DELETE SET NULL,
+    clave_idempotencia VARCHAR(150) UNIQUE NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente'
+        CHECK (estado IN ('pendiente', 'procesando', 'enviado', 'fallido')),
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    proximo_intento_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    bloqueado_hasta TIMESTAMP,
+    ultimo_error TEXT,
+    enviado_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Solo filas activas: es lo que recorre el worker
+CREATE INDEX IF NOT EXISTS idx_cola_envios_activos
+    ON cola_envios(proximo_intento_at)
+    WHERE estado IN ('pendiente', 'procesando');
+CREATE INDEX IF NOT EXISTS idx_cola_envios_log ON cola_envios(log_envio_id);
+CREATE INDEX IF NOT EXISTS idx_cola_envios_boleta ON cola_envios(boleta_id);
@@ -0,0 +1,6 @@
+-- Migracion: Guardar la clasificacion (snapshot) usada por cada envio masivo
+-- Fecha: 2026-10-18
+-- Descripcion: El preview se calcula una sola vez al iniciar el proceso y se
+--              guarda con el log; la cola de envios se arma desde este snapshot.
+
+ALTER TABLE log_envio_masivo ADD COLUMN IF NOT EXISTS clasificacion JSONB;
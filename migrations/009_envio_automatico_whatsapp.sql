@@ -0,0 +1,8 @@
+-- Migracion: Pipeline de envio post-generacion
+-- Fecha: 2026-10-18
+-- Descripcion: Opcion para que la generacion de boletas prepare el PDF y encole
+--              el envio por WhatsApp de cada boleta nueva en la misma pasada.
+
+INSERT INTO configuracion_sistema (clave, valor, descripcion, tipo) VALUES
+('envio_automatico_whatsapp', 'false', 'Encolar el envio por WhatsApp de las boletas al generarlas', 'boolean')
+ON CONFLICT (clave) DO NOTHING;
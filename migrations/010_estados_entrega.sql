@@ -0,0 +1,20 @@
+-- Migracion: Estados de entrega de los envios (webhook del proveedor)
+-- Fecha: 2026-10-18
+-- Descripcion: Guarda el id de mensaje del proveedor en envios_boletas y los
+--              estados de entrega (entregado, leido, fallido) que llegan por
+--              webhook, en una tabla hija con un registro por mensaje.
+
+ALTER TABLE envios_boletas ADD COLUMN IF NOT EXISTS mensaje_id VARCHAR(100);
+CREATE INDEX IF NOT EXISTS idx_envios_mensaje ON envios_boletas(mensaje_id)
+    WHERE mensaje_id IS NOT NULL;
+
+-- nivel: 1=fallido, 2=entregado, 3=leido (un estado nunca retrocede)
+CREATE TABLE IF NOT EXISTS estados_entrega_envio (
+    mensaje_id VARCHAR(100) PRIMARY KEY,
+    estado VARCHAR(20) NOT NULL CHECK (estado IN ('fallido', 'entregado', 'leido')),
+    nivel SMALLINT NOT NULL,
+    entregado_at TIMESTAMP,
+    leido_at TIMESTAMP,
+    error TEXT,
+    actualizado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,8 @@
+-- Migracion: Indice de boletas por periodo con desempate por id
+-- Fecha: 2026-10-18
+-- Descripcion: El listado de boletas pagina por seek sobre (periodo, id);
+--              el indice compuesto permite recorrerlo en orden sin ordenar
+--              todas las filas. Reemplaza al indice solo por periodo.
+
+CREATE INDEX IF NOT EXISTS idx_boletas_periodo_id ON boletas(periodo_anio, periodo_mes, id);
+DROP INDEX IF EXISTS idx_boletas_periodo;
@@ -0,0 +1,58 @@
+-- Migracion: Resumen de envios por boleta
+-- Fecha: 2026-10-18
+-- Descripcion: Tabla 1:1 con el conteo de envios exitosos, el ultimo envio,
+--              el canal y estado del ultimo intento y el mejor estado de
+--              entrega de cada boleta. La mantiene registrar_envio_boleta (y
+--              los estados de entrega) en la misma transaccion; el listado y
+--              el filtro por envio la leen en vez de agregar envios_boletas.
+--              El relleno inicial recalcula todo y puede re-ejecutarse.
+
+CREATE TABLE IF NOT EXISTS resumen_envios_boleta (
+    boleta_id INTEGER PRIMARY KEY REFERENCES boletas(id) ON DELETE CASCADE,
+    envios_count INTEGER NOT NULL DEFAULT 0,
+    ultimo_envio TIMESTAMP,
+    ultimo_envio_id INTEGER REFERENCES envios_boletas(id) ON DELETE SET NULL,
+    ultimo_canal VARCHAR(20),
+    ultimo_estado VARCHAR(20),
+    ultimo_intento_at TIMESTAMP,
+    nivel_entrega SMALLINT
+);
+
+CREATE INDEX IF NOT EXISTS idx_resumen_envios_enviadas ON resumen_envios_boleta(boleta_id) WHERE envios_count > 0;
+CREATE INDEX IF NOT EXISTS idx_resumen_envios_nivel ON resumen_envios_boleta(nivel_entrega, boleta_id) WHERE nivel_entrega IS NOT NULL;
+
+WITH exitosos AS (
+    SELECT e.boleta_id, COUNT(*) as envios_count, MAX(e.created_at) as ultimo_envio,
+           MAX(ee.nivel) as nivel_entrega
+    FROM envios_boletas e
+    LEFT JOIN estados_entrega_envio ee ON ee.mensaje_id = e.mensaje_id
+    WHERE e.estado = 'enviado'
+    GROUP BY e.boleta_id
+),
+ultimo_exitoso AS (
+    SELECT DISTINCT ON (boleta_id) boleta_id, id
+    FROM envios_boletas
+    WHERE estado = 'enviado'
+    ORDER BY boleta_id, created_at DESC, id DESC
+),
+ultimo_intento AS (
+    SELECT DISTINCT ON (boleta_id) boleta_id, canal, estado, created_at
+    FROM envios_boletas
+    ORDER BY boleta_id, created_at DESC, id DESC
+)
+INSERT INTO resumen_envios_boleta
+    (boleta_id, envios_count, ultimo_envio, ultimo_envio_id,
+     ultimo_canal, ultimo_estado, ultimo_intento_at, nivel_entrega)
+SELECT ui.boleta_id, COALESCE(ex.envios_count, 0), ex.ultimo_envio, ue.id,
+       ui.canal, ui.estado, ui.created_at, ex.nivel_entrega
+FROM ultimo_intento ui
+LEFT JOIN exitosos ex ON ex.boleta_id = ui.boleta_id
+LEFT JOIN ultimo_exitoso ue ON ue.boleta_id = ui.boleta_id
+ON CONFLICT (boleta_id) DO UPDATE SET
+    envios_count = EXCLUDED.envios_count,
+    ultimo_envio = EXCLUDED.ultimo_envio,
+    ultimo_envio_id = EXCLUDED.ultimo_envio_id,
+    ultimo_canal = EXCLUDED.ultimo_canal,
+    ultimo_estado = EXCLUDED.ultimo_estado,
+    ultimo_intento_at = EXCLUDED.ultimo_intento_at,
+    nivel_entrega = EXCLUDED.nivel_entrega;
@@ -0,0 +1,262 @@
+-- Migracion: Resumen de estadisticas por periodo
+-- Fecha: 2026-10-18
+-- Descripcion: Tabla resumen_periodo con conteos y montos de boletas,
+--              lecturas y pagos por (anio, mes), mantenida por triggers en
+--              cada escritura y recalculable con reconstruir_resumen_periodo()
+--              (el scheduler la ejecuta periodicamente). Las estadisticas sin
+--              filtros ad-hoc la leen en vez de recorrer las tablas.
+--              Requiere PostgreSQL 11+ (EXECUTE FUNCTION en triggers).
+
+-- Resumen por periodo (anio, mes) para estadisticas sin recorrer las tablas.
+-- Lo mantienen los triggers de boletas, lecturas y pagos (deltas por fila) y
+-- reconstruir_resumen_periodo() lo recalcula completo. Los pagos se cuentan
+-- en el mes de su fecha_envio.
+CREATE TABLE IF NOT EXISTS resumen_periodo (
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    boletas_total INTEGER NOT NULL DEFAULT 0,
+    boletas_pagadas INTEGER NOT NULL DEFAULT 0,
+    boletas_en_revision INTEGER NOT NULL DEFAULT 0,
+    boletas_pendientes INTEGER NOT NULL DEFAULT 0,
+    boletas_sin_comprobante INTEGER NOT NULL DEFAULT 0,
+    monto_total NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pagado NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_en_revision NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_pendiente NUMERIC(14,2) NOT NULL DEFAULT 0,
+    lecturas_total INTEGER NOT NULL DEFAULT 0,
+    lecturas_con_foto INTEGER NOT NULL DEFAULT 0,
+    lecturas_suma_m3 BIGINT NOT NULL DEFAULT 0,
+    pagos_total INTEGER NOT NULL DEFAULT 0,
+    pagos_aprobados INTEGER NOT NULL DEFAULT 0,
+    pagos_en_revision INTEGER NOT NULL DEFAULT 0,
+    pagos_rechazados INTEGER NOT NULL DEFAULT 0,
+    pagos_monto_total NUMERIC(14,2) NOT NULL DEFAULT 0,
+    actualizado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (anio, mes)
+);
+
+-- Suma (signo = 1) o resta (signo = -1) el aporte de una fila al resumen
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_boleta(b boletas, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo AS r
+        (anio, mes, boletas_total, boletas_pagadas, boletas_en_revision, boletas_pendientes,
+         boletas_sin_comprobante, monto_total, monto_pagado, monto_en_revision, monto_pendiente)
+    VALUES (
+        b.periodo_anio, b.periodo_mes, signo,
+        CASE WHEN b.pagada = 2 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 1 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 0 THEN signo ELSE 0 END,
+        CASE WHEN b.pagada = 2 AND (b.comprobante_path IS NULL OR b.comprobante_path = '') THEN signo ELSE 0 END,
+        signo * b.total,
+        CASE WHEN b.pagada = 2 THEN signo * b.total ELSE 0 END,
+        CASE WHEN b.pagada = 1 THEN signo * COALESCE(b.saldo_pendiente, b.total) ELSE 0 END,
+        CASE WHEN b.pagada != 2 THEN signo * COALESCE(b.saldo_pendiente, b.total) ELSE 0 END
+    )
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        boletas_total = r.boletas_total + EXCLUDED.boletas_total,
+        boletas_pagadas = r.boletas_pagadas + EXCLUDED.boletas_pagadas,
+        boletas_en_revision = r.boletas_en_revision + EXCLUDED.boletas_en_revision,
+        boletas_pendientes = r.boletas_pendientes + EXCLUDED.boletas_pendientes,
+        boletas_sin_comprobante = r.boletas_sin_comprobante + EXCLUDED.boletas_sin_comprobante,
+        monto_total = r.monto_total + EXCLUDED.monto_total,
+        monto_pagado = r.monto_pagado + EXCLUDED.monto_pagado,
+        monto_en_revision = r.monto_en_revision + EXCLUDED.monto_en_revision,
+        monto_pendiente = r.monto_pendiente + EXCLUDED.monto_pendiente,
+        actualizado_at = CURRENT_TIMESTAMP;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_lectura(l lecturas, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo AS r (anio, mes, lecturas_total, lecturas_con_foto, lecturas_suma_m3)
+    VALUES (
+        l.anio, l.mes, signo,
+        CASE WHEN l.foto_path IS NOT NULL AND l.foto_path != '' AND l.foto_nombre != 'sin_foto' THEN signo ELSE 0 END,
+        signo * l.lectura_m3
+    )
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        lecturas_total = r.lecturas_total + EXCLUDED.lecturas_total,
+        lecturas_con_foto = r.lecturas_con_foto + EXCLUDED.lecturas_con_foto,
+        lecturas_suma_m3 = r.lecturas_suma_m3 + EXCLUDED.lecturas_suma_m3,
+        actualizado_at = CURRENT_TIMESTAMP;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_pago(p pagos, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo AS r
+        (anio, mes, pagos_total, pagos_aprobados, pagos_en_revision, pagos_rechazados, pagos_monto_total)
+    VALUES (
+        EXTRACT(YEAR FROM p.fecha_envio)::INTEGER, EXTRACT(MONTH FROM p.fecha_envio)::INTEGER, signo,
+        CASE WHEN p.estado = 'aprobado' THEN signo ELSE 0 END,
+        CASE WHEN p.estado = 'en_revision' THEN signo ELSE 0 END,
+        CASE WHEN p.estado = 'rechazado' THEN signo ELSE 0 END,
+        signo * p.monto_total
+    )
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        pagos_total = r.pagos_total + EXCLUDED.pagos_total,
+        pagos_aprobados = r.pagos_aprobados + EXCLUDED.pagos_aprobados,
+        pagos_en_revision = r.pagos_en_revision + EXCLUDED.pagos_en_revision,
+        pagos_rechazados = r.pagos_rechazados + EXCLUDED.pagos_rechazados,
+        pagos_monto_total = r.pagos_monto_total + EXCLUDED.pagos_monto_total,
+        actualizado_at = CURRENT_TIMESTAMP;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_resumen_periodo() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'boletas' THEN
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_boleta(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_boleta(NEW, 1); END IF;
+    ELSIF TG_TABLE_NAME = 'lecturas' THEN
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_lectura(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_lectura(NEW, 1); END IF;
+    ELSE
+        IF TG_OP <> 'INSERT' THEN PERFORM resumen_periodo_sumar_pago(OLD, -1); END IF;
+        IF TG_OP <> 'DELETE' THEN PERFORM resumen_periodo_sumar_pago(NEW, 1); END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Los UPDATE solo disparan si cambia algo que el resumen cuenta
+DROP TRIGGER IF EXISTS trg_resumen_periodo_boletas ON boletas;
+CREATE TRIGGER trg_resumen_periodo_boletas AFTER INSERT OR DELETE ON boletas
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_boletas_upd ON boletas;
+CREATE TRIGGER trg_resumen_periodo_boletas_upd AFTER UPDATE ON boletas
+    FOR EACH ROW
+    WHEN ((OLD.periodo_anio, OLD.periodo_mes, OLD.pagada, OLD.total, OLD.saldo_pendiente, OLD.comprobante_path)
+          IS DISTINCT FROM
+          (NEW.periodo_anio, NEW.periodo_mes, NEW.pagada, NEW.total, NEW.saldo_pendiente, NEW.comprobante_path))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+DROP TRIGGER IF EXISTS trg_resumen_periodo_lecturas ON lecturas;
+CREATE TRIGGER trg_resumen_periodo_lecturas AFTER INSERT OR DELETE ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_lecturas_upd ON lecturas;
+CREATE TRIGGER trg_resumen_periodo_lecturas_upd AFTER UPDATE ON lecturas
+    FOR EACH ROW
+    WHEN ((OLD.anio, OLD.mes, OLD.lectura_m3, OLD.foto_path, OLD.foto_nombre)
+          IS DISTINCT FROM
+          (NEW.anio, NEW.mes, NEW.lectura_m3, NEW.foto_path, NEW.foto_nombre))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+DROP TRIGGER IF EXISTS trg_resumen_periodo_pagos ON pagos;
+CREATE TRIGGER trg_resumen_periodo_pagos AFTER INSERT OR DELETE ON pagos
+    FOR EACH ROW EXECUTE FUNCTION trg_resumen_periodo();
+DROP TRIGGER IF EXISTS trg_resumen_periodo_pagos_upd ON pagos;
+CREATE TRIGGER trg_resumen_periodo_pagos_upd AFTER UPDATE ON pagos
+    FOR EACH ROW
+    WHEN ((OLD.fecha_envio, OLD.estado, OLD.monto_total)
+          IS DISTINCT FROM
+          (NEW.fecha_envio, NEW.estado, NEW.monto_total))
+    EXECUTE FUNCTION trg_resumen_periodo();
+
+-- Recalcula el resumen completo desde las tablas; retorna los periodos
+-- corregidos (insertados, cambiados o eliminados)
+CREATE OR REPLACE FUNCTION reconstruir_resumen_periodo() RETURNS INTEGER AS $$
+DECLARE
+    corregidos INTEGER;
+    eliminados INTEGER;
+BEGIN
+    -- Bloquea escrituras (no lecturas) mientras se recalcula, para no
+    -- mezclar el recalculo con deltas de transacciones concurrentes
+    LOCK TABLE boletas, lecturas, pagos IN SHARE MODE;
+
+    WITH bo AS (
+        SELECT periodo_anio as anio, periodo_mes as mes,
+               COUNT(*) as boletas_total,
+               COUNT(CASE WHEN pagada = 2 THEN 1 END) as boletas_pagadas,
+               COUNT(CASE WHEN pagada = 1 THEN 1 END) as boletas_en_revision,
+               COUNT(CASE WHEN pagada = 0 THEN 1 END) as boletas_pendientes,
+               COUNT(CASE WHEN pagada = 2 AND (comprobante_path IS NULL OR comprobante_path = '') THEN 1 END) as boletas_sin_comprobante,
+               SUM(total) as monto_total,
+               SUM(CASE WHEN pagada = 2 THEN total ELSE 0 END) as monto_pagado,
+               SUM(CASE WHEN pagada = 1 THEN COALESCE(saldo_pendiente, total) ELSE 0 END) as monto_en_revision,
+               SUM(CASE WHEN pagada != 2 THEN COALESCE(saldo_pendiente, total) ELSE 0 END) as monto_pendiente
+        FROM boletas
+        GROUP BY periodo_anio, periodo_mes
+    ),
+    le AS (
+        SELECT anio, mes, COUNT(*) as lecturas_total,
+               COUNT(CASE WHEN foto_path IS NOT NULL AND foto_path != '' AND foto_nombre != 'sin_foto' THEN 1 END) as lecturas_con_foto,
+               SUM(lectura_m3) as lecturas_suma_m3
+        FROM lecturas
+        GROUP BY anio, mes
+    ),
+    pa AS (
+        SELECT EXTRACT(YEAR FROM fecha_envio)::INTEGER as anio, EXTRACT(MONTH FROM fecha_envio)::INTEGER as mes,
+               COUNT(*) as pagos_total,
+               COUNT(CASE WHEN estado = 'aprobado' THEN 1 END) as pagos_aprobados,
+               COUNT(CASE WHEN estado = 'en_revision' THEN 1 END) as pagos_en_revision,
+               COUNT(CASE WHEN estado = 'rechazado' THEN 1 END) as pagos_rechazados,
+               SUM(monto_total) as pagos_monto_total
+        FROM pagos
+        GROUP BY 1, 2
+    ),
+    periodos AS (
+        SELECT anio, mes FROM bo UNION SELECT anio, mes FROM le UNION SELECT anio, mes FROM pa
+    )
+    INSERT INTO resumen_periodo AS r
+        (anio, mes, boletas_total, boletas_pagadas, boletas_en_revision, boletas_pendientes,
+         boletas_sin_comprobante, monto_total, monto_pagado, monto_en_revision, monto_pendiente,
+         lecturas_total, lecturas_con_foto, lecturas_suma_m3,
+         pagos_total, pagos_aprobados, pagos_en_revision, pagos_rechazados, pagos_monto_total)
+    SELECT pe.anio, pe.mes,
+           COALESCE(bo.boletas_total, 0), COALESCE(bo.boletas_pagadas, 0),
+           COALESCE(bo.boletas_en_revision, 0), COALESCE(bo.boletas_pendientes, 0),
+           COALESCE(bo.boletas_sin_comprobante, 0), COALESCE(bo.monto_total, 0),
+           COALESCE(bo.monto_pagado, 0), COALESCE(bo.monto_en_revision, 0), COALESCE(bo.monto_pendiente, 0),
+           COALESCE(le.lecturas_total, 0), COALESCE(le.lecturas_con_foto, 0), COALESCE(le.lecturas_suma_m3, 0),
+           COALESCE(pa.pagos_total, 0), COALESCE(pa.pagos_aprobados, 0), COALESCE(pa.pagos_en_revision, 0),
+           COALESCE(pa.pagos_rechazados, 0), COALESCE(pa.pagos_monto_total, 0)
+    FROM periodos pe
+    LEFT JOIN bo ON bo.anio = pe.anio AND bo.mes = pe.mes
+    LEFT JOIN le ON le.anio = pe.anio AND le.mes = pe.mes
+    LEFT JOIN pa ON pa.anio = pe.anio AND pa.mes = pe.mes
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        boletas_total = EXCLUDED.boletas_total,
+        boletas_pagadas = EXCLUDED.boletas_pagadas,
+        boletas_en_revision = EXCLUDED.boletas_en_revision,
+        boletas_pendientes = EXCLUDED.boletas_pendientes,
+        boletas_sin_comprobante = EXCLUDED.boletas_sin_comprobante,
+        monto_total = EXCLUDED.monto_total,
+        monto_pagado = EXCLUDED.monto_pagado,
+        monto_en_revision = EXCLUDED.monto_en_revision,
+        monto_pendiente = EXCLUDED.monto_pendiente,
+        lecturas_total = EXCLUDED.lecturas_total,
+        lecturas_con_foto = EXCLUDED.lecturas_con_foto,
+        lecturas_suma_m3 = EXCLUDED.lecturas_suma_m3,
+        pagos_total = EXCLUDED.pagos_total,
+        pagos_aprobados = EXCLUDED.pagos_aprobados,
+        pagos_en_revision = EXCLUDED.pagos_en_revision,
+        pagos_rechazados = EXCLUDED.pagos_rechazados,
+        pagos_monto_total = EXCLUDED.pagos_monto_total,
+        actualizado_at = CURRENT_TIMESTAMP
+    WHERE (r.boletas_total, r.boletas_pagadas, r.boletas_en_revision, r.boletas_pendientes,
+           r.boletas_sin_comprobante, r.monto_total, r.monto_pagado, r.monto_en_revision, r.monto_pendiente,
+           r.lecturas_total, r.lecturas_con_foto, r.lecturas_suma_m3,
+           r.pagos_total, r.pagos_aprobados, r.pagos_en_revision, r.pagos_rechazados, r.pagos_monto_total)
+          IS DISTINCT FROM
+          (EXCLUDED.boletas_total, EXCLUDED.boletas_pagadas, EXCLUDED.boletas_en_revision, EXCLUDED.boletas_pendientes,
+           EXCLUDED.boletas_sin_comprobante, EXCLUDED.monto_total, EXCLUDED.monto_pagado, EXCLUDED.monto_en_revision,
+           EXCLUDED.monto_pendiente, EXCLUDED.lecturas_total, EXCLUDED.lecturas_con_foto, EXCLUDED.lecturas_suma_m3,
+           EXCLUDED.pagos_total, EXCLUDED.pagos_aprobados, EXCLUDED.pagos_en_revision, EXCLUDED.pagos_rechazados,
+           EXCLUDED.pagos_monto_total);
+    GET DIAGNOSTICS corregidos = ROW_COUNT;
+
+    DELETE FROM resumen_periodo r
+    WHERE NOT EXISTS (SELECT 1 FROM boletas WHERE periodo_anio = r.anio AND periodo_mes = r.mes)
+      AND NOT EXISTS (SELECT 1 FROM lecturas WHERE anio = r.anio AND mes = r.mes)
+      AND NOT EXISTS (SELECT 1 FROM pagos
+                      WHERE fecha_envio >= make_date(r.anio, r.mes, 1)
+                        AND fecha_envio < make_date(r.anio, r.mes, 1) + INTERVAL '1 month');
+    GET DIAGNOSTICS eliminados = ROW_COUNT;
+
+    RETURN corregidos + eliminados;
+END
+$$ LANGUAGE plpgsql;
+
+-- Relleno inicial
+SELECT reconstruir_resumen_periodo();
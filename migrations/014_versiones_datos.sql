@@ -0,0 +1,32 @@
+-- Migracion: Version de datos para caches en memoria
+-- Fecha: 2026-10-18
+-- Descripcion: Tabla versiones_datos con un contador por tabla que un
+--              trigger por sentencia incrementa en cada cambio de clientes.
+--              El indice de busqueda de clientes de cada proceso web la
+--              consulta para reconstruirse cuando los clientes cambian.
+
+-- Version por tabla, incrementada en cada sentencia que la modifica; los
+-- caches en memoria de los procesos web la consultan para saber si deben
+-- recargarse
+CREATE TABLE IF NOT EXISTS versiones_datos (
+    tabla VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    actualizado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION trg_version_datos() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO versiones_datos AS v (tabla, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (tabla) DO UPDATE SET
+        version = v.version + 1,
+        actualizado_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_version_clientes ON clientes;
+CREATE TRIGGER trg_version_clientes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON clientes
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_version_datos();
+
+INSERT INTO versiones_datos (tabla, version) VALUES ('clientes', 1)
+ON CONFLICT (tabla) DO NOTHING;
@@ -0,0 +1,33 @@
+-- Migracion: Busqueda con indices trigram en clientes y medidores
+-- Fecha: 2026-10-18
+-- Descripcion: Columna generada `busqueda` (texto normalizado sin tildes,
+--              incluye el RUT sin puntos ni guion) e indice GIN pg_trgm en
+--              clientes y medidores, para que la busqueda por subcadena y
+--              la aproximada usen indice en vez de recorrer las tablas.
+--              Agregar las columnas reescribe ambas tablas.
+
+-- Busqueda de clientes y medidores: columna normalizada (minusculas, sin
+-- tildes) generada por la base de datos e indice trigram (pg_trgm) para
+-- LIKE '%termino%' y coincidencias aproximadas (<%).
+-- Si se cambia normalizar_busqueda hay que recalcular las columnas
+-- (UPDATE ... SET nombre = nombre) porque son STORED.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION normalizar_busqueda(texto TEXT) RETURNS TEXT AS $$
+    SELECT translate(lower(texto), 'áàäâãéèëêíìïîóòöôõúùüûñç', 'aaaaaeeeeiiiiooooouuuunc')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+ALTER TABLE clientes ADD COLUMN IF NOT EXISTS busqueda TEXT GENERATED ALWAYS AS (
+    normalizar_busqueda(
+        COALESCE(nombre, '') || ' ' || COALESCE(nombre_completo, '') || ' ' ||
+        COALESCE(rut, '') || ' ' || regexp_replace(COALESCE(rut, ''), '[^0-9kK]', '', 'g') || ' ' ||
+        COALESCE(telefono, '') || ' ' || COALESCE(email, '')
+    )
+) STORED;
+
+ALTER TABLE medidores ADD COLUMN IF NOT EXISTS busqueda TEXT GENERATED ALWAYS AS (
+    normalizar_busqueda(COALESCE(numero_medidor, '') || ' ' || COALESCE(direccion, ''))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_clientes_busqueda_trgm ON clientes USING gin (busqueda gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_medidores_busqueda_trgm ON medidores USING gin (busqueda gin_trgm_ops);
@@ -0,0 +1,29 @@
+-- Migracion: Indicador tiene_foto en lecturas
+-- Fecha: 2026-10-18
+-- Descripcion: Columna generada tiene_foto (foto_path no vacio y
+--              foto_nombre distinto de 'sin_foto') con indices parciales
+--              por periodo, para filtrar lecturas con o sin foto en SQL
+--              (antes se filtraba en Python sobre la pagina ya cortada).
+--              El resumen por periodo pasa a contar con la columna.
+
+ALTER TABLE lecturas ADD COLUMN IF NOT EXISTS tiene_foto BOOLEAN
+    GENERATED ALWAYS AS (foto_path != '' AND foto_nombre != 'sin_foto') STORED;
+
+CREATE INDEX IF NOT EXISTS idx_lecturas_con_foto ON lecturas(anio, mes) WHERE tiene_foto;
+CREATE INDEX IF NOT EXISTS idx_lecturas_sin_foto ON lecturas(anio, mes) WHERE NOT tiene_foto;
+
+CREATE OR REPLACE FUNCTION resumen_periodo_sumar_lectura(l lecturas, signo INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO resumen_periodo AS r (anio, mes, lecturas_total, lecturas_con_foto, lecturas_suma_m3)
+    VALUES (
+        l.anio, l.mes, signo,
+        CASE WHEN l.tiene_foto THEN signo ELSE 0 END,
+        signo * l.lectura_m3
+    )
+    ON CONFLICT (anio, mes) DO UPDATE SET
+        lecturas_total = r.lecturas_total + EXCLUDED.lecturas_total,
+        lecturas_con_foto = r.lecturas_con_foto + EXCLUDED.lecturas_con_foto,
+        lecturas_suma_m3 = r.lecturas_suma_m3 + EXCLUDED.lecturas_suma_m3,
+        actualizado_at = CURRENT_TIMESTAMP;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,74 @@
+-- Migracion: Bitmap de completitud de lecturas por medidor
+-- Fecha: 2026-10-18
+-- Descripcion: Tabla lecturas_medidor_anio con los meses con lectura de
+--              cada medidor y anio como bits de un entero, mantenida por
+--              trigger en lecturas. La funcion medidores_incompletos
+--              responde para cualquier ventana de periodos que medidores
+--              tienen lecturas faltantes, y el filtro "Solo incompletos"
+--              se une contra ella en vez de pasar la lista de ids.
+
+-- Completitud de lecturas: un bitmap de meses con lectura por medidor y
+-- anio (bit 0 = enero ... bit 11 = diciembre), mantenido por trigger.
+-- Responde "que medidores no tienen todas las lecturas de la ventana
+-- [desde, hasta]" con operaciones de bits, sin contar lecturas.
+CREATE TABLE IF NOT EXISTS lecturas_medidor_anio (
+    medidor_id INTEGER NOT NULL REFERENCES medidores(id) ON DELETE CASCADE,
+    anio INTEGER NOT NULL,
+    meses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (medidor_id, anio)
+);
+
+CREATE OR REPLACE FUNCTION mascara_meses(desde_mes INTEGER, hasta_mes INTEGER) RETURNS INTEGER AS $$
+    SELECT CASE WHEN desde_mes > hasta_mes THEN 0
+                ELSE ((1 << hasta_mes) - 1) & ~((1 << (desde_mes - 1)) - 1) END
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION trg_lecturas_medidor_anio() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE lecturas_medidor_anio
+        SET meses = meses & ~(1 << (OLD.mes - 1))
+        WHERE medidor_id = OLD.medidor_id AND anio = OLD.anio;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO lecturas_medidor_anio AS lm (medidor_id, anio, meses)
+        VALUES (NEW.medidor_id, NEW.anio, 1 << (NEW.mes - 1))
+        ON CONFLICT (medidor_id, anio) DO UPDATE SET meses = lm.meses | EXCLUDED.meses;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_lecturas_medidor_anio ON lecturas;
+CREATE TRIGGER trg_lecturas_medidor_anio AFTER INSERT OR DELETE ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION trg_lecturas_medidor_anio();
+DROP TRIGGER IF EXISTS trg_lecturas_medidor_anio_upd ON lecturas;
+CREATE TRIGGER trg_lecturas_medidor_anio_upd AFTER UPDATE ON lecturas
+    FOR EACH ROW
+    WHEN ((OLD.medidor_id, OLD.anio, OLD.mes) IS DISTINCT FROM (NEW.medidor_id, NEW.anio, NEW.mes))
+    EXECUTE FUNCTION trg_lecturas_medidor_anio();
+
+-- Medidores a los que les falta al menos una lectura entre
+-- (desde_anio, desde_mes) y (hasta_anio, hasta_mes), ambos incluidos
+CREATE OR REPLACE FUNCTION medidores_incompletos(desde_anio INTEGER, desde_mes INTEGER,
+                                                 hasta_anio INTEGER, hasta_mes INTEGER)
+RETURNS TABLE (medidor_id INTEGER) AS $$
+    SELECT m.id
+    FROM medidores m
+    CROSS JOIN LATERAL (
+        SELECT a.anio,
+               mascara_meses(CASE WHEN a.anio = desde_anio THEN desde_mes ELSE 1 END,
+                             CASE WHEN a.anio = hasta_anio THEN hasta_mes ELSE 12 END) as requeridos
+        FROM generate_series(desde_anio, hasta_anio) AS a(anio)
+    ) v
+    LEFT JOIN lecturas_medidor_anio lm ON lm.medidor_id = m.id AND lm.anio = v.anio
+    GROUP BY m.id
+    HAVING bool_or((COALESCE(lm.meses, 0) & v.requeridos) <> v.requeridos)
+$$ LANGUAGE sql STABLE;
+
+-- Carga inicial desde las lecturas existentes
+INSERT INTO lecturas_medidor_anio (medidor_id, anio, meses)
+SELECT medidor_id, anio, bit_or(1 << (mes - 1))
+FROM lecturas
+GROUP BY medidor_id, anio
+ON CONFLICT (medidor_id, anio) DO UPDATE SET meses = EXCLUDED.meses;
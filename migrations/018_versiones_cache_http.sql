@@ -0,0 +1,22 @@
+-- Migracion: Versiones de datos para cache HTTP condicional
+-- Fecha: 2026-10-18
+-- Descripcion: Extiende versiones_datos (migracion 014) a las tablas que
+--              alimentan los listados, las APIs JSON y los PDF. La web
+--              arma ETag/Last-Modified con estas versiones y responde 304
+--              sin renderizar ni consultar los datos.
+
+-- Version de las tablas que alimentan listados, APIs JSON y PDF, para
+-- responder 304 Not Modified (ETag) sin consultar los datos
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['medidores', 'lecturas', 'boletas', 'resumen_envios_boleta',
+                             'pagos', 'configuracion_sistema', 'configuracion_boletas'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_version_' || t, t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trg_version_datos()', 'trg_version_' || t, t);
+        INSERT INTO versiones_datos (tabla, version) VALUES (t, 1) ON CONFLICT (tabla) DO NOTHING;
+    END LOOP;
+END
+$$;
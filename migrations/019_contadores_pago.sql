@@ -0,0 +1,22 @@
+-- Migracion: Contador transaccional de numeros de pago
+-- Fecha: 2026-10-18
+-- Descripcion: generar_numero_pago buscaba el ultimo PAG-YYYYMM-XXXX con
+--              LIKE en otra conexion, fuera de la transaccion del INSERT, y
+--              dos pagos simultaneos obtenian el mismo numero. El contador
+--              por mes se incrementa con un UPSERT dentro de la transaccion
+--              del pago: la fila queda bloqueada hasta el commit y un
+--              rollback devuelve el numero (sin saltos en la correlacion).
+
+CREATE TABLE IF NOT EXISTS contadores_pago (
+    periodo CHAR(6) PRIMARY KEY,          -- YYYYMM
+    ultimo INTEGER NOT NULL DEFAULT 0
+);
+
+-- Carga inicial: ultimo correlativo usado en cada mes
+INSERT INTO contadores_pago (periodo, ultimo)
+SELECT substring(numero_pago from 5 for 6),
+       MAX(split_part(numero_pago, '-', 3)::INTEGER)
+FROM pagos
+WHERE numero_pago ~ '^PAG-[0-9]{6}-[0-9]+$'
+GROUP BY 1
+ON CONFLICT (periodo) DO UPDATE SET ultimo = GREATEST(contadores_pago.ultimo, EXCLUDED.ultimo);
@@ -0,0 +1,57 @@
+-- Migracion: Versiones de datos con secuencias
+-- Fecha: 2026-10-18
+-- Descripcion: Las migraciones 014 y 018 incrementaban una fila de
+--              versiones_datos por tabla en cada sentencia. Esa fila quedaba
+--              bloqueada hasta el commit: todas las escrituras de la tabla
+--              se encolaban en ella y dos transacciones que tocaban las
+--              tablas en distinto orden (ej: aprobar_pago y
+--              registrar_pago_directo) se interbloqueaban.
+--              Ahora cada tabla tiene una secuencia version_<tabla>. nextval
+--              no se deshace con rollback ni retiene bloqueos, asi que no
+--              serializa escrituras. Se incrementa con un constraint trigger
+--              diferido, al momento del commit, para que un lector no vea la
+--              version nueva mucho antes que los datos.
+
+-- Incrementa la version de la tabla una vez por transaccion (la marca
+-- local de la transaccion evita un nextval por cada fila)
+CREATE OR REPLACE FUNCTION trg_version_datos() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('versiones.' || TG_TABLE_NAME, true) IS DISTINCT FROM '1' THEN
+        PERFORM nextval(('version_' || TG_TABLE_NAME)::regclass);
+        PERFORM set_config('versiones.' || TG_TABLE_NAME, '1', true);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+    anterior BIGINT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['clientes', 'medidores', 'lecturas', 'boletas', 'resumen_envios_boleta',
+                             'pagos', 'configuracion_sistema', 'configuracion_boletas'] LOOP
+        EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I', 'version_' || t);
+
+        -- Continuar desde la version anterior: un ETag viejo no debe
+        -- coincidir con una version nueva
+        IF to_regclass('versiones_datos') IS NOT NULL THEN
+            EXECUTE 'SELECT version FROM versiones_datos WHERE tabla = $1' INTO anterior USING t;
+            IF anterior IS NOT NULL THEN
+                PERFORM setval(('version_' || t)::regclass, anterior + 1);
+            END IF;
+        END IF;
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_version_' || t, t);
+        EXECUTE format('CREATE CONSTRAINT TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I '
+                       'DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION trg_version_datos()',
+                       'trg_version_' || t, t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_version_' || t || '_truncate', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trg_version_datos()',
+                       'trg_version_' || t || '_truncate', t);
+    END LOOP;
+END
+$$;
+
+DROP TABLE IF EXISTS versiones_datos;
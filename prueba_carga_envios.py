@@ -0,0 +1,292 @@
+"""
+Prueba de carga del envio masivo contra el stub local de la API de mensajes.
+
+Crea boletas sinteticas en un periodo dedicado, inicia un envio masivo con
+iniciar_envio_masivo_async (mismo camino que la UI) y procesa la cola con
+procesar_lote del worker, como lo haria el worker embebido o dedicado.
+Al final reporta:
+
+    - mensajes por segundo
+    - latencia de cola (encolado -> enviado) p50/p95/p99 y latencia por lote
+    - latencia y tamaño de payload vistos por el stub
+    - memoria (pico de tracemalloc y RSS maximo)
+    - escrituras en la base de datos por mensaje (pg_stat)
+
+IMPORTANTE: usar una base de datos de prueba. Los datos sinteticos se
+eliminan al terminar (salvo --conservar) y la prueba se niega a correr si
+la cola tiene envios activos ajenos.
+
+Uso:
+    DATABASE_URL=postgresql://.../agua_pruebas \\
+    python prueba_carga_envios.py --boletas 2000 --tasa 50 --en-vuelo 8 \\
+        --latencia-ms 80 --tasa-error 0.01 --rafaga-cada 500 --rafaga-largo 20
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import resource
+import tracemalloc
+
+from metricas_prueba import percentil
+from stub_mensajes_api import agregar_argumentos, stub_desde_argumentos, iniciar_stub
+
+
+def _configurar_entorno(args, url_stub: str):
+    """Variables que los servicios leen al importarse."""
+    os.environ['MENSAJES_API_URL'] = url_stub
+    os.environ['MENSAJES_API_KEY'] = 'stub'
+    os.environ['MENSAJES_TASA_POR_SEGUNDO'] = str(args.tasa)
+    os.environ['MENSAJES_RAFAGA'] = str(args.rafaga)
+    os.environ['MENSAJES_MAX_EN_VUELO'] = str(args.en_vuelo)
+    os.environ['COLA_ENVIOS_WORKER_EMBEBIDO'] = '0'
+    os.environ['COLA_ENVIOS_BACKOFF_BASE'] = str(args.backoff)
+    if args.con_enlace:
+        os.environ['APP_URL_PUBLICA'] = 'http://127.0.0.1:5000'
+
+
+# ============================================================
+# DATOS SINTETICOS
+# ============================================================
+
+def crear_datos_sinteticos(etiqueta: str, cantidad: int, anio: int, mes: int):
+    """Crea clientes, medidores, lecturas y boletas con consultas set-based."""
+    from src.database import get_connection
+
+    prefijo = f'CARGA {etiqueta} '
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO clientes (nombre, telefono, recibe_boleta_whatsapp)
+        SELECT %s || g, '9' || LPAD(g::text, 8, '0'), TRUE
+        FROM generate_series(1, %s) g
+    ''', (prefijo, cantidad))
+    cursor.execute('''
+        INSERT INTO medidores (cliente_id, numero_medidor, direccion)
+        SELECT id, 'CARGA-' || id, 'Sector carga'
+        FROM clientes WHERE nombre LIKE %s
+    ''', (prefijo + '%',))
+    cursor.execute('''
+        INSERT INTO lecturas (medidor_id, lectura_m3, fecha_lectura, foto_path, foto_nombre, anio, mes)
+        SELECT m.id, 100, CURRENT_DATE, '', 'prueba_carga', %s, %s
+        FROM medidores m JOIN clientes c ON m.cliente_id = c.id
+        WHERE c.nombre LIKE %s
+    ''', (anio, mes, prefijo + '%'))
+    cursor.execute('''
+        INSERT INTO boletas (
+            numero_boleta, lectura_id, cliente_nombre, medidor_id,
+            periodo_anio, periodo_mes, lectura_actual, lectura_anterior,
+            consumo_m3, cargo_fijo, precio_m3, subtotal_consumo, total,
+            fecha_emision, pagada, saldo_pendiente, monto_pagado
+        )
+        SELECT 'CARGA-' || %s || '-' || l.id, l.id, c.nombre, m.id,
+               %s, %s, 100, 90, 10, 2000, 500, 5000, 7000,
+               CURRENT_DATE, 0, 7000, 0
+        FROM lecturas l
+        JOIN medidores m ON l.medidor_id = m.id
+        JOIN clientes c ON m.cliente_id = c.id
+        WHERE c.nombre LIKE %s AND l.anio = %s AND l.mes = %s
+    ''', (etiqueta, anio, mes, prefijo + '%', anio, mes))
+
+    conn.commit()
+    conn.close()
+
+
+def eliminar_datos_sinteticos(etiqueta: str, log_id: int = None):
+    from src.database import get_connection
+
+    prefijo = f'CARGA {etiqueta} %'
+    conn = get_connection()
+    cursor = conn.cursor()
+    if log_id:
+        cursor.execute('DELETE FROM cola_envios WHERE log_envio_id = %s', (log_id,))
+        cursor.execute('DELETE FROM log_envio_masivo WHERE id = %s', (log_id,))
+    cursor.execute('''
+        DELETE FROM boletas WHERE medidor_id IN (
+            SELECT m.id FROM medidores m JOIN clientes c ON m.cliente_id = c.id
+            WHERE c.nombre LIKE %s)
+    ''', (prefijo,))
+    cursor.execute('''
+        DELETE FROM lecturas WHERE medidor_id IN (
+            SELECT m.id FROM medidores m JOIN clientes c ON m.cliente_id = c.id
+            WHERE c.nombre LIKE %s)
+    ''', (prefijo,))
+    cursor.execute('''
+        DELETE FROM medidores WHERE cliente_id IN (SELECT id FROM clientes WHERE nombre LIKE %s)
+    ''', (prefijo,))
+    cursor.execute('DELETE FROM clientes WHERE nombre LIKE %s', (prefijo,))
+    conn.commit()
+    conn.close()
+
+
+# ============================================================
+# MEDICIONES
+# ============================================================
+
+def contar_escrituras_db() -> dict:
+    """
+    Commits y filas escritas (insert/update/delete) acumuladas en la base.
+    Las estadisticas de PostgreSQL se publican con retardo: esperar antes
+    de leerlas.
+    """
+    from src.database import get_connection
+
+    time.sleep(1.5)
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT pg_stat_clear_snapshot()')
+    cursor.execute('''
+        SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()
+    ''')
+    commits = cursor.fetchone()['xact_commit']
+    cursor.execute('''
+        SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) AS filas
+        FROM pg_stat_user_tables
+    ''')
+    filas = cursor.fetchone()['filas']
+    conn.close()
+    return {'commits': int(commits), 'filas': int(filas)}
+
+
+def envios_activos_ajenos(log_id: int = None) -> int:
+    from src.database import get_connection
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) AS total FROM cola_envios
+        WHERE estado IN ('pendiente', 'procesando')
+          AND log_envio_id IS DISTINCT FROM %s
+    ''', (log_id,))
+    total = cursor.fetchone()['total']
+    conn.close()
+    return total
+
+
+def latencias_cola(log_id: int) -> list:
+    """Segundos entre encolado y envio de cada mensaje del proceso."""
+    from src.database import get_connection
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT EXTRACT(EPOCH FROM enviado_at - created_at) AS segundos
+        FROM cola_envios
+        WHERE log_envio_id = %s AND estado = 'enviado'
+    ''', (log_id,))
+    valores = [float(row['segundos']) for row in cursor.fetchall()]
+    conn.close()
+    return valores
+
+
+def _formato_percentiles(valores, unidad: str = 's', escala: float = 1.0) -> str:
+    if not valores:
+        return '-'
+    return ' '.join(f"p{p}={percentil(valores, p) * escala:.1f}{unidad}" for p in (50, 95, 99))
+
+
+# ============================================================
+# EJECUCION
+# ============================================================
+
+def ejecutar_prueba(args) -> int:
+    stub = stub_desde_argumentos(args, api_key='stub')
+    servidor = iniciar_stub(stub)
+    _configurar_entorno(args, f"http://127.0.0.1:{servidor.server_address[1]}/api")
+
+    # Importar despues de configurar el entorno
+    from web.app import app
+    from src.models_cola_envios import contar_envios_por_estado
+    from src.services.cola_envios_service import procesar_lote
+    from src.services.envio_masivo_service import iniciar_envio_masivo_async, obtener_log_envio
+
+    if envios_activos_ajenos():
+        print("ERROR: la cola tiene envios activos que no son de la prueba. Usar una base de prueba.")
+        return 1
+
+    etiqueta = uuid.uuid4().hex[:8]
+    print(f"Creando {args.boletas} boletas sinteticas (etiqueta {etiqueta}, periodo {args.mes}/{args.anio})...")
+    crear_datos_sinteticos(etiqueta, args.boletas, args.anio, args.mes)
+
+    log_id = None
+    try:
+        escrituras_inicio = contar_escrituras_db()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+
+        log_id = iniciar_envio_masivo_async(None, args.anio, args.mes)
+        total = obtener_log_envio(log_id)['total_enviables']
+        print(f"Envio masivo {log_id}: {total} boletas en cola")
+
+        latencias_lote = []
+        while True:
+            inicio_lote = time.perf_counter()
+            procesados = procesar_lote(app)
+            if procesados:
+                latencias_lote.append((time.perf_counter() - inicio_lote) / procesados)
+                continue
+
+            conteo = contar_envios_por_estado(log_id)
+            if not conteo['pendiente'] and not conteo['procesando']:
+                break
+            # Reintentos programados (backoff o Retry-After)
+            time.sleep(0.2)
+
+        duracion = time.perf_counter() - inicio
+        _, memoria_pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        escrituras_fin = contar_escrituras_db()
+
+        conteo = contar_envios_por_estado(log_id)
+        log = obtener_log_envio(log_id)
+        resumen_stub = stub.resumen()
+        cola = latencias_cola(log_id)
+        mensajes = conteo['enviado'] + conteo['fallido']
+        commits = escrituras_fin['commits'] - escrituras_inicio['commits']
+        filas = escrituras_fin['filas'] - escrituras_inicio['filas']
+
+        print()
+        print("=== Resultado ===")
+        print(f"Mensajes:            {conteo['enviado']} enviados, {conteo['fallido']} fallidos "
+              f"(log: {log['estado']})")
+        print(f"Duracion:            {duracion:.1f}s")
+        print(f"Throughput:          {conteo['enviado'] / duracion:.2f} msg/s")
+        print(f"Latencia de cola:    {_formato_percentiles(cola)}")
+        print(f"Tiempo por mensaje:  {_formato_percentiles(latencias_lote, 'ms', 1000)} (lote / reclamados)")
+        print(f"Stub:                {resumen_stub['solicitudes']} solicitudes, "
+              f"{resumen_stub['limitadas_429']} 429, {resumen_stub['errores_500']} 500, "
+              f"latencia {resumen_stub['latencia_ms']}")
+        print(f"Payload:             {resumen_stub['bytes_recibidos'] / 1024:.0f} KB totales, "
+              f"{resumen_stub['payload_bytes']} bytes, por tipo {resumen_stub['por_tipo']}")
+        print(f"Memoria:             pico Python {memoria_pico / 1024 / 1024:.1f} MB, "
+              f"RSS max {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+        if mensajes:
+            print(f"Escrituras DB:       {commits} commits ({commits / mensajes:.2f}/msg), "
+                  f"{filas} filas ({filas / mensajes:.2f}/msg)")
+        return 0
+
+    finally:
+        if args.conservar:
+            print(f"Datos conservados (etiqueta {etiqueta}, log {log_id})")
+        else:
+            eliminar_datos_sinteticos(etiqueta, log_id)
+        servidor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga del envio masivo')
+    parser.add_argument('--boletas', type=int, default=1000, help='Cantidad de boletas sinteticas')
+    parser.add_argument('--anio', type=int, default=1999, help='Periodo sintetico (anio)')
+    parser.add_argument('--mes', type=int, default=1, help='Periodo sintetico (mes)')
+    parser.add_argument('--tasa', type=float, default=50, help='MENSAJES_TASA_POR_SEGUNDO')
+    parser.add_argument('--rafaga', type=int, default=10, help='MENSAJES_RAFAGA')
+    parser.add_argument('--en-vuelo', type=int, default=8, help='MENSAJES_MAX_EN_VUELO')
+    parser.add_argument('--backoff', type=float, default=1, help='COLA_ENVIOS_BACKOFF_BASE')
+    parser.add_argument('--con-enlace', action='store_true',
+                        help='Enviar PDF como enlace firmado (APP_URL_PUBLICA) en vez de base64')
+    parser.add_argument('--conservar', action='store_true', help='No eliminar los datos sinteticos')
+    agregar_argumentos(parser)
+
+    sys.exit(ejecutar_prueba(parser.parse_args()))
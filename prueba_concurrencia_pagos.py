@@ -0,0 +1,346 @@
+"""
+Prueba de concurrencia de pagos y saldos a favor.
+
+Crea unos pocos clientes sinteticos con varias boletas cada uno y un saldo
+inicial, y lanza muchos threads que, sobre esos mismos clientes, llaman a
+la vez a registrar_pago (con y sin usar_saldo), aprobar_pago y
+rechazar_pago sobre los pagos en revision, usar_saldo_en_boletas,
+registrar_pago_directo (con excedente) y ajustar_saldo_cliente. Pocos
+clientes y muchos threads fuerzan la contencion sobre las mismas filas.
+
+Al final verifica que el libro de saldos quede consistente:
+
+    - ningun error de numero_pago duplicado ni interbloqueo
+    - contador del mes >= ultimo numero_pago emitido
+    - saldo_disponible = suma de los movimientos del cliente
+    - cada movimiento encadena con el anterior (saldo_anterior = saldo_nuevo
+      previo) y saldo_nuevo = saldo_anterior + monto, nunca negativo
+    - en cada boleta: saldo_pendiente >= 0, monto_pagado + saldo_pendiente
+      = total y monto_pagado = suma aplicada por pagos aprobados
+
+IMPORTANTE: usar una base de datos de prueba. Los datos sinteticos se
+eliminan al terminar (salvo --conservar); los numeros de pago consumidos
+por la prueba no se devuelven al contador del mes.
+
+Uso:
+    DATABASE_URL=postgresql://.../agua_pruebas \\
+    python prueba_concurrencia_pagos.py --clientes 3 --boletas 12 --hilos 16 --operaciones 100
+"""
+import sys
+import time
+import uuid
+import random
+import argparse
+import threading
+from decimal import Decimal
+from collections import Counter
+
+TOTAL_BOLETA = 7000
+
+
+# ============================================================
+# DATOS SINTETICOS
+# ============================================================
+
+def crear_datos_sinteticos(etiqueta: str, clientes: int, boletas: int, anio: int):
+    """Clientes con un medidor y `boletas` boletas mensuales pendientes cada uno."""
+    from src.database import get_connection
+
+    prefijo = f'CONCURRENCIA {etiqueta} '
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO clientes (nombre)
+        SELECT %s || g FROM generate_series(1, %s) g
+    ''', (prefijo, clientes))
+    cursor.execute('''
+        INSERT INTO medidores (cliente_id, numero_medidor, direccion)
+        SELECT id, 'CONC-' || id, 'Sector prueba'
+        FROM clientes WHERE nombre LIKE %s
+    ''', (prefijo + '%',))
+    # Periodos consecutivos desde enero de `anio`
+    cursor.execute('''
+        INSERT INTO lecturas (medidor_id, lectura_m3, fecha_lectura, foto_path, foto_nombre, anio, mes)
+        SELECT m.id, 100 + g, CURRENT_DATE, '', 'prueba_concurrencia',
+               %s + (g - 1) / 12, 1 + (g - 1) %% 12
+        FROM medidores m
+        JOIN clientes c ON m.cliente_id = c.id
+        CROSS JOIN generate_series(1, %s) g
+        WHERE c.nombre LIKE %s
+    ''', (anio, boletas, prefijo + '%'))
+    cursor.execute('''
+        INSERT INTO boletas (
+            numero_boleta, lectura_id, cliente_nombre, medidor_id,
+            periodo_anio, periodo_mes, lectura_actual, lectura_anterior,
+            consumo_m3, cargo_fijo, precio_m3, subtotal_consumo, total,
+            fecha_emision, pagada, saldo_pendiente, monto_pagado
+        )
+        SELECT 'CONC-' || %s || '-' || l.id, l.id, c.nombre, m.id,
+               l.anio, l.mes, 100, 90, 10, 2000, 500, 5000, %s,
+               CURRENT_DATE, 0, %s, 0
+        FROM lecturas l
+        JOIN medidores m ON l.medidor_id = m.id
+        JOIN clientes c ON m.cliente_id = c.id
+        WHERE c.nombre LIKE %s
+    ''', (etiqueta, TOTAL_BOLETA, TOTAL_BOLETA, prefijo + '%'))
+
+    cursor.execute('''
+        SELECT c.id AS cliente_id, ARRAY_AGG(b.id ORDER BY b.periodo_anio, b.periodo_mes) AS boletas
+        FROM clientes c
+        JOIN medidores m ON m.cliente_id = c.id
+        JOIN boletas b ON b.medidor_id = m.id
+        WHERE c.nombre LIKE %s
+        GROUP BY c.id
+    ''', (prefijo + '%',))
+    datos = {row['cliente_id']: list(row['boletas']) for row in cursor.fetchall()}
+
+    conn.commit()
+    conn.close()
+    return datos
+
+
+def eliminar_datos_sinteticos(etiqueta: str):
+    from src.database import get_connection
+
+    prefijo = f'CONCURRENCIA {etiqueta} %'
+    conn = get_connection()
+    cursor = conn.cursor()
+    filtro = 'SELECT id FROM clientes WHERE nombre LIKE %s'
+    cursor.execute(f'DELETE FROM movimientos_saldo WHERE cliente_id IN ({filtro})', (prefijo,))
+    cursor.execute(f'DELETE FROM saldos_cliente WHERE cliente_id IN ({filtro})', (prefijo,))
+    cursor.execute(f'DELETE FROM pagos WHERE cliente_id IN ({filtro})', (prefijo,))
+    cursor.execute(f'''
+        DELETE FROM boletas WHERE medidor_id IN (
+            SELECT id FROM medidores WHERE cliente_id IN ({filtro}))
+    ''', (prefijo,))
+    cursor.execute(f'''
+        DELETE FROM lecturas WHERE medidor_id IN (
+            SELECT id FROM medidores WHERE cliente_id IN ({filtro}))
+    ''', (prefijo,))
+    cursor.execute(f'DELETE FROM medidores WHERE cliente_id IN ({filtro})', (prefijo,))
+    cursor.execute('DELETE FROM clientes WHERE nombre LIKE %s', (prefijo,))
+    conn.commit()
+    conn.close()
+
+
+# ============================================================
+# CARGA CONCURRENTE
+# ============================================================
+
+def _pago_en_revision(clientes: list, rng: random.Random):
+    """ID de un pago en revision de los clientes de la prueba, o None."""
+    from src.database import get_connection
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id FROM pagos
+        WHERE cliente_id = ANY(%s) AND estado = 'en_revision'
+        ORDER BY id DESC
+        LIMIT 20
+    ''', (clientes,))
+    pagos = [row['id'] for row in cursor.fetchall()]
+    conn.close()
+    return rng.choice(pagos) if pagos else None
+
+
+def _operacion(datos: dict, rng: random.Random) -> str:
+    """Ejecuta una operacion al azar y retorna su nombre."""
+    from src.models_pagos import (
+        registrar_pago, registrar_pago_directo, usar_saldo_en_boletas, ajustar_saldo_cliente,
+        aprobar_pago, rechazar_pago
+    )
+
+    cliente_id = rng.choice(list(datos))
+    boletas = rng.sample(datos[cliente_id], k=min(3, len(datos[cliente_id])))
+    tipo = rng.choice(['pago', 'pago', 'pago_con_saldo', 'aprobar', 'aprobar', 'rechazar',
+                       'usar_saldo', 'usar_saldo', 'directo', 'ajuste'])
+
+    if tipo in ('aprobar', 'rechazar'):
+        pago_id = _pago_en_revision(list(datos), rng)
+        if pago_id is None:
+            return 'sin_pagos_en_revision'
+        if tipo == 'aprobar':
+            exito, mensaje = aprobar_pago(pago_id)
+        else:
+            exito, mensaje = rechazar_pago(pago_id, 'prueba_concurrencia')
+        # Otro thread lo proceso primero: esperado, no es un error
+        if not exito and 'no está en revisión' not in mensaje:
+            raise RuntimeError(mensaje)
+        return tipo if exito else 'ya_procesado'
+    elif tipo in ('pago', 'pago_con_saldo'):
+        registrar_pago(cliente_id, Decimal(rng.randrange(1000, 15000, 500)), boletas,
+                       comprobante_path=f'prueba_concurrencia/{uuid.uuid4().hex}.jpg',
+                       usar_saldo=(tipo == 'pago_con_saldo'))
+    elif tipo == 'usar_saldo':
+        usar_saldo_en_boletas(cliente_id, boletas)
+    elif tipo == 'directo':
+        registrar_pago_directo(cliente_id, Decimal(rng.randrange(1000, 20000, 500)), boletas,
+                               'efectivo', None, notas='prueba_concurrencia')
+    else:
+        exito, mensaje = ajustar_saldo_cliente(cliente_id, Decimal(rng.randrange(-3000, 6000, 500)),
+                                               'prueba_concurrencia', None)
+        if not exito and 'negativo' not in mensaje:
+            raise RuntimeError(mensaje)
+    return tipo
+
+
+def trabajar(datos: dict, operaciones: int, semilla: int, inicio: threading.Barrier,
+             stats: Counter, errores: Counter, lock):
+    rng = random.Random(semilla)
+    inicio.wait()
+    for _ in range(operaciones):
+        try:
+            tipo = _operacion(datos, rng)
+            with lock:
+                stats[tipo] += 1
+        except ValueError:
+            # Saldo insuficiente: rechazo esperado, no es inconsistencia
+            with lock:
+                stats['sin_saldo'] += 1
+        except Exception as e:
+            detalle = str(e).strip().split('\n')[0][:80]
+            with lock:
+                errores[f'{type(e).__name__}: {detalle}'] += 1
+
+
+# ============================================================
+# VERIFICACION
+# ============================================================
+
+def verificar(etiqueta: str) -> list:
+    """Lista de inconsistencias encontradas (vacia si el libro cuadra)."""
+    from src.database import get_connection
+
+    prefijo = f'CONCURRENCIA {etiqueta} %'
+    conn = get_connection()
+    cursor = conn.cursor()
+    problemas = []
+
+    cursor.execute('''
+        SELECT s.cliente_id, s.saldo_disponible, COALESCE(SUM(ms.monto), 0) AS suma
+        FROM saldos_cliente s
+        JOIN clientes c ON c.id = s.cliente_id
+        LEFT JOIN movimientos_saldo ms ON ms.cliente_id = s.cliente_id
+        WHERE c.nombre LIKE %s
+        GROUP BY s.cliente_id, s.saldo_disponible
+        HAVING s.saldo_disponible <> COALESCE(SUM(ms.monto), 0) OR s.saldo_disponible < 0
+    ''', (prefijo,))
+    for row in cursor.fetchall():
+        problemas.append(f"Cliente {row['cliente_id']}: saldo {row['saldo_disponible']} "
+                         f"<> suma de movimientos {row['suma']}")
+
+    cursor.execute('''
+        SELECT id, cliente_id, saldo_anterior, saldo_nuevo, monto, previo
+        FROM (
+            SELECT ms.*, COALESCE(LAG(ms.saldo_nuevo) OVER (
+                       PARTITION BY ms.cliente_id ORDER BY ms.id), 0) AS previo
+            FROM movimientos_saldo ms
+            JOIN clientes c ON c.id = ms.cliente_id
+            WHERE c.nombre LIKE %s
+        ) t
+        WHERE saldo_anterior <> previo
+           OR saldo_nuevo <> saldo_anterior + monto
+           OR saldo_nuevo < 0
+    ''', (prefijo,))
+    for row in cursor.fetchall():
+        problemas.append(f"Movimiento {row['id']} (cliente {row['cliente_id']}): anterior "
+                         f"{row['saldo_anterior']}, previo {row['previo']}, monto {row['monto']}, "
+                         f"nuevo {row['saldo_nuevo']}")
+
+    cursor.execute('''
+        SELECT b.id, b.total, b.monto_pagado, b.saldo_pendiente,
+               COALESCE(SUM(pb.monto_aplicado) FILTER (WHERE p.estado = 'aprobado'), 0) AS aplicado
+        FROM boletas b
+        JOIN medidores m ON m.id = b.medidor_id
+        JOIN clientes c ON c.id = m.cliente_id
+        LEFT JOIN pago_boletas pb ON pb.boleta_id = b.id
+        LEFT JOIN pagos p ON p.id = pb.pago_id
+        WHERE c.nombre LIKE %s
+        GROUP BY b.id
+        HAVING b.saldo_pendiente < 0
+            OR b.monto_pagado + b.saldo_pendiente <> b.total
+            OR b.monto_pagado <> COALESCE(SUM(pb.monto_aplicado) FILTER (WHERE p.estado = 'aprobado'), 0)
+    ''', (prefijo,))
+    for row in cursor.fetchall():
+        problemas.append(f"Boleta {row['id']}: total {row['total']}, pagado {row['monto_pagado']}, "
+                         f"pendiente {row['saldo_pendiente']}, aplicado por pagos {row['aplicado']}")
+
+    cursor.execute('''
+        SELECT cp.periodo, cp.ultimo, MAX(split_part(p.numero_pago, '-', 3)::INTEGER) AS emitido
+        FROM pagos p
+        JOIN contadores_pago cp ON cp.periodo = substring(p.numero_pago from 5 for 6)
+        GROUP BY cp.periodo, cp.ultimo
+        HAVING MAX(split_part(p.numero_pago, '-', 3)::INTEGER) > cp.ultimo
+    ''')
+    for row in cursor.fetchall():
+        problemas.append(f"Contador {row['periodo']} en {row['ultimo']} pero ya se emitio {row['emitido']}")
+
+    conn.close()
+    return problemas
+
+
+# ============================================================
+# EJECUCION
+# ============================================================
+
+def ejecutar_prueba(args) -> int:
+    from src.models_pagos import ajustar_saldo_cliente
+
+    etiqueta = uuid.uuid4().hex[:8]
+    print(f"Creando {args.clientes} clientes con {args.boletas} boletas (etiqueta {etiqueta})...")
+    datos = crear_datos_sinteticos(etiqueta, args.clientes, args.boletas, args.anio)
+
+    try:
+        for cliente_id in datos:
+            ajustar_saldo_cliente(cliente_id, Decimal(args.saldo_inicial), 'Saldo inicial prueba_concurrencia', None)
+
+        stats, errores = Counter(), Counter()
+        lock = threading.Lock()
+        inicio = threading.Barrier(args.hilos)
+        hilos = [threading.Thread(target=trabajar,
+                                  args=(datos, args.operaciones, args.semilla + i, inicio, stats, errores, lock))
+                 for i in range(args.hilos)]
+        t0 = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - t0
+
+        total = sum(stats.values()) + sum(errores.values())
+        print()
+        print("=== Resultado ===")
+        print(f"Operaciones:   {total} en {duracion:.1f}s ({total / duracion:.1f}/s) con {args.hilos} threads")
+        print(f"Por tipo:      {dict(stats)}")
+        print(f"Errores:       {sum(errores.values())}")
+        for mensaje, cantidad in errores.most_common():
+            print(f"  {cantidad:>5}  {mensaje}")
+
+        problemas = verificar(etiqueta)
+        print(f"Inconsistencias: {len(problemas)}")
+        for problema in problemas[:20]:
+            print(f"  {problema}")
+
+        return 1 if problemas or errores else 0
+
+    finally:
+        if args.conservar:
+            print(f"Datos conservados (etiqueta {etiqueta})")
+        else:
+            eliminar_datos_sinteticos(etiqueta)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de concurrencia de pagos y saldos')
+    parser.add_argument('--clientes', type=int, default=3, help='Clientes sinteticos (pocos = mas contencion)')
+    parser.add_argument('--boletas', type=int, default=12, help='Boletas por cliente')
+    parser.add_argument('--anio', type=int, default=1998, help='Anio del primer periodo sintetico')
+    parser.add_argument('--saldo-inicial', type=int, default=20000, help='Saldo a favor inicial por cliente')
+    parser.add_argument('--hilos', type=int, default=16, help='Threads simultaneos')
+    parser.add_argument('--operaciones', type=int, default=100, help='Operaciones por thread')
+    parser.add_argument('--semilla', type=int, default=1, help='Semilla de las operaciones al azar')
+    parser.add_argument('--conservar', action='store_true', help='No eliminar los datos sinteticos')
+
+    sys.exit(ejecutar_prueba(parser.parse_args()))
@@ -1,9 +1,71 @@
 """
 Módulo de modelos - Funciones CRUD para clientes, medidores y lecturas
 """
-from datetime import date
-from typing import Optional, List, Dict
+import os
+import unicodedata
+from datetime import date, datetime, timezone
+from typing import Optional, List, Dict, Iterator
 from .database import get_connection
+from .models_resumen import obtener_resumen_periodos
+
+
+# ============== BUSQUEDA ==============
+
+# Similitud minima (0..1) de la busqueda aproximada (pg_trgm word_similarity)
+BUSQUEDA_SIMILITUD_MINIMA = float(os.getenv('BUSQUEDA_SIMILITUD_MINIMA', '0.5'))
+
+
+def normalizar_busqueda(texto: str) -> str:
+    """Misma normalizacion que la funcion SQL normalizar_busqueda: minusculas y sin tildes."""
+    texto = unicodedata.normalize('NFKD', (texto or '').strip().lower())
+    return ''.join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def _busqueda_trigram(columna: str, busqueda: str, aproximada: bool = False):
+    """
+    Condicion sobre una columna `busqueda` (normalizada, con indice trigram)
+    y expresion de ranking por similitud.
+
+    Con aproximada=True tambien coinciden terminos mal escritos (operador <%).
+
+    Returns:
+        (condicion, params, ranking, params_ranking)
+    """
+    termino = normalizar_busqueda(busqueda)
+    patron = '%' + termino.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    if aproximada:
+        condicion = f'({columna} LIKE %s OR %s <%% {columna})'
+        params = [patron, termino]
+    else:
+        condicion = f'{columna} LIKE %s'
+        params = [patron]
+    return condicion, params, f'word_similarity(%s, {columna})', [termino]
+
+
+def _fijar_similitud_minima(cursor):
+    """Umbral de la busqueda aproximada para la transaccion actual."""
+    cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                   (str(BUSQUEDA_SIMILITUD_MINIMA),))
+
+
+def _busqueda_medidores(busqueda: str, aproximada: bool = False):
+    """
+    Condicion de busqueda de medidores por numero, direccion o nombre del
+    cliente. Cada rama usa su indice trigram (medidores y clientes) y se
+    unen por id, en vez de un OR entre tablas que obligaria a recorrerlas.
+
+    Returns:
+        (condicion, params, ranking, params_ranking) con alias m y c
+    """
+    cond_m, params_m, rank_m, rank_params_m = _busqueda_trigram('busqueda', busqueda, aproximada)
+    cond_c, params_c, rank_c, rank_params_c = _busqueda_trigram('cc.busqueda', busqueda, aproximada)
+    condicion = f'''m.id IN (
+            SELECT id FROM medidores WHERE {cond_m}
+            UNION
+            SELECT mm.id FROM medidores mm JOIN clientes cc ON cc.id = mm.cliente_id WHERE {cond_c}
+        )'''
+    ranking = f"GREATEST({rank_m.replace('busqueda', 'm.busqueda')}, {rank_c.replace('cc.', 'c.')})"
+    return condicion, params_m + params_c, ranking, rank_params_m + rank_params_c
 
 
 # ============== CLIENTES ==============
@@ -73,23 +135,10 @@ def obtener_o_crear_cliente(nombre: str) -> int:
     return crear_cliente(nombre)
 
 
-def listar_clientes(busqueda: str = None, con_medidores: str = None,
-                    filtro_telefono: str = None, recibe_whatsapp: str = None) -> List[Dict]:
-    """
-    Lista clientes con filtros opcionales.
-
-    Args:
-        busqueda: Texto para buscar en nombre, nombre_completo, RUT, telefono o email
-        con_medidores: 'si' para clientes con medidores, 'no' para sin medidores, None para todos
-        filtro_telefono: 'con' para clientes con telefono, 'sin' para sin telefono, None para todos
-        recibe_whatsapp: 'si' para clientes que reciben boleta por WhatsApp, 'no' para los que no, None para todos
-
-    Returns:
-        Lista de clientes con conteo de medidores
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-
+def _consulta_clientes(busqueda: str = None, con_medidores: str = None,
+                       filtro_telefono: str = None, recibe_whatsapp: str = None,
+                       aproximada: bool = False):
+    """SELECT del listado de clientes con sus filtros. Retorna (query, params)."""
     query = '''
         SELECT c.*,
                COUNT(m.id) as num_medidores
@@ -98,17 +147,14 @@ def listar_clientes(busqueda: str = None, con_medidores: str = None,
         WHERE 1=1
     '''
     params = []
+    orden = 'c.nombre'
+    orden_params = []
 
     if busqueda:
-        query += ''' AND (
-            LOWER(c.nombre) LIKE LOWER(%s) OR
-            LOWER(c.nombre_completo) LIKE LOWER(%s) OR
-            LOWER(c.rut) LIKE LOWER(%s) OR
-            LOWER(c.telefono) LIKE LOWER(%s) OR
-            LOWER(c.email) LIKE LOWER(%s)
-        )'''
-        busqueda_param = f'%{busqueda}%'
-        params.extend([busqueda_param, busqueda_param, busqueda_param, busqueda_param, busqueda_param])
+        condicion, busqueda_params, ranking, orden_params = _busqueda_trigram('c.busqueda', busqueda, aproximada)
+        query += f' AND {condicion}'
+        params.extend(busqueda_params)
+        orden = f'{ranking} DESC, c.nombre'
 
     if filtro_telefono == 'sin':
         query += ' AND (c.telefono IS NULL OR c.telefono = %s)'
@@ -129,14 +175,64 @@ def listar_clientes(busqueda: str = None, con_medidores: str = None,
     elif con_medidores == 'no':
         query += ' HAVING COUNT(m.id) = 0'
 
-    query += ' ORDER BY c.nombre'
+    query += f' ORDER BY {orden}'
+    params.extend(orden_params)
+    return query, params
+
+
+def listar_clientes(busqueda: str = None, con_medidores: str = None,
+                    filtro_telefono: str = None, recibe_whatsapp: str = None,
+                    aproximada: bool = False) -> List[Dict]:
+    """
+    Lista clientes con filtros opcionales.
+
+    Args:
+        busqueda: Texto para buscar en nombre, nombre_completo, RUT, telefono o email
+            (sin distinguir tildes; resultados ordenados por similitud)
+        con_medidores: 'si' para clientes con medidores, 'no' para sin medidores, None para todos
+        filtro_telefono: 'con' para clientes con telefono, 'sin' para sin telefono, None para todos
+        recibe_whatsapp: 'si' para clientes que reciben boleta por WhatsApp, 'no' para los que no, None para todos
+        aproximada: Incluir coincidencias aproximadas (nombres mal escritos)
+
+    Returns:
+        Lista de clientes con conteo de medidores
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    if busqueda and aproximada:
+        _fijar_similitud_minima(cursor)
 
+    query, params = _consulta_clientes(busqueda, con_medidores, filtro_telefono,
+                                       recibe_whatsapp, aproximada)
     cursor.execute(query, params)
     rows = cursor.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
 
+def iterar_clientes(busqueda: str = None, con_medidores: str = None,
+                    filtro_telefono: str = None, recibe_whatsapp: str = None,
+                    aproximada: bool = False) -> Iterator[Dict]:
+    """
+    Recorre los mismos clientes que listar_clientes con un cursor del lado
+    del servidor (para exportaciones): las filas llegan por lotes y la
+    conexion se cierra al agotar o descartar el iterador.
+    """
+    conn = get_connection()
+    try:
+        if busqueda and aproximada:
+            _fijar_similitud_minima(conn.cursor())
+
+        query, params = _consulta_clientes(busqueda, con_medidores, filtro_telefono,
+                                           recibe_whatsapp, aproximada)
+        cursor = conn.cursor_servidor('iterar_clientes')
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        conn.close()
+
+
 def obtener_cliente(cliente_id: int) -> Optional[Dict]:
     """Obtiene un cliente por ID."""
     conn = get_connection()
@@ -256,20 +352,24 @@ def obtener_o_crear_medidor(cliente_id: int) -> int:
 
 
 def listar_medidores(cliente_id: int = None, busqueda: str = None,
-                     estado: str = None) -> List[Dict]:
+                     estado: str = None, aproximada: bool = False) -> List[Dict]:
     """
     Lista medidores con filtros opcionales.
 
     Args:
         cliente_id: Filtrar por cliente específico
         busqueda: Texto para buscar en numero_medidor, direccion o nombre de cliente
+            (sin distinguir tildes; resultados ordenados por similitud)
         estado: 'activo' o 'inactivo', None para todos
+        aproximada: Incluir coincidencias aproximadas (textos mal escritos)
 
     Returns:
         Lista de medidores con info del cliente y conteo de lecturas
     """
     conn = get_connection()
     cursor = conn.cursor()
+    if busqueda and aproximada:
+        _fijar_similitud_minima(cursor)
 
     query = '''
         SELECT m.*, c.nombre as cliente_nombre,
@@ -285,21 +385,22 @@ def listar_medidores(cliente_id: int = None, busqueda: str = None,
         query += ' AND m.cliente_id = %s'
         params.append(cliente_id)
 
+    orden = 'c.nombre'
+    orden_params = []
+
     if busqueda:
-        query += ''' AND (
-            LOWER(m.numero_medidor) LIKE LOWER(%s) OR
-            LOWER(m.direccion) LIKE LOWER(%s) OR
-            LOWER(c.nombre) LIKE LOWER(%s)
-        )'''
-        busqueda_param = f'%{busqueda}%'
-        params.extend([busqueda_param, busqueda_param, busqueda_param])
+        condicion, busqueda_params, ranking, orden_params = _busqueda_medidores(busqueda, aproximada)
+        query += f' AND {condicion}'
+        params.extend(busqueda_params)
+        orden = f'{ranking} DESC, c.nombre'
 
     if estado == 'activo':
         query += ' AND m.activo = 1'
     elif estado == 'inactivo':
         query += ' AND m.activo = 0'
 
-    query += ' GROUP BY m.id, c.nombre ORDER BY c.nombre'
+    query += f' GROUP BY m.id, c.nombre, c.busqueda ORDER BY {orden}'
+    params.extend(orden_params)
 
     cursor.execute(query, params)
     rows = cursor.fetchall()
@@ -541,7 +642,7 @@ def lectura_existe(medidor_id: int, anio: int, mes: int) -> bool:
 def listar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
                     cliente_id: int = None, limit: int = 100, offset: int = 0,
                     orden_col: str = None, orden_dir: str = 'asc',
-                    solo_incompletos: bool = False) -> List[Dict]:
+                    solo_incompletos: bool = False, con_foto: int = None) -> List[Dict]:
     """
     Lista lecturas con filtros opcionales.
 
@@ -555,6 +656,7 @@ def listar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
         orden_col: Columna para ordenar (id, cliente, periodo, lectura_m3, fecha_lectura)
         orden_dir: Dirección del orden (asc, desc)
         solo_incompletos: Si True, solo muestra lecturas de medidores incompletos
+        con_foto: 1 solo con foto, 0 solo sin foto, None todas
 
     Returns:
         Lista de lecturas con info del medidor y cliente
@@ -583,16 +685,12 @@ def listar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
     if cliente_id:
         query += ' AND c.id = %s'
         params.append(cliente_id)
+    if con_foto is not None:
+        query += ' AND l.tiene_foto' if con_foto else ' AND NOT l.tiene_foto'
 
     if solo_incompletos:
-        medidores_inc = obtener_medidores_incompletos()
-        if medidores_inc:
-            placeholders = ','.join('%s' * len(medidores_inc))
-            query += f' AND l.medidor_id IN ({placeholders})'
-            params.extend(medidores_inc)
-        else:
-            # No hay medidores incompletos, no devolver nada
-            query += ' AND 1=0'
+        query += ' AND l.medidor_id IN (SELECT medidor_id FROM medidores_incompletos(%s, %s, %s, %s))'
+        params.extend(_ventana_completitud())
 
     # Mapeo de columnas permitidas
     columnas_orden = {
@@ -682,7 +780,8 @@ def eliminar_lectura(lectura_id: int) -> bool:
 
 
 def contar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
-                    cliente_id: int = None, solo_incompletos: bool = False) -> int:
+                    cliente_id: int = None, solo_incompletos: bool = False,
+                    con_foto: int = None) -> int:
     """Cuenta lecturas con filtros opcionales."""
     conn = get_connection()
     cursor = conn.cursor()
@@ -707,15 +806,12 @@ def contar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
     if cliente_id:
         query += ' AND c.id = %s'
         params.append(cliente_id)
+    if con_foto is not None:
+        query += ' AND l.tiene_foto' if con_foto else ' AND NOT l.tiene_foto'
 
     if solo_incompletos:
-        medidores_inc = obtener_medidores_incompletos()
-        if medidores_inc:
-            placeholders = ','.join('%s' * len(medidores_inc))
-            query += f' AND l.medidor_id IN ({placeholders})'
-            params.extend(medidores_inc)
-        else:
-            query += ' AND 1=0'
+        query += ' AND l.medidor_id IN (SELECT medidor_id FROM medidores_incompletos(%s, %s, %s, %s))'
+        params.extend(_ventana_completitud())
 
     cursor.execute(query, params)
     count = cursor.fetchone()[0]
@@ -725,71 +821,64 @@ def contar_lecturas(medidor_id: int = None, anio: int = None, mes: int = None,
 
 # ============== ESTADÍSTICAS ==============
 
-def obtener_medidores_incompletos() -> List[int]:
+def _periodo_config(variable: str, defecto: str) -> tuple:
+    """Periodo 'AAAA-MM' de una variable de entorno como (anio, mes)."""
+    anio, mes = os.getenv(variable, defecto).split('-')
+    return int(anio), int(mes)
+
+
+# Ventana de periodos del filtro "Solo incompletos" (ambos incluidos)
+LECTURAS_COMPLETITUD_DESDE = _periodo_config('LECTURAS_COMPLETITUD_DESDE', '2023-12')
+LECTURAS_COMPLETITUD_HASTA = _periodo_config('LECTURAS_COMPLETITUD_HASTA', '2025-11')
+
+
+def _ventana_completitud(desde: tuple = None, hasta: tuple = None) -> list:
+    """Parametros (desde_anio, desde_mes, hasta_anio, hasta_mes) de medidores_incompletos()."""
+    desde = desde or LECTURAS_COMPLETITUD_DESDE
+    hasta = hasta or LECTURAS_COMPLETITUD_HASTA
+    return [desde[0], desde[1], hasta[0], hasta[1]]
+
+
+def obtener_medidores_incompletos(desde: tuple = None, hasta: tuple = None) -> List[int]:
     """
-    Obtiene IDs de medidores que no tienen todos los meses registrados
-    desde diciembre 2023 hasta noviembre 2025.
+    Obtiene IDs de medidores a los que les falta al menos una lectura en la
+    ventana de periodos. Se calcula con el bitmap de meses por medidor y
+    anio (lecturas_medidor_anio), sin contar lecturas.
+
+    Args:
+        desde: (anio, mes) inicial, por defecto LECTURAS_COMPLETITUD_DESDE
+        hasta: (anio, mes) final, por defecto LECTURAS_COMPLETITUD_HASTA
 
     Returns:
         Lista de IDs de medidores incompletos
     """
-    total_periodos = 24  # dic 2023 + 12 meses 2024 + 11 meses 2025
-
     conn = get_connection()
     cursor = conn.cursor()
-
-    # Obtener medidores que NO tienen todos los periodos
-    cursor.execute('''
-        SELECT m.id
-        FROM medidores m
-        WHERE (
-            SELECT COUNT(DISTINCT l.anio * 100 + l.mes)
-            FROM lecturas l
-            WHERE l.medidor_id = m.id
-            AND (
-                (l.anio = 2023 AND l.mes = 12) OR
-                (l.anio = 2024) OR
-                (l.anio = 2025 AND l.mes <= 11)
-            )
-        ) < %s
-    ''', (total_periodos,))
-
+    cursor.execute('SELECT medidor_id FROM medidores_incompletos(%s, %s, %s, %s)',
+                   _ventana_completitud(desde, hasta))
     rows = cursor.fetchall()
     conn.close()
-    return [row[0] if isinstance(row, tuple) else row['id'] for row in rows]
+    return [row['medidor_id'] for row in rows]
 
 
-def obtener_clientes_incompletos() -> List[int]:
+def obtener_clientes_incompletos(desde: tuple = None, hasta: tuple = None) -> List[int]:
     """
-    Obtiene IDs de clientes que tienen al menos un medidor incompleto.
+    Obtiene IDs de clientes que tienen al menos un medidor incompleto en la
+    ventana de periodos (ver obtener_medidores_incompletos).
 
     Returns:
         Lista de IDs de clientes incompletos
     """
-    total_periodos = 24  # dic 2023 + 12 meses 2024 + 11 meses 2025
-
     conn = get_connection()
     cursor = conn.cursor()
-
-    # Obtener clientes con al menos un medidor incompleto
     cursor.execute('''
         SELECT DISTINCT m.cliente_id
-        FROM medidores m
-        WHERE (
-            SELECT COUNT(DISTINCT l.anio * 100 + l.mes)
-            FROM lecturas l
-            WHERE l.medidor_id = m.id
-            AND (
-                (l.anio = 2023 AND l.mes = 12) OR
-                (l.anio = 2024) OR
-                (l.anio = 2025 AND l.mes <= 11)
-            )
-        ) < %s
-    ''', (total_periodos,))
-
+        FROM medidores_incompletos(%s, %s, %s, %s) i
+        JOIN medidores m ON m.id = i.medidor_id
+    ''', _ventana_completitud(desde, hasta))
     rows = cursor.fetchall()
     conn.close()
-    return [row[0] if isinstance(row, tuple) else row['cliente_id'] for row in rows]
+    return [row['cliente_id'] for row in rows]
 
 
 def obtener_anios_disponibles() -> List[int]:
@@ -814,16 +903,27 @@ def obtener_anios_disponibles() -> List[int]:
 
 def obtener_estadisticas_lecturas(anio: int = None, mes: int = None,
                                   cliente_id: int = None, medidor_id: int = None,
-                                  solo_incompletos: bool = False) -> Dict:
+                                  solo_incompletos: bool = False, con_foto: int = None) -> Dict:
     """Obtiene estadisticas de lecturas con los mismos filtros del listado."""
+    if not (cliente_id or medidor_id or solo_incompletos) and con_foto is None:
+        # Solo filtros de periodo: leer del resumen por periodo
+        resumen = obtener_resumen_periodos(anio or None, mes or None)
+        total = resumen['lecturas_total']
+        return {
+            'total': total,
+            'con_foto': resumen['lecturas_con_foto'],
+            'sin_foto': total - resumen['lecturas_con_foto'],
+            'promedio_m3': round(float(resumen['lecturas_suma_m3']) / total, 1) if total else 0.0
+        }
+
     conn = get_connection()
     cursor = conn.cursor()
 
     query = '''
         SELECT
             COUNT(*) as total,
-            COUNT(CASE WHEN l.foto_path IS NOT NULL AND l.foto_path != '' AND l.foto_nombre != 'sin_foto' THEN 1 END) as con_foto,
-            COUNT(CASE WHEN l.foto_path IS NULL OR l.foto_path = '' OR l.foto_nombre = 'sin_foto' THEN 1 END) as sin_foto,
+            COUNT(*) FILTER (WHERE l.tiene_foto) as con_foto,
+            COUNT(*) FILTER (WHERE NOT l.tiene_foto) as sin_foto,
             COALESCE(ROUND(AVG(l.lectura_m3)::numeric, 1), 0) as promedio_m3
         FROM lecturas l
         JOIN medidores m ON l.medidor_id = m.id
@@ -844,15 +944,12 @@ def obtener_estadisticas_lecturas(anio: int = None, mes: int = None,
     if cliente_id:
         query += ' AND c.id = %s'
         params.append(cliente_id)
+    if con_foto is not None:
+        query += ' AND l.tiene_foto' if con_foto else ' AND NOT l.tiene_foto'
 
     if solo_incompletos:
-        medidores_inc = obtener_medidores_incompletos()
-        if medidores_inc:
-            placeholders = ','.join(['%s'] * len(medidores_inc))
-            query += f' AND l.medidor_id IN ({placeholders})'
-            params.extend(medidores_inc)
-        else:
-            query += ' AND 1=0'
+        query += ' AND l.medidor_id IN (SELECT medidor_id FROM medidores_incompletos(%s, %s, %s, %s))'
+        params.extend(_ventana_completitud())
 
     cursor.execute(query, params)
     row = cursor.fetchone()
@@ -867,10 +964,12 @@ def obtener_estadisticas_lecturas(anio: int = None, mes: int = None,
 
 
 def obtener_estadisticas_clientes(busqueda: str = None, con_medidores: str = None,
-                                  filtro_telefono: str = None) -> Dict:
+                                  filtro_telefono: str = None, aproximada: bool = False) -> Dict:
     """Obtiene estadisticas de clientes con los mismos filtros del listado."""
     conn = get_connection()
     cursor = conn.cursor()
+    if busqueda and aproximada:
+        _fijar_similitud_minima(cursor)
 
     query = '''
         SELECT
@@ -887,15 +986,9 @@ def obtener_estadisticas_clientes(busqueda: str = None, con_medidores: str = Non
     params = []
 
     if busqueda:
-        query += ''' AND (
-            LOWER(c.nombre) LIKE LOWER(%s) OR
-            LOWER(c.nombre_completo) LIKE LOWER(%s) OR
-            LOWER(c.rut) LIKE LOWER(%s) OR
-            LOWER(c.telefono) LIKE LOWER(%s) OR
-            LOWER(c.email) LIKE LOWER(%s)
-        )'''
-        busqueda_param = f'%{busqueda}%'
-        params.extend([busqueda_param] * 5)
+        condicion, busqueda_params, _, _ = _busqueda_trigram('c.busqueda', busqueda, aproximada)
+        query += f' AND {condicion}'
+        params.extend(busqueda_params)
 
     if filtro_telefono == 'sin':
         query += ' AND (c.telefono IS NULL OR c.telefono = %s)'
@@ -929,10 +1022,12 @@ def obtener_estadisticas_clientes(busqueda: str = None, con_medidores: str = Non
 
 
 def obtener_estadisticas_medidores(busqueda: str = None, cliente_id: int = None,
-                                   estado: str = None) -> Dict:
+                                   estado: str = None, aproximada: bool = False) -> Dict:
     """Obtiene estadisticas de medidores con los mismos filtros del listado."""
     conn = get_connection()
     cursor = conn.cursor()
+    if busqueda and aproximada:
+        _fijar_similitud_minima(cursor)
 
     query = '''
         SELECT
@@ -952,13 +1047,9 @@ def obtener_estadisticas_medidores(busqueda: str = None, cliente_id: int = None,
     params = []
 
     if busqueda:
-        query += ''' AND (
-            LOWER(m.numero_medidor) LIKE LOWER(%s) OR
-            LOWER(m.direccion) LIKE LOWER(%s) OR
-            LOWER(c.nombre) LIKE LOWER(%s)
-        )'''
-        busqueda_param = f'%{busqueda}%'
-        params.extend([busqueda_param] * 3)
+        condicion, busqueda_params, _, _ = _busqueda_medidores(busqueda, aproximada)
+        query += f' AND {condicion}'
+        params.extend(busqueda_params)
 
     if cliente_id:
         query += ' AND m.cliente_id = %s'
@@ -986,6 +1077,17 @@ def obtener_estadisticas_medidores(busqueda: str = None, cliente_id: int = None,
 
 def obtener_estadisticas_pagos(estado: str = None, cliente_id: int = None) -> Dict:
     """Obtiene estadisticas de pagos con los mismos filtros del listado."""
+    if not estado and not cliente_id:
+        # Sin filtros: leer del resumen por periodo
+        resumen = obtener_resumen_periodos()
+        return {
+            'total': resumen['pagos_total'],
+            'aprobados': resumen['pagos_aprobados'],
+            'en_revision': resumen['pagos_en_revision'],
+            'rechazados': resumen['pagos_rechazados'],
+            'monto_total': float(resumen['pagos_monto_total'])
+        }
+
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -1128,11 +1230,10 @@ def obtener_estadisticas() -> Dict:
     cursor.execute('SELECT COUNT(*) FROM medidores')
     num_medidores = cursor.fetchone()[0]
 
-    cursor.execute('SELECT COUNT(*) FROM lecturas')
-    num_lecturas = cursor.fetchone()[0]
-
     conn.close()
 
+    num_lecturas = obtener_resumen_periodos()['lecturas_total']
+
     return {
         'clientes': num_clientes,
         'medidores': num_medidores,
@@ -1234,3 +1335,45 @@ def buscar_cliente_por_rut(rut: str) -> Optional[Dict]:
     if row:
         return dict(row)
     return None
+
+
+# ============== VERSIONES DE DATOS ==============
+
+# Momento en que este proceso vio por primera vez la version vigente de
+# cada tabla: {tabla: (version, datetime)}
+_versiones_vistas: Dict[str, tuple] = {}
+
+
+def obtener_versiones_datos(tablas: List[str]) -> Dict[str, Dict]:
+    """
+    Version de cada tabla (secuencia version_<tabla>, incrementada al
+    commit de cada transaccion que la modifica). Una sola consulta, sin
+    leer los datos ni escribir nada.
+
+    actualizado_at es cuando este proceso vio por primera vez esa version
+    (las secuencias no guardan fecha); sirve para Last-Modified.
+
+    Returns:
+        {tabla: {'version': int, 'actualizado_at': datetime con zona}};
+        las tablas sin cambios registrados tienen version 0
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT sequencename, last_value
+        FROM pg_sequences
+        WHERE schemaname = current_schema() AND sequencename = ANY(%s)
+    ''', (['version_' + tabla for tabla in tablas],))
+    rows = cursor.fetchall()
+    conn.close()
+
+    valores = {row['sequencename'][len('version_'):]: row['last_value'] or 0 for row in rows}
+    ahora = datetime.now(timezone.utc)
+    versiones = {}
+    for tabla in tablas:
+        version = valores.get(tabla, 0)
+        vista = _versiones_vistas.get(tabla)
+        if vista is None or vista[0] != version:
+            vista = _versiones_vistas[tabla] = (version, ahora)
+        versiones[tabla] = {'version': version, 'actualizado_at': vista[1]}
+    return versiones
@@ -2,8 +2,9 @@
 Modelos para el sistema de boletas - CRUD desacoplado
 """
 from datetime import date
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from .database import get_connection
+from .models_resumen import obtener_resumen_periodos
 
 
 # =============================================================================
@@ -136,72 +137,232 @@ def obtener_boleta_por_lectura(lectura_id: int):
     return dict(boleta) if boleta else None
 
 
-def listar_boletas(cliente_id: int = None, medidor_id: int = None,
-                   pagada: int = None, sin_comprobante: bool = False,
-                   anio: int = None, mes: int = None, enviada: int = None):
-    """Lista boletas con filtros opcionales.
-
-    Args:
-        cliente_id: Filtrar por cliente
-        medidor_id: Filtrar por medidor
-        pagada: Filtrar por estado de pago (0=pendiente, 1=revision, 2=pagada)
-        sin_comprobante: Filtrar boletas pagadas sin comprobante
-        anio: Filtrar por anio
-        mes: Filtrar por mes
-        enviada: Filtrar por estado de envio (1=enviada, 0=no enviada)
+# Claves de orden de listar_boletas: expresiones SQL sin NULL (para el seek)
+ORDEN_BOLETAS = {
+    'numero': ['b.numero_boleta'],
+    'cliente': ['b.cliente_nombre'],
+    'periodo': ['b.periodo_anio', 'b.periodo_mes'],
+    'consumo': ['b.consumo_m3'],
+    'total': ['b.total'],
+    'pendiente': ['COALESCE(b.saldo_pendiente, b.total)'],
+    'estado': ['COALESCE(b.pagada, 0)']
+}
+
+# Tipo de cada clave de orden (y de b.id) para validar los cursores de seek
+TIPOS_CLAVE_BOLETAS = {
+    'b.numero_boleta': str,
+    'b.cliente_nombre': str,
+    'b.periodo_anio': int,
+    'b.periodo_mes': int,
+    'b.consumo_m3': int,
+    'b.total': float,
+    'COALESCE(b.saldo_pendiente, b.total)': float,
+    'COALESCE(b.pagada, 0)': int,
+    'b.id': int
+}
+
+def _filtros_boletas(cliente_id: int = None, medidor_id: int = None,
+                     pagada: int = None, sin_comprobante: bool = False,
+                     anio: int = None, mes: int = None, enviada: int = None):
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = '''
-        SELECT b.*, m.numero_medidor, c.nombre as cliente_nombre_actual, c.id as cliente_id,
-               c.telefono as cliente_telefono, c.recibe_boleta_whatsapp,
-               (SELECT COUNT(*) FROM envios_boletas e WHERE e.boleta_id = b.id AND e.estado = 'enviado') as envios_count,
-               (SELECT MAX(created_at) FROM envios_boletas e WHERE e.boleta_id = b.id AND e.estado = 'enviado') as ultimo_envio
-        FROM boletas b
-        JOIN medidores m ON b.medidor_id = m.id
-        JOIN clientes c ON m.cliente_id = c.id
-        WHERE 1=1
-    '''
+    Condiciones WHERE comunes del listado, conteo y estadisticas de boletas.
+    El filtro `enviada` requiere resumen_envios_boleta unido como `r`.
+    Retorna (sql, params).
+    """
+    sql = ''
     params = []
 
     if cliente_id is not None:
-        query += ' AND c.id = %s'
+        sql += ' AND c.id = %s'
         params.append(cliente_id)
 
     if medidor_id is not None:
-        query += ' AND b.medidor_id = %s'
+        sql += ' AND b.medidor_id = %s'
         params.append(medidor_id)
 
     if pagada is not None:
-        query += ' AND b.pagada = %s'
+        sql += ' AND b.pagada = %s'
         params.append(pagada)
 
     if sin_comprobante:
-        query += ' AND b.pagada = 2 AND (b.comprobante_path IS NULL OR b.comprobante_path = \'\')'
+        sql += ' AND b.pagada = 2 AND (b.comprobante_path IS NULL OR b.comprobante_path = \'\')'
 
     if anio is not None:
-        query += ' AND b.periodo_anio = %s'
+        sql += ' AND b.periodo_anio = %s'
         params.append(anio)
 
     if mes is not None:
-        query += ' AND b.periodo_mes = %s'
+        sql += ' AND b.periodo_mes = %s'
         params.append(mes)
 
     if enviada is not None:
         if enviada == 1:
-            query += ' AND EXISTS (SELECT 1 FROM envios_boletas e WHERE e.boleta_id = b.id AND e.estado = \'enviado\')'
+            sql += ' AND r.envios_count > 0'
+        elif enviada == 2:
+            sql += ' AND r.nivel_entrega >= 2'
+        elif enviada == 3:
+            sql += ' AND r.nivel_entrega >= 3'
         else:
-            query += ' AND NOT EXISTS (SELECT 1 FROM envios_boletas e WHERE e.boleta_id = b.id AND e.estado = \'enviado\')'
+            sql += ' AND COALESCE(r.envios_count, 0) = 0'
+
+    return sql, params
+
+
+def listar_boletas(cliente_id: int = None, medidor_id: int = None,
+                   pagada: int = None, sin_comprobante: bool = False,
+                   anio: int = None, mes: int = None, enviada: int = None,
+                   orden: str = None, direccion: str = 'desc', limite: int = None,
+                   offset: int = None, despues: list = None, antes: list = None,
+                   desde_final: bool = False):
+    """Lista boletas con filtros opcionales.
 
-    query += ' ORDER BY b.periodo_anio DESC, b.periodo_mes DESC, b.id DESC'
+    Args:
+        cliente_id: Filtrar por cliente
+        medidor_id: Filtrar por medidor
+        pagada: Filtrar por estado de pago (0=pendiente, 1=revision, 2=pagada)
+        sin_comprobante: Filtrar boletas pagadas sin comprobante
+        anio: Filtrar por anio
+        mes: Filtrar por mes
+        enviada: Filtrar por estado de envio (1=enviada, 0=no enviada,
+            2=entregada, 3=leida)
+        orden: Clave de ORDEN_BOLETAS (por defecto periodo); b.id desempata
+        direccion: 'asc' o 'desc'
+        limite: Maximo de boletas (una pagina)
+        offset: Boletas a saltar (solo para saltos a una pagina arbitraria)
+        despues: Cursor (clave_cursor_boletas) de la ultima boleta de la
+            pagina anterior: pagina siguiente por seek, sin OFFSET
+        antes: Cursor de la primera boleta de la pagina siguiente: pagina
+            anterior por seek
+        desde_final: Ultimas `limite` boletas del orden (ultima pagina)
+    """
+    columnas = ORDEN_BOLETAS.get(orden) or ORDEN_BOLETAS['periodo']
+    claves = columnas + ['b.id']
+    direccion = 'ASC' if (direccion or '').lower() == 'asc' else 'DESC'
+
+    # Un cursor que no corresponde a la clave de orden se ignora por completo
+    if despues and len(despues) != len(claves):
+        despues = None
+    if antes and len(antes) != len(claves):
+        antes = None
+
+    # Hacia atras (pagina anterior o ultima) se recorre el orden invertido
+    invertir = bool(antes) or (desde_final and not despues)
+    recorrido = {'ASC': 'DESC', 'DESC': 'ASC'}[direccion] if invertir else direccion
+
+    filtros_sql, params = _filtros_boletas(cliente_id, medidor_id, pagada, sin_comprobante,
+                                           anio, mes, enviada)
+
+    cursor_seek = despues or antes
+    if cursor_seek:
+        filtros_sql += ' AND ({}) {} ({})'.format(
+            ', '.join(claves), '<' if recorrido == 'DESC' else '>', ', '.join(['%s'] * len(claves)))
+        params.extend(cursor_seek)
+
+    limite_sql = ''
+    if limite is not None:
+        limite_sql += ' LIMIT %s'
+        params.append(limite)
+    if offset and not cursor_seek and not invertir:
+        limite_sql += ' OFFSET %s'
+        params.append(offset)
+
+    join_filtro = ('LEFT JOIN resumen_envios_boleta r ON r.boleta_id = b.id'
+                   if enviada is not None else '')
+    orden_pagina = ', '.join(f'{clave} {recorrido}' for clave in claves)
+    orden_final = ', '.join(f'p.orden_{i} {direccion}' for i in range(len(columnas)))
+
+    query = f'''
+        WITH pagina AS (
+            SELECT b.id, {', '.join(f'{col} as orden_{i}' for i, col in enumerate(columnas))}
+            FROM boletas b
+            JOIN medidores m ON b.medidor_id = m.id
+            JOIN clientes c ON m.cliente_id = c.id
+            {join_filtro}
+            WHERE 1=1 {filtros_sql}
+            ORDER BY {orden_pagina}
+            {limite_sql}
+        )
+        SELECT b.*, m.numero_medidor, c.nombre as cliente_nombre_actual, c.id as cliente_id,
+               c.telefono as cliente_telefono, c.recibe_boleta_whatsapp,
+               COALESCE(r.envios_count, 0) as envios_count, r.ultimo_envio,
+               r.nivel_entrega, r.ultimo_canal, r.ultimo_estado,
+               {', '.join(f'p.orden_{i}' for i in range(len(columnas)))}
+        FROM pagina p
+        JOIN boletas b ON b.id = p.id
+        JOIN medidores m ON b.medidor_id = m.id
+        JOIN clientes c ON m.cliente_id = c.id
+        LEFT JOIN resumen_envios_boleta r ON r.boleta_id = b.id
+        ORDER BY {orden_final}, b.id {direccion}
+    '''
 
+    conn = get_connection()
+    cursor = conn.cursor()
     cursor.execute(query, params)
     boletas = cursor.fetchall()
     conn.close()
     return [dict(b) for b in boletas]
 
 
+def clave_cursor_boletas(boleta: Dict, orden: str = None) -> list:
+    """Cursor de seek de una boleta listada: valores de la clave de orden + id."""
+    columnas = ORDEN_BOLETAS.get(orden) or ORDEN_BOLETAS['periodo']
+    return [boleta[f'orden_{i}'] for i in range(len(columnas))] + [boleta['id']]
+
+
+def contar_boletas(cliente_id: int = None, medidor_id: int = None,
+                   pagada: int = None, sin_comprobante: bool = False,
+                   anio: int = None, mes: int = None, enviada: int = None) -> int:
+    """Cuenta las boletas que devolveria listar_boletas con los mismos filtros."""
+    filtros_sql, params = _filtros_boletas(cliente_id, medidor_id, pagada, sin_comprobante,
+                                           anio, mes, enviada)
+    join_filtro = ('LEFT JOIN resumen_envios_boleta r ON r.boleta_id = b.id'
+                   if enviada is not None else '')
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT COUNT(*) as total
+        FROM boletas b
+        JOIN medidores m ON b.medidor_id = m.id
+        JOIN clientes c ON m.cliente_id = c.id
+        {join_filtro}
+        WHERE 1=1 {filtros_sql}
+    ''', params)
+    resultado = cursor.fetchone()
+    conn.close()
+    return resultado['total'] if resultado else 0
+
+
+def iterar_boletas(cliente_id: int = None, medidor_id: int = None,
+                   pagada: int = None, sin_comprobante: bool = False,
+                   anio: int = None, mes: int = None) -> Iterator[Dict]:
+    """
+    Recorre las boletas filtradas en el orden por defecto del listado
+    (periodo descendente) con un cursor del lado del servidor, para
+    exportaciones: solo las columnas necesarias y por lotes. La conexion
+    se cierra al agotar o descartar el iterador.
+    """
+    filtros_sql, params = _filtros_boletas(cliente_id, medidor_id, pagada, sin_comprobante, anio, mes)
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor_servidor('iterar_boletas')
+        cursor.execute(f'''
+            SELECT b.id, b.numero_boleta, b.cliente_nombre, m.numero_medidor,
+                   b.periodo_anio, b.periodo_mes, b.consumo_m3, b.total, b.pagada,
+                   (b.comprobante_path IS NOT NULL AND b.comprobante_path != '') as tiene_comprobante
+            FROM boletas b
+            JOIN medidores m ON b.medidor_id = m.id
+            JOIN clientes c ON m.cliente_id = c.id
+            WHERE 1=1 {filtros_sql}
+            ORDER BY b.periodo_anio DESC, b.periodo_mes DESC, b.id DESC
+        ''', params)
+        for boleta in cursor:
+            yield boleta
+    finally:
+        conn.close()
+
+
 def marcar_boleta_pagada(boleta_id: int, metodo_pago: str) -> bool:
     """Marca una boleta como pagada."""
     conn = get_connection()
@@ -361,7 +522,25 @@ def obtener_anios_disponibles():
 def obtener_estadisticas_boletas(cliente_id: int = None, medidor_id: int = None,
                                   pagada: int = None, sin_comprobante: bool = False,
                                   anio: int = None, mes: int = None):
-    """Obtiene estadisticas de boletas con filtros opcionales."""
+    """Obtiene estadisticas de boletas con filtros opcionales.
+
+    Filtrando solo por periodo (o sin filtros) se leen del resumen por
+    periodo en vez de recorrer las boletas.
+    """
+    if cliente_id is None and medidor_id is None and pagada is None and not sin_comprobante:
+        resumen = obtener_resumen_periodos(anio, mes)
+        return {
+            'total': resumen['boletas_total'],
+            'pagadas': resumen['boletas_pagadas'],
+            'en_revision': resumen['boletas_en_revision'],
+            'pendientes': resumen['boletas_pendientes'],
+            'sin_comprobante': resumen['boletas_sin_comprobante'],
+            'monto_total': resumen['monto_total'],
+            'monto_pagado': resumen['monto_pagado'],
+            'monto_en_revision': resumen['monto_en_revision'],
+            'monto_pendiente': resumen['monto_pendiente']
+        }
+
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -381,30 +560,8 @@ def obtener_estadisticas_boletas(cliente_id: int = None, medidor_id: int = None,
         JOIN clientes c ON m.cliente_id = c.id
         WHERE 1=1
     '''
-    params = []
-
-    if cliente_id is not None:
-        query += ' AND c.id = %s'
-        params.append(cliente_id)
-
-    if medidor_id is not None:
-        query += ' AND b.medidor_id = %s'
-        params.append(medidor_id)
-
-    if pagada is not None:
-        query += ' AND b.pagada = %s'
-        params.append(pagada)
-
-    if sin_comprobante:
-        query += ' AND b.pagada = 2 AND (b.comprobante_path IS NULL OR b.comprobante_path = \'\')'
-
-    if anio is not None:
-        query += ' AND b.periodo_anio = %s'
-        params.append(anio)
-
-    if mes is not None:
-        query += ' AND b.periodo_mes = %s'
-        params.append(mes)
+    filtros_sql, params = _filtros_boletas(cliente_id, medidor_id, pagada, sin_comprobante, anio, mes)
+    query += filtros_sql
 
     cursor.execute(query, params)
     stats = cursor.fetchone()
@@ -574,9 +731,10 @@ def obtener_intento_en_revision(boleta_id: int) -> Optional[Dict]:
 
 def registrar_envio_boleta(boleta_id: int, usuario_id: int, canal: str,
                             destinatario: str, estado: str = 'enviado',
-                            mensaje_error: str = None) -> int:
+                            mensaje_error: str = None, mensaje_id: str = None) -> int:
     """
-    Registra un envio de boleta en el historial.
+    Registra un envio de boleta en el historial y actualiza, en la misma
+    transaccion, el resumen de envios de la boleta (resumen_envios_boleta).
 
     Args:
         boleta_id: ID de la boleta enviada
@@ -585,6 +743,7 @@ def registrar_envio_boleta(boleta_id: int, usuario_id: int, canal: str,
         destinatario: Telefono o email del destinatario
         estado: Estado del envio (enviado, fallido)
         mensaje_error: Mensaje de error si el envio fallo
+        mensaje_id: ID del mensaje en el proveedor (para los estados de entrega)
 
     Returns:
         ID del registro de envio creado
@@ -593,17 +752,100 @@ def registrar_envio_boleta(boleta_id: int, usuario_id: int, canal: str,
     cursor = conn.cursor()
 
     cursor.execute('''
-        INSERT INTO envios_boletas (boleta_id, usuario_id, canal, destinatario, estado, mensaje_error)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id
-    ''', (boleta_id, usuario_id, canal, destinatario, estado, mensaje_error))
+        INSERT INTO envios_boletas (boleta_id, usuario_id, canal, destinatario, estado, mensaje_error, mensaje_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        RETURNING id, created_at
+    ''', (boleta_id, usuario_id, canal, destinatario, estado, mensaje_error, mensaje_id))
+    envio = cursor.fetchone()
+    envio_id = envio['id']
+
+    # Resumen de la boleta: el conteo y el ultimo envio exitoso solo cambian
+    # con un envio exitoso; el estado de entrega puede haber llegado antes
+    # que el registro del envio
+    exitoso = estado == 'enviado'
+    cursor.execute('''
+        INSERT INTO resumen_envios_boleta AS r
+            (boleta_id, envios_count, ultimo_envio, ultimo_envio_id,
+             ultimo_canal, ultimo_estado, ultimo_intento_at, nivel_entrega)
+        VALUES (%s, %s, %s, %s, %s, %s, %s,
+                (SELECT nivel FROM estados_entrega_envio WHERE mensaje_id = %s AND %s))
+        ON CONFLICT (boleta_id) DO UPDATE SET
+            envios_count = r.envios_count + EXCLUDED.envios_count,
+            ultimo_envio = COALESCE(EXCLUDED.ultimo_envio, r.ultimo_envio),
+            ultimo_envio_id = COALESCE(EXCLUDED.ultimo_envio_id, r.ultimo_envio_id),
+            ultimo_canal = EXCLUDED.ultimo_canal,
+            ultimo_estado = EXCLUDED.ultimo_estado,
+            ultimo_intento_at = EXCLUDED.ultimo_intento_at,
+            nivel_entrega = GREATEST(r.nivel_entrega, EXCLUDED.nivel_entrega)
+    ''', (boleta_id, 1 if exitoso else 0,
+          envio['created_at'] if exitoso else None, envio_id if exitoso else None,
+          canal, estado, envio['created_at'], mensaje_id, exitoso))
 
-    envio_id = cursor.fetchone()[0]
     conn.commit()
     conn.close()
     return envio_id
 
 
+def guardar_estados_entrega(estados: List[Dict]) -> int:
+    """
+    Guarda un lote de estados de entrega con un unico INSERT multi-fila.
+
+    Cada dict trae mensaje_id, estado, nivel, entregado_at, leido_at y error
+    (un solo dict por mensaje_id). Es idempotente: un estado repetido o de
+    menor nivel que el guardado no lo hace retroceder, y las fechas se
+    conservan desde el primer aviso.
+
+    Tambien sube el nivel de entrega en el resumen de las boletas de esos
+    mensajes, en la misma transaccion.
+
+    Returns:
+        Cantidad de mensajes insertados o actualizados
+    """
+    if not estados:
+        return 0
+
+    valores = []
+    for estado in estados:
+        valores.extend([estado['mensaje_id'], estado['estado'], estado['nivel'],
+                        estado.get('entregado_at'), estado.get('leido_at'), estado.get('error')])
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        INSERT INTO estados_entrega_envio AS ee
+            (mensaje_id, estado, nivel, entregado_at, leido_at, error)
+        VALUES {', '.join(['(%s, %s, %s, %s::timestamp, %s::timestamp, %s)'] * len(estados))}
+        ON CONFLICT (mensaje_id) DO UPDATE SET
+            estado = CASE WHEN EXCLUDED.nivel > ee.nivel THEN EXCLUDED.estado ELSE ee.estado END,
+            nivel = GREATEST(ee.nivel, EXCLUDED.nivel),
+            entregado_at = COALESCE(ee.entregado_at, EXCLUDED.entregado_at),
+            leido_at = COALESCE(ee.leido_at, EXCLUDED.leido_at),
+            error = COALESCE(EXCLUDED.error, ee.error),
+            actualizado_at = CURRENT_TIMESTAMP
+        WHERE EXCLUDED.nivel > ee.nivel
+           OR (EXCLUDED.entregado_at IS NOT NULL AND ee.entregado_at IS NULL)
+           OR (EXCLUDED.leido_at IS NOT NULL AND ee.leido_at IS NULL)
+    ''', valores)
+    afectados = cursor.rowcount
+
+    if afectados:
+        cursor.execute('''
+            UPDATE resumen_envios_boleta r
+            SET nivel_entrega = n.nivel
+            FROM (
+                SELECT e.boleta_id, MAX(ee.nivel) as nivel
+                FROM envios_boletas e
+                JOIN estados_entrega_envio ee ON ee.mensaje_id = e.mensaje_id
+                WHERE e.mensaje_id = ANY(%s) AND e.estado = 'enviado'
+                GROUP BY e.boleta_id
+            ) n
+            WHERE r.boleta_id = n.boleta_id AND n.nivel > COALESCE(r.nivel_entrega, 0)
+        ''', ([estado['mensaje_id'] for estado in estados],))
+    conn.commit()
+    conn.close()
+    return afectados
+
+
 def obtener_envios_boleta(boleta_id: int) -> List[Dict]:
     """
     Obtiene el historial de envios de una boleta.
@@ -618,9 +860,11 @@ def obtener_envios_boleta(boleta_id: int) -> List[Dict]:
     cursor = conn.cursor()
 
     cursor.execute('''
-        SELECT e.*, u.nombre_completo as usuario_nombre, u.username
+        SELECT e.*, u.nombre_completo as usuario_nombre, u.username,
+               ee.estado as estado_entrega, ee.entregado_at, ee.leido_at
         FROM envios_boletas e
         LEFT JOIN usuarios u ON e.usuario_id = u.id
+        LEFT JOIN estados_entrega_envio ee ON ee.mensaje_id = e.mensaje_id
         WHERE e.boleta_id = %s
         ORDER BY e.created_at DESC
     ''', (boleta_id,))
@@ -645,11 +889,10 @@ def obtener_ultimo_envio_boleta(boleta_id: int) -> Optional[Dict]:
 
     cursor.execute('''
         SELECT e.*, u.nombre_completo as usuario_nombre
-        FROM envios_boletas e
+        FROM resumen_envios_boleta r
+        JOIN envios_boletas e ON e.id = r.ultimo_envio_id
         LEFT JOIN usuarios u ON e.usuario_id = u.id
-        WHERE e.boleta_id = %s AND e.estado = 'enviado'
-        ORDER BY e.created_at DESC
-        LIMIT 1
+        WHERE r.boleta_id = %s
     ''', (boleta_id,))
 
     envio = cursor.fetchone()
@@ -671,9 +914,9 @@ def contar_envios_boleta(boleta_id: int) -> int:
     cursor = conn.cursor()
 
     cursor.execute('''
-        SELECT COUNT(*) as total
-        FROM envios_boletas
-        WHERE boleta_id = %s AND estado = 'enviado'
+        SELECT envios_count as total
+        FROM resumen_envios_boleta
+        WHERE boleta_id = %s
     ''', (boleta_id,))
 
     resultado = cursor.fetchone()
@@ -0,0 +1,198 @@
+"""
+Modelos para la cola persistente de envios (outbox)
+"""
+from typing import Dict, List, Optional
+from src.database import get_connection
+
+
+def encolar_envio(destinatario: str, clave_idempotencia: str, canal: str = 'whatsapp',
+                  boleta_id: int = None, mensaje: str = None, usuario_id: int = None,
+                  log_envio_id: int = None, max_intentos: int = 5) -> int:
+    """
+    Agrega un envio a la cola. Si ya existe uno con la misma clave de
+    idempotencia no se duplica y se retorna el id existente.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO cola_envios
+        (canal, boleta_id, destinatario, mensaje, usuario_id, log_envio_id,
+         clave_idempotencia, max_intentos)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (clave_idempotencia) DO NOTHING
+        RETURNING id
+    ''', (canal, boleta_id, destinatario, mensaje, usuario_id, log_envio_id,
+          clave_idempotencia, max_intentos))
+    row = cursor.fetchone()
+
+    if not row:
+        cursor.execute('SELECT id FROM cola_envios WHERE clave_idempotencia = %s',
+                       (clave_idempotencia,))
+        row = cursor.fetchone()
+
+    conn.commit()
+    conn.close()
+    return row['id']
+
+
+def encolar_envios_masivo(envios: List[Dict]) -> int:
+    """
+    Encola varios envios en una sola conexion y transaccion.
+    Cada dict trae las mismas claves que los parametros de encolar_envio.
+    Retorna la cantidad de envios nuevos (los duplicados se ignoran).
+    """
+    if not envios:
+        return 0
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    nuevos = 0
+    for envio in envios:
+        cursor.execute('''
+            INSERT INTO cola_envios
+            (canal, boleta_id, destinatario, mensaje, usuario_id, log_envio_id,
+             clave_idempotencia, max_intentos)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (clave_idempotencia) DO NOTHING
+        ''', (envio.get('canal', 'whatsapp'), envio.get('boleta_id'), envio['destinatario'],
+              envio.get('mensaje'), envio.get('usuario_id'), envio.get('log_envio_id'),
+              envio['clave_idempotencia'], envio.get('max_intentos', 5)))
+        nuevos += cursor.rowcount
+
+    conn.commit()
+    conn.close()
+    return nuevos
+
+
+def reclamar_envios(limite: int = 10, bloqueo_segundos: int = 300) -> List[Dict]:
+    """
+    Reclama envios listos para procesar y los marca como 'procesando'.
+
+    Usa FOR UPDATE SKIP LOCKED para que varios workers (threads o procesos)
+    no tomen la misma fila. Tambien recupera filas 'procesando' cuyo
+    bloqueo vencio (worker caido a mitad de un envio).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        UPDATE cola_envios
+        SET estado = 'procesando',
+            intentos = intentos + 1,
+            bloqueado_hasta = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT id FROM cola_envios
+            WHERE (estado = 'pendiente' AND proximo_intento_at <= CURRENT_TIMESTAMP)
+               OR (estado = 'procesando' AND bloqueado_hasta < CURRENT_TIMESTAMP)
+            ORDER BY proximo_intento_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ''', (bloqueo_segundos, limite))
+
+    rows = cursor.fetchall()
+    conn.commit()
+    conn.close()
+
+    return [dict(row) for row in rows]
+
+
+def marcar_envio_enviado(envio_id: int):
+    """Marca un envio de la cola como enviado."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE cola_envios
+        SET estado = 'enviado', enviado_at = CURRENT_TIMESTAMP,
+            bloqueado_hasta = NULL, ultimo_error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''', (envio_id,))
+    conn.commit()
+    conn.close()
+
+
+def reprogramar_envio(envio_id: int, error: str, segundos: float, contar_intento: bool = True):
+    """
+    Devuelve un envio a 'pendiente' para reintentarlo en `segundos`.
+    Con contar_intento=False el intento no consume el maximo (ej: limite 429).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE cola_envios
+        SET estado = 'pendiente',
+            intentos = CASE WHEN %s THEN intentos ELSE GREATEST(intentos - 1, 0) END,
+            proximo_intento_at = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+            bloqueado_hasta = NULL, ultimo_error = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''', (contar_intento, segundos, error, envio_id))
+    conn.commit()
+    conn.close()
+
+
+def marcar_envio_fallido(envio_id: int, error: str):
+    """Marca un envio como fallido definitivo (sin mas reintentos)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE cola_envios
+        SET estado = 'fallido', bloqueado_hasta = NULL,
+            ultimo_error = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''', (error, envio_id))
+    conn.commit()
+    conn.close()
+
+
+def contar_envios_por_estado(log_envio_id: int = None) -> Dict[str, int]:
+    """Cuenta envios de la cola por estado, opcionalmente de un envio masivo."""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    query = 'SELECT estado, COUNT(*) as total FROM cola_envios'
+    params = []
+    if log_envio_id is not None:
+        query += ' WHERE log_envio_id = %s'
+        params.append(log_envio_id)
+    query += ' GROUP BY estado'
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    conteo = {'pendiente': 0, 'procesando': 0, 'enviado': 0, 'fallido': 0}
+    for row in rows:
+        conteo[row['estado']] = row['total']
+    return conteo
+
+
+def listar_envios_log(log_envio_id: int) -> List[Dict]:
+    """Lista los envios encolados por un envio masivo con datos de la boleta."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT ce.id, ce.boleta_id, ce.destinatario, ce.estado, ce.intentos,
+               ce.ultimo_error, ce.enviado_at,
+               b.numero_boleta, b.cliente_nombre
+        FROM cola_envios ce
+        LEFT JOIN boletas b ON ce.boleta_id = b.id
+        WHERE ce.log_envio_id = %s
+        ORDER BY ce.id
+    ''', (log_envio_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def obtener_envio_cola(envio_id: int) -> Optional[Dict]:
+    """Obtiene un envio de la cola por ID."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM cola_envios WHERE id = %s', (envio_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
@@ -9,35 +9,29 @@ from decimal import Decimal
 from src.database import get_connection
 
 
-def generar_numero_pago() -> str:
-    """Genera un número de pago único con formato PAG-YYYYMM-XXXX."""
-    conn = get_connection()
-    cursor = conn.cursor()
+def generar_numero_pago(cursor) -> str:
+    """
+    Genera un número de pago único con formato PAG-YYYYMM-XXXX.
 
-    ahora = datetime.now()
-    prefijo = f"PAG-{ahora.year}{ahora.month:02d}-"
+    Usa el cursor de la transaccion que inserta el pago: el UPSERT sobre
+    contadores_pago bloquea la fila del mes hasta el commit, asi dos pagos
+    simultaneos no pueden obtener el mismo numero y un rollback no deja
+    saltos en la correlacion.
+    """
+    periodo = datetime.now().strftime('%Y%m')
 
     cursor.execute('''
-        SELECT numero_pago FROM pagos
-        WHERE numero_pago LIKE %s
-        ORDER BY numero_pago DESC
-        LIMIT 1
-    ''', (prefijo + '%',))
-
-    resultado = cursor.fetchone()
-    conn.close()
-
-    if resultado:
-        ultimo_numero = int(resultado['numero_pago'].split('-')[-1])
-        nuevo_numero = ultimo_numero + 1
-    else:
-        nuevo_numero = 1
+        INSERT INTO contadores_pago (periodo, ultimo)
+        VALUES (%s, 1)
+        ON CONFLICT (periodo) DO UPDATE SET ultimo = contadores_pago.ultimo + 1
+        RETURNING ultimo
+    ''', (periodo,))
 
-    return f"{prefijo}{nuevo_numero:04d}"
+    return f"PAG-{periodo}-{cursor.fetchone()['ultimo']:04d}"
 
 
 def obtener_saldo_cliente(cliente_id: int) -> Decimal:
-    """Obtiene el saldo a favor actual del cliente."""
+    """Obtiene el saldo a favor actual del cliente (solo lectura, sin bloqueo)."""
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -52,6 +46,32 @@ def obtener_saldo_cliente(cliente_id: int) -> Decimal:
     return Decimal(str(resultado['saldo_disponible'])) if resultado else Decimal('0')
 
 
+def bloquear_saldo_cliente(cursor, cliente_id: int) -> Decimal:
+    """
+    Lee el saldo del cliente con SELECT ... FOR UPDATE dentro de la
+    transaccion del cursor. Crea la fila en 0 si no existe, para que haya
+    algo que bloquear aun en el primer movimiento.
+
+    Los demas movimientos del mismo cliente esperan hasta el commit o
+    rollback. Todos los caminos de pago bloquean en el mismo orden: saldo
+    del cliente, boletas (por periodo e id), pago existente y al final el
+    contador de numeros (generar_numero_pago).
+    """
+    cursor.execute('''
+        INSERT INTO saldos_cliente (cliente_id, saldo_disponible, ultima_actualizacion)
+        VALUES (%s, 0, CURRENT_TIMESTAMP)
+        ON CONFLICT (cliente_id) DO NOTHING
+    ''', (cliente_id,))
+
+    cursor.execute('''
+        SELECT saldo_disponible FROM saldos_cliente
+        WHERE cliente_id = %s
+        FOR UPDATE
+    ''', (cliente_id,))
+
+    return Decimal(str(cursor.fetchone()['saldo_disponible']))
+
+
 def actualizar_saldo_cliente(cliente_id: int, nuevo_saldo: Decimal,
                              cursor_ext=None) -> bool:
     """Actualiza el saldo disponible del cliente."""
@@ -82,28 +102,27 @@ def actualizar_saldo_cliente(cliente_id: int, nuevo_saldo: Decimal,
             conn.close()
 
 
-def registrar_movimiento_saldo(cliente_id: int, tipo: str, origen: str,
-                                monto: Decimal, descripcion: str = None,
-                                pago_id: int = None, boleta_id: int = None,
-                                usuario_id: int = None,
-                                cursor_ext=None) -> int:
+def registrar_movimientos_saldo(cliente_id: int, movimientos: List[Dict],
+                                 cursor_ext=None) -> List[int]:
     """
-    Registra un movimiento en el historial de saldos.
+    Registra varios movimientos de saldo de un cliente en una sola
+    escritura: la cadena saldo_anterior -> saldo_nuevo se calcula en
+    memoria a partir del saldo bloqueado (bloquear_saldo_cliente), se
+    insertan todas las filas con un INSERT multi-fila y el saldo del
+    cliente se actualiza una vez con el valor final.
 
-    Args:
-        cliente_id: ID del cliente
-        tipo: 'ingreso', 'egreso', 'ajuste'
-        origen: 'excedente_pago', 'aplicacion_boleta', 'ajuste_admin', etc.
-        monto: Monto del movimiento (positivo para ingreso, negativo para egreso)
-        descripcion: Descripción opcional
-        pago_id: ID del pago relacionado (opcional)
-        boleta_id: ID de la boleta relacionada (opcional)
-        usuario_id: ID del usuario que hace el ajuste (opcional)
-        cursor_ext: Cursor externo para participar en transacción existente
+    Cada movimiento es un dict con: tipo, origen, monto y opcionalmente
+    descripcion, pago_id, boleta_id y usuario_id.
 
     Returns:
-        ID del movimiento creado
+        IDs de los movimientos creados, en el mismo orden
+
+    Raises:
+        ValueError: si algun movimiento deja el saldo negativo
     """
+    if not movimientos:
+        return []
+
     conn = None
     if cursor_ext:
         cursor = cursor_ext
@@ -112,26 +131,50 @@ def registrar_movimiento_saldo(cliente_id: int, tipo: str, origen: str,
         cursor = conn.cursor()
 
     try:
-        saldo_anterior = obtener_saldo_cliente(cliente_id)
-        saldo_nuevo = saldo_anterior + monto
+        saldo = bloquear_saldo_cliente(cursor, cliente_id)
+        saldos_anteriores, saldos_nuevos = [], []
+        for movimiento in movimientos:
+            saldo_nuevo = saldo + Decimal(str(movimiento['monto']))
+            if saldo_nuevo < 0:
+                raise ValueError(f"Saldo insuficiente: disponible ${saldo:,.0f}")
+            saldos_anteriores.append(saldo)
+            saldos_nuevos.append(saldo_nuevo)
+            saldo = saldo_nuevo
 
         cursor.execute('''
             INSERT INTO movimientos_saldo
             (cliente_id, tipo, origen, pago_id, boleta_id, monto,
              saldo_anterior, saldo_nuevo, descripcion, usuario_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            SELECT %s, m.tipo, m.origen, m.pago_id, m.boleta_id, m.monto,
+                   m.saldo_anterior, m.saldo_nuevo, m.descripcion, m.usuario_id
+            FROM unnest(%s::varchar[], %s::varchar[], %s::integer[], %s::integer[],
+                        %s::numeric[], %s::numeric[], %s::numeric[], %s::text[], %s::integer[])
+                 WITH ORDINALITY AS m(tipo, origen, pago_id, boleta_id, monto,
+                                      saldo_anterior, saldo_nuevo, descripcion, usuario_id, orden)
+            ORDER BY m.orden
             RETURNING id
-        ''', (cliente_id, tipo, origen, pago_id, boleta_id, monto,
-              saldo_anterior, saldo_nuevo, descripcion, usuario_id))
-
-        movimiento_id = cursor.fetchone()['id']
-
-        # Actualizar saldo del cliente
-        actualizar_saldo_cliente(cliente_id, saldo_nuevo, cursor_ext=cursor)
+        ''', (cliente_id,
+              [m['tipo'] for m in movimientos],
+              [m['origen'] for m in movimientos],
+              [m.get('pago_id') for m in movimientos],
+              [m.get('boleta_id') for m in movimientos],
+              [Decimal(str(m['monto'])) for m in movimientos],
+              saldos_anteriores, saldos_nuevos,
+              [m.get('descripcion') for m in movimientos],
+              [m.get('usuario_id') for m in movimientos]))
+
+        movimientos_ids = sorted(row['id'] for row in cursor.fetchall())
+
+        # Saldo final del cliente (fila ya bloqueada)
+        cursor.execute('''
+            UPDATE saldos_cliente
+            SET saldo_disponible = %s, ultima_actualizacion = CURRENT_TIMESTAMP
+            WHERE cliente_id = %s
+        ''', (saldo, cliente_id))
 
         if conn:
             conn.commit()
-        return movimiento_id
+        return movimientos_ids
     except Exception as e:
         if conn:
             conn.rollback()
@@ -141,6 +184,46 @@ def registrar_movimiento_saldo(cliente_id: int, tipo: str, origen: str,
             conn.close()
 
 
+def registrar_movimiento_saldo(cliente_id: int, tipo: str, origen: str,
+                                monto: Decimal, descripcion: str = None,
+                                pago_id: int = None, boleta_id: int = None,
+                                usuario_id: int = None,
+                                cursor_ext=None) -> int:
+    """
+    Registra un movimiento en el historial de saldos.
+
+    El saldo anterior se lee con bloqueo (bloquear_saldo_cliente) en la
+    misma transaccion, por lo que ve los movimientos aun no confirmados de
+    esa transaccion y serializa los de otras.
+
+    Args:
+        cliente_id: ID del cliente
+        tipo: 'ingreso', 'egreso', 'ajuste'
+        origen: 'excedente_pago', 'aplicacion_boleta', 'ajuste_admin', etc.
+        monto: Monto del movimiento (positivo para ingreso, negativo para egreso)
+        descripcion: Descripción opcional
+        pago_id: ID del pago relacionado (opcional)
+        boleta_id: ID de la boleta relacionada (opcional)
+        usuario_id: ID del usuario que hace el ajuste (opcional)
+        cursor_ext: Cursor externo para participar en transacción existente
+
+    Returns:
+        ID del movimiento creado
+
+    Raises:
+        ValueError: si el movimiento deja el saldo negativo
+    """
+    return registrar_movimientos_saldo(cliente_id, [{
+        'tipo': tipo,
+        'origen': origen,
+        'monto': monto,
+        'descripcion': descripcion,
+        'pago_id': pago_id,
+        'boleta_id': boleta_id,
+        'usuario_id': usuario_id
+    }], cursor_ext=cursor_ext)[0]
+
+
 def registrar_pago(cliente_id: int, monto_total: Decimal,
                    boletas_ids: List[int], comprobante_path: str = None,
                    metodo_pago: str = 'transferencia',
@@ -167,50 +250,43 @@ def registrar_pago(cliente_id: int, monto_total: Decimal,
     cursor = conn.cursor()
 
     try:
-        numero_pago = generar_numero_pago()
-
-        # Obtener saldo disponible del cliente
+        # Obtener saldo disponible del cliente (bloqueado hasta el commit)
         saldo_disponible = Decimal('0')
         if usar_saldo:
-            saldo_disponible = obtener_saldo_cliente(cliente_id)
+            saldo_disponible = bloquear_saldo_cliente(cursor, cliente_id)
 
         # Monto total disponible para aplicar
         monto_disponible = Decimal(str(monto_total)) + saldo_disponible
 
+        # Reparto del pago entre las boletas, calculado en memoria
+        resultado = _asignar_pago(_bloquear_boletas(cursor, boletas_ids),
+                                  monto_disponible, saldo_disponible)
+
         # Determinar estado inicial
         estado = 'en_revision' if comprobante_path else 'pendiente'
 
-        # Crear registro de pago
+        # Crear registro de pago con sus totales
+        numero_pago = generar_numero_pago(cursor)
         cursor.execute('''
             INSERT INTO pagos (numero_pago, cliente_id, monto_total,
+                              monto_aplicado, monto_a_favor,
                               comprobante_path, metodo_pago, estado,
                               fecha_pago, fecha_envio, notas)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_DATE, %s)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_DATE, %s)
             RETURNING id
-        ''', (numero_pago, cliente_id, monto_total, comprobante_path,
-              metodo_pago, estado, fecha_pago or date.today(), notas))
+        ''', (numero_pago, cliente_id, monto_total,
+              resultado['monto_aplicado'], resultado['saldo_generado'],
+              comprobante_path, metodo_pago, estado, fecha_pago or date.today(), notas))
 
         pago_id = cursor.fetchone()['id']
 
-        # Aplicar pago a boletas
-        resultado = _aplicar_pago_a_boletas(
-            cursor, pago_id, cliente_id,
-            monto_disponible, boletas_ids, saldo_disponible
-        )
-
-        # Actualizar totales del pago
-        cursor.execute('''
-            UPDATE pagos
-            SET monto_aplicado = %s, monto_a_favor = %s
-            WHERE id = %s
-        ''', (resultado['monto_aplicado'], resultado['saldo_generado'], pago_id))
+        _insertar_pago_boletas(cursor, pago_id, resultado['asignaciones'])
 
         # Actualizar estado de boletas a "En Revisión"
-        for boleta_id in resultado['boletas_afectadas']:
-            cursor.execute('''
-                UPDATE boletas SET pagada = 1, comprobante_path = %s
-                WHERE id = %s AND pagada = 0
-            ''', (comprobante_path, boleta_id,))
+        cursor.execute('''
+            UPDATE boletas SET pagada = 1, comprobante_path = %s
+            WHERE id = ANY(%s) AND pagada = 0
+        ''', (comprobante_path, resultado['boletas_afectadas']))
 
         conn.commit()
 
@@ -228,66 +304,130 @@ def registrar_pago(cliente_id: int, monto_total: Decimal,
         conn.close()
 
 
-def _aplicar_pago_a_boletas(cursor, pago_id: int, cliente_id: int,
-                            monto_disponible: Decimal, boletas_ids: List[int],
-                            saldo_usado: Decimal = Decimal('0')) -> Dict:
+def _bloquear_boletas(cursor, boletas_ids: List[int]) -> List[Dict]:
     """
-    Distribuye el monto disponible entre las boletas seleccionadas.
-    Esta es una función interna que usa el cursor existente.
-
-    Returns:
-        dict con: monto_aplicado, saldo_generado, boletas_afectadas, detalles
+    Boletas con saldo pendiente de la lista, ordenadas por periodo (más
+    antigua primero) y bloqueadas con FOR UPDATE hasta el fin de la
+    transaccion. El orden fijo evita interbloqueos entre pagos que tocan
+    las mismas boletas.
     """
-    monto_restante = monto_disponible
-    monto_aplicado_total = Decimal('0')
-    boletas_afectadas = []
-    detalles = []
-
-    # Ordenar boletas por periodo (más antigua primero)
     cursor.execute('''
         SELECT id, total, monto_pagado, saldo_pendiente
         FROM boletas
         WHERE id = ANY(%s) AND saldo_pendiente > 0
-        ORDER BY periodo_anio ASC, periodo_mes ASC
+        ORDER BY periodo_anio ASC, periodo_mes ASC, id ASC
+        FOR UPDATE
     ''', (boletas_ids,))
-    boletas_ordenadas = cursor.fetchall()
+    return cursor.fetchall()
+
+
+def _bloquear_boletas_de_pago(cursor, pago_id: int) -> List[Dict]:
+    """
+    Aplicaciones (pago_boletas) de un pago con el saldo pendiente actual de
+    cada boleta, bloqueadas en el mismo orden que _bloquear_boletas.
+    """
+    cursor.execute('''
+        SELECT pb.*, b.saldo_pendiente FROM pago_boletas pb
+        JOIN boletas b ON b.id = pb.boleta_id
+        WHERE pb.pago_id = %s
+        ORDER BY b.periodo_anio ASC, b.periodo_mes ASC, b.id ASC
+        FOR UPDATE OF b
+    ''', (pago_id,))
+    return cursor.fetchall()
+
+
+def _bloquear_pago_en_revision(cursor, pago_id: int) -> Optional[Dict]:
+    """
+    Bloquea el pago si sigue en revision (despues de sus boletas). Una
+    segunda aprobacion o rechazo simultaneo espera y luego ya no lo
+    encuentra en revision.
+    """
+    cursor.execute('''
+        SELECT * FROM pagos WHERE id = %s AND estado = 'en_revision'
+        FOR UPDATE
+    ''', (pago_id,))
+    return cursor.fetchone()
+
+
+def _asignar_pago(boletas_ordenadas: List[Dict], monto_disponible: Decimal,
+                  saldo_usado: Decimal = Decimal('0')) -> Dict:
+    """
+    Distribuye el monto disponible entre las boletas, más antigua primero.
+    Solo calcula: el reparto se escribe despues con sentencias multi-fila
+    (_insertar_pago_boletas, _abonar_boletas, registrar_movimientos_saldo).
+
+    Returns:
+        dict con: asignaciones (boleta_id, monto_aplicado, es_completo),
+        monto_aplicado, saldo_generado, saldo_usado, boletas_afectadas, detalles
+    """
+    monto_restante = Decimal(str(monto_disponible))
+    asignaciones = []
 
     for boleta in boletas_ordenadas:
         if monto_restante <= 0:
             break
 
-        boleta_id = boleta['id']
         saldo_boleta = Decimal(str(boleta['saldo_pendiente']))
         monto_aplicar = min(monto_restante, saldo_boleta)
-        es_completo = (monto_aplicar >= saldo_boleta)
-
-        # Registrar en pago_boletas
-        cursor.execute('''
-            INSERT INTO pago_boletas (pago_id, boleta_id, monto_aplicado, es_pago_completo)
-            VALUES (%s, %s, %s, %s)
-        ''', (pago_id, boleta_id, monto_aplicar, es_completo))
-
-        monto_restante -= monto_aplicar
-        monto_aplicado_total += monto_aplicar
-        boletas_afectadas.append(boleta_id)
-        detalles.append({
-            'boleta_id': boleta_id,
-            'monto_aplicado': float(monto_aplicar),
-            'es_completo': es_completo
+        asignaciones.append({
+            'boleta_id': boleta['id'],
+            'monto_aplicado': monto_aplicar,
+            'es_completo': monto_aplicar >= saldo_boleta
         })
-
-    # Calcular saldo a favor (si sobró dinero)
-    saldo_generado = max(Decimal('0'), monto_restante)
+        monto_restante -= monto_aplicar
 
     return {
-        'monto_aplicado': monto_aplicado_total,
-        'saldo_generado': saldo_generado,
+        'asignaciones': asignaciones,
+        'monto_aplicado': sum((a['monto_aplicado'] for a in asignaciones), Decimal('0')),
+        # Saldo a favor (si sobró dinero)
+        'saldo_generado': max(Decimal('0'), monto_restante),
         'saldo_usado': saldo_usado,
-        'boletas_afectadas': boletas_afectadas,
-        'detalles': detalles
+        'boletas_afectadas': [a['boleta_id'] for a in asignaciones],
+        'detalles': [{'boleta_id': a['boleta_id'],
+                      'monto_aplicado': float(a['monto_aplicado']),
+                      'es_completo': a['es_completo']} for a in asignaciones]
     }
 
 
+def _insertar_pago_boletas(cursor, pago_id: int, asignaciones: List[Dict]):
+    """Relaciones pago-boletas de un reparto, en un solo INSERT."""
+    if not asignaciones:
+        return
+
+    cursor.execute('''
+        INSERT INTO pago_boletas (pago_id, boleta_id, monto_aplicado, es_pago_completo)
+        SELECT %s, a.boleta_id, a.monto, a.completo
+        FROM unnest(%s::integer[], %s::numeric[], %s::boolean[]) AS a(boleta_id, monto, completo)
+    ''', (pago_id,
+          [a['boleta_id'] for a in asignaciones],
+          [a['monto_aplicado'] for a in asignaciones],
+          [a['es_completo'] for a in asignaciones]))
+
+
+def _abonar_boletas(cursor, asignaciones: List[Dict], metodo_pago: str,
+                    fecha_pago: date, comprobante_path: str = None):
+    """
+    Abona los montos a las boletas en un solo UPDATE ... FROM. La boleta
+    queda pagada (2) si su saldo llega a 0 y pendiente (0) si no.
+    """
+    if not asignaciones:
+        return
+
+    cursor.execute('''
+        UPDATE boletas b
+        SET monto_pagado = b.monto_pagado + a.monto,
+            saldo_pendiente = b.saldo_pendiente - a.monto,
+            pagada = CASE WHEN b.saldo_pendiente - a.monto <= 0 THEN 2 ELSE 0 END,
+            fecha_pago = CASE WHEN b.saldo_pendiente - a.monto <= 0 THEN %s ELSE b.fecha_pago END,
+            metodo_pago = %s,
+            comprobante_path = COALESCE(%s, b.comprobante_path)
+        FROM unnest(%s::integer[], %s::numeric[]) AS a(boleta_id, monto)
+        WHERE b.id = a.boleta_id
+    ''', (fecha_pago, metodo_pago, comprobante_path,
+          [a['boleta_id'] for a in asignaciones],
+          [Decimal(str(a['monto_aplicado'])) for a in asignaciones]))
+
+
 def aprobar_pago(pago_id: int, usuario_id: int = None) -> Tuple[bool, str]:
     """
     Aprueba un pago y aplica efectivamente los montos a las boletas.
@@ -303,43 +443,59 @@ def aprobar_pago(pago_id: int, usuario_id: int = None) -> Tuple[bool, str]:
     cursor = conn.cursor()
 
     try:
-        # Obtener pago
+        # Cliente del pago (sin bloqueo, solo para saber que saldo bloquear)
         cursor.execute('''
-            SELECT * FROM pagos WHERE id = %s AND estado = 'en_revision'
+            SELECT cliente_id FROM pagos WHERE id = %s AND estado = 'en_revision'
         ''', (pago_id,))
-        pago = cursor.fetchone()
+        pendiente = cursor.fetchone()
 
-        if not pago:
+        if not pendiente:
             return False, "Pago no encontrado o no está en revisión"
 
-        # Obtener aplicaciones de boletas
-        cursor.execute('''
-            SELECT * FROM pago_boletas WHERE pago_id = %s
-        ''', (pago_id,))
-        aplicaciones = cursor.fetchall()
+        # Orden de bloqueo comun a todos los pagos: saldo, boletas y pago
+        bloquear_saldo_cliente(cursor, pendiente['cliente_id'])
+        aplicaciones = _bloquear_boletas_de_pago(cursor, pago_id)
+        pago = _bloquear_pago_en_revision(cursor, pago_id)
 
-        # Actualizar cada boleta
-        for app in aplicaciones:
-            monto = Decimal(str(app['monto_aplicado']))
+        if not pago:
+            conn.rollback()
+            return False, "Pago no encontrado o no está en revisión"
 
+        # Lo asignado al enviar el pago puede superar el saldo actual de la
+        # boleta si se pago por otro camino mientras estaba en revision: se
+        # abona solo lo pendiente y la diferencia pasa a saldo a favor
+        monto_a_favor = Decimal(str(pago['monto_a_favor']))
+        asignaciones, ajustadas = [], []
+        for aplicacion in aplicaciones:
+            asignado = Decimal(str(aplicacion['monto_aplicado']))
+            pendiente_boleta = max(Decimal('0'), Decimal(str(aplicacion['saldo_pendiente'])))
+            monto = min(asignado, pendiente_boleta)
+            asignacion = {
+                'boleta_id': aplicacion['boleta_id'],
+                'monto_aplicado': monto,
+                'es_completo': monto >= pendiente_boleta
+            }
+            if monto < asignado:
+                monto_a_favor += asignado - monto
+                ajustadas.append(asignacion)
+            if monto > 0:
+                asignaciones.append(asignacion)
+
+        if ajustadas:
             cursor.execute('''
-                UPDATE boletas
-                SET monto_pagado = monto_pagado + %s,
-                    saldo_pendiente = saldo_pendiente - %s,
-                    pagada = CASE
-                        WHEN saldo_pendiente - %s <= 0 THEN 2
-                        ELSE 0
-                    END,
-                    fecha_pago = CASE
-                        WHEN saldo_pendiente - %s <= 0 THEN CURRENT_DATE
-                        ELSE fecha_pago
-                    END,
-                    metodo_pago = %s
-                WHERE id = %s
-            ''', (monto, monto, monto, monto, pago['metodo_pago'], app['boleta_id']))
+                UPDATE pago_boletas pb
+                SET monto_aplicado = a.monto, es_pago_completo = a.completo
+                FROM unnest(%s::integer[], %s::numeric[], %s::boolean[]) AS a(boleta_id, monto, completo)
+                WHERE pb.pago_id = %s AND pb.boleta_id = a.boleta_id
+            ''', ([a['boleta_id'] for a in ajustadas],
+                  [a['monto_aplicado'] for a in ajustadas],
+                  [a['es_completo'] for a in ajustadas],
+                  pago_id))
+
+        # Abonar todas las boletas del pago en un solo UPDATE
+        _abonar_boletas(cursor, asignaciones, pago['metodo_pago'], date.today())
 
         # Generar saldo a favor si hay excedente
-        monto_a_favor = Decimal(str(pago['monto_a_favor']))
         if monto_a_favor > 0:
             registrar_movimiento_saldo(
                 cliente_id=pago['cliente_id'],
@@ -352,15 +508,18 @@ def aprobar_pago(pago_id: int, usuario_id: int = None) -> Tuple[bool, str]:
                 cursor_ext=cursor
             )
 
-        # Actualizar estado del pago
+        # Actualizar estado y totales del pago
         cursor.execute('''
             UPDATE pagos
             SET estado = 'aprobado',
+                monto_aplicado = %s,
+                monto_a_favor = %s,
                 fecha_procesamiento = CURRENT_DATE,
                 procesado_por = %s,
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        ''', (usuario_id, pago_id))
+        ''', (sum((a['monto_aplicado'] for a in asignaciones), Decimal('0')),
+              monto_a_favor, usuario_id, pago_id))
 
         conn.commit()
         return True, "Pago aprobado exitosamente"
@@ -388,21 +547,12 @@ def rechazar_pago(pago_id: int, motivo: str, usuario_id: int = None) -> Tuple[bo
     cursor = conn.cursor()
 
     try:
-        # Obtener pago
-        cursor.execute('''
-            SELECT * FROM pagos WHERE id = %s AND estado = 'en_revision'
-        ''', (pago_id,))
-        pago = cursor.fetchone()
-
-        if not pago:
+        # Orden de bloqueo comun a todos los pagos: boletas y luego el pago
+        boletas = _bloquear_boletas_de_pago(cursor, pago_id)
+        if not _bloquear_pago_en_revision(cursor, pago_id):
+            conn.rollback()
             return False, "Pago no encontrado o no está en revisión"
 
-        # Obtener boletas afectadas
-        cursor.execute('''
-            SELECT boleta_id FROM pago_boletas WHERE pago_id = %s
-        ''', (pago_id,))
-        boletas = cursor.fetchall()
-
         # Revertir boletas a estado pendiente (solo si no tienen otros pagos en revisión)
         for b in boletas:
             # Verificar si la boleta tiene otros pagos en revisión
@@ -465,77 +615,36 @@ def registrar_pago_directo(cliente_id: int, monto_total: Decimal,
     cursor = conn.cursor()
 
     try:
-        numero_pago = generar_numero_pago()
         monto_total = Decimal(str(monto_total))
 
-        # Crear registro de pago con estado aprobado
+        # Orden de bloqueo: saldo (por si queda excedente), boletas y por
+        # ultimo el contador de numeros, que se retiene el menor tiempo
+        bloquear_saldo_cliente(cursor, cliente_id)
+        reparto = _asignar_pago(_bloquear_boletas(cursor, boletas_ids), monto_total)
+        monto_aplicado_total = reparto['monto_aplicado']
+        saldo_generado = reparto['saldo_generado']
+        boletas_afectadas = reparto['boletas_afectadas']
+        numero_pago = generar_numero_pago(cursor)
+
+        # Crear registro de pago con estado aprobado y sus totales
         cursor.execute('''
             INSERT INTO pagos (numero_pago, cliente_id, monto_total,
+                              monto_aplicado, monto_a_favor,
                               metodo_pago, estado, fecha_pago, fecha_envio,
                               fecha_procesamiento, procesado_por, notas,
                               comprobante_path)
-            VALUES (%s, %s, %s, %s, 'aprobado', %s, CURRENT_DATE,
+            VALUES (%s, %s, %s, %s, %s, %s, 'aprobado', %s, CURRENT_DATE,
                     CURRENT_DATE, %s, %s, %s)
             RETURNING id
-        ''', (numero_pago, cliente_id, monto_total, metodo_pago,
-              fecha_pago or date.today(), usuario_id, notas, comprobante_path))
+        ''', (numero_pago, cliente_id, monto_total, monto_aplicado_total, saldo_generado,
+              metodo_pago, fecha_pago or date.today(), usuario_id, notas, comprobante_path))
 
         pago_id = cursor.fetchone()['id']
 
         # Aplicar pago a boletas (ordenadas por periodo, más antigua primero)
-        monto_restante = monto_total
-        monto_aplicado_total = Decimal('0')
-        boletas_afectadas = []
-
-        cursor.execute('''
-            SELECT id, total, saldo_pendiente
-            FROM boletas
-            WHERE id = ANY(%s) AND saldo_pendiente > 0
-            ORDER BY periodo_anio ASC, periodo_mes ASC
-        ''', (boletas_ids,))
-        boletas_ordenadas = cursor.fetchall()
-
-        for boleta in boletas_ordenadas:
-            if monto_restante <= 0:
-                break
-
-            boleta_id = boleta['id']
-            saldo_boleta = Decimal(str(boleta['saldo_pendiente']))
-            monto_aplicar = min(monto_restante, saldo_boleta)
-            es_completo = (monto_aplicar >= saldo_boleta)
-
-            # Registrar relación
-            cursor.execute('''
-                INSERT INTO pago_boletas (pago_id, boleta_id, monto_aplicado, es_pago_completo)
-                VALUES (%s, %s, %s, %s)
-            ''', (pago_id, boleta_id, monto_aplicar, es_completo))
-
-            # Actualizar boleta
-            nuevo_estado = 2 if es_completo else 0
-            cursor.execute('''
-                UPDATE boletas
-                SET monto_pagado = monto_pagado + %s,
-                    saldo_pendiente = saldo_pendiente - %s,
-                    pagada = %s,
-                    fecha_pago = CASE WHEN %s = 2 THEN %s ELSE fecha_pago END,
-                    metodo_pago = %s,
-                    comprobante_path = COALESCE(%s, comprobante_path)
-                WHERE id = %s
-            ''', (monto_aplicar, monto_aplicar, nuevo_estado,
-                  nuevo_estado, fecha_pago or date.today(), metodo_pago,
-                  comprobante_path, boleta_id))
-
-            monto_restante -= monto_aplicar
-            monto_aplicado_total += monto_aplicar
-            boletas_afectadas.append(boleta_id)
-
-        # Calcular saldo a favor
-        saldo_generado = max(Decimal('0'), monto_restante)
-
-        # Actualizar totales del pago
-        cursor.execute('''
-            UPDATE pagos SET monto_aplicado = %s, monto_a_favor = %s WHERE id = %s
-        ''', (monto_aplicado_total, saldo_generado, pago_id))
+        _insertar_pago_boletas(cursor, pago_id, reparto['asignaciones'])
+        _abonar_boletas(cursor, reparto['asignaciones'], metodo_pago,
+                        fecha_pago or date.today(), comprobante_path)
 
         # Si hay excedente, agregarlo al saldo del cliente
         if saldo_generado > 0:
@@ -665,6 +774,30 @@ def obtener_pago(pago_id: int) -> Optional[Dict]:
     return resultado
 
 
+def comprobante_pertenece_a_cliente(comprobante_path: str, cliente_id: int) -> bool:
+    """
+    True si el comprobante corresponde a un pago del cliente o a una boleta
+    de uno de sus medidores (acceso desde el portal).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT EXISTS (
+            SELECT 1 FROM pagos
+            WHERE comprobante_path = %s AND cliente_id = %s
+        ) OR EXISTS (
+            SELECT 1 FROM boletas b
+            JOIN medidores m ON b.medidor_id = m.id
+            WHERE b.comprobante_path = %s AND m.cliente_id = %s
+        ) as pertenece
+    ''', (comprobante_path, cliente_id, comprobante_path, cliente_id))
+    pertenece = cursor.fetchone()['pertenece']
+    conn.close()
+
+    return bool(pertenece)
+
+
 def obtener_resumen_cuenta_cliente(cliente_id: int) -> Dict:
     """
     Obtiene resumen completo de la cuenta del cliente.
@@ -751,26 +884,36 @@ def ajustar_saldo_cliente(cliente_id: int, monto: Decimal,
     Returns:
         Tuple (éxito, mensaje)
     """
+    conn = get_connection()
+    cursor = conn.cursor()
+
     try:
-        saldo_actual = obtener_saldo_cliente(cliente_id)
-        nuevo_saldo = saldo_actual + Decimal(str(monto))
+        # Lectura y escritura en la misma transaccion, con el saldo bloqueado
+        monto = Decimal(str(monto))
+        nuevo_saldo = bloquear_saldo_cliente(cursor, cliente_id) + monto
 
         if nuevo_saldo < 0:
+            conn.rollback()
             return False, "El ajuste resultaría en un saldo negativo"
 
         registrar_movimiento_saldo(
             cliente_id=cliente_id,
             tipo='ajuste',
             origen='ajuste_admin',
-            monto=Decimal(str(monto)),
+            monto=monto,
             descripcion=descripcion,
-            usuario_id=usuario_id
+            usuario_id=usuario_id,
+            cursor_ext=cursor
         )
 
+        conn.commit()
         return True, f"Saldo ajustado. Nuevo saldo: ${nuevo_saldo:,.0f}"
 
     except Exception as e:
+        conn.rollback()
         return False, f"Error al ajustar saldo: {str(e)}"
+    finally:
+        conn.close()
 
 
 def obtener_historial_movimientos(cliente_id: int, limit: int = 50) -> List[Dict]:
@@ -810,90 +953,48 @@ def usar_saldo_en_boletas(cliente_id: int, boletas_ids: List[int],
     Returns:
         dict con información del resultado
     """
-    saldo_disponible = obtener_saldo_cliente(cliente_id)
-
-    if saldo_disponible <= 0:
-        raise ValueError("No hay saldo disponible")
-
     conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        numero_pago = generar_numero_pago()
-        monto_usado = Decimal('0')
-        boletas_afectadas = []
+        # El saldo queda bloqueado hasta el commit: otro uso simultaneo del
+        # mismo saldo espera y luego ve el saldo ya descontado
+        saldo_disponible = bloquear_saldo_cliente(cursor, cliente_id)
+
+        if saldo_disponible <= 0:
+            raise ValueError("No hay saldo disponible")
+
+        # Reparto del saldo (boletas ordenadas por periodo, más antigua primero)
+        reparto = _asignar_pago(_bloquear_boletas(cursor, boletas_ids), saldo_disponible)
+        monto_usado = reparto['monto_aplicado']
+        saldo_restante = saldo_disponible - monto_usado
+        numero_pago = generar_numero_pago(cursor)
 
         # Crear pago con estado aprobado (uso de saldo)
         cursor.execute('''
-            INSERT INTO pagos (numero_pago, cliente_id, monto_total,
+            INSERT INTO pagos (numero_pago, cliente_id, monto_total, monto_aplicado,
                               metodo_pago, estado, fecha_pago, fecha_envio,
                               fecha_procesamiento, notas)
-            VALUES (%s, %s, 0, 'saldo_favor', 'aprobado', CURRENT_DATE,
+            VALUES (%s, %s, 0, %s, 'saldo_favor', 'aprobado', CURRENT_DATE,
                     CURRENT_DATE, CURRENT_DATE, 'Pago con saldo a favor')
             RETURNING id
-        ''', (numero_pago, cliente_id))
+        ''', (numero_pago, cliente_id, monto_usado))
 
         pago_id = cursor.fetchone()['id']
 
-        # Aplicar saldo a boletas (ordenadas por periodo, más antigua primero)
-        saldo_restante = saldo_disponible
-
-        cursor.execute('''
-            SELECT id, saldo_pendiente
-            FROM boletas
-            WHERE id = ANY(%s) AND saldo_pendiente > 0
-            ORDER BY periodo_anio ASC, periodo_mes ASC
-        ''', (boletas_ids,))
-        boletas_ordenadas = cursor.fetchall()
-
-        for boleta in boletas_ordenadas:
-            if saldo_restante <= 0:
-                break
-
-            boleta_id = boleta['id']
-            saldo_boleta = Decimal(str(boleta['saldo_pendiente']))
-            monto_aplicar = min(saldo_restante, saldo_boleta)
-            es_completo = (monto_aplicar >= saldo_boleta)
-
-            # Registrar relación
-            cursor.execute('''
-                INSERT INTO pago_boletas (pago_id, boleta_id, monto_aplicado, es_pago_completo)
-                VALUES (%s, %s, %s, %s)
-            ''', (pago_id, boleta_id, monto_aplicar, es_completo))
-
-            # Actualizar boleta
-            nuevo_estado = 2 if es_completo else 0
-            cursor.execute('''
-                UPDATE boletas
-                SET monto_pagado = monto_pagado + %s,
-                    saldo_pendiente = saldo_pendiente - %s,
-                    pagada = %s,
-                    fecha_pago = CASE WHEN %s = 2 THEN CURRENT_DATE ELSE fecha_pago END,
-                    metodo_pago = 'saldo_favor'
-                WHERE id = %s
-            ''', (monto_aplicar, monto_aplicar, nuevo_estado, nuevo_estado, boleta_id))
-
-            # Registrar movimiento de egreso
-            registrar_movimiento_saldo(
-                cliente_id=cliente_id,
-                tipo='egreso',
-                origen='aplicacion_boleta',
-                monto=-monto_aplicar,
-                descripcion=f'Aplicado a boleta {boleta_id}',
-                pago_id=pago_id,
-                boleta_id=boleta_id,
-                usuario_id=usuario_id,
-                cursor_ext=cursor
-            )
-
-            saldo_restante -= monto_aplicar
-            monto_usado += monto_aplicar
-            boletas_afectadas.append(boleta_id)
+        _insertar_pago_boletas(cursor, pago_id, reparto['asignaciones'])
+        _abonar_boletas(cursor, reparto['asignaciones'], 'saldo_favor', date.today())
 
-        # Actualizar pago con monto aplicado
-        cursor.execute('''
-            UPDATE pagos SET monto_aplicado = %s WHERE id = %s
-        ''', (monto_usado, pago_id))
+        # Un egreso por boleta, escritos juntos con el saldo final
+        registrar_movimientos_saldo(cliente_id, [{
+            'tipo': 'egreso',
+            'origen': 'aplicacion_boleta',
+            'monto': -a['monto_aplicado'],
+            'descripcion': f"Aplicado a boleta {a['boleta_id']}",
+            'pago_id': pago_id,
+            'boleta_id': a['boleta_id'],
+            'usuario_id': usuario_id
+        } for a in reparto['asignaciones']], cursor_ext=cursor)
 
         conn.commit()
 
@@ -902,7 +1003,7 @@ def usar_saldo_en_boletas(cliente_id: int, boletas_ids: List[int],
             'numero_pago': numero_pago,
             'monto_usado': float(monto_usado),
             'saldo_restante': float(saldo_restante),
-            'boletas_afectadas': boletas_afectadas
+            'boletas_afectadas': reparto['boletas_afectadas']
         }
 
     except Exception as e:
@@ -0,0 +1,90 @@
+"""
+Modelos del resumen de estadisticas por periodo (tabla resumen_periodo)
+
+Los triggers de la base de datos agregan un delta a resumen_periodo_delta
+en cada escritura de boletas, lecturas y pagos (solo inserciones, sin
+bloquear la fila del periodo); consolidar_resumen_periodos() los suma a
+resumen_periodo y reconstruir_resumen_periodos() lo recalcula completo
+para corregir cualquier desvio. Los pagos se cuentan en el mes de su
+fecha_envio.
+"""
+from typing import Dict
+from .database import get_connection
+
+_COLUMNAS = (
+    'boletas_total', 'boletas_pagadas', 'boletas_en_revision', 'boletas_pendientes',
+    'boletas_sin_comprobante', 'monto_total', 'monto_pagado', 'monto_en_revision',
+    'monto_pendiente', 'lecturas_total', 'lecturas_con_foto', 'lecturas_suma_m3',
+    'pagos_total', 'pagos_aprobados', 'pagos_en_revision', 'pagos_rechazados',
+    'pagos_monto_total',
+)
+
+
+def obtener_resumen_periodos(anio: int = None, mes: int = None) -> Dict:
+    """
+    Suma el resumen de los periodos indicados (todos si no se filtra).
+    Lee una fila por periodo mas los deltas pendientes de consolidar, sin
+    recorrer boletas, lecturas ni pagos.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Resumen consolidado mas los deltas que aun no se consolidan
+    columnas = ', '.join(_COLUMNAS)
+    sumas = ', '.join(f'COALESCE(SUM({c}), 0) as {c}' for c in _COLUMNAS)
+    query = f'''
+        SELECT {sumas}
+        FROM (
+            SELECT anio, mes, {columnas} FROM resumen_periodo
+            UNION ALL
+            SELECT anio, mes, {columnas} FROM resumen_periodo_delta
+        ) r
+        WHERE 1=1
+    '''
+    params = []
+
+    if anio is not None:
+        query += ' AND anio = %s'
+        params.append(anio)
+
+    if mes is not None:
+        query += ' AND mes = %s'
+        params.append(mes)
+
+    cursor.execute(query, params)
+    resumen = cursor.fetchone()
+    conn.close()
+    return dict(resumen)
+
+
+def consolidar_resumen_periodos() -> int:
+    """
+    Suma los deltas pendientes a resumen_periodo y los elimina.
+
+    Returns:
+        Cantidad de periodos actualizados
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT consolidar_resumen_periodo() as actualizados')
+    actualizados = cursor.fetchone()['actualizados']
+    conn.commit()
+    conn.close()
+    return actualizados
+
+
+def reconstruir_resumen_periodos() -> int:
+    """
+    Recalcula el resumen completo desde las tablas. Bloquea brevemente las
+    escrituras de boletas, lecturas y pagos mientras recalcula.
+
+    Returns:
+        Cantidad de periodos corregidos
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT reconstruir_resumen_periodo() as corregidos')
+    corregidos = cursor.fetchone()['corregidos']
+    conn.commit()
+    conn.close()
+    return corregidos
@@ -0,0 +1,447 @@
+"""
+Cubo analitico de consumo y recaudacion.
+
+Extrae boletas, lecturas y pagos a arreglos columnares de NumPy (un
+arreglo por campo, indexados por periodo x medidor x cliente) y los guarda
+en data/analitica/cubo.npz para no reconstruirlos al reiniciar. Los
+reportes (group-by, rollup, top N, interanual) se resuelven con
+operaciones vectorizadas sobre esos arreglos: en tiempo de consulta no se
+tocan las tablas transaccionales.
+
+El cubo se refresca cada ANALITICA_REFRESCO_MINUTOS (job del scheduler)
+solo si cambio la version de alguna tabla de origen (secuencias version_<tabla>).
+Cada proceso recarga el archivo cuando cambia su mtime, asi todos los
+workers de gunicorn ven el cubo que refresco cualquiera de ellos.
+
+Los periodos se codifican como un entero: anio * 12 + (mes - 1).
+"""
+import os
+import json
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.database import get_connection, BASE_DIR
+from src.models import obtener_versiones_datos
+
+logger = logging.getLogger(__name__)
+
+ANALITICA_DIR = os.path.join(BASE_DIR, 'data', 'analitica')
+ANALITICA_ARCHIVO = os.path.join(ANALITICA_DIR, 'cubo.npz')
+# Minutos entre verificaciones de cambios para reconstruir el cubo (0 = solo manual)
+ANALITICA_REFRESCO_MINUTOS = float(os.getenv('ANALITICA_REFRESCO_MINUTOS', '60'))
+
+TABLAS_ORIGEN = ['boletas', 'lecturas', 'pagos', 'clientes', 'medidores']
+
+# Tablas de hechos: consulta de extraccion y tipo de cada columna
+HECHOS = {
+    'boletas': {
+        'sql': '''
+            SELECT b.periodo_anio * 12 + b.periodo_mes - 1 as periodo,
+                   b.medidor_id, m.cliente_id,
+                   b.consumo_m3 as consumo,
+                   b.total::float8 as facturado,
+                   (CASE WHEN b.pagada = 2 THEN b.total
+                         ELSE b.total - COALESCE(b.saldo_pendiente, b.total) END)::float8 as cobrado,
+                   (CASE WHEN b.pagada = 2 THEN 0
+                         ELSE COALESCE(b.saldo_pendiente, b.total) END)::float8 as pendiente
+            FROM boletas b
+            JOIN medidores m ON m.id = b.medidor_id
+        ''',
+        'columnas': {'periodo': np.int32, 'medidor_id': np.int32, 'cliente_id': np.int32,
+                     'consumo': np.int64, 'facturado': np.float64, 'cobrado': np.float64,
+                     'pendiente': np.float64}
+    },
+    'lecturas': {
+        'sql': '''
+            SELECT l.anio * 12 + l.mes - 1 as periodo, l.medidor_id, m.cliente_id,
+                   l.tiene_foto::int as con_foto
+            FROM lecturas l
+            JOIN medidores m ON m.id = l.medidor_id
+        ''',
+        'columnas': {'periodo': np.int32, 'medidor_id': np.int32, 'cliente_id': np.int32,
+                     'con_foto': np.int32}
+    },
+    # Pagos aprobados, por mes en que se pagaron
+    'pagos': {
+        'sql': '''
+            SELECT (EXTRACT(YEAR FROM f.fecha) * 12 + EXTRACT(MONTH FROM f.fecha) - 1)::int as periodo,
+                   p.cliente_id, p.monto_total::float8 as recaudado
+            FROM pagos p
+            CROSS JOIN LATERAL (SELECT COALESCE(p.fecha_pago, p.fecha_procesamiento, p.fecha_envio) as fecha) f
+            WHERE p.estado = 'aprobado'
+        ''',
+        'columnas': {'periodo': np.int32, 'cliente_id': np.int32, 'recaudado': np.float64}
+    }
+}
+
+# Columnas que se suman en los group-by de cada hecho
+MEDIDAS = {
+    'boletas': ['consumo', 'facturado', 'cobrado', 'pendiente'],
+    'lecturas': ['con_foto'],
+    'pagos': ['recaudado']
+}
+
+# Columnas por las que se puede agrupar (anio y mes se derivan de periodo)
+DIMENSIONES = ['anio', 'mes', 'periodo', 'cliente_id', 'medidor_id']
+
+_cubo = None
+# mtime (ns) del archivo del que se cargo _cubo: si otro worker lo reescribe, se recarga
+_cubo_mtime = None
+_lock_refresco = threading.Lock()
+_lock_carga = threading.Lock()
+
+
+def codificar_periodo(anio: int, mes: int) -> int:
+    """Periodo como entero (anio * 12 + mes - 1)."""
+    return anio * 12 + mes - 1
+
+
+def etiqueta_periodo(periodo: int) -> str:
+    """Periodo codificado como 'AAAA-MM'."""
+    return f'{periodo // 12}-{periodo % 12 + 1:02d}'
+
+
+# ============================================================
+# CUBO
+# ============================================================
+
+class CuboAnalitico:
+    """
+    Hechos y dimensiones en arreglos columnares.
+
+    hechos: {'boletas': {'periodo': ndarray, 'consumo': ndarray, ...}, ...}
+    dimensiones: {'clientes': {'id': ndarray, 'nombre': ndarray}, 'medidores': {...}}
+    meta: generado, versiones de las tablas de origen y filas por hecho
+    """
+
+    def __init__(self, hechos: Dict, dimensiones: Dict, meta: Dict):
+        self.hechos = hechos
+        self.dimensiones = dimensiones
+        self.meta = meta
+        self._nombres_clientes = dict(zip(dimensiones['clientes']['id'].tolist(),
+                                          dimensiones['clientes']['nombre'].tolist()))
+        self._numeros_medidores = dict(zip(dimensiones['medidores']['id'].tolist(),
+                                           dimensiones['medidores']['numero_medidor'].tolist()))
+
+    # ---------- Persistencia ----------
+
+    def guardar(self, ruta: str):
+        """Guarda el cubo en un .npz (escritura atomica)."""
+        arreglos = {f'h_{hecho}__{columna}': valores
+                    for hecho, columnas in self.hechos.items() for columna, valores in columnas.items()}
+        arreglos.update({f'd_{dimension}__{columna}': valores
+                         for dimension, columnas in self.dimensiones.items() for columna, valores in columnas.items()})
+        arreglos['meta'] = np.array(json.dumps(self.meta))
+
+        # Temporal unico por escritura: dos workers pueden guardar a la vez
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        archivo = tempfile.NamedTemporaryFile(dir=os.path.dirname(ruta), prefix=os.path.basename(ruta) + '.',
+                                              suffix='.tmp', delete=False)
+        try:
+            with archivo:
+                np.savez_compressed(archivo, **arreglos)
+            os.replace(archivo.name, ruta)
+        except BaseException:
+            if os.path.exists(archivo.name):
+                os.remove(archivo.name)
+            raise
+
+    @classmethod
+    def cargar(cls, ruta: str) -> 'CuboAnalitico':
+        """Lee un cubo guardado con guardar()."""
+        hechos, dimensiones = {}, {}
+        with np.load(ruta, allow_pickle=False) as datos:
+            meta = json.loads(str(datos['meta']))
+            for clave in datos.files:
+                if clave == 'meta':
+                    continue
+                grupo, columna = clave[2:].split('__', 1)
+                destino = hechos if clave.startswith('h_') else dimensiones
+                destino.setdefault(grupo, {})[columna] = datos[clave]
+        return cls(hechos, dimensiones, meta)
+
+    # ---------- Consultas ----------
+
+    def _columna(self, hecho: str, nombre: str) -> np.ndarray:
+        columnas = self.hechos[hecho]
+        if nombre == 'anio':
+            return columnas['periodo'] // 12
+        if nombre == 'mes':
+            return columnas['periodo'] % 12 + 1
+        return columnas[nombre]
+
+    def _mascara(self, hecho: str, desde: int = None, hasta: int = None,
+                 cliente_id: int = None, medidor_id: int = None) -> np.ndarray:
+        columnas = self.hechos[hecho]
+        mascara = np.ones(len(columnas['periodo']), dtype=bool)
+        if desde is not None:
+            mascara &= columnas['periodo'] >= desde
+        if hasta is not None:
+            mascara &= columnas['periodo'] <= hasta
+        if cliente_id is not None:
+            mascara &= columnas['cliente_id'] == cliente_id
+        if medidor_id is not None:
+            if 'medidor_id' not in columnas:
+                raise ValueError(f"'{hecho}' no se puede filtrar por medidor")
+            mascara &= columnas['medidor_id'] == medidor_id
+        return mascara
+
+    def agrupar(self, hecho: str, por: List[str], desde: int = None, hasta: int = None,
+                cliente_id: int = None, medidor_id: int = None) -> Dict[str, np.ndarray]:
+        """
+        GROUP BY vectorizado: suma las MEDIDAS del hecho por las columnas
+        `por` (vacio = total general). Retorna un arreglo por columna de
+        agrupacion, uno por medida y 'filas' (cantidad de registros).
+        """
+        if hecho not in self.hechos:
+            raise ValueError(f'Hecho desconocido: {hecho}')
+        for dimension in por:
+            if dimension not in DIMENSIONES or (dimension == 'medidor_id' and 'medidor_id' not in self.hechos[hecho]):
+                raise ValueError(f"'{hecho}' no se puede agrupar por {dimension}")
+
+        mascara = self._mascara(hecho, desde, hasta, cliente_id, medidor_id)
+        if por and not mascara.any():
+            unicas = np.zeros((0, len(por)), dtype=np.int64)
+            inversa = np.zeros(0, dtype=np.int64)
+        elif por:
+            claves = np.column_stack([self._columna(hecho, d)[mascara] for d in por])
+            unicas, inversa = np.unique(claves, axis=0, return_inverse=True)
+            inversa = inversa.reshape(-1)
+        else:
+            unicas = np.zeros((1, 0), dtype=np.int64)
+            inversa = np.zeros(int(mascara.sum()), dtype=np.int64)
+
+        grupos = len(unicas)
+        resultado = {d: unicas[:, i] for i, d in enumerate(por)}
+        resultado['filas'] = np.bincount(inversa, minlength=grupos)
+        for medida in MEDIDAS[hecho]:
+            resultado[medida] = np.bincount(inversa, weights=self.hechos[hecho][medida][mascara],
+                                            minlength=grupos)
+        return resultado
+
+    def rollup(self, hecho: str, por: List[str], **filtros) -> List[Dict]:
+        """
+        ROLLUP: el detalle por todas las columnas de `por` y los subtotales
+        de cada prefijo hasta el total general (columnas agregadas en None).
+        """
+        filas = []
+        for nivel in range(len(por), -1, -1):
+            grupo = self.agrupar(hecho, por[:nivel], **filtros)
+            for fila in self.filas(grupo):
+                fila.update({d: None for d in por[nivel:]})
+                fila['nivel'] = nivel
+                filas.append(fila)
+        return filas
+
+    def filas(self, grupo: Dict[str, np.ndarray]) -> List[Dict]:
+        """Convierte el resultado de agrupar() en filas (dicts) con nombres."""
+        columnas = {nombre: valores.tolist() for nombre, valores in grupo.items()}
+        filas = [dict(zip(columnas, valores)) for valores in zip(*columnas.values())]
+        for fila in filas:
+            if 'periodo' in fila:
+                fila['periodo'] = etiqueta_periodo(fila['periodo'])
+            if 'cliente_id' in fila:
+                fila['cliente'] = self._nombres_clientes.get(fila['cliente_id'], '')
+            if 'medidor_id' in fila:
+                fila['medidor'] = self._numeros_medidores.get(fila['medidor_id'], '')
+        return filas
+
+    # ---------- Reportes ----------
+
+    def mensual(self, desde: int = None, hasta: int = None, cliente_id: int = None) -> List[Dict]:
+        """
+        Por periodo: lecturas, boletas, consumo, facturado, cobrado (de las
+        boletas del periodo), pendiente y recaudado (pagos aprobados en el mes).
+        """
+        filtros = {'desde': desde, 'hasta': hasta, 'cliente_id': cliente_id}
+        boletas = self.agrupar('boletas', ['periodo'], **filtros)
+        lecturas = self.agrupar('lecturas', ['periodo'], **filtros)
+        pagos = self.agrupar('pagos', ['periodo'], **filtros)
+
+        periodos = np.union1d(np.union1d(boletas['periodo'], lecturas['periodo']), pagos['periodo'])
+
+        def alinear(grupo, columna):
+            valores = np.zeros(len(periodos), dtype=np.float64)
+            valores[np.searchsorted(periodos, grupo['periodo'])] = grupo[columna]
+            return valores
+
+        facturado = alinear(boletas, 'facturado')
+        cobrado = alinear(boletas, 'cobrado')
+        columnas = {
+            'periodo': periodos,
+            'lecturas': alinear(lecturas, 'filas'),
+            'con_foto': alinear(lecturas, 'con_foto'),
+            'boletas': alinear(boletas, 'filas'),
+            'consumo': alinear(boletas, 'consumo'),
+            'facturado': facturado,
+            'cobrado': cobrado,
+            'pendiente': alinear(boletas, 'pendiente'),
+            'recaudado': alinear(pagos, 'recaudado'),
+            'cobranza_pct': np.divide(cobrado * 100, facturado, out=np.zeros_like(facturado),
+                                      where=facturado > 0).round(1)
+        }
+        return self.filas(columnas)
+
+    def top_consumidores(self, desde: int = None, hasta: int = None, limite: int = 10,
+                         por: str = 'cliente_id') -> List[Dict]:
+        """Los `limite` clientes (o medidores) de mayor consumo en el rango."""
+        grupo = self.agrupar('boletas', [por], desde=desde, hasta=hasta)
+        limite = min(limite, len(grupo[por]))
+        if limite <= 0:
+            return []
+        # argpartition evita ordenar todos los grupos
+        mayores = np.argpartition(-grupo['consumo'], limite - 1)[:limite]
+        mayores = mayores[np.argsort(-grupo['consumo'][mayores], kind='stable')]
+        return self.filas({nombre: valores[mayores] for nombre, valores in grupo.items()})
+
+    def interanual(self, anio: int, cliente_id: int = None) -> List[Dict]:
+        """Consumo, facturado y cobrado por mes de `anio` frente al anio anterior."""
+        grupo = self.agrupar('boletas', ['anio', 'mes'], desde=codificar_periodo(anio - 1, 1),
+                             hasta=codificar_periodo(anio, 12), cliente_id=cliente_id)
+        tabla = {medida: np.zeros((2, 12)) for medida in ('consumo', 'facturado', 'cobrado')}
+        fila_anio = (grupo['anio'] == anio).astype(int)
+        for medida, valores in tabla.items():
+            valores[fila_anio, grupo['mes'] - 1] = grupo[medida]
+
+        def variacion(actual, anterior):
+            return np.divide((actual - anterior) * 100, anterior, out=np.full_like(actual, np.nan),
+                             where=anterior > 0).round(1)
+
+        columnas = {'mes': np.arange(1, 13)}
+        for medida, valores in tabla.items():
+            columnas[f'{medida}_anterior'] = valores[0]
+            columnas[medida] = valores[1]
+        columnas['variacion_consumo_pct'] = variacion(tabla['consumo'][1], tabla['consumo'][0])
+        columnas['variacion_facturado_pct'] = variacion(tabla['facturado'][1], tabla['facturado'][0])
+
+        filas = self.filas(columnas)
+        for fila in filas:
+            # NaN no es JSON valido: sin base de comparacion
+            for clave in ('variacion_consumo_pct', 'variacion_facturado_pct'):
+                if fila[clave] != fila[clave]:
+                    fila[clave] = None
+        return filas
+
+
+# ============================================================
+# EXTRACCION Y REFRESCO
+# ============================================================
+
+def extraer_cubo(versiones: Dict[str, int] = None) -> CuboAnalitico:
+    """
+    Lee las tablas de origen en una sola transaccion REPEATABLE READ (todos
+    los hechos ven la misma foto) con cursores del lado del servidor.
+    """
+    conn = get_connection()
+    try:
+        conn.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+        hechos = {}
+        for hecho, definicion in HECHOS.items():
+            valores = {columna: [] for columna in definicion['columnas']}
+            cursor = conn.cursor_servidor(f'analitica_{hecho}')
+            cursor.execute(definicion['sql'])
+            for fila in cursor:
+                for columna, lista in valores.items():
+                    lista.append(fila[columna])
+            cursor.close()
+            hechos[hecho] = {columna: np.array(lista, dtype=definicion['columnas'][columna])
+                             for columna, lista in valores.items()}
+
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, nombre FROM clientes ORDER BY id')
+        clientes = cursor.fetchall()
+        cursor.execute("SELECT id, COALESCE(numero_medidor, '') as numero_medidor FROM medidores ORDER BY id")
+        medidores = cursor.fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+
+    dimensiones = {
+        'clientes': {'id': np.array([c['id'] for c in clientes], dtype=np.int32),
+                     'nombre': np.array([c['nombre'] for c in clientes], dtype=str)},
+        'medidores': {'id': np.array([m['id'] for m in medidores], dtype=np.int32),
+                      'numero_medidor': np.array([m['numero_medidor'] for m in medidores], dtype=str)}
+    }
+    periodos = hechos['boletas']['periodo']
+    meta = {
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'versiones': versiones or {},
+        'filas': {hecho: len(columnas['periodo']) for hecho, columnas in hechos.items()},
+        'periodo_min': int(periodos.min()) if len(periodos) else None,
+        'periodo_max': int(periodos.max()) if len(periodos) else None
+    }
+    return CuboAnalitico(hechos, dimensiones, meta)
+
+
+def _mtime_archivo() -> Optional[int]:
+    try:
+        return os.stat(ANALITICA_ARCHIVO).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def obtener_cubo() -> Optional[CuboAnalitico]:
+    """
+    Cubo vigente, o None si aun no existe. Se carga del disco la primera vez
+    y se recarga cuando cambia el mtime del archivo (otro worker lo refresco).
+    """
+    global _cubo, _cubo_mtime
+    mtime = _mtime_archivo()
+    if mtime is not None and mtime != _cubo_mtime:
+        with _lock_carga:
+            mtime = _mtime_archivo()
+            if mtime is not None and mtime != _cubo_mtime:
+                try:
+                    _cubo = CuboAnalitico.cargar(ANALITICA_ARCHIVO)
+                except Exception as e:
+                    logger.error(f"No se pudo leer el cubo analitico: {e}")
+                # Aunque falle, no reintentar en cada consulta hasta el proximo cambio
+                _cubo_mtime = mtime
+    return _cubo
+
+
+def refrescar_cubo(forzar: bool = False) -> bool:
+    """
+    Reconstruye el cubo si cambio alguna tabla de origen (o si `forzar`).
+    Retorna True si se reconstruyo. Si ya hay un refresco en curso no hace nada.
+    """
+    global _cubo, _cubo_mtime
+    if not _lock_refresco.acquire(blocking=False):
+        return False
+    try:
+        versiones = {tabla: datos['version'] for tabla, datos in obtener_versiones_datos(TABLAS_ORIGEN).items()}
+        actual = obtener_cubo()
+        if actual is not None and not forzar and actual.meta.get('versiones') == versiones:
+            return False
+
+        cubo = extraer_cubo(versiones)
+        cubo.guardar(ANALITICA_ARCHIVO)
+        with _lock_carga:
+            _cubo = cubo
+            _cubo_mtime = _mtime_archivo()
+        logger.info(f"Cubo analitico reconstruido: {cubo.meta['filas']}")
+        return True
+    finally:
+        _lock_refresco.release()
+
+
+def refresco_en_curso() -> bool:
+    """True si se esta reconstruyendo el cubo."""
+    return _lock_refresco.locked()
+
+
+def refrescar_cubo_async(forzar: bool = True):
+    """Reconstruye el cubo en un thread (la vista responde de inmediato)."""
+    def ejecutar():
+        try:
+            refrescar_cubo(forzar)
+        except Exception:
+            logger.exception("Error reconstruyendo el cubo analitico")
+
+    threading.Thread(target=ejecutar, name='analitica-refresco', daemon=True).start()
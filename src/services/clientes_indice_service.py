@@ -0,0 +1,194 @@
+"""
+Indice en memoria de clientes para la busqueda con autocompletado.
+
+Evita cargar la lista completa de clientes en cada pagina con filtros: el
+navegador pide solo las coincidencias de lo que se escribe. El indice
+guarda nombres y RUT normalizados (minusculas, sin tildes ni puntuacion)
+y busca primero por prefijo (nombre completo, cada palabra o RUT) y luego
+por subcadena.
+
+Se reconstruye cuando cambia la version de la tabla clientes
+(secuencia version_clientes, incrementada por trigger), verificada a lo sumo cada
+CLIENTES_INDICE_VERIFICAR segundos, asi cada proceso web ve los cambios
+hechos por los demas.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional
+
+from src.database import get_connection
+from src.models import obtener_versiones_datos
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre verificaciones de la version de clientes
+CLIENTES_INDICE_VERIFICAR = float(os.getenv('CLIENTES_INDICE_VERIFICAR', '5'))
+# Maximo de resultados por busqueda
+CLIENTES_BUSQUEDA_LIMITE = 20
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Minusculas, sin tildes y solo letras, numeros y espacios simples."""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(ch if ch.isalnum() else ' ' for ch in texto if not unicodedata.combining(ch))
+    return ' '.join(texto.split())
+
+
+def normalizar_rut(rut: Optional[str]) -> str:
+    """RUT sin puntos ni guion (ej: 12.345.678-k -> 12345678k)."""
+    return ''.join(ch for ch in (rut or '').lower() if ch.isdigit() or ch == 'k')
+
+
+class _Instantanea(NamedTuple):
+    """
+    Contenido del indice en una version de la tabla clientes.
+
+    - claves: lista ordenada de (clave, cliente_id) con el nombre
+      completo, cada palabra de nombre y nombre_completo y el RUT, para
+      buscar por prefijo con bisect.
+    - textos: (cliente_id, texto) con todo lo buscable, para subcadenas.
+    """
+    clientes: Dict[int, Dict]
+    claves: List[tuple]
+    textos: List[tuple]
+    version: Optional[int]
+
+
+class IndiceClientes:
+    """
+    Indice de busqueda de clientes. Todo su contenido vive en una sola
+    _Instantanea que se reemplaza completa al recargar, asi una busqueda
+    nunca mezcla las claves de una version con los clientes de otra.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = _Instantanea({}, [], [], None)
+        self._verificado = 0.0
+
+    @staticmethod
+    def _version_actual() -> int:
+        return obtener_versiones_datos(['clientes'])['clientes']['version']
+
+    def _cargar(self, version: int):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, nombre, nombre_completo, rut, activo
+            FROM clientes
+            ORDER BY nombre
+        ''')
+        filas = cursor.fetchall()
+        conn.close()
+
+        clientes = {}
+        claves = set()
+        textos = []
+        for fila in filas:
+            cliente = {
+                'id': fila['id'],
+                'nombre': fila['nombre'],
+                'nombre_completo': fila['nombre_completo'],
+                'rut': fila['rut'],
+                'activo': fila['activo']
+            }
+            clientes[cliente['id']] = cliente
+
+            nombre = normalizar_texto(cliente['nombre'])
+            nombre_completo = normalizar_texto(cliente['nombre_completo'])
+            rut = normalizar_rut(cliente['rut'])
+            for clave in [nombre, nombre_completo, rut] + nombre.split() + nombre_completo.split():
+                if clave:
+                    claves.add((clave, cliente['id']))
+            textos.append((cliente['id'], ' | '.join(t for t in (nombre, nombre_completo, rut) if t)))
+
+        # Reemplazo atomico (una sola asignacion): las busquedas en curso
+        # siguen con la instantanea anterior
+        self._datos = _Instantanea(clientes, sorted(claves), textos, version)
+        logger.info(f"Indice de clientes reconstruido: {len(clientes)} clientes (version {version})")
+
+    def _asegurar_vigente(self):
+        ahora = time.monotonic()
+        if self._datos.version is not None and ahora - self._verificado < CLIENTES_INDICE_VERIFICAR:
+            return
+        with self._lock:
+            if self._datos.version is not None and ahora - self._verificado < CLIENTES_INDICE_VERIFICAR:
+                return
+            version = self._version_actual()
+            if version != self._datos.version:
+                self._cargar(version)
+            self._verificado = time.monotonic()
+
+    def invalidar(self):
+        """Fuerza la verificacion de la version en la proxima consulta."""
+        self._verificado = 0.0
+
+    def buscar(self, consulta: str, limite: int = CLIENTES_BUSQUEDA_LIMITE) -> List[Dict]:
+        """
+        Clientes que coinciden con la consulta: primero por prefijo (ordenados
+        por nombre) y luego por subcadena. Sin consulta, los primeros por nombre.
+        """
+        self._asegurar_vigente()
+        clientes, claves, textos, _ = self._datos
+
+        texto = normalizar_texto(consulta)
+        if not texto:
+            return list(clientes.values())[:limite]
+
+        encontrados = []
+        vistos = set()
+        prefijos = {texto}
+        rut = normalizar_rut(consulta)
+        if len(rut) >= 3:
+            prefijos.add(rut)
+
+        for prefijo in prefijos:
+            i = bisect.bisect_left(claves, (prefijo,))
+            while i < len(claves) and claves[i][0].startswith(prefijo) and len(vistos) < limite:
+                cliente_id = claves[i][1]
+                if cliente_id not in vistos:
+                    vistos.add(cliente_id)
+                    encontrados.append(clientes[cliente_id])
+                i += 1
+        encontrados.sort(key=lambda c: c['nombre'])
+
+        if len(encontrados) < limite:
+            for cliente_id, buscable in textos:
+                if cliente_id not in vistos and texto in buscable:
+                    vistos.add(cliente_id)
+                    encontrados.append(clientes[cliente_id])
+                    if len(encontrados) >= limite:
+                        break
+
+        return encontrados[:limite]
+
+    def obtener(self, cliente_id) -> Optional[Dict]:
+        """Cliente por id desde el indice (None si no existe)."""
+        if not cliente_id:
+            return None
+        self._asegurar_vigente()
+        try:
+            return self._datos.clientes.get(int(cliente_id))
+        except (TypeError, ValueError):
+            return None
+
+
+# Indice compartido del proceso
+indice_clientes = IndiceClientes()
+
+
+def buscar_clientes(consulta: str, limite: int = CLIENTES_BUSQUEDA_LIMITE) -> List[Dict]:
+    """Busqueda de clientes para autocompletado."""
+    return indice_clientes.buscar(consulta, limite)
+
+
+def nombre_cliente(cliente_id) -> str:
+    """Nombre del cliente para mostrar el valor seleccionado de un filtro."""
+    cliente = indice_clientes.obtener(cliente_id)
+    return cliente['nombre'] if cliente else ''
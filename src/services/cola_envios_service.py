@@ -0,0 +1,274 @@
+"""
+Servicio de cola persistente de envios (outbox).
+
+Todos los envios (WhatsApp y email) se encolan en la tabla cola_envios y un
+worker los procesa. El worker puede correr embebido en la app (thread, con
+COLA_ENVIOS_WORKER_EMBEBIDO=1) y/o como proceso aparte:
+
+    python -m src.services.cola_envios_service
+
+Las filas se reclaman con FOR UPDATE SKIP LOCKED, por lo que varios workers
+pueden convivir. Si un worker muere a mitad de un envio, la fila se recupera
+cuando vence su bloqueo (entrega "al menos una vez").
+"""
+import os
+import random
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.models_boletas import obtener_boleta, registrar_envio_boleta
+from src.models_cola_envios import (
+    encolar_envio, reclamar_envios, marcar_envio_enviado,
+    reprogramar_envio, marcar_envio_fallido
+)
+from src.services.mensajes_service import (
+    enviar_whatsapp, enviar_boleta_whatsapp, enviar_concurrente,
+    MensajesError, LimiteExcedidoError, MENSAJES_MAX_EN_VUELO
+)
+from src.services.email_service import enviar_boleta_email
+from src.services.pdf_service import obtener_pdf_boleta, publicar_pdf_boleta
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre consultas a la cola cuando no hay trabajo
+COLA_ENVIOS_INTERVALO = float(os.getenv('COLA_ENVIOS_INTERVALO', '5'))
+# Tiempo que una fila queda reservada para el worker que la tomo
+COLA_ENVIOS_BLOQUEO = int(os.getenv('COLA_ENVIOS_BLOQUEO', '300'))
+# Backoff entre reintentos: base * 2^(intento-1), con tope
+COLA_ENVIOS_BACKOFF_BASE = float(os.getenv('COLA_ENVIOS_BACKOFF_BASE', '30'))
+COLA_ENVIOS_BACKOFF_MAXIMO = float(os.getenv('COLA_ENVIOS_BACKOFF_MAXIMO', '3600'))
+# Iniciar un worker dentro del proceso web (opcional; start.sh lo habilita)
+COLA_ENVIOS_WORKER_EMBEBIDO = os.getenv('COLA_ENVIOS_WORKER_EMBEBIDO', '0') == '1'
+
+_despertar = threading.Event()
+_detener = threading.Event()
+_worker_thread: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+# ============================================================
+# ENCOLAR
+# ============================================================
+
+def clave_envio_boleta(boleta_id: int, log_envio_id: int = None, usuario_id: int = None,
+                       canal: str = 'whatsapp') -> str:
+    """
+    Clave de idempotencia para el envio de una boleta por un canal.
+    En un envio masivo es unica por (boleta, proceso). En envios manuales
+    agrupa por minuto, de modo que un doble clic no duplica el mensaje.
+    """
+    if log_envio_id:
+        return f'{canal}:boleta:{boleta_id}:masivo:{log_envio_id}'
+    return f'{canal}:boleta:{boleta_id}:manual:{usuario_id or 0}:{datetime.now():%Y%m%d%H%M}'
+
+
+def encolar_boleta_whatsapp(boleta_id: int, telefono: str, usuario_id: int = None,
+                            log_envio_id: int = None, clave_idempotencia: str = None) -> int:
+    """Encola el envio de una boleta por WhatsApp y despierta al worker."""
+    envio_id = encolar_envio(
+        destinatario=telefono,
+        clave_idempotencia=clave_idempotencia or clave_envio_boleta(boleta_id, log_envio_id, usuario_id),
+        canal='whatsapp',
+        boleta_id=boleta_id,
+        usuario_id=usuario_id,
+        log_envio_id=log_envio_id
+    )
+    notificar_worker()
+    return envio_id
+
+
+def encolar_boleta_email(boleta_id: int, email: str, usuario_id: int = None,
+                         log_envio_id: int = None, clave_idempotencia: str = None) -> int:
+    """Encola el envio de una boleta por email y despierta al worker."""
+    envio_id = encolar_envio(
+        destinatario=email,
+        clave_idempotencia=clave_idempotencia or clave_envio_boleta(boleta_id, log_envio_id, usuario_id, 'email'),
+        canal='email',
+        boleta_id=boleta_id,
+        usuario_id=usuario_id,
+        log_envio_id=log_envio_id
+    )
+    notificar_worker()
+    return envio_id
+
+
+def notificar_worker():
+    """Despierta al worker embebido para que revise la cola de inmediato."""
+    _despertar.set()
+
+
+# ============================================================
+# PROCESAMIENTO
+# ============================================================
+
+def _segundos_backoff(intentos: int) -> float:
+    """Backoff exponencial con jitter para el siguiente reintento."""
+    base = min(COLA_ENVIOS_BACKOFF_MAXIMO, COLA_ENVIOS_BACKOFF_BASE * (2 ** max(intentos - 1, 0)))
+    return random.uniform(base / 2, base)
+
+
+def _registrar_historial(envio: Dict, estado: str, mensaje_error: str = None,
+                         mensaje_id: str = None):
+    if envio.get('boleta_id'):
+        registrar_envio_boleta(
+            boleta_id=envio['boleta_id'],
+            usuario_id=envio.get('usuario_id'),
+            canal=envio['canal'],
+            destinatario=envio['destinatario'],
+            estado=estado,
+            mensaje_error=mensaje_error,
+            mensaje_id=mensaje_id
+        )
+
+
+def procesar_envio(envio: Dict, app) -> str:
+    """
+    Procesa un envio reclamado de la cola. Retorna el estado resultante
+    ('enviado', 'pendiente' si se reprogramo o 'fallido').
+    """
+    try:
+        if envio.get('boleta_id'):
+            boleta = obtener_boleta(envio['boleta_id'])
+            if not boleta:
+                raise MensajesError('Boleta no encontrada', permanente=True)
+
+            # Usa el PDF prerenderizado si existe (pipeline post-generacion)
+            with app.app_context():
+                pdf_bytes = obtener_pdf_boleta(boleta)
+
+            if envio['canal'] == 'email':
+                respuesta = enviar_boleta_email(envio['destinatario'], boleta, pdf_bytes=pdf_bytes)
+            else:
+                pdf_url = publicar_pdf_boleta(boleta['id'], pdf_bytes)
+                respuesta = enviar_boleta_whatsapp(envio['destinatario'], boleta,
+                                                   pdf_bytes=pdf_bytes, pdf_url=pdf_url)
+        elif envio['canal'] == 'email':
+            raise MensajesError('Los envios por email requieren una boleta', permanente=True)
+        else:
+            respuesta = enviar_whatsapp(envio['destinatario'], envio.get('mensaje') or '')
+
+    except LimiteExcedidoError as e:
+        # El limite del proveedor no consume intentos
+        reprogramar_envio(envio['id'], str(e), e.retry_after or _segundos_backoff(1),
+                          contar_intento=False)
+        return 'pendiente'
+
+    except Exception as e:
+        error_msg = str(e)
+        # Los errores permanentes fallan de inmediato: reintentar no los corrige
+        if getattr(e, 'permanente', False) or envio['intentos'] >= envio['max_intentos']:
+            marcar_envio_fallido(envio['id'], error_msg)
+            _registrar_historial(envio, 'fallido', error_msg)
+            return 'fallido'
+
+        reprogramar_envio(envio['id'], error_msg, _segundos_backoff(envio['intentos']))
+        return 'pendiente'
+
+    marcar_envio_enviado(envio['id'])
+    # El id del proveedor enlaza los avisos de entrega que llegan por webhook
+    _registrar_historial(envio, 'enviado', mensaje_id=(respuesta or {}).get('messageId'))
+    return 'enviado'
+
+
+def procesar_lote(app, limite: int = None) -> int:
+    """
+    Reclama y procesa un lote de envios con concurrencia acotada.
+    Retorna la cantidad de envios reclamados.
+    """
+    from src.services.envio_masivo_service import registrar_avance_envio_masivo
+
+    envios = reclamar_envios(limite or MENSAJES_MAX_EN_VUELO * 2, COLA_ENVIOS_BLOQUEO)
+    if not envios:
+        return 0
+
+    # Resultados por envio masivo: {log_id: {'enviado': n, 'fallido': n}}
+    avance_logs: Dict[int, Dict[str, int]] = {}
+    for envio, resultado, error in enviar_concurrente(envios, lambda e: procesar_envio(e, app)):
+        if error is not None:
+            # Error fuera del envio (ej: base de datos); la fila se recupera al vencer el bloqueo
+            logger.error(f"Error procesando envio {envio['id']} de la cola: {error}")
+        if envio.get('log_envio_id'):
+            avance = avance_logs.setdefault(envio['log_envio_id'], {'enviado': 0, 'fallido': 0})
+            if resultado in avance:
+                avance[resultado] += 1
+
+    # Progreso de envios masivos: se publica en memoria y el log se escribe coalescido
+    for log_id, avance in avance_logs.items():
+        try:
+            registrar_avance_envio_masivo(log_id, avance['enviado'], avance['fallido'])
+        except Exception as e:
+            logger.error(f"Error actualizando progreso del envio masivo {log_id}: {e}")
+
+    return len(envios)
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+def ejecutar_worker(app, detener: threading.Event = None):
+    """Bucle del worker: procesa lotes mientras haya trabajo y espera si no."""
+    detener = detener or _detener
+    logger.info("Worker de cola de envios iniciado")
+
+    while not detener.is_set():
+        try:
+            procesados = procesar_lote(app)
+        except Exception as e:
+            logger.error(f"Error en worker de cola de envios: {e}")
+            procesados = 0
+
+        if procesados == 0:
+            _despertar.wait(COLA_ENVIOS_INTERVALO)
+            _despertar.clear()
+
+    logger.info("Worker de cola de envios detenido")
+
+
+def iniciar_worker_cola(app) -> Optional[threading.Thread]:
+    """Inicia el worker embebido (una vez por proceso) si esta habilitado."""
+    global _worker_thread
+
+    if not COLA_ENVIOS_WORKER_EMBEBIDO:
+        return None
+
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _detener.clear()
+            _worker_thread = threading.Thread(
+                target=ejecutar_worker, args=(app,), name='cola-envios', daemon=True
+            )
+            _worker_thread.start()
+    return _worker_thread
+
+
+def crear_app_worker():
+    """
+    App Flask minima para el worker dedicado: solo plantillas y filtros para
+    renderizar los PDF. No importa web.app, asi no registra rutas ni inicia
+    el scheduler ni el worker embebido.
+    """
+    from flask import Flask
+    from src.database import BASE_DIR
+    from web.filtros import registrar_filtros
+
+    app = Flask('cola_envios', template_folder=os.path.join(BASE_DIR, 'web', 'templates'))
+    registrar_filtros(app)
+    return app
+
+
+def detener_worker_cola():
+    """Solicita la detencion del worker embebido."""
+    _detener.set()
+    _despertar.set()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    try:
+        ejecutar_worker(crear_app_worker())
+    except KeyboardInterrupt:
+        detener_worker_cola()
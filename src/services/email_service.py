@@ -0,0 +1,288 @@
+"""
+Servicio de envio de boletas por email (SMTP).
+
+Los envios reutilizan un pool pequeño de conexiones SMTP persistentes: cada
+conexion abierta (y autenticada) sirve muchos mensajes, y se reconecta sola
+si el servidor la cerro. El ritmo se controla con un limitador propio del
+canal, independiente del de WhatsApp.
+"""
+import os
+import time
+import queue
+import smtplib
+import threading
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Any, Dict, Optional, Tuple
+
+from src.services.mensajes_service import MensajesError, LimiteExcedidoError, LimitadorEnvios
+
+
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USUARIO = os.getenv('SMTP_USUARIO', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+# starttls, ssl o ninguna
+SMTP_SEGURIDAD = os.getenv('SMTP_SEGURIDAD', 'starttls').lower()
+SMTP_REMITENTE = os.getenv('SMTP_REMITENTE', '') or SMTP_USUARIO
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+# Conexiones SMTP simultaneas (y reutilizables) del proceso
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '2'))
+# Mensajes por conexion antes de renovarla
+SMTP_MENSAJES_POR_CONEXION = int(os.getenv('SMTP_MENSAJES_POR_CONEXION', '100'))
+# Segundos de inactividad tras los cuales se verifica la conexion (NOOP)
+SMTP_INACTIVIDAD = float(os.getenv('SMTP_INACTIVIDAD', '60'))
+
+# Limite de envio del canal email (token bucket)
+EMAIL_TASA_POR_SEGUNDO = float(os.getenv('EMAIL_TASA_POR_SEGUNDO', '2'))
+EMAIL_RAFAGA = int(os.getenv('EMAIL_RAFAGA', '5'))
+EMAIL_ESPERA_MAXIMA = float(os.getenv('EMAIL_ESPERA_MAXIMA', '120'))
+
+
+def _error_conexion(error: Exception) -> bool:
+    """La conexion se corto (smtplib.SMTPException tambien es OSError)."""
+    return (isinstance(error, smtplib.SMTPServerDisconnected)
+            or (isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)))
+
+
+def _rechazo_smtp(error: Exception) -> bool:
+    """El servidor respondio con un rechazo y la conexion sigue abierta."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code != 421
+
+
+class PoolSMTP:
+    """
+    Pool de conexiones SMTP persistentes.
+
+    - A lo sumo `tamano` conexiones en uso a la vez; quien pide una de mas
+      espera a que se libere.
+    - Las conexiones libres se reutilizan (la ultima usada primero); si
+      estuvieron inactivas mas de `inactividad` segundos se verifican con
+      NOOP antes de usarlas.
+    - Una conexion se renueva tras `mensajes_por_conexion` envios.
+    - Si una conexion reutilizada resulta estar cerrada, el envio se
+      reintenta una vez con una conexion nueva.
+    """
+
+    def __init__(self, tamano: int = None, mensajes_por_conexion: int = None,
+                 inactividad: float = None):
+        self.tamano = max(1, tamano or SMTP_POOL_SIZE)
+        self.mensajes_por_conexion = max(1, mensajes_por_conexion or SMTP_MENSAJES_POR_CONEXION)
+        self.inactividad = SMTP_INACTIVIDAD if inactividad is None else inactividad
+        self._libres = queue.LifoQueue()
+        self._cupos = threading.BoundedSemaphore(self.tamano)
+        self._lock = threading.Lock()
+        self.estadisticas = {'conexiones': 0, 'reconexiones': 0, 'mensajes': 0}
+
+    def _sumar(self, clave: str):
+        with self._lock:
+            self.estadisticas[clave] += 1
+
+    def _conectar(self) -> smtplib.SMTP:
+        if not SMTP_HOST:
+            raise MensajesError('Servidor SMTP no configurado. Configure SMTP_HOST en las variables de entorno.',
+                                permanente=True)
+
+        if SMTP_SEGURIDAD == 'ssl':
+            conexion = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        else:
+            conexion = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_SEGURIDAD == 'starttls':
+                conexion.starttls()
+            if SMTP_USUARIO:
+                conexion.login(SMTP_USUARIO, SMTP_PASSWORD)
+        except Exception:
+            conexion.close()
+            raise
+
+        self._sumar('conexiones')
+        return conexion
+
+    @staticmethod
+    def _cerrar(conexion: smtplib.SMTP):
+        try:
+            conexion.quit()
+        except Exception:
+            conexion.close()
+
+    def _tomar(self) -> Tuple[smtplib.SMTP, int, bool]:
+        """Retorna (conexion, mensajes enviados, reutilizada)."""
+        while True:
+            try:
+                conexion, usos, ultimo_uso = self._libres.get_nowait()
+            except queue.Empty:
+                return self._conectar(), 0, False
+
+            if time.monotonic() - ultimo_uso > self.inactividad:
+                try:
+                    vigente = conexion.noop()[0] == 250
+                except Exception:
+                    vigente = False
+                if not vigente:
+                    conexion.close()
+                    continue
+            return conexion, usos, True
+
+    def _devolver(self, conexion: smtplib.SMTP, usos: int):
+        if usos >= self.mensajes_por_conexion:
+            self._cerrar(conexion)
+        else:
+            self._libres.put((conexion, usos, time.monotonic()))
+
+    def _enviar_con(self, conexion: smtplib.SMTP, usos: int, mensaje: EmailMessage):
+        try:
+            conexion.send_message(mensaje)
+        except Exception as e:
+            if _rechazo_smtp(e):
+                # El servidor rechazo el mensaje pero la conexion sigue sirviendo
+                self._devolver(conexion, usos + 1)
+            else:
+                conexion.close()
+            raise
+        self._devolver(conexion, usos + 1)
+
+    def enviar(self, mensaje: EmailMessage):
+        """Envia un mensaje usando una conexion del pool."""
+        with self._cupos:
+            conexion, usos, reutilizada = self._tomar()
+            try:
+                self._enviar_con(conexion, usos, mensaje)
+            except Exception as e:
+                if not (reutilizada and _error_conexion(e)):
+                    raise
+                # La conexion guardada habia caducado: reintentar con una nueva
+                self._sumar('reconexiones')
+                self._enviar_con(self._conectar(), 0, mensaje)
+            self._sumar('mensajes')
+
+    def cerrar(self):
+        """Cierra las conexiones libres del pool."""
+        while True:
+            try:
+                conexion, _, _ = self._libres.get_nowait()
+            except queue.Empty:
+                return
+            self._cerrar(conexion)
+
+
+# Pool y limitador compartidos por todos los envios de email del proceso
+pool_smtp = PoolSMTP()
+limitador_email = LimitadorEnvios(tasa=EMAIL_TASA_POR_SEGUNDO, capacidad=EMAIL_RAFAGA)
+
+
+def _codigo_smtp(error: smtplib.SMTPException) -> Optional[int]:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codigos = [codigo for codigo, _ in error.recipients.values()]
+        return codigos[0] if codigos else None
+    return getattr(error, 'smtp_code', None)
+
+
+def _enviar_mensaje(mensaje: EmailMessage) -> Dict[str, Any]:
+    """Envia respetando el limitador del canal y traduce los errores SMTP."""
+    if not limitador_email.adquirir(espera_maxima=EMAIL_ESPERA_MAXIMA):
+        raise LimiteExcedidoError(retry_after=limitador_email.segundos_pausa())
+
+    try:
+        pool_smtp.enviar(mensaje)
+    except smtplib.SMTPAuthenticationError:
+        raise MensajesError('Usuario o contraseña SMTP invalidos', permanente=True)
+    except smtplib.SMTPServerDisconnected as e:
+        raise MensajesError(f'El servidor SMTP cerro la conexion: {e}')
+    except smtplib.SMTPException as e:
+        codigo = _codigo_smtp(e)
+        if codigo and 400 <= codigo < 500:
+            # Rechazo temporal (ej: 421/451 por exceso de envios): pausar el canal
+            pausa = limitador_email.registrar_limite()
+            raise LimiteExcedidoError(f'Servidor SMTP ocupado ({codigo})', retry_after=pausa)
+        # 5xx: rechazo definitivo (ej: 550 destinatario inexistente)
+        raise MensajesError(f'Error SMTP: {e}', permanente=bool(codigo and codigo >= 500))
+    except OSError as e:
+        raise MensajesError(f'No se pudo conectar con el servidor SMTP: {e}')
+
+    return {'success': True, 'messageId': mensaje['Message-ID']}
+
+
+def email_valido(email: str) -> bool:
+    """Validacion basica de formato de email."""
+    if not email or ' ' in email.strip():
+        return False
+    usuario, _, dominio = email.strip().rpartition('@')
+    return bool(usuario) and '.' in dominio
+
+
+def enviar_boleta_email(
+    email: str,
+    boleta: Dict[str, Any],
+    pdf_bytes: Optional[bytes] = None,
+    url_portal: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Envia la boleta por email, con el PDF adjunto si se entrega.
+
+    Args:
+        email: Email del cliente
+        boleta: Diccionario con datos de la boleta
+        pdf_bytes: Contenido del PDF en bytes (opcional)
+        url_portal: URL opcional del portal de pagos
+
+    Returns:
+        Dict con resultado del envio
+
+    Raises:
+        MensajesError: Si hay error en el envio
+    """
+    if not email_valido(email):
+        raise MensajesError('Email invalido', permanente=True)
+    if not SMTP_REMITENTE:
+        raise MensajesError('Remitente no configurado. Configure SMTP_REMITENTE en las variables de entorno.',
+                            permanente=True)
+
+    meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+             'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+    periodo = f"{meses[boleta.get('periodo_mes', 1)]} {boleta.get('periodo_anio', '')}"
+
+    total = boleta.get('total', 0) or 0
+    total_fmt = f"${total:,.0f}".replace(',', '.')
+
+    cuerpo = f"""Estimado(a) {boleta.get('cliente_nombre', 'cliente')}:
+
+Adjuntamos su boleta de agua potable {boleta.get('numero_boleta', '')}.
+
+Periodo: {periodo}
+Consumo: {boleta.get('consumo_m3', 0)} m3
+Total a pagar: {total_fmt}
+"""
+    if url_portal:
+        cuerpo += f"\nPortal de pagos: {url_portal}\n"
+
+    mensaje = EmailMessage()
+    mensaje['From'] = SMTP_REMITENTE
+    mensaje['To'] = email.strip()
+    mensaje['Subject'] = f"Boleta {boleta.get('numero_boleta', '')} - {periodo}"
+    mensaje['Date'] = formatdate(localtime=True)
+    mensaje['Message-ID'] = make_msgid(domain=SMTP_REMITENTE.rpartition('@')[2] or None)
+    mensaje.set_content(cuerpo)
+
+    if pdf_bytes:
+        mensaje.add_attachment(pdf_bytes, maintype='application', subtype='pdf',
+                               filename=f"Boleta_{boleta.get('numero_boleta', 'SN')}.pdf")
+
+    return _enviar_mensaje(mensaje)
+
+
+def verificar_conexion_smtp() -> Dict[str, Any]:
+    """
+    Verifica que el servidor SMTP acepte conexion (y credenciales).
+
+    Returns:
+        Dict con estado de la conexion
+    """
+    try:
+        conexion = pool_smtp._conectar()
+        pool_smtp._cerrar(conexion)
+        return {'conectado': True, 'servidor': f'{SMTP_HOST}:{SMTP_PORT}'}
+    except Exception as e:
+        return {'conectado': False, 'error': str(e)}
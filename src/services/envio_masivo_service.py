@@ -1,50 +1,78 @@
 """
 Servicio de envio masivo de boletas por WhatsApp
 """
-import os
-import time
 import json
 import threading
-from io import BytesIO
 from datetime import datetime
 from typing import Dict, List, Optional
-from flask import render_template, current_app
-from weasyprint import HTML
 
 from src.database import get_connection
 from src.models_configuracion import obtener_periodo_objetivo_generacion
-from src.models_boletas import registrar_envio_boleta
-from src.services.mensajes_service import enviar_boleta_whatsapp, MensajesError
+from src.models_cola_envios import encolar_envios_masivo, contar_envios_por_estado, listar_envios_log
+from src.services.cola_envios_service import clave_envio_boleta, notificar_worker
+from src.services.progreso_service import (
+    clave_progreso, publicar_progreso, obtener_progreso, obtener_estado, EscrituraCoalescida
+)
 
-
-# Directorio base del proyecto
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Pausa entre envios (segundos) para evitar rate limiting
-PAUSA_ENTRE_ENVIOS = 2
+# Escritura coalescida del log por proceso en curso
+_escrituras: Dict[int, EscrituraCoalescida] = {}
+_escrituras_lock = threading.Lock()
 
 
 def obtener_boletas_periodo_envio(anio: int, mes: int) -> List[Dict]:
     """
-    Obtiene boletas del periodo especificado con datos del cliente.
+    Obtiene boletas impagas del periodo con datos del cliente, el estado de
+    envio por WhatsApp agregado y su clasificacion para el envio masivo,
+    todo en una sola consulta.
+
+    Clasificacion (en orden de prioridad):
+        ya_enviada: tiene un envio exitoso o un envio pendiente en la cola
+        sin_telefono: el cliente no tiene telefono
+        no_recibe_wa: el cliente no acepta boleta por WhatsApp
+        enviable: resto
     """
     conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
+        WITH periodo AS (
+            SELECT id FROM boletas
+            WHERE periodo_anio = %s AND periodo_mes = %s AND pagada = 0
+        ),
+        envios AS (
+            SELECT e.boleta_id, COUNT(*) as envios_whatsapp, MAX(e.created_at) as ultimo_envio
+            FROM envios_boletas e
+            JOIN periodo p ON p.id = e.boleta_id
+            WHERE e.canal = 'whatsapp' AND e.estado = 'enviado'
+            GROUP BY e.boleta_id
+        ),
+        en_cola AS (
+            SELECT DISTINCT ce.boleta_id
+            FROM cola_envios ce
+            JOIN periodo p ON p.id = ce.boleta_id
+            WHERE ce.canal = 'whatsapp' AND ce.estado IN ('pendiente', 'procesando')
+        )
         SELECT
             b.id, b.numero_boleta, b.cliente_nombre, b.medidor_id,
             b.periodo_anio, b.periodo_mes, b.lectura_actual, b.lectura_anterior,
             b.consumo_m3, b.cargo_fijo, b.precio_m3, b.subtotal_consumo,
             b.total, b.fecha_emision, b.pagada, b.lectura_id,
             c.id as cliente_id, c.telefono, c.recibe_boleta_whatsapp,
-            m.numero_medidor, m.direccion
-        FROM boletas b
+            m.numero_medidor, m.direccion,
+            COALESCE(e.envios_whatsapp, 0) as envios_whatsapp,
+            e.ultimo_envio,
+            CASE
+                WHEN e.boleta_id IS NOT NULL OR q.boleta_id IS NOT NULL THEN 'ya_enviada'
+                WHEN c.telefono IS NULL OR c.telefono = '' THEN 'sin_telefono'
+                WHEN NOT COALESCE(c.recibe_boleta_whatsapp, FALSE) THEN 'no_recibe_wa'
+                ELSE 'enviable'
+            END as clasificacion
+        FROM periodo p
+        JOIN boletas b ON b.id = p.id
         JOIN medidores m ON b.medidor_id = m.id
         JOIN clientes c ON m.cliente_id = c.id
-        WHERE b.periodo_anio = %s
-          AND b.periodo_mes = %s
-          AND b.pagada = 0
+        LEFT JOIN envios e ON e.boleta_id = b.id
+        LEFT JOIN en_cola q ON q.boleta_id = b.id
         ORDER BY c.nombre, b.numero_boleta
     ''', (anio, mes))
 
@@ -54,65 +82,51 @@ def obtener_boletas_periodo_envio(anio: int, mes: int) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
-def verificar_ya_enviada_whatsapp(boleta_id: int, anio: int, mes: int) -> bool:
-    """
-    Verifica si una boleta ya fue enviada por WhatsApp en el periodo actual.
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT COUNT(*) as total
-        FROM envios_boletas
-        WHERE boleta_id = %s
-          AND canal = 'whatsapp'
-          AND estado = 'enviado'
-    ''', (boleta_id,))
-
-    row = cursor.fetchone()
-    conn.close()
-
-    return row['total'] > 0
-
-
-def obtener_preview_envio() -> Dict:
+def obtener_preview_envio(anio: int = None, mes: int = None) -> Dict:
     """
     Obtiene un preview del envio masivo sin ejecutar.
+    Por defecto usa el periodo objetivo de generacion.
     """
-    anio, mes = obtener_periodo_objetivo_generacion()
+    if anio is None or mes is None:
+        anio, mes = obtener_periodo_objetivo_generacion()
 
     boletas = obtener_boletas_periodo_envio(anio, mes)
 
-    enviables = []
-    sin_telefono = []
-    no_recibe_wa = []
-    ya_enviadas = []
-
+    grupos = {'enviable': [], 'sin_telefono': [], 'no_recibe_wa': [], 'ya_enviada': []}
     for boleta in boletas:
-        telefono = boleta.get('telefono')
-        recibe_wa = boleta.get('recibe_boleta_whatsapp', False)
-
-        if verificar_ya_enviada_whatsapp(boleta['id'], anio, mes):
-            ya_enviadas.append(boleta)
-        elif not telefono:
-            sin_telefono.append(boleta)
-        elif not recibe_wa:
-            no_recibe_wa.append(boleta)
-        else:
-            enviables.append(boleta)
+        grupos[boleta['clasificacion']].append(boleta)
 
     return {
         'periodo_anio': anio,
         'periodo_mes': mes,
         'total_boletas': len(boletas),
-        'enviables': enviables,
-        'total_enviables': len(enviables),
-        'sin_telefono': sin_telefono,
-        'total_sin_telefono': len(sin_telefono),
-        'no_recibe_wa': no_recibe_wa,
-        'total_no_recibe_wa': len(no_recibe_wa),
-        'ya_enviadas': ya_enviadas,
-        'total_ya_enviadas': len(ya_enviadas)
+        'enviables': grupos['enviable'],
+        'total_enviables': len(grupos['enviable']),
+        'sin_telefono': grupos['sin_telefono'],
+        'total_sin_telefono': len(grupos['sin_telefono']),
+        'no_recibe_wa': grupos['no_recibe_wa'],
+        'total_no_recibe_wa': len(grupos['no_recibe_wa']),
+        'ya_enviadas': grupos['ya_enviada'],
+        'total_ya_enviadas': len(grupos['ya_enviada'])
+    }
+
+
+def _snapshot_preview(preview: Dict) -> Dict:
+    """
+    Resumen serializable de la clasificacion usada por un proceso.
+    Se guarda con el log para que el inicio y la ejecucion compartan el
+    mismo calculo.
+    """
+    def ids(boletas):
+        return [b['id'] for b in boletas]
+
+    return {
+        'periodo_anio': preview['periodo_anio'],
+        'periodo_mes': preview['periodo_mes'],
+        'enviables': [{'boleta_id': b['id'], 'telefono': b['telefono']} for b in preview['enviables']],
+        'sin_telefono': ids(preview['sin_telefono']),
+        'no_recibe_wa': ids(preview['no_recibe_wa']),
+        'ya_enviadas': ids(preview['ya_enviadas'])
     }
 
 
@@ -141,19 +155,35 @@ def hay_proceso_en_curso() -> Optional[Dict]:
     return dict(row) if row else None
 
 
-def crear_log_envio_masivo(usuario_id: int, anio: int, mes: int, total_boletas: int = 0, total_enviables: int = 0) -> int:
+def crear_log_envio_masivo(usuario_id: int, anio: int, mes: int, preview: Dict) -> int:
     """
-    Crea un registro de log para el envio masivo.
+    Crea el registro de log del envio masivo con los totales, las omitidas
+    y la clasificacion (snapshot) del preview, en un solo INSERT.
     """
+    detalles = {
+        'enviadas': [],
+        'fallidas': [],
+        'omitidas': (
+            [_detalle_boleta(b, 'sin_telefono') for b in preview['sin_telefono']] +
+            [_detalle_boleta(b, 'no_recibe_whatsapp') for b in preview['no_recibe_wa']] +
+            [_detalle_boleta(b, 'ya_enviada') for b in preview['ya_enviadas']]
+        )
+    }
+
     conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
         INSERT INTO log_envio_masivo
-        (periodo_anio, periodo_mes, estado, iniciado_por, total_boletas, total_enviables)
-        VALUES (%s, %s, 'iniciado', %s, %s, %s)
+        (periodo_anio, periodo_mes, estado, iniciado_por, total_boletas, total_enviables,
+         omitidas_sin_telefono, omitidas_no_recibe_wa, omitidas_ya_enviadas,
+         mensaje, detalles, clasificacion)
+        VALUES (%s, %s, 'iniciado', %s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id
-    ''', (anio, mes, usuario_id, total_boletas, total_enviables))
+    ''', (anio, mes, usuario_id, preview['total_boletas'], preview['total_enviables'],
+          preview['total_sin_telefono'], preview['total_no_recibe_wa'], preview['total_ya_enviadas'],
+          f"En cola: 0/{preview['total_enviables']}",
+          json.dumps(detalles), json.dumps(_snapshot_preview(preview))))
 
     log_id = cursor.fetchone()[0]
     conn.commit()
@@ -277,261 +307,240 @@ def listar_logs_envio(limite: int = 50) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
-def generar_pdf_boleta_standalone(boleta: Dict, app) -> bytes:
+def _detalle_boleta(boleta: Dict, motivo: str) -> Dict:
+    return {
+        'boleta_id': boleta['id'],
+        'numero_boleta': boleta['numero_boleta'],
+        'cliente': boleta['cliente_nombre'],
+        'motivo': motivo
+    }
+
+
+def _encolar_envio_masivo(log_id: int, usuario_id: int, clasificacion: Dict):
     """
-    Genera el PDF de una boleta sin contexto de request.
-    Se usa dentro del thread de background.
+    Encola las boletas enviables segun la clasificacion guardada en el log.
+    El envio lo realiza el worker de la cola de envios.
     """
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
+    encolar_envios_masivo([
+        {
+            'destinatario': item['telefono'],
+            'clave_idempotencia': clave_envio_boleta(item['boleta_id'], log_id),
+            'boleta_id': item['boleta_id'],
+            'usuario_id': usuario_id,
+            'log_envio_id': log_id
+        }
+        for item in clasificacion['enviables']
+    ])
 
-    # Obtener datos de la lectura actual para la foto y fecha
-    foto_lectura = None
-    fecha_lectura_actual = None
-
-    if boleta.get('lectura_id'):
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT foto_path, fecha_lectura FROM lecturas WHERE id = %s
-        ''', (boleta['lectura_id'],))
-        lectura = cursor.fetchone()
-        conn.close()
-
-        if lectura:
-            if lectura.get('foto_path') and lectura['foto_path'] != '':
-                foto_lectura = os.path.join(BASE_DIR, 'web', 'fotos', lectura['foto_path'])
-            fecha_lectura_actual = lectura.get('fecha_lectura')
-
-    # Obtener fecha de lectura anterior
-    fecha_lectura_anterior = None
-    if boleta.get('lectura_anterior') is not None:
-        medidor_id = boleta['medidor_id']
-        anio = boleta['periodo_anio']
-        mes = boleta['periodo_mes']
-
-        if mes == 1:
-            mes_anterior = 12
-            anio_anterior = anio - 1
-        else:
-            mes_anterior = mes - 1
-            anio_anterior = anio
-
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT fecha_lectura FROM lecturas
-            WHERE medidor_id = %s AND anio = %s AND mes = %s
-        ''', (medidor_id, anio_anterior, mes_anterior))
-        lectura_ant = cursor.fetchone()
-        conn.close()
-
-        if lectura_ant:
-            fecha_lectura_anterior = lectura_ant['fecha_lectura']
-
-    # Renderizar template HTML dentro del contexto de la app
-    with app.app_context():
-        html_string = render_template('boletas/boleta_pdf.html',
-                                       boleta=boleta,
-                                       meses=meses,
-                                       foto_lectura=foto_lectura,
-                                       fecha_lectura_actual=fecha_lectura_actual,
-                                       fecha_lectura_anterior=fecha_lectura_anterior)
-
-    # Generar PDF usando WeasyPrint
-    web_dir = os.path.join(BASE_DIR, 'web')
-    pdf_file = BytesIO()
-    HTML(string=html_string, base_url=web_dir).write_pdf(pdf_file)
-    pdf_file.seek(0)
-
-    return pdf_file.getvalue()
-
-
-def _ejecutar_envio_en_background(log_id: int, usuario_id: int, app):
+    # Sin boletas enviables el proceso termina de inmediato
+    actualizar_progreso_envio_masivo(log_id)
+    notificar_worker()
+
+
+# ============================================================
+# LOG DE PIPELINE (GENERACION + ENVIO)
+# ============================================================
+
+def crear_log_envio_pipeline(usuario_id: Optional[int], anio: int, mes: int) -> int:
     """
-    Funcion interna que ejecuta el envio masivo en un thread separado.
+    Crea el log de un envio alimentado por el pipeline post-generacion.
+    Queda 'abierto' (no se cierra aunque la cola se vacie) hasta que el
+    pipeline termine de agregar boletas.
     """
-    inicio = time.time()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO log_envio_masivo
+        (periodo_anio, periodo_mes, estado, iniciado_por, mensaje, detalles, clasificacion)
+        VALUES (%s, %s, 'iniciado', %s, 'Pipeline: esperando boletas...', %s, %s)
+        RETURNING id
+    ''', (anio, mes, usuario_id,
+          json.dumps({'enviadas': [], 'fallidas': [], 'omitidas': []}),
+          json.dumps({'periodo_anio': anio, 'periodo_mes': mes, 'pipeline': True, 'abierto': True})))
+    log_id = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return log_id
 
-    try:
-        anio, mes = obtener_periodo_objetivo_generacion()
 
-        # Obtener preview para clasificar boletas
-        preview = obtener_preview_envio()
+def registrar_lote_pipeline(log_id: int, encoladas: int, sin_telefono: int = 0, no_recibe_wa: int = 0):
+    """Suma a los totales del log las boletas que el pipeline encolo u omitio."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE log_envio_masivo
+        SET total_boletas = total_boletas + %s,
+            total_enviables = total_enviables + %s,
+            omitidas_sin_telefono = omitidas_sin_telefono + %s,
+            omitidas_no_recibe_wa = omitidas_no_recibe_wa + %s
+        WHERE id = %s
+    ''', (encoladas + sin_telefono + no_recibe_wa, encoladas, sin_telefono, no_recibe_wa, log_id))
+    conn.commit()
+    conn.close()
+
 
-        detalles = {
-            'enviadas': [],
-            'fallidas': [],
-            'omitidas': []
-        }
+def cerrar_log_envio_pipeline(log_id: int):
+    """Marca que el pipeline no agregara mas boletas y sincroniza el progreso."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE log_envio_masivo
+        SET clasificacion = COALESCE(clasificacion, '{}'::jsonb) || '{"abierto": false}'::jsonb
+        WHERE id = %s
+    ''', (log_id,))
+    conn.commit()
+    conn.close()
 
-        # Actualizar log con totales iniciales
-        actualizar_log_envio_masivo(
-            log_id=log_id,
-            total_boletas=preview['total_boletas'],
-            omitidas_sin_telefono=preview['total_sin_telefono'],
-            omitidas_no_recibe_wa=preview['total_no_recibe_wa'],
-            omitidas_ya_enviadas=preview['total_ya_enviadas']
-        )
+    actualizar_progreso_envio_masivo(log_id)
 
-        enviadas_exitosas = 0
-        enviadas_fallidas = 0
 
-        # Agregar omitidas a detalles
-        for boleta in preview['sin_telefono']:
-            detalles['omitidas'].append({
-                'boleta_id': boleta['id'],
-                'numero_boleta': boleta['numero_boleta'],
-                'cliente': boleta['cliente_nombre'],
-                'motivo': 'sin_telefono'
-            })
+# ============================================================
+# PROGRESO
+# ============================================================
 
-        for boleta in preview['no_recibe_wa']:
-            detalles['omitidas'].append({
-                'boleta_id': boleta['id'],
-                'numero_boleta': boleta['numero_boleta'],
-                'cliente': boleta['cliente_nombre'],
-                'motivo': 'no_recibe_whatsapp'
-            })
+def estado_log_envio(log: Dict) -> Dict:
+    """Estado de un envio masivo (el que consumen polling y SSE) desde su log."""
+    return {
+        'id': log['id'],
+        'estado': log['estado'],
+        'total_boletas': log['total_boletas'],
+        'total_enviables': log.get('total_enviables') or 0,
+        'enviadas_exitosas': log['enviadas_exitosas'] or 0,
+        'enviadas_fallidas': log['enviadas_fallidas'] or 0,
+        'mensaje': log.get('mensaje') or '',
+        'duracion_segundos': float(log['duracion_segundos']) if log.get('duracion_segundos') else None,
+        'en_curso': log['estado'] == 'iniciado'
+    }
 
-        for boleta in preview['ya_enviadas']:
-            detalles['omitidas'].append({
-                'boleta_id': boleta['id'],
-                'numero_boleta': boleta['numero_boleta'],
-                'cliente': boleta['cliente_nombre'],
-                'motivo': 'ya_enviada'
-            })
 
-        boletas_enviables = preview['enviables']
-        total_enviables = len(boletas_enviables)
-
-        for i, boleta in enumerate(boletas_enviables):
-            telefono = boleta['telefono']
-
-            try:
-                # Generar PDF
-                pdf_bytes = generar_pdf_boleta_standalone(boleta, app)
-
-                # Enviar por WhatsApp
-                enviar_boleta_whatsapp(telefono, boleta, pdf_bytes=pdf_bytes)
-
-                # Registrar envio exitoso
-                registrar_envio_boleta(
-                    boleta_id=boleta['id'],
-                    usuario_id=usuario_id,
-                    canal='whatsapp',
-                    destinatario=telefono,
-                    estado='enviado'
-                )
-
-                enviadas_exitosas += 1
-                detalles['enviadas'].append({
-                    'boleta_id': boleta['id'],
-                    'numero_boleta': boleta['numero_boleta'],
-                    'cliente': boleta['cliente_nombre'],
-                    'telefono': telefono
-                })
-
-                # Actualizar progreso cada envio
-                actualizar_log_envio_masivo(
-                    log_id=log_id,
-                    enviadas_exitosas=enviadas_exitosas,
-                    enviadas_fallidas=enviadas_fallidas,
-                    mensaje=f"Enviando... {enviadas_exitosas}/{total_enviables}"
-                )
-
-            except MensajesError as e:
-                error_msg = str(e)
-
-                # Si es error 429 (rate limit), interrumpir el proceso
-                if 'Limite de mensajes excedido' in error_msg:
-                    detalles['fallidas'].append({
-                        'boleta_id': boleta['id'],
-                        'numero_boleta': boleta['numero_boleta'],
-                        'cliente': boleta['cliente_nombre'],
-                        'error': error_msg
-                    })
-                    enviadas_fallidas += 1
-
-                    duracion = time.time() - inicio
-                    mensaje = f"Interrumpido por limite. Enviadas: {enviadas_exitosas}, Pendientes: {total_enviables - i - 1}"
-
-                    actualizar_log_envio_masivo(
-                        log_id=log_id,
-                        estado='interrumpido',
-                        enviadas_exitosas=enviadas_exitosas,
-                        enviadas_fallidas=enviadas_fallidas,
-                        mensaje=mensaje,
-                        detalles=detalles,
-                        duracion_segundos=duracion
-                    )
-                    return
-
-                # Otro error: registrar y continuar
-                registrar_envio_boleta(
-                    boleta_id=boleta['id'],
-                    usuario_id=usuario_id,
-                    canal='whatsapp',
-                    destinatario=telefono,
-                    estado='fallido',
-                    mensaje_error=error_msg
-                )
-
-                enviadas_fallidas += 1
-                detalles['fallidas'].append({
-                    'boleta_id': boleta['id'],
-                    'numero_boleta': boleta['numero_boleta'],
-                    'cliente': boleta['cliente_nombre'],
-                    'error': error_msg
-                })
-
-            except Exception as e:
-                enviadas_fallidas += 1
-                detalles['fallidas'].append({
-                    'boleta_id': boleta['id'],
-                    'numero_boleta': boleta['numero_boleta'],
-                    'cliente': boleta['cliente_nombre'],
-                    'error': str(e)
-                })
-
-            # Pausa entre envios
-            if i < total_enviables - 1:
-                time.sleep(PAUSA_ENTRE_ENVIOS)
-
-        # Proceso completado
-        duracion = time.time() - inicio
-        mensaje = f"Completado: {enviadas_exitosas} exitosas, {enviadas_fallidas} fallidas"
+def cargar_estado_envio(log_id: int) -> Optional[Dict]:
+    """Estado de un envio masivo leido desde la base de datos."""
+    log = obtener_log_envio(log_id)
+    return estado_log_envio(log) if log else None
 
-        actualizar_log_envio_masivo(
-            log_id=log_id,
-            estado='completado',
-            enviadas_exitosas=enviadas_exitosas,
-            enviadas_fallidas=enviadas_fallidas,
-            mensaje=mensaje,
-            detalles=detalles,
-            duracion_segundos=duracion
-        )
 
-    except Exception as e:
-        duracion = time.time() - inicio
+def obtener_estado_envio(log_id: int) -> Optional[Dict]:
+    """
+    Estado de un envio masivo: el de memoria si el worker corre en este
+    proceso, si no el del log en la base de datos.
+    """
+    return obtener_estado(clave_progreso('envio', log_id), lambda: cargar_estado_envio(log_id))
+
+
+def _escritura_log(log_id: int) -> EscrituraCoalescida:
+    with _escrituras_lock:
+        if log_id not in _escrituras:
+            _escrituras[log_id] = EscrituraCoalescida()
+        return _escrituras[log_id]
+
+
+def actualizar_progreso_envio_masivo(log_id: int):
+    """
+    Sincroniza el log de un envio masivo con el estado de la cola y publica
+    el progreso. Cuando no quedan envios pendientes, cierra el proceso con
+    el detalle de enviadas y fallidas.
+    """
+    log = obtener_log_envio(log_id)
+    if not log or log['estado'] != 'iniciado':
+        return
+
+    conteo = contar_envios_por_estado(log_id)
+    exitosas = conteo['enviado']
+    fallidas = conteo['fallido']
+    total = exitosas + fallidas + conteo['pendiente'] + conteo['procesando']
+
+    # Un log de pipeline sigue abierto mientras la generacion le agrega boletas
+    abierto = (log.get('clasificacion') or {}).get('abierto', False)
+
+    if conteo['pendiente'] or conteo['procesando'] or abierto:
+        mensaje = f"Enviando... {exitosas + fallidas}/{total}"
         actualizar_log_envio_masivo(
             log_id=log_id,
-            estado='error',
-            mensaje=f"Error: {str(e)}",
-            duracion_segundos=duracion
+            enviadas_exitosas=exitosas,
+            enviadas_fallidas=fallidas,
+            mensaje=mensaje
         )
+        log.update(enviadas_exitosas=exitosas, enviadas_fallidas=fallidas, mensaje=mensaje)
+        publicar_progreso(clave_progreso('envio', log_id), **estado_log_envio(log))
+        return
+
+    detalles = log.get('detalles') or {'omitidas': []}
+    detalles['enviadas'] = []
+    detalles['fallidas'] = []
+    for envio in listar_envios_log(log_id):
+        if envio['estado'] == 'enviado':
+            detalles['enviadas'].append({
+                'boleta_id': envio['boleta_id'],
+                'numero_boleta': envio['numero_boleta'],
+                'cliente': envio['cliente_nombre'],
+                'telefono': envio['destinatario']
+            })
+        else:
+            detalles['fallidas'].append({
+                'boleta_id': envio['boleta_id'],
+                'numero_boleta': envio['numero_boleta'],
+                'cliente': envio['cliente_nombre'],
+                'error': envio['ultimo_error']
+            })
+
+    duracion = (datetime.now() - log['fecha_ejecucion']).total_seconds() if log.get('fecha_ejecucion') else None
+    mensaje = f"Completado: {exitosas} exitosas, {fallidas} fallidas"
+
+    actualizar_log_envio_masivo(
+        log_id=log_id,
+        estado='completado',
+        enviadas_exitosas=exitosas,
+        enviadas_fallidas=fallidas,
+        mensaje=mensaje,
+        detalles=detalles,
+        duracion_segundos=duracion
+    )
+
+    log.update(estado='completado', enviadas_exitosas=exitosas, enviadas_fallidas=fallidas,
+               mensaje=mensaje, duracion_segundos=duracion)
+    publicar_progreso(clave_progreso('envio', log_id), **estado_log_envio(log))
+    with _escrituras_lock:
+        _escrituras.pop(log_id, None)
 
 
-def iniciar_envio_masivo_async(usuario_id: int, app) -> int:
+def registrar_avance_envio_masivo(log_id: int, enviadas: int = 0, fallidas: int = 0):
     """
-    Inicia el proceso de envio masivo en background.
+    Registra el resultado de envios de un proceso masivo.
+
+    El avance se publica en memoria en cada llamada; el log en la base de
+    datos solo se escribe cada PROGRESO_ESCRIBIR_CADA envios o
+    PROGRESO_ESCRIBIR_SEGUNDOS segundos, y siempre al completar el total.
+    """
+    clave = clave_progreso('envio', log_id)
+    progreso = obtener_progreso(clave)
+    if progreso is None or not progreso['en_curso']:
+        # Primer avance visto por este proceso (ej: tras un reinicio)
+        actualizar_progreso_envio_masivo(log_id)
+        return
+
+    exitosas = progreso['enviadas_exitosas'] + enviadas
+    fallidas_total = progreso['enviadas_fallidas'] + fallidas
+    total = progreso['total_enviables']
+    publicar_progreso(
+        clave,
+        enviadas_exitosas=exitosas,
+        enviadas_fallidas=fallidas_total,
+        mensaje=f"Enviando... {exitosas + fallidas_total}/{total}"
+    )
+
+    if _escritura_log(log_id).registrar(enviadas + fallidas) or exitosas + fallidas_total >= total:
+        actualizar_progreso_envio_masivo(log_id)
+
+
+def iniciar_envio_masivo_async(usuario_id: int, anio: int = None, mes: int = None) -> int:
+    """
+    Inicia el proceso de envio masivo encolando las boletas enviables.
+    El worker de la cola las envia en segundo plano; el proceso sobrevive
+    a reinicios del servidor porque su estado vive en la base de datos.
 
     Args:
         usuario_id: ID del usuario que ejecuta el proceso
-        app: Instancia de la aplicacion Flask
+        anio, mes: Periodo a enviar (por defecto el periodo objetivo)
 
     Returns:
         ID del log creado
@@ -541,24 +550,14 @@ def iniciar_envio_masivo_async(usuario_id: int, app) -> int:
     if proceso:
         raise ValueError(f"Ya hay un proceso en curso (ID: {proceso['id']})")
 
-    anio, mes = obtener_periodo_objetivo_generacion()
+    # Clasificacion calculada una sola vez y guardada con el log
+    preview = obtener_preview_envio(anio, mes)
+    log_id = crear_log_envio_masivo(usuario_id, preview['periodo_anio'], preview['periodo_mes'], preview)
 
-    # Obtener preview para saber totales
-    preview = obtener_preview_envio()
-
-    # Crear log inicial con total de enviables
-    log_id = crear_log_envio_masivo(
-        usuario_id, anio, mes,
-        total_boletas=preview['total_boletas'],
-        total_enviables=preview['total_enviables']
-    )
-
-    # Iniciar thread de background
-    thread = threading.Thread(
-        target=_ejecutar_envio_en_background,
-        args=(log_id, usuario_id, app),
-        daemon=True
-    )
-    thread.start()
+    try:
+        _encolar_envio_masivo(log_id, usuario_id, _snapshot_preview(preview))
+    except Exception as e:
+        actualizar_log_envio_masivo(log_id=log_id, estado='error', mensaje=f"Error: {str(e)}")
+        raise
 
     return log_id
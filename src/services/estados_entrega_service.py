@@ -0,0 +1,163 @@
+"""
+Ingesta de estados de entrega (entregado, leido, fallido) que el proveedor
+de mensajes informa por webhook.
+
+Los avisos se acumulan en memoria y se guardan por lotes: cada
+ESTADOS_ENTREGA_LOTE mensajes distintos o cada ESTADOS_ENTREGA_INTERVALO
+segundos, con un unico INSERT ... ON CONFLICT por lote. Los avisos
+repetidos del mismo mensaje se fusionan en memoria antes de escribir y la
+base de datos ignora los que no aportan nada nuevo.
+"""
+import os
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.models_boletas import guardar_estados_entrega
+
+logger = logging.getLogger(__name__)
+
+# Mensajes distintos en memoria que disparan una escritura
+ESTADOS_ENTREGA_LOTE = int(os.getenv('ESTADOS_ENTREGA_LOTE', '200'))
+# Tiempo maximo que un aviso espera en memoria antes de guardarse
+ESTADOS_ENTREGA_INTERVALO = float(os.getenv('ESTADOS_ENTREGA_INTERVALO', '2'))
+# Tope del buffer si la base de datos no responde (se descartan los mas nuevos)
+ESTADOS_ENTREGA_MAXIMO = int(os.getenv('ESTADOS_ENTREGA_MAXIMO', '20000'))
+
+NIVELES = {'fallido': 1, 'entregado': 2, 'leido': 3}
+
+# Estados del proveedor -> estados propios (los demas se ignoran)
+ESTADOS_PROVEEDOR = {
+    'delivered': 'entregado',
+    'delivery_ack': 'entregado',
+    'entregado': 'entregado',
+    'read': 'leido',
+    'played': 'leido',
+    'leido': 'leido',
+    'failed': 'fallido',
+    'undelivered': 'fallido',
+    'error': 'fallido',
+    'fallido': 'fallido'
+}
+
+_pendientes: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_vaciar = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+
+def _fusionar(actual: Optional[Dict], nuevo: Dict) -> Dict:
+    """Combina dos avisos del mismo mensaje (gana el de mayor nivel)."""
+    if actual is None:
+        return nuevo
+    fusion = dict(actual if actual['nivel'] >= nuevo['nivel'] else nuevo)
+    for campo in ('entregado_at', 'leido_at'):
+        fechas = [f for f in (actual.get(campo), nuevo.get(campo)) if f]
+        fusion[campo] = min(fechas) if fechas else None
+    fusion['error'] = nuevo.get('error') or actual.get('error')
+    return fusion
+
+
+def _texto_error(error) -> Optional[str]:
+    """Error del proveedor como texto (puede venir como objeto o lista)."""
+    if error in (None, ''):
+        return None
+    if not isinstance(error, str):
+        error = json.dumps(error, ensure_ascii=False, default=str)
+    return error[:500]
+
+
+def normalizar_estado(mensaje_id: str, estado: str, fecha: datetime = None,
+                      error: str = None) -> Optional[Dict]:
+    """
+    Convierte un aviso del proveedor en un registro de estado, o None si el
+    estado no interesa (ej: 'sent', 'queued') o no es un texto.
+    """
+    estado = ESTADOS_PROVEEDOR.get(estado.lower()) if isinstance(estado, str) else None
+    if not mensaje_id or not estado:
+        return None
+
+    fecha = fecha or datetime.now()
+    return {
+        'mensaje_id': str(mensaje_id)[:100],
+        'estado': estado,
+        'nivel': NIVELES[estado],
+        # Leido implica entregado
+        'entregado_at': fecha if estado in ('entregado', 'leido') else None,
+        'leido_at': fecha if estado == 'leido' else None,
+        'error': _texto_error(error) if estado == 'fallido' else None
+    }
+
+
+def registrar_estado(mensaje_id: str, estado: str, fecha: datetime = None,
+                     error: str = None) -> bool:
+    """
+    Acumula un aviso de estado para guardarlo en el proximo lote.
+    Retorna False si el aviso se ignoro.
+    """
+    registro = normalizar_estado(mensaje_id, estado, fecha, error)
+    if registro is None:
+        return False
+
+    _iniciar_flusher()
+    with _lock:
+        clave = registro['mensaje_id']
+        if clave not in _pendientes and len(_pendientes) >= ESTADOS_ENTREGA_MAXIMO:
+            logger.warning(f"Buffer de estados de entrega lleno, se descarta aviso de {clave}")
+            return False
+        _pendientes[clave] = _fusionar(_pendientes.get(clave), registro)
+        lleno = len(_pendientes) >= ESTADOS_ENTREGA_LOTE
+
+    if lleno:
+        _vaciar.set()
+    return True
+
+
+def vaciar_estados() -> int:
+    """Guarda todos los avisos acumulados. Retorna los mensajes afectados."""
+    global _pendientes
+    with _lock:
+        lote, _pendientes = _pendientes, {}
+    if not lote:
+        return 0
+
+    registros = list(lote.values())
+    afectados = 0
+    try:
+        for i in range(0, len(registros), ESTADOS_ENTREGA_LOTE):
+            afectados += guardar_estados_entrega(registros[i:i + ESTADOS_ENTREGA_LOTE])
+    except Exception as e:
+        # Devolver al buffer para el proximo intento (sin pisar avisos mas nuevos)
+        logger.error(f"Error guardando estados de entrega: {e}")
+        with _lock:
+            for registro in registros:
+                clave = registro['mensaje_id']
+                _pendientes[clave] = _fusionar(_pendientes.get(clave), registro)
+    return afectados
+
+
+def _ejecutar_flusher():
+    while True:
+        _vaciar.wait(ESTADOS_ENTREGA_INTERVALO)
+        _vaciar.clear()
+        try:
+            vaciar_estados()
+        except Exception as e:
+            logger.error(f"Error en flusher de estados de entrega: {e}")
+
+
+def _iniciar_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_ejecutar_flusher, name='estados-entrega', daemon=True)
+            _flusher.start()
+
+
+# Al apagar el proceso, no perder lo acumulado
+atexit.register(vaciar_estados)
@@ -0,0 +1,276 @@
+"""
+Servicio de exportacion de listados a Excel y CSV.
+
+Las filas llegan de un cursor del lado del servidor (por lotes) y se
+escriben a medida que se leen, asi la memoria no crece con el tamano del
+listado:
+
+- Excel: openpyxl en modo write_only. Los estilos se registran una sola
+  vez por libro como estilos con nombre y cada celda solo los referencia.
+- CSV: se genera por bloques de filas, apto para una respuesta en streaming.
+
+Una exportacion se describe con un dict:
+    {
+        'nombre': 'boletas',              # prefijo del archivo
+        'hoja': 'Boletas',
+        'titulo': 'REPORTE DE BOLETAS',
+        'lineas': ['Filtros aplicados: ...'],
+        'resumen': [('Total Boletas:', 120), ...],   # opcional
+        'columnas': [{'header': 'Total', 'width': 15, 'estilo': 'exp_moneda',
+                      'estilos': {'Pagada': 'exp_exito'}}, ...],
+        'filas': callable sin argumentos que retorna un iterador de listas,
+        'total': filas esperadas
+    }
+
+Sobre EXPORTACION_LIMITE_SINCRONO filas la exportacion se genera en un
+thread y se publica su avance en progreso_service; el archivo queda en
+exportaciones/ durante EXPORTACION_RETENCION_HORAS.
+"""
+import os
+import re
+import csv
+import glob
+import time
+import logging
+import secrets
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from src.database import BASE_DIR
+from src.services.progreso_service import clave_progreso, publicar_progreso, obtener_estado
+
+logger = logging.getLogger(__name__)
+
+EXPORTACIONES_DIR = os.path.join(BASE_DIR, 'exportaciones')
+# Sobre este numero de filas la exportacion se genera en segundo plano
+EXPORTACION_LIMITE_SINCRONO = int(os.getenv('EXPORTACION_LIMITE_SINCRONO', '20000'))
+# Horas que se conservan los archivos generados en segundo plano
+EXPORTACION_RETENCION_HORAS = float(os.getenv('EXPORTACION_RETENCION_HORAS', '24'))
+# Excel en configuracion regional es-CL espera ';' como separador de listas
+EXPORTACION_CSV_SEPARADOR = os.getenv('EXPORTACION_CSV_SEPARADOR', ';')
+
+# Filas por bloque del CSV y cada cuantas filas se publica el avance
+FILAS_POR_BLOQUE = 1000
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+_TOKEN_VALIDO = re.compile(r'[0-9a-f]{32}')
+
+
+def nombre_archivo(exportacion: Dict, formato: str) -> str:
+    """Nombre de descarga con fecha y hora (ej: boletas_20261018_101500.xlsx)."""
+    return f"{exportacion['nombre']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+
+
+# ============================================================
+# EXCEL (write_only)
+# ============================================================
+
+def _registrar_estilos(wb):
+    """Crea los estilos con nombre del libro (una vez por exportacion)."""
+    from openpyxl.styles import NamedStyle, Font, Alignment, PatternFill, Border, Side
+
+    borde = Border(left=Side(style='thin'), right=Side(style='thin'),
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+
+    def relleno(color):
+        return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+    for estilo in (
+        NamedStyle('exp_titulo', font=Font(bold=True, size=14)),
+        NamedStyle('exp_filtros', font=Font(italic=True)),
+        NamedStyle('exp_seccion', font=Font(bold=True, size=12), fill=relleno('E7E6E6')),
+        NamedStyle('exp_etiqueta', font=Font(bold=True)),
+        NamedStyle('exp_encabezado', font=Font(bold=True, color='FFFFFF', size=12), fill=relleno('4472C4'),
+                   alignment=Alignment(horizontal='center', vertical='center'), border=borde),
+        NamedStyle('exp_celda', border=borde),
+        NamedStyle('exp_moneda', border=borde, number_format='$#,##0'),
+        NamedStyle('exp_exito', border=borde, fill=relleno('C6EFCE')),
+        NamedStyle('exp_alerta', border=borde, fill=relleno('FFEB9C')),
+        NamedStyle('exp_error', border=borde, fill=relleno('FFC7CE')),
+    ):
+        wb.add_named_style(estilo)
+
+
+def _contar_filas(filas, al_avanzar=None) -> Iterator:
+    """Pasa las filas y avisa el total acumulado cada FILAS_POR_BLOQUE."""
+    for numero, fila in enumerate(filas, 1):
+        if al_avanzar and numero % FILAS_POR_BLOQUE == 0:
+            al_avanzar(numero)
+        yield fila
+
+
+def escribir_excel(exportacion: Dict, destino, al_avanzar=None) -> int:
+    """
+    Escribe la exportacion como xlsx en `destino` (ruta o archivo abierto
+    en modo binario). Retorna el numero de filas de datos.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    _registrar_estilos(wb)
+    ws = wb.create_sheet(exportacion['hoja'])
+
+    def celda(valor, estilo):
+        resultado = WriteOnlyCell(ws, value=valor)
+        resultado.style = estilo
+        return resultado
+
+    columnas = exportacion['columnas']
+    # En write_only los anchos deben fijarse antes de la primera fila
+    for indice, columna in enumerate(columnas, 1):
+        ws.column_dimensions[get_column_letter(indice)].width = columna['width']
+
+    ws.append([celda(exportacion['titulo'], 'exp_titulo')])
+    ws.append([f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}"])
+    for linea in exportacion.get('lineas') or []:
+        ws.append([celda(linea, 'exp_filtros')])
+
+    if exportacion.get('resumen'):
+        ws.append([])
+        ws.append([celda('RESUMEN', 'exp_seccion')])
+        for etiqueta, valor in exportacion['resumen']:
+            ws.append([celda(etiqueta, 'exp_etiqueta'), valor])
+
+    ws.append([])
+    ws.append([celda(columna['header'], 'exp_encabezado') for columna in columnas])
+
+    estilos = [(columna.get('estilo', 'exp_celda'), columna.get('estilos') or {}) for columna in columnas]
+    total = 0
+    for fila in _contar_filas(exportacion['filas'](), al_avanzar):
+        ws.append([celda(valor, por_valor.get(valor, estilo))
+                   for valor, (estilo, por_valor) in zip(fila, estilos)])
+        total += 1
+
+    wb.save(destino)
+    return total
+
+
+# ============================================================
+# CSV
+# ============================================================
+
+class _Eco:
+    """Destino de csv.writer que retorna la linea en vez de guardarla."""
+
+    def write(self, linea):
+        return linea
+
+
+def generar_csv(exportacion: Dict) -> Iterator[str]:
+    """
+    CSV de la exportacion en bloques de FILAS_POR_BLOQUE filas. Comienza
+    con BOM para que Excel reconozca UTF-8.
+    """
+    escritor = csv.writer(_Eco(), delimiter=EXPORTACION_CSV_SEPARADOR)
+    yield '\ufeff' + escritor.writerow([columna['header'] for columna in exportacion['columnas']])
+
+    bloque = []
+    for fila in exportacion['filas']():
+        bloque.append(escritor.writerow(fila))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
+
+
+def escribir_csv(exportacion: Dict, ruta: str, al_avanzar=None) -> int:
+    """Escribe el CSV en `ruta`. Retorna el numero de filas de datos."""
+    total = 0
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        escritor = csv.writer(archivo, delimiter=EXPORTACION_CSV_SEPARADOR)
+        archivo.write('\ufeff')
+        escritor.writerow([columna['header'] for columna in exportacion['columnas']])
+        for fila in _contar_filas(exportacion['filas'](), al_avanzar):
+            escritor.writerow(fila)
+            total += 1
+    return total
+
+
+# ============================================================
+# EXPORTACION EN SEGUNDO PLANO
+# ============================================================
+
+def _ruta_parcial(token: str) -> str:
+    return os.path.join(EXPORTACIONES_DIR, f'{token}.parcial')
+
+
+def ruta_exportacion(token: str) -> Optional[str]:
+    """Ruta del archivo terminado de una exportacion, o None."""
+    if not _TOKEN_VALIDO.fullmatch(token or ''):
+        return None
+    archivos = glob.glob(os.path.join(EXPORTACIONES_DIR, f'{token}_*'))
+    return archivos[0] if archivos else None
+
+
+def _purgar_exportaciones():
+    """Elimina archivos de exportaciones mas antiguos que la retencion."""
+    limite = time.time() - EXPORTACION_RETENCION_HORAS * 3600
+    for ruta in glob.glob(os.path.join(EXPORTACIONES_DIR, '*')):
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+def cargar_estado_exportacion(token: str) -> Optional[Dict]:
+    """
+    Estado segun los archivos en disco: sirve cuando la exportacion corrio
+    en otro worker o el estado en memoria ya expiro.
+    """
+    ruta = ruta_exportacion(token)
+    if ruta:
+        return {'id': token, 'estado': 'completado', 'en_curso': False,
+                'archivo': os.path.basename(ruta)[len(token) + 1:]}
+    if _TOKEN_VALIDO.fullmatch(token or '') and os.path.exists(_ruta_parcial(token)):
+        return {'id': token, 'estado': 'en_curso', 'en_curso': True}
+    return None
+
+
+def obtener_estado_exportacion(token: str) -> Optional[Dict]:
+    """Estado de una exportacion en segundo plano (memoria o disco)."""
+    return obtener_estado(clave_progreso('exportacion', token),
+                          lambda: cargar_estado_exportacion(token))
+
+
+def iniciar_exportacion_async(exportacion: Dict, formato: str, usuario_id: int = None) -> str:
+    """
+    Genera la exportacion en un thread y retorna el token para seguir su
+    avance y descargarla.
+    """
+    os.makedirs(EXPORTACIONES_DIR, exist_ok=True)
+    _purgar_exportaciones()
+
+    token = secrets.token_hex(16)
+    archivo = nombre_archivo(exportacion, formato)
+    clave = clave_progreso('exportacion', token)
+    publicar_progreso(clave, id=token, estado='en_curso', archivo=archivo, filas=0,
+                      total=exportacion['total'], usuario_id=usuario_id, en_curso=True)
+
+    def ejecutar():
+        parcial = _ruta_parcial(token)
+        avanzar = lambda filas: publicar_progreso(clave, filas=filas)
+        try:
+            if formato == 'csv':
+                filas = escribir_csv(exportacion, parcial, avanzar)
+            else:
+                filas = escribir_excel(exportacion, parcial, avanzar)
+            os.replace(parcial, os.path.join(EXPORTACIONES_DIR, f'{token}_{archivo}'))
+            publicar_progreso(clave, estado='completado', filas=filas, en_curso=False)
+            logger.info(f"Exportacion {archivo}: {filas} filas")
+        except Exception as e:
+            logger.exception(f"Error en exportacion {archivo}")
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            publicar_progreso(clave, estado='error', error=str(e), en_curso=False)
+
+    threading.Thread(target=ejecutar, name=f'exportacion-{token[:8]}', daemon=True).start()
+    return token
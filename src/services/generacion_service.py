@@ -2,6 +2,7 @@
 Servicio de generacion automatica de lecturas y boletas
 """
 import time
+import threading
 from datetime import date
 from typing import Dict, List, Optional, Tuple
 from src.database import get_connection
@@ -13,7 +14,8 @@ from src.models_configuracion import (
 from src.models_scheduler import (
     crear_log_generacion,
     actualizar_log_generacion,
-    actualizar_ultima_ejecucion
+    actualizar_ultima_ejecucion,
+    obtener_log_generacion
 )
 from src.models_boletas import (
     obtener_configuracion as obtener_config_boletas,
@@ -21,6 +23,12 @@ from src.models_boletas import (
     calcular_consumo,
     crear_boleta
 )
+from src.services.progreso_service import (
+    clave_progreso, publicar_progreso, EscrituraCoalescida
+)
+
+# Evita dos generaciones manuales simultaneas en el mismo proceso
+_lock_generacion = threading.Lock()
 
 
 def obtener_medidores_sin_lectura(anio: int, mes: int) -> List[Dict]:
@@ -348,15 +356,26 @@ def obtener_preview_generacion() -> Dict:
 def ejecutar_generacion(
     usuario_id: Optional[int] = None,
     es_automatico: bool = True,
-    solo_boletas: bool = False
+    solo_boletas: bool = False,
+    log_id: Optional[int] = None,
+    enviar_whatsapp: Optional[bool] = None,
+    app=None
 ) -> Dict:
     """
     Ejecuta el proceso de generacion automatica de lecturas y boletas.
 
+    El avance se publica en memoria en cada paso y el log solo se escribe
+    de forma coalescida (ver progreso_service).
+
     Args:
         usuario_id: ID del usuario que inicia el proceso (None si es automatico)
         es_automatico: True si es ejecucion automatica por cron
         solo_boletas: True para solo generar boletas (no crear lecturas)
+        log_id: Log ya creado (ejecucion en segundo plano); si es None se crea
+        enviar_whatsapp: Pasar las boletas nuevas del periodo por el pipeline
+            de envio (PDF + cola de envios). None usa la configuracion
+            'envio_automatico_whatsapp'
+        app: Aplicacion Flask (necesaria para renderizar los PDF del pipeline)
 
     Returns:
         Diccionario con resultados de la ejecucion
@@ -365,12 +384,18 @@ def ejecutar_generacion(
     anio, mes = obtener_periodo_objetivo_generacion()
 
     # Crear log de ejecucion
-    log_id = crear_log_generacion(
-        usuario_id=usuario_id,
-        es_automatico=es_automatico,
-        periodo_anio=anio,
-        periodo_mes=mes
-    )
+    if log_id is None:
+        log_id = crear_log_generacion(
+            usuario_id=usuario_id,
+            es_automatico=es_automatico,
+            periodo_anio=anio,
+            periodo_mes=mes
+        )
+    escritura = EscrituraCoalescida()
+    pipeline = None
+
+    if enviar_whatsapp is None:
+        enviar_whatsapp = obtener_configuracion('envio_automatico_whatsapp', False)
 
     resultado = {
         'log_id': log_id,
@@ -395,7 +420,7 @@ def ejecutar_generacion(
             medidores = obtener_medidores_sin_lectura(anio, mes)
             fecha_lectura = obtener_fecha_lectura_por_defecto(anio, mes)
 
-            for medidor in medidores:
+            for procesados, medidor in enumerate(medidores, 1):
                 try:
                     # Determinar valor de la lectura
                     if valor_lectura == 'ultima':
@@ -432,6 +457,8 @@ def ejecutar_generacion(
                         'error': str(e)
                     })
 
+                _registrar_avance(resultado, escritura, 'lecturas', procesados, len(medidores))
+
         # PASO 2: Generar boletas
         config_boletas = obtener_config_boletas()
         if not config_boletas:
@@ -439,7 +466,16 @@ def ejecutar_generacion(
 
         lecturas = obtener_lecturas_sin_boleta_todas()
 
-        for lectura in lecturas:
+        if enviar_whatsapp and lecturas:
+            if app is None:
+                print("Pipeline de envio omitido: no hay aplicacion para renderizar los PDF")
+            else:
+                from src.services.pipeline_envio_service import iniciar_pipeline_envio
+                pipeline = iniciar_pipeline_envio(app, anio, mes, usuario_id)
+                resultado['log_envio_id'] = pipeline.log_envio_id
+                resultado['detalles']['log_envio_id'] = pipeline.log_envio_id
+
+        for procesados, lectura in enumerate(lecturas, 1):
             try:
                 boleta_id = generar_boleta_desde_lectura(lectura, config_boletas)
 
@@ -452,6 +488,9 @@ def ejecutar_generacion(
                         'medidor': lectura['numero_medidor'] or 'Sin número',
                         'periodo': f"{lectura['mes']}/{lectura['anio']}"
                     })
+                    # Solo las boletas del periodo objetivo siguen al envio
+                    if pipeline and (lectura['anio'], lectura['mes']) == (anio, mes):
+                        pipeline.agregar(boleta_id)
                 else:
                     resultado['errores'] += 1
                     resultado['detalles']['errores'].append({
@@ -468,6 +507,11 @@ def ejecutar_generacion(
                     'error': str(e)
                 })
 
+            _registrar_avance(resultado, escritura, 'boletas', procesados, len(lecturas))
+
+        if pipeline:
+            pipeline.finalizar()
+
         # Actualizar log con resultados
         duracion = time.time() - inicio
         estado = 'completado' if resultado['errores'] == 0 else 'completado'
@@ -475,6 +519,8 @@ def ejecutar_generacion(
 
         if resultado['errores'] > 0:
             mensaje += f", {resultado['errores']} errores"
+        if pipeline:
+            mensaje += f", {pipeline.estadisticas['encoladas']} en cola de envio"
 
         actualizar_log_generacion(
             log_id=log_id,
@@ -496,6 +542,13 @@ def ejecutar_generacion(
         resultado['duracion_segundos'] = duracion
 
     except Exception as e:
+        if pipeline:
+            # Cerrar el envio con lo que alcanzo a entrar al pipeline
+            try:
+                pipeline.finalizar()
+            except Exception as error_pipeline:
+                print(f"Error cerrando pipeline de envio: {error_pipeline}")
+
         duracion = time.time() - inicio
         actualizar_log_generacion(
             log_id=log_id,
@@ -511,4 +564,115 @@ def ejecutar_generacion(
         resultado['mensaje'] = str(e)
         resultado['duracion_segundos'] = duracion
 
+    publicar_progreso(
+        clave_progreso('generacion', log_id),
+        id=log_id,
+        estado=resultado['estado'],
+        lecturas_creadas=resultado['lecturas_creadas'],
+        boletas_generadas=resultado['boletas_generadas'],
+        errores=resultado['errores'],
+        mensaje=resultado['mensaje'],
+        duracion_segundos=resultado['duracion_segundos'],
+        en_curso=False
+    )
+
     return resultado
+
+
+# ============================================================
+# PROGRESO Y EJECUCION EN SEGUNDO PLANO
+# ============================================================
+
+def _registrar_avance(resultado: Dict, escritura: EscrituraCoalescida,
+                      fase: str, procesados: int, total: int):
+    """
+    Publica el avance de la generacion en memoria y escribe el log
+    solo cuando corresponde (cada N pasos o T segundos).
+    """
+    accion = 'Creando lecturas' if fase == 'lecturas' else 'Generando boletas'
+    mensaje = f"{accion}... {procesados}/{total}"
+
+    publicar_progreso(
+        clave_progreso('generacion', resultado['log_id']),
+        id=resultado['log_id'],
+        estado='iniciado',
+        fase=fase,
+        procesados=procesados,
+        total=total,
+        lecturas_creadas=resultado['lecturas_creadas'],
+        boletas_generadas=resultado['boletas_generadas'],
+        errores=resultado['errores'],
+        mensaje=mensaje,
+        en_curso=True
+    )
+
+    if escritura.registrar():
+        actualizar_log_generacion(
+            log_id=resultado['log_id'],
+            estado='iniciado',
+            lecturas_creadas=resultado['lecturas_creadas'],
+            boletas_generadas=resultado['boletas_generadas'],
+            errores=resultado['errores'],
+            mensaje=mensaje
+        )
+
+
+def estado_log_generacion(log: Dict) -> Dict:
+    """Estado de una generacion (el que consumen polling y SSE) desde su log."""
+    return {
+        'id': log['id'],
+        'estado': log['estado'],
+        'lecturas_creadas': log['lecturas_creadas'] or 0,
+        'boletas_generadas': log['boletas_generadas'] or 0,
+        'errores': log['errores'] or 0,
+        'mensaje': log.get('mensaje') or '',
+        'duracion_segundos': float(log['duracion_segundos']) if log.get('duracion_segundos') else None,
+        'en_curso': log['estado'] == 'iniciado'
+    }
+
+
+def cargar_estado_generacion(log_id: int) -> Optional[Dict]:
+    """Estado de una generacion leido desde la base de datos."""
+    log = obtener_log_generacion(log_id)
+    return estado_log_generacion(log) if log else None
+
+
+def iniciar_generacion_async(usuario_id: Optional[int], solo_boletas: bool = False,
+                             enviar_whatsapp: Optional[bool] = None, app=None) -> int:
+    """
+    Crea el log y ejecuta la generacion en un thread, para que la peticion
+    HTTP responda de inmediato y la vista siga el progreso.
+
+    Returns:
+        ID del log creado
+    """
+    if not _lock_generacion.acquire(blocking=False):
+        raise ValueError("Ya hay una generacion en curso")
+
+    try:
+        anio, mes = obtener_periodo_objetivo_generacion()
+        log_id = crear_log_generacion(
+            usuario_id=usuario_id,
+            es_automatico=False,
+            periodo_anio=anio,
+            periodo_mes=mes
+        )
+        publicar_progreso(
+            clave_progreso('generacion', log_id),
+            id=log_id, estado='iniciado', lecturas_creadas=0, boletas_generadas=0,
+            errores=0, mensaje='Iniciando generacion...', en_curso=True
+        )
+    except Exception:
+        _lock_generacion.release()
+        raise
+
+    def ejecutar():
+        try:
+            ejecutar_generacion(usuario_id=usuario_id, es_automatico=False,
+                                solo_boletas=solo_boletas, log_id=log_id,
+                                enviar_whatsapp=enviar_whatsapp, app=app)
+        finally:
+            _lock_generacion.release()
+
+    threading.Thread(target=ejecutar, name=f'generacion-{log_id}', daemon=True).start()
+    return log_id
@@ -3,18 +3,305 @@ Servicio de mensajeria para envio via Sistema Mensajes API.
 Soporta WhatsApp y Gmail.
 """
 import os
+import time
 import base64
+import random
+import threading
 import requests
-from typing import Optional, Dict, Any, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, Union, Callable, Iterable, Iterator, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 MENSAJES_API_URL = os.getenv('MENSAJES_API_URL', 'https://comite-mensajes-api-dev.vk98yo.easypanel.host/api')
 MENSAJES_API_KEY = os.getenv('MENSAJES_API_KEY', '')
 
+# Limite de envio (token bucket): mensajes por segundo y rafaga maxima
+MENSAJES_TASA_POR_SEGUNDO = float(os.getenv('MENSAJES_TASA_POR_SEGUNDO', '1'))
+MENSAJES_RAFAGA = int(os.getenv('MENSAJES_RAFAGA', '3'))
+# Segundos sin 429 antes de volver a subir la tasa
+MENSAJES_PERIODO_CALMA = float(os.getenv('MENSAJES_PERIODO_CALMA', '30'))
+# Espera maxima por un turno de envio antes de desistir (segundos)
+MENSAJES_ESPERA_MAXIMA = float(os.getenv('MENSAJES_ESPERA_MAXIMA', '120'))
+# Conexiones HTTP reutilizables hacia la API y envios simultaneos maximos
+MENSAJES_POOL_SIZE = int(os.getenv('MENSAJES_POOL_SIZE', '10'))
+MENSAJES_MAX_EN_VUELO = int(os.getenv('MENSAJES_MAX_EN_VUELO', '4'))
+
 
 class MensajesError(Exception):
-    """Error al enviar mensaje."""
-    pass
+    """
+    Error al enviar mensaje. `permanente` indica que reintentar no sirve
+    (configuracion faltante, credenciales o destinatario invalidos): la cola
+    de envios lo marca fallido sin consumir reintentos.
+    """
+
+    def __init__(self, mensaje: str = '', permanente: bool = False):
+        super().__init__(mensaje)
+        self.permanente = permanente
+
+
+class RechazoProveedorError(MensajesError):
+    """
+    El proveedor respondio con un codigo de error (no 2xx): el envio no fue
+    aceptado. A diferencia de un timeout o un corte de conexion, aqui es
+    seguro reintentar de otra forma sin riesgo de duplicar el mensaje.
+    """
+
+    def __init__(self, mensaje: str, status_code: int):
+        # Un 4xx (salvo 408 timeout) no cambia al reintentar lo mismo
+        super().__init__(mensaje, permanente=400 <= status_code < 500 and status_code != 408)
+        self.status_code = status_code
+
+
+class LimiteExcedidoError(MensajesError):
+    """El proveedor rechazo el envio por limite de mensajes (HTTP 429)."""
+
+    def __init__(self, mensaje: str = 'Limite de mensajes excedido, intente mas tarde',
+                 retry_after: Optional[float] = None):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+
+class LimitadorEnvios:
+    """
+    Token bucket adaptativo para el envio de mensajes.
+
+    - Cada envio consume un token; los tokens se reponen a `tasa` por segundo
+      hasta `capacidad`.
+    - Ante un 429 se pausa segun Retry-After (o backoff exponencial con jitter)
+      y la tasa se reduce a la mitad.
+    - Tras `periodo_calma` segundos sin 429 la tasa vuelve a subir
+      gradualmente hasta `tasa_maxima`.
+    """
+
+    def __init__(self, tasa: float, capacidad: int, periodo_calma: float = 30.0,
+                 tasa_minima: float = 0.05, backoff_base: float = 2.0, backoff_maximo: float = 300.0):
+        self.tasa_maxima = max(tasa, tasa_minima)
+        self.tasa = self.tasa_maxima
+        self.tasa_minima = tasa_minima
+        self.capacidad = max(1, capacidad)
+        self.periodo_calma = periodo_calma
+        self.backoff_base = backoff_base
+        self.backoff_maximo = backoff_maximo
+
+        self._tokens = float(self.capacidad)
+        self._ultima_recarga = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._ultimo_limite = 0.0
+        self._intentos_limite = 0
+        self._lock = threading.Lock()
+
+    def _recargar(self, ahora: float):
+        transcurrido = ahora - self._ultima_recarga
+        self._tokens = min(self.capacidad, self._tokens + transcurrido * self.tasa)
+        self._ultima_recarga = ahora
+
+        # Subida gradual de la tasa tras un periodo sin limites
+        if (self.tasa < self.tasa_maxima and self._ultimo_limite
+                and ahora - self._ultimo_limite >= self.periodo_calma):
+            self.tasa = min(self.tasa_maxima, self.tasa * 1.5)
+            self._ultimo_limite = ahora
+            if self.tasa >= self.tasa_maxima:
+                self._intentos_limite = 0
+
+    def adquirir(self, espera_maxima: Optional[float] = None) -> bool:
+        """
+        Espera hasta obtener un turno de envio.
+        Retorna False si la espera superaria espera_maxima.
+        """
+        limite = None if espera_maxima is None else time.monotonic() + espera_maxima
+
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._recargar(ahora)
+
+                if ahora >= self._pausa_hasta and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+
+                if ahora < self._pausa_hasta:
+                    espera = self._pausa_hasta - ahora
+                else:
+                    espera = (1 - self._tokens) / self.tasa
+
+            if limite is not None and time.monotonic() + espera > limite:
+                return False
+            time.sleep(min(espera, 1.0))
+
+    def registrar_limite(self, retry_after: Optional[float] = None) -> float:
+        """
+        Registra un 429 del proveedor. Retorna los segundos de pausa aplicados.
+        """
+        with self._lock:
+            self._intentos_limite += 1
+            backoff = min(self.backoff_maximo, self.backoff_base * (2 ** (self._intentos_limite - 1)))
+            # Full jitter sobre el backoff; Retry-After es el minimo obligatorio
+            pausa = random.uniform(backoff / 2, backoff)
+            if retry_after is not None:
+                pausa = max(pausa, retry_after)
+
+            ahora = time.monotonic()
+            self._pausa_hasta = max(self._pausa_hasta, ahora + pausa)
+            self._ultimo_limite = ahora
+            self.tasa = max(self.tasa_minima, self.tasa / 2)
+            self._tokens = 0.0
+            return pausa
+
+    def segundos_pausa(self) -> float:
+        """Segundos restantes de pausa por limite (0 si no hay pausa)."""
+        with self._lock:
+            return max(0.0, self._pausa_hasta - time.monotonic())
+
+    def estado(self) -> Dict[str, Any]:
+        """Estado actual del limitador (para diagnostico)."""
+        with self._lock:
+            return {
+                'tasa': round(self.tasa, 3),
+                'tasa_maxima': self.tasa_maxima,
+                'tokens': round(self._tokens, 2),
+                'pausa_restante': round(max(0.0, self._pausa_hasta - time.monotonic()), 1)
+            }
+
+
+# Limitador compartido por todos los envios del proceso
+limitador = LimitadorEnvios(
+    tasa=MENSAJES_TASA_POR_SEGUNDO,
+    capacidad=MENSAJES_RAFAGA,
+    periodo_calma=MENSAJES_PERIODO_CALMA
+)
+
+
+def _parsear_retry_after(valor: Optional[str]) -> Optional[float]:
+    """Interpreta el header Retry-After (segundos o fecha HTTP)."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _esperar_turno():
+    """Espera turno en el limitador o falla si la pausa es demasiado larga."""
+    if not limitador.adquirir(espera_maxima=MENSAJES_ESPERA_MAXIMA):
+        raise LimiteExcedidoError(retry_after=limitador.segundos_pausa())
+
+
+def _error_limite(response) -> LimiteExcedidoError:
+    """Registra el 429 en el limitador y construye el error."""
+    retry_after = _parsear_retry_after(response.headers.get('Retry-After'))
+    pausa = limitador.registrar_limite(retry_after)
+    return LimiteExcedidoError(retry_after=pausa)
+
+
+def _procesar_respuesta_envio(response) -> Dict[str, Any]:
+    """
+    Interpreta la respuesta de /send. El 429 (y los demas codigos de error)
+    se revisan antes de leer el cuerpo, que en esos casos puede no ser JSON
+    (ej: la pagina de un proxy); el JSON solo se exige a las respuestas
+    exitosas.
+    """
+    if response.status_code == 429:
+        raise _error_limite(response)
+    if response.status_code == 401:
+        raise RechazoProveedorError('API Key invalida o expirada', 401)
+    if response.status_code == 403:
+        raise RechazoProveedorError('No hay conexion de WhatsApp activa en el proyecto', 403)
+
+    if response.status_code in (200, 201):
+        try:
+            data = response.json() if response.text else {}
+        except ValueError:
+            raise MensajesError('Respuesta invalida del servicio de mensajes')
+        if data.get('success'):
+            return data
+        raise MensajesError(data.get('error', 'El servicio de mensajes no confirmo el envio'))
+
+    # Error: usar el mensaje del proveedor solo si el cuerpo es JSON
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    error_msg = data.get('error') if isinstance(data, dict) else None
+    raise RechazoProveedorError(error_msg or f'Error HTTP {response.status_code}', response.status_code)
+
+
+_sesion = None
+_sesion_lock = threading.Lock()
+
+
+def _crear_sesion() -> requests.Session:
+    """
+    Crea una sesion HTTP con keep-alive y pool de conexiones.
+    Reintenta errores de conexion (el mensaje no alcanzo a enviarse) y
+    errores 502/503/504 solo en metodos idempotentes; los POST de envio
+    no se reintentan a ciegas para no duplicar mensajes.
+    """
+    reintentos = Retry(
+        total=3,
+        connect=3,
+        read=2,
+        status=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=max(MENSAJES_POOL_SIZE, MENSAJES_MAX_EN_VUELO),
+        max_retries=reintentos
+    )
+    sesion = requests.Session()
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    sesion.headers.update({'X-API-Key': MENSAJES_API_KEY})
+    return sesion
+
+
+def obtener_sesion() -> requests.Session:
+    """Retorna la sesion HTTP compartida del proceso (se crea al primer uso)."""
+    global _sesion
+    if _sesion is None:
+        with _sesion_lock:
+            if _sesion is None:
+                _sesion = _crear_sesion()
+    return _sesion
+
+
+def enviar_concurrente(
+    items: Iterable[Any],
+    funcion: Callable[[Any], Any],
+    max_en_vuelo: Optional[int] = None
+) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Ejecuta funcion(item) para cada item con a lo sumo max_en_vuelo envios
+    simultaneos. Entrega tuplas (item, resultado, error) a medida que
+    terminan; error es None si la funcion no lanzo excepcion.
+
+    El ritmo global lo sigue controlando el limitador, por lo que la
+    concurrencia solo solapa la latencia de red y la generacion de PDF.
+    """
+    max_en_vuelo = max(1, max_en_vuelo or MENSAJES_MAX_EN_VUELO)
+    with ThreadPoolExecutor(max_workers=max_en_vuelo, thread_name_prefix='envio') as executor:
+        futuros = {executor.submit(funcion, item): item for item in items}
+        for futuro in as_completed(futuros):
+            item = futuros[futuro]
+            try:
+                yield item, futuro.result(), None
+            except Exception as e:
+                yield item, None, e
 
 
 def normalizar_telefono(telefono: str) -> str:
@@ -67,40 +354,27 @@ def enviar_whatsapp(telefono: str, mensaje: str) -> Dict[str, Any]:
         MensajesError: Si hay error en el envio
     """
     if not MENSAJES_API_KEY:
-        raise MensajesError('API Key no configurada. Configure MENSAJES_API_KEY en las variables de entorno.')
+        raise MensajesError('API Key no configurada. Configure MENSAJES_API_KEY en las variables de entorno.',
+                            permanente=True)
 
     telefono_normalizado = normalizar_telefono(telefono)
     if not telefono_normalizado:
-        raise MensajesError('Numero de telefono invalido')
+        raise MensajesError('Numero de telefono invalido', permanente=True)
+
+    _esperar_turno()
 
     try:
-        response = requests.post(
+        response = obtener_sesion().post(
             f'{MENSAJES_API_URL}/send',
             json={
                 'channel': 'whatsapp',
                 'to': telefono_normalizado,
                 'body': mensaje
             },
-            headers={
-                'X-API-Key': MENSAJES_API_KEY,
-                'Content-Type': 'application/json'
-            },
             timeout=30
         )
 
-        data = response.json() if response.text else {}
-
-        if response.status_code in (200, 201) and data.get('success'):
-            return data
-        elif response.status_code == 401:
-            raise MensajesError('API Key invalida o expirada')
-        elif response.status_code == 403:
-            raise MensajesError('No hay conexion de WhatsApp activa en el proyecto')
-        elif response.status_code == 429:
-            raise MensajesError('Limite de mensajes excedido, intente mas tarde')
-        else:
-            error_msg = data.get('error', f'Error HTTP {response.status_code}')
-            raise MensajesError(error_msg)
+        return _procesar_respuesta_envio(response)
 
     except requests.exceptions.Timeout:
         raise MensajesError('Timeout al conectar con servicio de mensajes')
@@ -132,11 +406,12 @@ def enviar_documento_whatsapp(
         MensajesError: Si hay error en el envio
     """
     if not MENSAJES_API_KEY:
-        raise MensajesError('API Key no configurada. Configure MENSAJES_API_KEY en las variables de entorno.')
+        raise MensajesError('API Key no configurada. Configure MENSAJES_API_KEY en las variables de entorno.',
+                            permanente=True)
 
     telefono_normalizado = normalizar_telefono(telefono)
     if not telefono_normalizado:
-        raise MensajesError('Numero de telefono invalido')
+        raise MensajesError('Numero de telefono invalido', permanente=True)
 
     # Si es bytes, convertir a base64
     if isinstance(documento, bytes):
@@ -155,30 +430,16 @@ def enviar_documento_whatsapp(
     if caption:
         payload['caption'] = caption
 
+    _esperar_turno()
+
     try:
-        response = requests.post(
+        response = obtener_sesion().post(
             f'{MENSAJES_API_URL}/send',
             json=payload,
-            headers={
-                'X-API-Key': MENSAJES_API_KEY,
-                'Content-Type': 'application/json'
-            },
             timeout=60  # Mas tiempo para documentos
         )
 
-        data = response.json() if response.text else {}
-
-        if response.status_code in (200, 201) and data.get('success'):
-            return data
-        elif response.status_code == 401:
-            raise MensajesError('API Key invalida o expirada')
-        elif response.status_code == 403:
-            raise MensajesError('No hay conexion de WhatsApp activa en el proyecto')
-        elif response.status_code == 429:
-            raise MensajesError('Limite de mensajes excedido, intente mas tarde')
-        else:
-            error_msg = data.get('error', f'Error HTTP {response.status_code}')
-            raise MensajesError(error_msg)
+        return _procesar_respuesta_envio(response)
 
     except requests.exceptions.Timeout:
         raise MensajesError('Timeout al enviar documento')
@@ -192,7 +453,8 @@ def enviar_boleta_whatsapp(
     telefono: str,
     boleta: Dict[str, Any],
     pdf_bytes: Optional[bytes] = None,
-    url_portal: Optional[str] = None
+    url_portal: Optional[str] = None,
+    pdf_url: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Envia notificacion de boleta por WhatsApp, opcionalmente con PDF adjunto.
@@ -202,6 +464,8 @@ def enviar_boleta_whatsapp(
         boleta: Diccionario con datos de la boleta
         pdf_bytes: Contenido del PDF en bytes (opcional)
         url_portal: URL opcional del portal de pagos
+        pdf_url: Enlace de descarga del PDF (opcional). Si la API no logra
+            usarlo se reintenta con pdf_bytes en base64.
 
     Returns:
         Dict con resultado del envio
@@ -225,9 +489,21 @@ Consumo: {boleta.get('consumo_m3', 0)} m3
     if url_portal:
         mensaje += f"\n\nPortal de pagos: {url_portal}"
 
+    nombre_archivo = f"Boleta_{boleta.get('numero_boleta', 'SN')}.pdf"
+
+    # Preferir enlace: payload pequeño y sin copia base64 en memoria. Solo se
+    # reintenta en base64 si el proveedor rechazo el enlace con un 4xx; ante
+    # timeout, corte de conexion o 5xx (ej: 504 de un proxy) el primer envio
+    # pudo haberse aceptado, asi que el error sube y la cola lo reprograma.
+    if pdf_url:
+        try:
+            return enviar_documento_whatsapp(telefono, pdf_url, nombre_archivo, mensaje)
+        except RechazoProveedorError as e:
+            if not pdf_bytes or not 400 <= e.status_code < 500:
+                raise
+
     # Si hay PDF, enviar como documento
     if pdf_bytes:
-        nombre_archivo = f"Boleta_{boleta.get('numero_boleta', 'SN')}.pdf"
         return enviar_documento_whatsapp(telefono, pdf_bytes, nombre_archivo, mensaje)
 
     # Si no hay PDF, enviar solo texto
@@ -242,7 +518,7 @@ def verificar_conexion() -> Dict[str, Any]:
         Dict con estado de la conexion
     """
     try:
-        response = requests.get(
+        response = obtener_sesion().get(
             f'{MENSAJES_API_URL}/health',
             timeout=10
         )
@@ -0,0 +1,391 @@
+"""
+Servicio de generacion de PDF de boletas.
+Centraliza el renderizado individual y el PDF consolidado por periodo
+(un solo archivo multipagina para impresion, cacheado en disco).
+"""
+import os
+import glob
+import hmac
+import time
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from flask import render_template
+from pypdf import PdfWriter
+from weasyprint import HTML
+
+from src.database import get_connection, BASE_DIR
+from src.models_configuracion import obtener_datos_bancarios
+
+
+MESES = {
+    1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
+    5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
+    9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
+}
+
+FOTOS_DIR = os.path.join(BASE_DIR, 'fotos')
+PDF_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'pdf_cache')
+PDF_PUBLICADOS_DIR = os.path.join(PDF_CACHE_DIR, 'publicados')
+PDF_BOLETAS_DIR = os.path.join(PDF_CACHE_DIR, 'boletas')
+
+# Boletas por tramo al renderizar el PDF consolidado del periodo
+PDF_PERIODO_TRAMO = int(os.getenv('PDF_PERIODO_TRAMO', '50'))
+
+# Dias que se conserva el PDF prerenderizado de una boleta
+PDF_CACHE_BOLETAS_DIAS = int(os.getenv('PDF_CACHE_BOLETAS_DIAS', '45'))
+
+# URL publica de la app (ej: https://agua.ejemplo.cl). Sin ella los PDF se
+# envian embebidos en base64.
+APP_URL_PUBLICA = os.getenv('APP_URL_PUBLICA', '').rstrip('/')
+# Vigencia de los enlaces firmados de descarga (segundos)
+PDF_URL_TTL = int(os.getenv('PDF_URL_TTL', '3600'))
+PDF_URL_SECRET = os.getenv('PDF_URL_SECRET') or os.environ.get('SECRET_KEY', 'lecturas-medidores-secret-key-dev')
+
+# Evita que dos peticiones rendericen el mismo periodo a la vez
+_lock_periodos = threading.Lock()
+
+
+def periodo_anterior(anio: int, mes: int) -> Tuple[int, int]:
+    """Retorna (anio, mes) del periodo anterior."""
+    if mes == 1:
+        return anio - 1, 12
+    return anio, mes - 1
+
+
+def _ruta_foto(foto_path: Optional[str]) -> Optional[str]:
+    """Convierte foto_path relativo ('medidor_X/...') a ruta absoluta."""
+    if not foto_path:
+        return None
+    return os.path.join(FOTOS_DIR, foto_path)
+
+
+def obtener_contexto_pdf_boleta(boleta: Dict, datos_bancarios: Dict = None) -> Dict:
+    """
+    Obtiene los datos que necesita el template del PDF de una boleta:
+    foto de la lectura, fechas de lectura actual/anterior y datos bancarios.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    foto_lectura = None
+    fecha_lectura_actual = None
+    if boleta.get('lectura_id'):
+        cursor.execute('''
+            SELECT foto_path, fecha_lectura FROM lecturas WHERE id = %s
+        ''', (boleta['lectura_id'],))
+        lectura = cursor.fetchone()
+        if lectura:
+            foto_lectura = _ruta_foto(lectura.get('foto_path'))
+            fecha_lectura_actual = lectura.get('fecha_lectura')
+
+    fecha_lectura_anterior = None
+    if boleta.get('lectura_anterior') is not None:
+        anio_anterior, mes_anterior = periodo_anterior(boleta['periodo_anio'], boleta['periodo_mes'])
+        cursor.execute('''
+            SELECT fecha_lectura FROM lecturas
+            WHERE medidor_id = %s AND anio = %s AND mes = %s
+        ''', (boleta['medidor_id'], anio_anterior, mes_anterior))
+        lectura_ant = cursor.fetchone()
+        if lectura_ant:
+            fecha_lectura_anterior = lectura_ant['fecha_lectura']
+
+    conn.close()
+
+    return {
+        'foto_lectura': foto_lectura,
+        'fecha_lectura_actual': fecha_lectura_actual,
+        'fecha_lectura_anterior': fecha_lectura_anterior,
+        'datos_bancarios': datos_bancarios if datos_bancarios is not None else obtener_datos_bancarios()
+    }
+
+
+def renderizar_html_boleta(boleta: Dict, contexto: Dict = None) -> str:
+    """
+    Renderiza el HTML de la boleta. Requiere contexto de aplicacion Flask.
+    """
+    if contexto is None:
+        contexto = obtener_contexto_pdf_boleta(boleta)
+    return render_template('boletas/boleta_pdf.html',
+                           boleta=boleta,
+                           meses=MESES,
+                           **contexto)
+
+
+def generar_pdf_boleta(boleta: Dict) -> bytes:
+    """Genera el PDF de una boleta y retorna sus bytes."""
+    html_string = renderizar_html_boleta(boleta)
+    pdf_file = BytesIO()
+    HTML(string=html_string, base_url=BASE_DIR).write_pdf(pdf_file)
+    return pdf_file.getvalue()
+
+
+# =============================================================================
+# CACHE DE PDF POR BOLETA
+# =============================================================================
+
+def version_pdf_boleta(boleta: Dict, contexto: Dict) -> str:
+    """Huella de los datos que aparecen en el PDF de una boleta."""
+    huella = hashlib.sha1()
+    huella.update(repr(sorted(boleta.items())).encode('utf-8'))
+    huella.update(repr(sorted(
+        (clave, sorted(valor.items()) if isinstance(valor, dict) else valor)
+        for clave, valor in contexto.items()
+    )).encode('utf-8'))
+    return huella.hexdigest()[:16]
+
+
+def obtener_pdf_boleta(boleta: Dict, contexto: Dict = None) -> bytes:
+    """
+    Retorna el PDF de una boleta usando el cache en disco. Si la version
+    cacheada no existe o quedo obsoleta (cambio la boleta, sus lecturas o
+    los datos bancarios) se renderiza y se guarda.
+    Requiere contexto de aplicacion Flask.
+    """
+    if contexto is None:
+        contexto = obtener_contexto_pdf_boleta(boleta)
+    version = version_pdf_boleta(boleta, contexto)
+    ruta = os.path.join(PDF_BOLETAS_DIR, f"boleta_{boleta['id']}_{version}.pdf")
+
+    try:
+        with open(ruta, 'rb') as archivo:
+            return archivo.read()
+    except FileNotFoundError:
+        pass
+
+    html_string = renderizar_html_boleta(boleta, contexto)
+    pdf_bytes = HTML(string=html_string, base_url=BASE_DIR).write_pdf()
+
+    os.makedirs(PDF_BOLETAS_DIR, exist_ok=True)
+    for anterior in glob.glob(os.path.join(PDF_BOLETAS_DIR, f"boleta_{boleta['id']}_*.pdf")):
+        try:
+            os.remove(anterior)
+        except OSError:
+            pass
+    fd, ruta_tmp = tempfile.mkstemp(suffix='.pdf.tmp', dir=PDF_BOLETAS_DIR)
+    with os.fdopen(fd, 'wb') as archivo:
+        archivo.write(pdf_bytes)
+    os.replace(ruta_tmp, ruta)
+
+    return pdf_bytes
+
+
+def limpiar_cache_boletas():
+    """Elimina PDF de boletas cacheados hace mas de PDF_CACHE_BOLETAS_DIAS."""
+    limite = time.time() - PDF_CACHE_BOLETAS_DIAS * 86400
+    for ruta in glob.glob(os.path.join(PDF_BOLETAS_DIR, 'boleta_*.pdf')):
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+# =============================================================================
+# PDF CONSOLIDADO POR PERIODO
+# =============================================================================
+
+def obtener_boletas_periodo_impresion(anio: int, mes: int) -> List[Dict]:
+    """
+    Obtiene todas las boletas de un periodo con los datos del PDF ya resueltos,
+    ordenadas por sector (direccion del medidor) y cliente.
+    Una sola consulta en vez de dos por boleta.
+    """
+    anio_anterior, mes_anterior = periodo_anterior(anio, mes)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT b.*,
+               l.foto_path,
+               l.fecha_lectura AS fecha_lectura_actual,
+               la.fecha_lectura AS fecha_lectura_previa,
+               m.direccion AS sector
+        FROM boletas b
+        LEFT JOIN lecturas l ON b.lectura_id = l.id
+        LEFT JOIN lecturas la ON la.medidor_id = b.medidor_id
+                             AND la.anio = %s AND la.mes = %s
+        LEFT JOIN medidores m ON b.medidor_id = m.id
+        WHERE b.periodo_anio = %s AND b.periodo_mes = %s
+        ORDER BY COALESCE(m.direccion, '') ASC, b.cliente_nombre ASC, b.numero_boleta ASC
+    ''', (anio_anterior, mes_anterior, anio, mes))
+    boletas = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return boletas
+
+
+def calcular_version_periodo(boletas: List[Dict], datos_bancarios: Dict) -> str:
+    """
+    Calcula una huella de los datos que aparecen en el PDF del periodo.
+    Cualquier cambio en una boleta (o en los datos bancarios) genera otra version.
+    """
+    huella = hashlib.sha1()
+    for boleta in sorted(boletas, key=lambda b: b['id']):
+        huella.update(repr(sorted(boleta.items())).encode('utf-8'))
+    huella.update(repr(sorted(datos_bancarios.items())).encode('utf-8'))
+    return huella.hexdigest()[:16]
+
+
+def _ruta_cache_periodo(anio: int, mes: int, version: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, f'boletas_{anio}_{mes:02d}_{version}.pdf')
+
+
+def _limpiar_cache_periodo(anio: int, mes: int, conservar: str = None):
+    """Elimina versiones antiguas del PDF de un periodo."""
+    patron = os.path.join(PDF_CACHE_DIR, f'boletas_{anio}_{mes:02d}_*.pdf')
+    for ruta in glob.glob(patron):
+        if ruta != conservar:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def _renderizar_tramo(boletas: List[Dict], datos_bancarios: Dict, destino: str, cache_imagenes: str):
+    """
+    Renderiza un tramo de boletas en un unico documento y lo escribe en disco.
+    Cada HTML se descarta apenas se maqueta, de modo que solo se mantienen
+    las paginas ya compuestas del tramo.
+    """
+    documentos = []
+    for boleta in boletas:
+        contexto = {
+            'foto_lectura': _ruta_foto(boleta.get('foto_path')),
+            'fecha_lectura_actual': boleta.get('fecha_lectura_actual'),
+            'fecha_lectura_anterior': (boleta.get('fecha_lectura_previa')
+                                       if boleta.get('lectura_anterior') is not None else None),
+            'datos_bancarios': datos_bancarios
+        }
+        html_string = renderizar_html_boleta(boleta, contexto)
+        documentos.append(
+            HTML(string=html_string, base_url=BASE_DIR).render(cache=cache_imagenes)
+        )
+
+    paginas = [pagina for documento in documentos for pagina in documento.pages]
+    documentos[0].copy(paginas).write_pdf(destino, cache=cache_imagenes)
+
+
+def _renderizar_periodo(boletas: List[Dict], datos_bancarios: Dict, destino: str):
+    """
+    Renderiza las boletas del periodo en tramos de PDF_PERIODO_TRAMO: cada
+    tramo se escribe a un PDF temporal y se libera antes del siguiente, y al
+    final los tramos se concatenan en `destino`. La memoria maxima es la de
+    un tramo maquetado, no la del periodo completo. Las imagenes se cachean
+    en un directorio temporal compartido entre tramos.
+    """
+    with tempfile.TemporaryDirectory(prefix='pdf_periodo_') as directorio:
+        cache_imagenes = os.path.join(directorio, 'imagenes')
+        os.makedirs(cache_imagenes)
+
+        if len(boletas) <= PDF_PERIODO_TRAMO:
+            _renderizar_tramo(boletas, datos_bancarios, destino, cache_imagenes)
+            return
+
+        tramos = []
+        for inicio in range(0, len(boletas), PDF_PERIODO_TRAMO):
+            ruta_tramo = os.path.join(directorio, f'tramo_{len(tramos):04d}.pdf')
+            _renderizar_tramo(boletas[inicio:inicio + PDF_PERIODO_TRAMO], datos_bancarios,
+                              ruta_tramo, cache_imagenes)
+            tramos.append(ruta_tramo)
+
+        escritor = PdfWriter()
+        for ruta_tramo in tramos:
+            escritor.append(ruta_tramo)
+        # Imagenes y fuentes comunes quedan una vez en el PDF final, no una por tramo
+        escritor.compress_identical_objects()
+        with open(destino, 'wb') as archivo:
+            escritor.write(archivo)
+
+
+def obtener_pdf_periodo(anio: int, mes: int) -> Optional[str]:
+    """
+    Retorna la ruta del PDF consolidado del periodo, generandolo si la
+    version cacheada no existe o quedo obsoleta.
+    Requiere contexto de aplicacion Flask. Retorna None si no hay boletas.
+    """
+    boletas = obtener_boletas_periodo_impresion(anio, mes)
+    if not boletas:
+        return None
+
+    datos_bancarios = obtener_datos_bancarios()
+    version = calcular_version_periodo(boletas, datos_bancarios)
+    ruta = _ruta_cache_periodo(anio, mes, version)
+
+    if os.path.exists(ruta):
+        return ruta
+
+    with _lock_periodos:
+        # Otra peticion pudo generarlo mientras esperabamos
+        if os.path.exists(ruta):
+            return ruta
+
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fd, ruta_tmp = tempfile.mkstemp(suffix='.pdf.tmp', dir=PDF_CACHE_DIR)
+        os.close(fd)
+        try:
+            _renderizar_periodo(boletas, datos_bancarios, ruta_tmp)
+            os.replace(ruta_tmp, ruta)
+        finally:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+
+        _limpiar_cache_periodo(anio, mes, conservar=ruta)
+
+    return ruta
+
+
+# =============================================================================
+# ENLACES FIRMADOS DE DESCARGA
+# =============================================================================
+
+def _firma_pdf(boleta_id: int, expira: int) -> str:
+    mensaje = f'{boleta_id}.{expira}'.encode('utf-8')
+    return hmac.new(PDF_URL_SECRET.encode('utf-8'), mensaje, hashlib.sha256).hexdigest()
+
+
+def verificar_firma_pdf(boleta_id: int, expira: int, firma: str) -> bool:
+    """Valida la firma y vigencia de un enlace de descarga."""
+    if not firma or expira < time.time():
+        return False
+    return hmac.compare_digest(_firma_pdf(boleta_id, expira), firma)
+
+
+def ruta_pdf_publicado(boleta_id: int) -> str:
+    return os.path.join(PDF_PUBLICADOS_DIR, f'boleta_{boleta_id}.pdf')
+
+
+def _limpiar_pdf_publicados():
+    """Elimina PDF publicados cuyo enlace ya vencio."""
+    limite = time.time() - PDF_URL_TTL
+    for ruta in glob.glob(os.path.join(PDF_PUBLICADOS_DIR, 'boleta_*.pdf')):
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+def publicar_pdf_boleta(boleta_id: int, pdf_bytes: bytes) -> Optional[str]:
+    """
+    Guarda el PDF en disco y retorna un enlace firmado de corta duracion
+    para que la API de mensajes lo descargue.
+    Retorna None si no hay APP_URL_PUBLICA configurada (usar base64).
+    """
+    if not APP_URL_PUBLICA:
+        return None
+
+    os.makedirs(PDF_PUBLICADOS_DIR, exist_ok=True)
+    _limpiar_pdf_publicados()
+
+    ruta = ruta_pdf_publicado(boleta_id)
+    fd, ruta_tmp = tempfile.mkstemp(suffix='.pdf.tmp', dir=PDF_PUBLICADOS_DIR)
+    with os.fdopen(fd, 'wb') as archivo:
+        archivo.write(pdf_bytes)
+    os.replace(ruta_tmp, ruta)
+
+    expira = int(time.time()) + PDF_URL_TTL
+    firma = _firma_pdf(boleta_id, expira)
+    return f'{APP_URL_PUBLICA}/pdf/boleta/{boleta_id}?exp={expira}&firma={firma}'
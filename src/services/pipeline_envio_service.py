@@ -0,0 +1,267 @@
+"""
+Pipeline post-generacion: cada boleta recien creada pasa por etapas en
+memoria hasta quedar en la cola de envios, en una sola pasada.
+
+    generacion -> [cola acotada] -> prerender PDF (N hilos)
+               -> [cola acotada] -> encolar en cola_envios (por lotes)
+               -> worker de la cola de envios (limitador + concurrencia propia)
+
+Cada etapa tiene su propia concurrencia y las colas entre etapas son
+acotadas: si una etapa se atrasa, la anterior se bloquea (backpressure)
+en vez de acumular boletas en memoria.
+
+El avance se observa en el log de envio masivo asociado (pagina de
+detalle y stream SSE). Si el proceso muere a mitad de camino el log queda
+abierto y puede reanudarse: se vuelven a pasar por el pipeline las
+boletas enviables del periodo (encolar es idempotente por clave).
+"""
+import os
+import queue
+import logging
+import threading
+from typing import Dict, Optional
+
+from src.database import get_connection
+from src.models_boletas import obtener_boleta
+from src.models_cola_envios import encolar_envios_masivo
+from src.services.cola_envios_service import clave_envio_boleta, notificar_worker
+from src.services.envio_masivo_service import (
+    crear_log_envio_pipeline, registrar_lote_pipeline, cerrar_log_envio_pipeline,
+    actualizar_progreso_envio_masivo, obtener_boletas_periodo_envio, obtener_log_envio
+)
+from src.services.pdf_service import obtener_pdf_boleta, limpiar_cache_boletas
+
+logger = logging.getLogger(__name__)
+
+# Hilos de la etapa de prerender de PDF
+PIPELINE_HILOS_PDF = int(os.getenv('PIPELINE_HILOS_PDF', '2'))
+# Capacidad de cada cola entre etapas (backpressure)
+PIPELINE_CAPACIDAD = int(os.getenv('PIPELINE_CAPACIDAD', '20'))
+# Boletas por INSERT en la cola de envios
+PIPELINE_LOTE_ENCOLAR = int(os.getenv('PIPELINE_LOTE_ENCOLAR', '20'))
+
+_FIN = object()
+
+# Pipelines activos en este proceso: {log_envio_id: PipelineEnvio}
+_pipelines: Dict[int, 'PipelineEnvio'] = {}
+_pipelines_lock = threading.Lock()
+
+
+def _datos_envio_boleta(boleta_id: int) -> Optional[Dict]:
+    """Telefono y preferencia de WhatsApp del cliente de una boleta."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT c.telefono, c.recibe_boleta_whatsapp
+        FROM boletas b
+        JOIN medidores m ON b.medidor_id = m.id
+        JOIN clientes c ON m.cliente_id = c.id
+        WHERE b.id = %s AND b.pagada = 0
+    ''', (boleta_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+class PipelineEnvio:
+    """
+    Etapas acotadas entre la generacion de boletas y la cola de envios.
+
+    Uso:
+        pipeline = PipelineEnvio(app, log_envio_id, usuario_id).iniciar()
+        pipeline.agregar(boleta_id)   # bloquea si la etapa PDF va atrasada
+        pipeline.finalizar()          # espera a que se vacien las etapas
+    """
+
+    def __init__(self, app, log_envio_id: int, usuario_id: Optional[int] = None,
+                 hilos_pdf: int = None, capacidad: int = None, lote: int = None):
+        self.app = app
+        self.log_envio_id = log_envio_id
+        self.usuario_id = usuario_id
+        self.hilos_pdf = hilos_pdf or PIPELINE_HILOS_PDF
+        self.lote = lote or PIPELINE_LOTE_ENCOLAR
+        capacidad = capacidad or PIPELINE_CAPACIDAD
+        self._cola_pdf = queue.Queue(maxsize=capacidad)
+        self._cola_encolar = queue.Queue(maxsize=capacidad)
+        self._hilos_pdf = []
+        self._hilo_encolar = None
+        self._lock = threading.Lock()
+        self._finalizado = False
+        self.estadisticas = {
+            'recibidas': 0, 'pdf_listos': 0, 'encoladas': 0,
+            'sin_telefono': 0, 'no_recibe_wa': 0, 'errores': 0
+        }
+
+    def _sumar(self, clave: str, cantidad: int = 1):
+        with self._lock:
+            self.estadisticas[clave] += cantidad
+
+    def iniciar(self) -> 'PipelineEnvio':
+        for i in range(self.hilos_pdf):
+            hilo = threading.Thread(target=self._etapa_pdf, daemon=True,
+                                    name=f'pipeline-{self.log_envio_id}-pdf-{i}')
+            hilo.start()
+            self._hilos_pdf.append(hilo)
+        self._hilo_encolar = threading.Thread(target=self._etapa_encolar, daemon=True,
+                                              name=f'pipeline-{self.log_envio_id}-encolar')
+        self._hilo_encolar.start()
+
+        with _pipelines_lock:
+            _pipelines[self.log_envio_id] = self
+        return self
+
+    def agregar(self, boleta_id: int):
+        """Entrega una boleta al pipeline (bloquea si la etapa PDF esta llena)."""
+        self._sumar('recibidas')
+        self._cola_pdf.put(boleta_id)
+
+    def finalizar(self):
+        """Espera a que las etapas terminen y cierra el log del envio."""
+        if self._finalizado:
+            return
+        self._finalizado = True
+        try:
+            for _ in self._hilos_pdf:
+                self._cola_pdf.put(_FIN)
+            for hilo in self._hilos_pdf:
+                hilo.join()
+            self._cola_encolar.put(_FIN)
+            self._hilo_encolar.join()
+
+            cerrar_log_envio_pipeline(self.log_envio_id)
+            limpiar_cache_boletas()
+        finally:
+            with _pipelines_lock:
+                _pipelines.pop(self.log_envio_id, None)
+
+    # --------------------------------------------------------
+    # Etapas
+    # --------------------------------------------------------
+
+    def _etapa_pdf(self):
+        """Filtra boletas no enviables y prerenderiza el PDF de las demas."""
+        while True:
+            boleta_id = self._cola_pdf.get()
+            if boleta_id is _FIN:
+                return
+
+            try:
+                datos = _datos_envio_boleta(boleta_id)
+                if not datos or not datos['telefono']:
+                    self._sumar('sin_telefono')
+                    continue
+                if not datos['recibe_boleta_whatsapp']:
+                    self._sumar('no_recibe_wa')
+                    continue
+            except Exception as e:
+                self._sumar('errores')
+                logger.error(f"Pipeline {self.log_envio_id}: error leyendo boleta {boleta_id}: {e}")
+                continue
+
+            try:
+                boleta = obtener_boleta(boleta_id)
+                with self.app.app_context():
+                    obtener_pdf_boleta(boleta)
+                self._sumar('pdf_listos')
+            except Exception as e:
+                # El prerender es una optimizacion: el worker renderiza al enviar
+                logger.warning(f"Pipeline {self.log_envio_id}: sin PDF previo para boleta {boleta_id}: {e}")
+
+            self._cola_encolar.put({'boleta_id': boleta_id, 'telefono': datos['telefono']})
+
+    def _etapa_encolar(self):
+        """Agrupa boletas listas y las inserta por lotes en la cola de envios."""
+        terminar = False
+        while not terminar:
+            lote = []
+            item = self._cola_encolar.get()
+            while True:
+                if item is _FIN:
+                    terminar = True
+                    break
+                lote.append(item)
+                if len(lote) >= self.lote:
+                    break
+                try:
+                    item = self._cola_encolar.get(timeout=1)
+                except queue.Empty:
+                    break
+
+            if lote:
+                self._encolar_lote(lote)
+
+        self._registrar_omitidas()
+
+    def _encolar_lote(self, lote):
+        try:
+            encolar_envios_masivo([
+                {
+                    'destinatario': item['telefono'],
+                    'clave_idempotencia': clave_envio_boleta(item['boleta_id'], self.log_envio_id),
+                    'boleta_id': item['boleta_id'],
+                    'usuario_id': self.usuario_id,
+                    'log_envio_id': self.log_envio_id
+                }
+                for item in lote
+            ])
+            registrar_lote_pipeline(self.log_envio_id, len(lote))
+            self._sumar('encoladas', len(lote))
+            notificar_worker()
+            actualizar_progreso_envio_masivo(self.log_envio_id)
+        except Exception as e:
+            self._sumar('errores', len(lote))
+            logger.error(f"Pipeline {self.log_envio_id}: error encolando lote: {e}")
+
+    def _registrar_omitidas(self):
+        with self._lock:
+            sin_telefono = self.estadisticas['sin_telefono']
+            no_recibe_wa = self.estadisticas['no_recibe_wa']
+        if sin_telefono or no_recibe_wa:
+            registrar_lote_pipeline(self.log_envio_id, 0, sin_telefono, no_recibe_wa)
+
+
+# ============================================================
+# INICIO Y REANUDACION
+# ============================================================
+
+def iniciar_pipeline_envio(app, anio: int, mes: int, usuario_id: Optional[int] = None) -> PipelineEnvio:
+    """Crea el log de envio del periodo y arranca las etapas del pipeline."""
+    log_id = crear_log_envio_pipeline(usuario_id, anio, mes)
+    logger.info(f"Pipeline de envio {log_id} iniciado para {mes}/{anio}")
+    return PipelineEnvio(app, log_id, usuario_id).iniciar()
+
+
+def pipeline_activo(log_envio_id: int) -> bool:
+    """Indica si el pipeline de un log esta corriendo en este proceso."""
+    with _pipelines_lock:
+        return log_envio_id in _pipelines
+
+
+def reanudar_pipeline_envio(app, log_envio_id: int) -> int:
+    """
+    Reanuda un pipeline interrumpido (log abierto sin pipeline activo):
+    vuelve a pasar por las etapas las boletas enviables del periodo y
+    cierra el log. Corre en un thread; retorna cuantas boletas se reanudan.
+    """
+    log = obtener_log_envio(log_envio_id)
+    clasificacion = (log or {}).get('clasificacion') or {}
+    if not log or not clasificacion.get('pipeline') or log['estado'] != 'iniciado':
+        raise ValueError('El envio no corresponde a un pipeline en curso')
+    if pipeline_activo(log_envio_id):
+        raise ValueError('El pipeline de este envio sigue en ejecucion')
+
+    pendientes = [
+        boleta['id']
+        for boleta in obtener_boletas_periodo_envio(log['periodo_anio'], log['periodo_mes'])
+        if boleta['clasificacion'] == 'enviable'
+    ]
+
+    pipeline = PipelineEnvio(app, log_envio_id, log.get('iniciado_por')).iniciar()
+
+    def ejecutar():
+        for boleta_id in pendientes:
+            pipeline.agregar(boleta_id)
+        pipeline.finalizar()
+
+    threading.Thread(target=ejecutar, name=f'pipeline-{log_envio_id}-reanudar', daemon=True).start()
+    return len(pendientes)
@@ -0,0 +1,167 @@
+"""
+Seguimiento en memoria del progreso de procesos largos (envio masivo,
+generacion de boletas).
+
+Los procesos publican su avance aqui en cada paso (sin tocar la base de
+datos) y solo persisten el log cada N pasos o T segundos. Las vistas leen
+el estado en memoria y lo empujan al navegador por Server-Sent Events.
+
+Si el proceso corre en otro proceso (worker dedicado), no hay estado en
+memoria y se usa el log de la base de datos como respaldo.
+"""
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+# Persistir el log cada N pasos...
+PROGRESO_ESCRIBIR_CADA = int(os.getenv('PROGRESO_ESCRIBIR_CADA', '25'))
+# ...o cada T segundos, lo que ocurra primero
+PROGRESO_ESCRIBIR_SEGUNDOS = float(os.getenv('PROGRESO_ESCRIBIR_SEGUNDOS', '5'))
+# Tiempo que se conserva el estado de un proceso ya terminado
+PROGRESO_RETENCION = int(os.getenv('PROGRESO_RETENCION', '600'))
+# Intervalo de keepalive / consulta a la base de datos en el stream SSE
+PROGRESO_SSE_INTERVALO = float(os.getenv('PROGRESO_SSE_INTERVALO', '3'))
+# Duracion maxima de una conexion SSE; el navegador reconecta solo
+PROGRESO_SSE_DURACION = float(os.getenv('PROGRESO_SSE_DURACION', '55'))
+
+_procesos: Dict[str, Dict] = {}
+_condicion = threading.Condition()
+
+
+def clave_progreso(tipo: str, proceso_id: int) -> str:
+    """Clave del proceso en el registro (ej: 'envio:15', 'generacion:3')."""
+    return f'{tipo}:{proceso_id}'
+
+
+def _purgar_terminados():
+    """Elimina procesos terminados hace mas de PROGRESO_RETENCION segundos."""
+    limite = time.time() - PROGRESO_RETENCION
+    for clave in [c for c, p in _procesos.items() if not p['en_curso'] and p['actualizado'] < limite]:
+        del _procesos[clave]
+
+
+def publicar_progreso(clave: str, **datos) -> Dict:
+    """
+    Actualiza el estado de un proceso y despierta a quienes lo esperan.
+    Los campos no informados conservan su valor anterior.
+    """
+    with _condicion:
+        progreso = _procesos.setdefault(clave, {'version': 0, 'en_curso': True})
+        progreso.update(datos)
+        progreso['version'] += 1
+        progreso['actualizado'] = time.time()
+        _purgar_terminados()
+        _condicion.notify_all()
+        return dict(progreso)
+
+
+def obtener_progreso(clave: str) -> Optional[Dict]:
+    """Retorna una copia del estado en memoria del proceso, o None."""
+    with _condicion:
+        progreso = _procesos.get(clave)
+        return dict(progreso) if progreso else None
+
+
+def esperar_progreso(clave: str, version: int, timeout: float) -> Optional[Dict]:
+    """
+    Espera hasta que el proceso publique una version posterior a `version`.
+    Retorna el nuevo estado o None si vence el timeout.
+    """
+    def hay_novedad():
+        progreso = _procesos.get(clave)
+        return progreso is not None and progreso['version'] > version
+
+    with _condicion:
+        if _condicion.wait_for(hay_novedad, timeout):
+            return dict(_procesos[clave])
+    return None
+
+
+def obtener_estado(clave: str, cargar_estado: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """
+    Estado de un proceso: el de memoria si esta reciente o terminado; si
+    no, el que entrega `cargar_estado` (el proceso puede avanzar en otro
+    worker y esta copia haber quedado atrasada).
+    """
+    progreso = obtener_progreso(clave)
+    if progreso and (not progreso['en_curso']
+                     or time.time() - progreso['actualizado'] < PROGRESO_ESCRIBIR_SEGUNDOS):
+        return progreso
+    return cargar_estado() or progreso
+
+
+class EscrituraCoalescida:
+    """
+    Decide cuando persistir el progreso: cada `cada` pasos o cada
+    `segundos`, lo que ocurra primero.
+    """
+
+    def __init__(self, cada: int = None, segundos: float = None):
+        self.cada = cada or PROGRESO_ESCRIBIR_CADA
+        self.segundos = segundos if segundos is not None else PROGRESO_ESCRIBIR_SEGUNDOS
+        self._pendientes = 0
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def registrar(self, pasos: int = 1) -> bool:
+        """Suma pasos y retorna True si corresponde escribir ahora."""
+        with self._lock:
+            self._pendientes += pasos
+            ahora = time.monotonic()
+            if self._pendientes >= self.cada or ahora - self._ultima >= self.segundos:
+                self._pendientes = 0
+                self._ultima = ahora
+                return True
+            return False
+
+
+# ============================================================
+# SERVER-SENT EVENTS
+# ============================================================
+
+def _evento_sse(datos: Dict, evento: str = 'progreso') -> str:
+    carga = {k: v for k, v in datos.items() if k not in ('version', 'actualizado')}
+    return f'event: {evento}\ndata: {json.dumps(carga, default=str)}\n\n'
+
+
+def eventos_progreso(clave: str, cargar_estado: Callable[[], Optional[Dict]]) -> Iterator[str]:
+    """
+    Genera el stream SSE de un proceso.
+
+    Usa el estado en memoria cuando existe; si no (el proceso corre en otro
+    worker o ya termino), consulta `cargar_estado` (lee el log de la base
+    de datos) cada PROGRESO_SSE_INTERVALO segundos.
+    La conexion se cierra al terminar el proceso o tras PROGRESO_SSE_DURACION
+    segundos; EventSource reconecta automaticamente.
+    """
+    yield f'retry: {int(PROGRESO_SSE_INTERVALO * 1000)}\n\n'
+
+    estado = obtener_estado(clave, cargar_estado)
+    if estado is None:
+        yield _evento_sse({'error': 'Proceso no encontrado'}, 'error')
+        return
+    yield _evento_sse(estado)
+
+    fin = time.monotonic() + PROGRESO_SSE_DURACION
+    version = estado.get('version', 0)
+    while estado.get('en_curso') and time.monotonic() < fin:
+        nuevo = esperar_progreso(clave, version, PROGRESO_SSE_INTERVALO)
+        if nuevo is not None:
+            version = nuevo['version']
+        else:
+            # Sin novedades en memoria: el proceso puede avanzar en otro worker.
+            # Si hay estado en memoria, la base solo se usa para detectar el fin.
+            en_memoria = obtener_progreso(clave) is not None
+            nuevo = cargar_estado()
+            if (nuevo is None or (en_memoria and nuevo.get('en_curso'))
+                    or _evento_sse(nuevo) == _evento_sse(estado)):
+                yield ': keepalive\n\n'
+                continue
+
+        estado = nuevo
+        yield _evento_sse(estado)
+
+    if not estado.get('en_curso'):
+        yield _evento_sse(estado, 'fin')
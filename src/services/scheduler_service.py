@@ -3,7 +3,7 @@ Servicio de APScheduler para tareas programadas
 """
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
@@ -13,6 +13,17 @@ logger = logging.getLogger(__name__)
 
 # Scheduler global
 _scheduler: Optional[BackgroundScheduler] = None
+# App Flask para los jobs que renderizan plantillas (PDF del pipeline de envio)
+_app = None
+
+# El scheduler solo se inicia en los procesos que lo piden explicitamente
+# (start.sh lo habilita para gunicorn); importar la app no lo levanta
+SCHEDULER_HABILITADO = os.getenv('SCHEDULER_HABILITADO', '0') == '1'
+
+# Cada cuantas horas se recalcula completo el resumen de estadisticas por periodo
+RESUMEN_PERIODO_HORAS = float(os.getenv('RESUMEN_PERIODO_HORAS', '24'))
+# Cada cuantos minutos se suman al resumen los deltas escritos por los triggers
+RESUMEN_PERIODO_CONSOLIDAR_MINUTOS = float(os.getenv('RESUMEN_PERIODO_CONSOLIDAR_MINUTOS', '5'))
 
 
 def get_scheduler() -> BackgroundScheduler:
@@ -33,7 +44,10 @@ def init_scheduler(app=None) -> BackgroundScheduler:
     Returns:
         Instancia del BackgroundScheduler
     """
-    global _scheduler
+    global _scheduler, _app
+
+    if app is not None:
+        _app = app
 
     if _scheduler is not None:
         logger.info("Scheduler ya inicializado")
@@ -85,6 +99,9 @@ def start_scheduler():
 
         # Programar job de generacion si esta activo
         _setup_generacion_job()
+        _setup_resumen_job()
+        _setup_resumen_consolidar_job()
+        _setup_analitica_job()
 
 
 def shutdown_scheduler():
@@ -181,12 +198,105 @@ def _ejecutar_generacion_job():
     logger.info("Iniciando generacion automatica de boletas...")
 
     try:
-        resultado = ejecutar_generacion(usuario_id=None, es_automatico=True)
+        resultado = ejecutar_generacion(usuario_id=None, es_automatico=True, app=_app)
         logger.info(f"Generacion completada: {resultado['mensaje']}")
     except Exception as e:
         logger.error(f"Error en generacion automatica: {e}")
 
 
+def _setup_resumen_job():
+    """Programa la reconstruccion periodica del resumen de estadisticas."""
+    if RESUMEN_PERIODO_HORAS <= 0:
+        logger.info("Reconstruccion del resumen por periodo desactivada")
+        return
+    try:
+        _scheduler.add_job(
+            _ejecutar_resumen_job,
+            'interval',
+            id='reconstruir_resumen_periodo',
+            hours=RESUMEN_PERIODO_HORAS,
+            replace_existing=True
+        )
+        logger.info(f"Job reconstruir_resumen_periodo programado: cada {RESUMEN_PERIODO_HORAS} horas")
+    except Exception as e:
+        logger.error(f"Error configurando job de resumen por periodo: {e}")
+
+
+def _setup_resumen_consolidar_job():
+    """Programa la consolidacion periodica de los deltas del resumen."""
+    if RESUMEN_PERIODO_CONSOLIDAR_MINUTOS <= 0:
+        logger.info("Consolidacion del resumen por periodo desactivada")
+        return
+    try:
+        _scheduler.add_job(
+            _ejecutar_resumen_consolidar_job,
+            'interval',
+            id='consolidar_resumen_periodo',
+            minutes=RESUMEN_PERIODO_CONSOLIDAR_MINUTOS,
+            replace_existing=True
+        )
+        logger.info(f"Job consolidar_resumen_periodo programado: cada {RESUMEN_PERIODO_CONSOLIDAR_MINUTOS} minutos")
+    except Exception as e:
+        logger.error(f"Error configurando job de consolidacion del resumen: {e}")
+
+
+def _ejecutar_resumen_consolidar_job():
+    """Suma al resumen por periodo los deltas pendientes."""
+    from src.models_resumen import consolidar_resumen_periodos
+
+    try:
+        actualizados = consolidar_resumen_periodos()
+        logger.debug(f"Resumen por periodo consolidado: {actualizados} periodos actualizados")
+    except Exception as e:
+        logger.error(f"Error consolidando resumen por periodo: {e}")
+
+
+def _ejecutar_resumen_job():
+    """Recalcula el resumen por periodo y registra si habia desvios."""
+    from src.models_resumen import reconstruir_resumen_periodos
+
+    try:
+        corregidos = reconstruir_resumen_periodos()
+        if corregidos:
+            logger.warning(f"Resumen por periodo reconstruido: {corregidos} periodos corregidos")
+        else:
+            logger.info("Resumen por periodo reconstruido sin diferencias")
+    except Exception as e:
+        logger.error(f"Error reconstruyendo resumen por periodo: {e}")
+
+
+def _setup_analitica_job():
+    """Programa el refresco periodico del cubo analitico (y uno al iniciar)."""
+    from src.services.analitica_service import ANALITICA_REFRESCO_MINUTOS
+
+    if ANALITICA_REFRESCO_MINUTOS <= 0:
+        logger.info("Refresco automatico del cubo analitico desactivado")
+        return
+    try:
+        _scheduler.add_job(
+            _ejecutar_analitica_job,
+            'interval',
+            id='refrescar_cubo_analitico',
+            minutes=ANALITICA_REFRESCO_MINUTOS,
+            next_run_time=datetime.now(timezone.utc),
+            replace_existing=True
+        )
+        logger.info(f"Job refrescar_cubo_analitico programado: cada {ANALITICA_REFRESCO_MINUTOS} minutos")
+    except Exception as e:
+        logger.error(f"Error configurando job del cubo analitico: {e}")
+
+
+def _ejecutar_analitica_job():
+    """Reconstruye el cubo analitico si cambiaron las tablas de origen."""
+    from src.services.analitica_service import refrescar_cubo
+
+    try:
+        if refrescar_cubo():
+            logger.info("Cubo analitico actualizado")
+    except Exception as e:
+        logger.error(f"Error actualizando el cubo analitico: {e}")
+
+
 def recargar_configuracion_cron():
     """Recarga la configuracion del cron desde la base de datos."""
     global _scheduler
@@ -6,18 +6,25 @@ echo "DATABASE_URL: $DATABASE_URL"
 echo "FLASK_ENV: $FLASK_ENV"
 echo "FLASK_APP: $FLASK_APP"
 
-# Verificar que la app se puede importar
+# Verificar que la app se puede importar (sin levantar scheduler ni worker)
 echo "=== Verificando importación de la aplicación ==="
-python -c "from web.app import app; print('✓ Aplicación importada correctamente')" 2>&1
+SCHEDULER_HABILITADO=0 COLA_ENVIOS_WORKER_EMBEBIDO=0 \
+    python -c "from web.app import app; print('✓ Aplicación importada correctamente')" 2>&1
 
 if [ $? -ne 0 ]; then
     echo "ERROR: No se pudo importar la aplicación Flask"
     exit 1
 fi
 
+# Gunicorn levanta el scheduler y el worker de envios embebido, salvo que
+# se desactiven (ej: COLA_ENVIOS_WORKER_EMBEBIDO=0 con un worker dedicado)
+export SCHEDULER_HABILITADO=${SCHEDULER_HABILITADO:-1}
+export COLA_ENVIOS_WORKER_EMBEBIDO=${COLA_ENVIOS_WORKER_EMBEBIDO:-1}
+
 echo "=== Iniciando Gunicorn ==="
 exec gunicorn --bind 0.0.0.0:5000 \
     --workers 1 \
+    --threads ${GUNICORN_THREADS:-8} \
     --timeout 120 \
     --log-level debug \
     --access-logfile - \
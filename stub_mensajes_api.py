@@ -0,0 +1,247 @@
+"""
+Servidor local que imita la API de mensajes (MENSAJES_API_URL) para
+pruebas y mediciones del envio masivo sin el proveedor real de WhatsApp.
+
+Implementa el mismo contrato que usa src/services/mensajes_service.py:
+    POST {base}/send     -> {"success": true, "messageId": "..."}
+    GET  {base}/health   -> {"status": "ok"}
+y ademas:
+    GET  {base}/stats    -> contadores, latencias y tamaños de payload
+    POST {base}/reset    -> reinicia los contadores
+
+Uso:
+    python stub_mensajes_api.py --puerto 8099 --latencia-ms 120 --tasa-error 0.02 \\
+        --rafaga-cada 300 --rafaga-largo 15 --retry-after 2
+
+    MENSAJES_API_URL=http://127.0.0.1:8099/api MENSAJES_API_KEY=stub ...
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+from metricas_prueba import percentil, redondear
+
+
+class StubMensajesAPI:
+    """
+    Estado y configuracion del servidor simulado.
+
+    Args:
+        latencia_ms: Latencia base de cada /send
+        jitter_ms: Variacion aleatoria adicional (0..jitter_ms)
+        latencia_por_kb_ms: Latencia extra por KB de payload (documentos base64)
+        tasa_error: Fraccion de envios que responden HTTP 500
+        rafaga_cada: Cada cuantos envios comienza una rafaga de 429 (0 = nunca)
+        rafaga_largo: Cuantos envios seguidos responden 429 en cada rafaga
+        retry_after: Valor del header Retry-After (segundos) en los 429
+        api_key: Si se define, exige el header X-API-Key
+    """
+
+    def __init__(self, latencia_ms: float = 50, jitter_ms: float = 50,
+                 latencia_por_kb_ms: float = 0.0, tasa_error: float = 0.0,
+                 rafaga_cada: int = 0, rafaga_largo: int = 10,
+                 retry_after: float = 1, api_key: str = None):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.latencia_por_kb_ms = latencia_por_kb_ms
+        self.tasa_error = tasa_error
+        self.rafaga_cada = rafaga_cada
+        self.rafaga_largo = rafaga_largo
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._solicitudes = 0
+            self._rafaga_restante = 0
+            self._stats = {
+                'solicitudes': 0,
+                'exitosas': 0,
+                'errores_500': 0,
+                'limitadas_429': 0,
+                'no_autorizadas': 0,
+                'bytes_recibidos': 0,
+                'por_tipo': {},
+                'latencias_ms': [],
+                'tamanos': [],
+                'inicio': time.time()
+            }
+
+    def _tipo_payload(self, payload: Dict) -> str:
+        media = payload.get('media')
+        if not media:
+            return 'texto'
+        if str(media).startswith('data:'):
+            return 'documento_base64'
+        return 'documento_url'
+
+    def decidir(self, payload: Dict, tamano: int, api_key: str) -> Tuple[int, Dict, Dict, float]:
+        """
+        Decide la respuesta de un /send.
+        Retorna (status, cuerpo, headers, segundos de latencia simulada).
+        """
+        with self._lock:
+            self._solicitudes += 1
+            stats = self._stats
+            stats['solicitudes'] += 1
+            stats['bytes_recibidos'] += tamano
+            stats['tamanos'].append(tamano)
+            tipo = self._tipo_payload(payload)
+            por_tipo = stats['por_tipo'].setdefault(tipo, {'solicitudes': 0, 'bytes': 0})
+            por_tipo['solicitudes'] += 1
+            por_tipo['bytes'] += tamano
+
+            if self.api_key and api_key != self.api_key:
+                stats['no_autorizadas'] += 1
+                return 401, {'success': False, 'error': 'API Key invalida'}, {}, 0
+
+            if self.rafaga_cada and self._solicitudes % self.rafaga_cada == 0:
+                self._rafaga_restante = self.rafaga_largo
+            if self._rafaga_restante > 0:
+                self._rafaga_restante -= 1
+                stats['limitadas_429'] += 1
+                return (429, {'success': False, 'error': 'Rate limit exceeded'},
+                        {'Retry-After': f'{self.retry_after:g}'}, 0)
+
+            latencia = (self.latencia_ms + random.uniform(0, self.jitter_ms)
+                        + self.latencia_por_kb_ms * tamano / 1024) / 1000
+
+            if random.random() < self.tasa_error:
+                stats['errores_500'] += 1
+                return 500, {'success': False, 'error': 'Error simulado del proveedor'}, {}, latencia
+
+            stats['exitosas'] += 1
+            cuerpo = {'success': True, 'messageId': f"stub-{self._solicitudes}"}
+            return 200, cuerpo, {}, latencia
+
+    def registrar_latencia(self, segundos: float):
+        with self._lock:
+            self._stats['latencias_ms'].append(segundos * 1000)
+
+    def resumen(self) -> Dict:
+        """Contadores y percentiles de latencia y tamaño de payload."""
+        with self._lock:
+            stats = dict(self._stats)
+            latencias = list(stats.pop('latencias_ms'))
+            tamanos = list(stats.pop('tamanos'))
+        duracion = time.time() - stats.pop('inicio')
+        stats['duracion_segundos'] = round(duracion, 2)
+        stats['solicitudes_por_segundo'] = round(stats['solicitudes'] / duracion, 2) if duracion else 0
+        stats['latencia_ms'] = {f'p{p}': redondear(percentil(latencias, p)) for p in (50, 95, 99)}
+        stats['latencia_ms']['max'] = redondear(max(latencias)) if latencias else None
+        stats['payload_bytes'] = {f'p{p}': percentil(tamanos, p) for p in (50, 95, 99)}
+        stats['payload_bytes']['max'] = max(tamanos) if tamanos else None
+        return stats
+
+
+def _crear_handler(stub: StubMensajesAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _responder(self, status: int, cuerpo: Dict, headers: Dict = None):
+            datos = json.dumps(cuerpo, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(datos)))
+            for nombre, valor in (headers or {}).items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            if self.path.endswith('/health'):
+                self._responder(200, {'status': 'ok', 'stub': True})
+            elif self.path.endswith('/stats'):
+                self._responder(200, stub.resumen())
+            else:
+                self._responder(404, {'success': False, 'error': 'No encontrado'})
+
+        def do_POST(self):
+            largo = int(self.headers.get('Content-Length') or 0)
+            cuerpo = self.rfile.read(largo) if largo else b''
+
+            if self.path.endswith('/reset'):
+                stub.reiniciar()
+                self._responder(200, {'success': True})
+                return
+            if not self.path.endswith('/send'):
+                self._responder(404, {'success': False, 'error': 'No encontrado'})
+                return
+
+            inicio = time.perf_counter()
+            try:
+                payload = json.loads(cuerpo or b'{}')
+            except ValueError:
+                self._responder(400, {'success': False, 'error': 'JSON invalido'})
+                return
+
+            status, respuesta, headers, latencia = stub.decidir(
+                payload, len(cuerpo), self.headers.get('X-API-Key'))
+            if latencia:
+                time.sleep(latencia)
+            self._responder(status, respuesta, headers)
+            stub.registrar_latencia(time.perf_counter() - inicio)
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Handler
+
+
+def iniciar_stub(stub: StubMensajesAPI, host: str = '127.0.0.1', puerto: int = 0) -> ThreadingHTTPServer:
+    """
+    Levanta el servidor en un thread. Con puerto=0 se elige uno libre
+    (ver servidor.server_address).
+    """
+    servidor = ThreadingHTTPServer((host, puerto), _crear_handler(stub))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='stub-mensajes', daemon=True).start()
+    return servidor
+
+
+def agregar_argumentos(parser: argparse.ArgumentParser):
+    """Argumentos de configuracion del stub (compartidos con la prueba de carga)."""
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--latencia-por-kb-ms', type=float, default=0.0)
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Fraccion de HTTP 500 (0..1)')
+    parser.add_argument('--rafaga-cada', type=int, default=0, help='Iniciar rafaga de 429 cada N envios')
+    parser.add_argument('--rafaga-largo', type=int, default=10, help='Largo de cada rafaga de 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After de los 429 (segundos)')
+
+
+def stub_desde_argumentos(args, api_key: str = None) -> StubMensajesAPI:
+    return StubMensajesAPI(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        latencia_por_kb_ms=args.latencia_por_kb_ms,
+        tasa_error=args.tasa_error,
+        rafaga_cada=args.rafaga_cada,
+        rafaga_largo=args.rafaga_largo,
+        retry_after=args.retry_after,
+        api_key=api_key
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor simulado de la API de mensajes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8099)
+    parser.add_argument('--api-key', default=None, help='Exigir esta X-API-Key')
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor = iniciar_stub(stub_desde_argumentos(args, args.api_key), args.host, args.puerto)
+    host, puerto = servidor.server_address[:2]
+    print(f"Stub de mensajes escuchando en http://{host}:{puerto}/api (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
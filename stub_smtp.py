@@ -0,0 +1,228 @@
+"""
+Servidor SMTP local minimo para pruebas y mediciones del canal email,
+sin un proveedor real. Acepta los mensajes y los descarta, contando
+conexiones, mensajes y bytes.
+
+Uso:
+    python stub_smtp.py --puerto 8025 --latencia-ms 20 --tasa-error 0.01
+
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_SEGURIDAD=ninguna \\
+    SMTP_REMITENTE=boletas@ejemplo.cl ...
+
+Medir el envio con el pool de conexiones del sistema (levanta su propio stub):
+    python stub_smtp.py --medir 500 --hilos 4 --pdf-kb 60
+    python stub_smtp.py --medir 500 --hilos 4 --mensajes-por-conexion 1   # sin reutilizar
+"""
+import os
+import time
+import random
+import argparse
+import threading
+import socketserver
+from typing import Dict
+
+from metricas_prueba import percentil, redondear
+
+
+class StubSMTP:
+    """
+    Estado y configuracion del servidor SMTP simulado.
+
+    Args:
+        latencia_ms: Latencia de la respuesta al fin de DATA
+        tasa_error: Fraccion de mensajes rechazados con 451 (temporal)
+        cerrar_cada: Cerrar la conexion tras N mensajes (0 = nunca), para
+            probar la reconexion del pool
+    """
+
+    def __init__(self, latencia_ms: float = 0, tasa_error: float = 0.0, cerrar_cada: int = 0):
+        self.latencia_ms = latencia_ms
+        self.tasa_error = tasa_error
+        self.cerrar_cada = cerrar_cada
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._stats = {
+                'conexiones': 0,
+                'mensajes': 0,
+                'rechazados_451': 0,
+                'bytes_recibidos': 0,
+                'tamanos': [],
+                'inicio': time.time()
+            }
+
+    def sumar(self, clave: str, cantidad: int = 1):
+        with self._lock:
+            self._stats[clave] += cantidad
+
+    def recibir_mensaje(self, tamano: int) -> int:
+        """Registra un mensaje y decide el codigo de respuesta (250 o 451)."""
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        with self._lock:
+            if random.random() < self.tasa_error:
+                self._stats['rechazados_451'] += 1
+                return 451
+            self._stats['mensajes'] += 1
+            self._stats['bytes_recibidos'] += tamano
+            self._stats['tamanos'].append(tamano)
+            return 250
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            tamanos = list(stats.pop('tamanos'))
+        duracion = time.time() - stats.pop('inicio')
+        stats['duracion_segundos'] = round(duracion, 2)
+        stats['mensajes_por_conexion'] = (round(stats['mensajes'] / stats['conexiones'], 1)
+                                          if stats['conexiones'] else None)
+        stats['mensaje_bytes'] = {f'p{p}': percentil(tamanos, p) for p in (50, 95, 99)}
+        return stats
+
+
+def _crear_handler(stub: StubSMTP):
+    class Handler(socketserver.StreamRequestHandler):
+
+        def _responder(self, linea: str):
+            self.wfile.write(f'{linea}\r\n'.encode('ascii'))
+            self.wfile.flush()
+
+        def _leer_datos(self) -> int:
+            tamano = 0
+            while True:
+                linea = self.rfile.readline()
+                if not linea or linea in (b'.\r\n', b'.\n'):
+                    return tamano
+                tamano += len(linea)
+
+        def handle(self):
+            stub.sumar('conexiones')
+            self._responder('220 stub-smtp listo')
+            mensajes = 0
+
+            while True:
+                linea = self.rfile.readline()
+                if not linea:
+                    return
+                comando = linea.decode('ascii', 'replace').strip().upper()
+
+                if comando.startswith('EHLO'):
+                    self._responder('250-stub-smtp')
+                    self._responder('250-SIZE 52428800')
+                    self._responder('250 8BITMIME')
+                elif comando.startswith('HELO'):
+                    self._responder('250 stub-smtp')
+                elif comando.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                    self._responder('250 OK')
+                elif comando == 'DATA':
+                    self._responder('354 Fin con <CRLF>.<CRLF>')
+                    codigo = stub.recibir_mensaje(self._leer_datos())
+                    if codigo == 250:
+                        mensajes += 1
+                        self._responder('250 OK encolado')
+                    else:
+                        self._responder('451 4.7.1 Intente mas tarde')
+                    if stub.cerrar_cada and mensajes >= stub.cerrar_cada:
+                        return
+                elif comando == 'QUIT':
+                    self._responder('221 Adios')
+                    return
+                else:
+                    self._responder('502 Comando no implementado')
+
+    return Handler
+
+
+def iniciar_stub_smtp(stub: StubSMTP, host: str = '127.0.0.1', puerto: int = 0) -> socketserver.ThreadingTCPServer:
+    """
+    Levanta el servidor en un thread. Con puerto=0 se elige uno libre
+    (ver servidor.server_address).
+    """
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    servidor = socketserver.ThreadingTCPServer((host, puerto), _crear_handler(stub))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='stub-smtp', daemon=True).start()
+    return servidor
+
+
+def medir_envio(args):
+    """Envia N boletas ficticias con el pool SMTP del sistema contra un stub local."""
+    stub = StubSMTP(args.latencia_ms, args.tasa_error, args.cerrar_cada)
+    servidor = iniciar_stub_smtp(stub, args.host, 0)
+    host, puerto = servidor.server_address[:2]
+
+    # La configuracion del servicio se lee al importarlo
+    os.environ.update({
+        'SMTP_HOST': host,
+        'SMTP_PORT': str(puerto),
+        'SMTP_SEGURIDAD': 'ninguna',
+        'SMTP_USUARIO': '',
+        'SMTP_REMITENTE': 'boletas@stub.local',
+        'SMTP_POOL_SIZE': str(args.hilos),
+        'SMTP_MENSAJES_POR_CONEXION': str(args.mensajes_por_conexion),
+        'EMAIL_TASA_POR_SEGUNDO': str(args.tasa),
+        'EMAIL_RAFAGA': str(max(1, int(args.tasa)))
+    })
+    from src.services.email_service import enviar_boleta_email, pool_smtp
+    from src.services.mensajes_service import enviar_concurrente
+
+    pdf = os.urandom(args.pdf_kb * 1024)
+    boletas = [{
+        'numero_boleta': f'STUB-{i:06d}', 'cliente_nombre': f'Cliente {i}',
+        'periodo_anio': 1999, 'periodo_mes': 1, 'consumo_m3': 10, 'total': 12345
+    } for i in range(args.medir)]
+
+    latencias = []
+    errores = 0
+    inicio = time.perf_counter()
+
+    def enviar(boleta):
+        t0 = time.perf_counter()
+        enviar_boleta_email(f"{boleta['numero_boleta'].lower()}@stub.local", boleta, pdf_bytes=pdf)
+        latencias.append((time.perf_counter() - t0) * 1000)
+
+    for _, _, error in enviar_concurrente(boletas, enviar, args.hilos):
+        if error is not None:
+            errores += 1
+
+    duracion = time.perf_counter() - inicio
+    pool_smtp.cerrar()
+
+    print(f"Mensajes: {args.medir} ({errores} con error) en {duracion:.2f}s "
+          f"-> {args.medir / duracion:.1f} msg/s")
+    print(f"Latencia por mensaje (ms): p50={redondear(percentil(latencias, 50))} "
+          f"p95={redondear(percentil(latencias, 95))} p99={redondear(percentil(latencias, 99))}")
+    print(f"Pool: {pool_smtp.estadisticas}")
+    print(f"Stub: {stub.resumen()}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor SMTP simulado')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8025)
+    parser.add_argument('--latencia-ms', type=float, default=0)
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Fraccion de 451 (0..1)')
+    parser.add_argument('--cerrar-cada', type=int, default=0, help='Cortar la conexion tras N mensajes')
+    parser.add_argument('--medir', type=int, default=0, help='Enviar N mensajes con el pool y reportar')
+    parser.add_argument('--hilos', type=int, default=2, help='Envios simultaneos (y tamaño del pool)')
+    parser.add_argument('--mensajes-por-conexion', type=int, default=100)
+    parser.add_argument('--tasa', type=float, default=1000, help='EMAIL_TASA_POR_SEGUNDO durante la medicion')
+    parser.add_argument('--pdf-kb', type=int, default=60, help='Tamaño del PDF adjunto simulado')
+    args = parser.parse_args()
+
+    if args.medir:
+        medir_envio(args)
+    else:
+        stub_smtp = StubSMTP(args.latencia_ms, args.tasa_error, args.cerrar_cada)
+        servidor_smtp = iniciar_stub_smtp(stub_smtp, args.host, args.puerto)
+        host_smtp, puerto_smtp = servidor_smtp.server_address[:2]
+        print(f"Stub SMTP escuchando en {host_smtp}:{puerto_smtp} (Ctrl+C para salir)")
+        try:
+            while True:
+                time.sleep(60)
+                print(stub_smtp.resumen())
+        except KeyboardInterrupt:
+            servidor_smtp.shutdown()
@@ -7,11 +7,12 @@ import sys
 # Agregar src al path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, render_template
 
 from src.database import inicializar_db, BASE_DIR
 from src.models import obtener_estadisticas
-from web.auth import admin_required
+from web.auth import admin_required, registrador_required
+from web.archivos import servir_archivo
 
 app = Flask(__name__)
 
@@ -24,6 +25,10 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hora
 # Directorio base de la app
 APP_DIR = BASE_DIR
 
+# Estaticos con hash y precomprimidos (si se ejecuto build_static.py)
+from web.static_assets import registrar_assets
+registrar_assets(app)
+
 
 @app.route('/')
 @admin_required
@@ -39,20 +44,54 @@ def health():
 
 
 @app.route('/foto/<path:filename>')
+@registrador_required
 def servir_foto(filename):
-    """Sirve las fotos desde el directorio de fotos de la app."""
+    """Sirve las fotos de lecturas (administradores y registradores)."""
     # Si filename empieza con 'fotos/', quitarlo para evitar duplicacion
     if filename.startswith('fotos/'):
         filename = filename[6:]
-    fotos_dir = os.path.join(APP_DIR, 'fotos')
-    return send_from_directory(fotos_dir, filename)
+    return servir_archivo(os.path.join(APP_DIR, 'fotos'), 'fotos', filename)
+
+
+@app.route('/pdf/boleta/<int:boleta_id>')
+def servir_pdf_boleta(boleta_id):
+    """Sirve el PDF publicado de una boleta mediante enlace firmado (sin sesion)."""
+    from flask import request, abort, send_file
+    from src.services.pdf_service import verificar_firma_pdf, ruta_pdf_publicado
+
+    expira = request.args.get('exp', type=int)
+    firma = request.args.get('firma', '')
+    if not expira or not verificar_firma_pdf(boleta_id, expira, firma):
+        abort(403)
+
+    ruta = ruta_pdf_publicado(boleta_id)
+    if not os.path.exists(ruta):
+        abort(404)
+
+    # conditional=True habilita Range, ETag y 304
+    return send_file(ruta, mimetype='application/pdf', conditional=True,
+                     download_name=f'boleta_{boleta_id}.pdf')
+
+
+def _enviar_comprobante(filename):
+    return servir_archivo(os.path.join(APP_DIR, 'comprobantes'), 'comprobantes', filename)
 
 
 @app.route('/comprobantes/<path:filename>')
 def servir_comprobante(filename):
-    """Sirve los comprobantes de pago desde el directorio de la app."""
-    comprobantes_dir = os.path.join(APP_DIR, 'comprobantes')
-    return send_from_directory(comprobantes_dir, filename)
+    """
+    Sirve los comprobantes de pago a administradores y, en el portal, al
+    cliente dueno del pago o boleta con ese comprobante.
+    """
+    from flask import session, abort
+    from src.models_pagos import comprobante_pertenece_a_cliente
+
+    if session.get('rol') != 'administrador' and session.get('cliente_id'):
+        if not comprobante_pertenece_a_cliente(f'comprobantes/{filename}', session['cliente_id']):
+            abort(404)
+        return _enviar_comprobante(filename)
+
+    return admin_required(_enviar_comprobante)(filename)
 
 
 # Registrar blueprints
@@ -67,6 +106,9 @@ from web.routes.portal import portal_bp
 from web.routes.configuracion import configuracion_bp
 from web.routes.scheduler import scheduler_bp
 from web.routes.envio_masivo import envio_masivo_bp
+from web.routes.webhooks import webhooks_bp
+from web.routes.exportaciones import exportaciones_bp
+from web.routes.analitica import analitica_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(usuarios_bp)
@@ -79,81 +121,14 @@ app.register_blueprint(portal_bp, url_prefix='/portal')
 app.register_blueprint(configuracion_bp, url_prefix='/configuracion')
 app.register_blueprint(scheduler_bp, url_prefix='/scheduler')
 app.register_blueprint(envio_masivo_bp)
+app.register_blueprint(webhooks_bp)
+app.register_blueprint(exportaciones_bp)
+app.register_blueprint(analitica_bp, url_prefix='/analitica')
 
 
-# Filtros de plantilla
-@app.template_filter('mes_nombre')
-def mes_nombre(mes):
-    """Convierte número de mes a nombre."""
-    meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
-             'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-    return meses[mes] if 1 <= mes <= 12 else str(mes)
-
-
-@app.template_filter('nombre_mes')
-def nombre_mes(mes):
-    """Convierte número de mes a nombre corto (Ene, Feb, etc.)."""
-    meses = ['', 'Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun',
-             'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
-    try:
-        idx = int(mes)
-        return meses[idx] if 1 <= idx <= 12 else str(mes)
-    except (ValueError, TypeError):
-        return str(mes)
-
-
-@app.template_filter('fecha_formato')
-def fecha_formato(fecha):
-    """Convierte fecha a formato dd/mm/yyyy."""
-    if not fecha:
-        return '-'
-    # Si es objeto date o datetime
-    if hasattr(fecha, 'strftime'):
-        return fecha.strftime('%d/%m/%Y')
-    if isinstance(fecha, str):
-        # Si viene como yyyy-mm-dd
-        if '-' in fecha and len(fecha) == 10:
-            partes = fecha.split('-')
-            if len(partes) == 3:
-                return f"{partes[2]}/{partes[1]}/{partes[0]}"
-    return str(fecha)
-
-
-@app.template_filter('formato_pesos')
-def formato_pesos(monto):
-    """Formatea un monto en pesos con separador de miles (punto)."""
-    try:
-        # Convertir a float y formatear sin decimales
-        valor = float(monto)
-        # Formatear con separador de miles usando coma
-        formateado = "{:,.0f}".format(valor)
-        # Reemplazar coma por punto (formato chileno)
-        return formateado.replace(',', '.')
-    except (ValueError, TypeError):
-        return str(monto)
-
-
-@app.template_filter('formato_fecha_hora')
-def formato_fecha_hora(fecha):
-    """Convierte datetime a formato dd/mm/yyyy HH:MM."""
-    if not fecha:
-        return '-'
-    # Si es objeto datetime
-    if hasattr(fecha, 'strftime'):
-        return fecha.strftime('%d/%m/%Y %H:%M')
-    if isinstance(fecha, str):
-        # Si viene como yyyy-mm-dd HH:MM:SS
-        if 'T' in fecha or ' ' in fecha:
-            try:
-                from datetime import datetime
-                if 'T' in fecha:
-                    dt = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
-                else:
-                    dt = datetime.strptime(fecha[:19], '%Y-%m-%d %H:%M:%S')
-                return dt.strftime('%d/%m/%Y %H:%M')
-            except:
-                pass
-    return str(fecha)
+# Filtros de plantilla (compartidos con el worker dedicado de la cola de envios)
+from web.filtros import registrar_filtros
+registrar_filtros(app)
 
 
 @app.context_processor
@@ -161,19 +136,29 @@ def utility_processor():
     """Inyecta utilidades al contexto de templates."""
     def url_for_page(page):
         """Genera URL preservando query params actuales, cambiando solo page."""
+        from urllib.parse import urlencode
         from flask import request
         args = request.args.copy()
+        # Los cursores de paginacion solo valen para la pagina contigua
+        args.pop('despues', None)
+        args.pop('antes', None)
         args['page'] = page
-        return request.path + '?' + '&'.join(
-            f'{k}={v}' for k, v in args.items() if v != ''
-        )
-    return {'url_for_page': url_for_page}
+        # Los valores vacios se conservan: anio= significa "Todos"
+        return request.path + '?' + urlencode(list(args.items(multi=True)))
+    def cliente_nombre(cliente_id):
+        """Nombre del cliente seleccionado en un buscador de clientes."""
+        from src.services.clientes_indice_service import nombre_cliente
+        return nombre_cliente(cliente_id)
+
+    return {'url_for_page': url_for_page, 'cliente_nombre': cliente_nombre}
 
 
 def _iniciar_scheduler():
-    """Inicializa el scheduler de tareas programadas."""
+    """Inicializa el scheduler de tareas programadas (si SCHEDULER_HABILITADO=1)."""
     try:
-        from src.services.scheduler_service import init_scheduler, start_scheduler
+        from src.services.scheduler_service import SCHEDULER_HABILITADO, init_scheduler, start_scheduler
+        if not SCHEDULER_HABILITADO:
+            return
         init_scheduler(app)
         start_scheduler()
         print("Scheduler iniciado correctamente")
@@ -181,11 +166,24 @@ def _iniciar_scheduler():
         print(f"Error inicializando scheduler: {e}")
 
 
+def _iniciar_worker_cola():
+    """Inicia el worker de la cola de envios dentro del proceso web (si COLA_ENVIOS_WORKER_EMBEBIDO=1)."""
+    try:
+        from src.services.cola_envios_service import iniciar_worker_cola
+        if iniciar_worker_cola(app):
+            print("Worker de cola de envios iniciado")
+    except Exception as e:
+        print(f"Error iniciando worker de cola de envios: {e}")
+
+
 # Inicializar base de datos al importar el modulo
 inicializar_db()
 
-# Inicializar scheduler (con 1 worker no hay riesgo de duplicados)
+# Scheduler y worker de envios solo si se habilitan explicitamente
+# (start.sh los habilita para gunicorn; con 1 worker no hay duplicados y
+# la cola admite varios workers gracias a SKIP LOCKED)
 _iniciar_scheduler()
+_iniciar_worker_cola()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+"""
+Entrega de fotos de lecturas y comprobantes de pago.
+
+La autorizacion se valida en Flask y la transferencia depende de
+ARCHIVOS_MODO:
+
+- 'python' (defecto): send_file con Range, ETag/304 y Last-Modified. Sin
+  Range, gunicorn envia el archivo con sendfile(2) (wsgi.file_wrapper),
+  sin copiarlo por Python.
+- 'x-accel': responde solo la cabecera X-Accel-Redirect y nginx entrega
+  el archivo desde una location internal (ARCHIVOS_ACCEL_PREFIJO). El
+  worker queda libre apenas valida el permiso.
+- 'x-sendfile': cabecera X-Sendfile con la ruta absoluta (Apache con
+  mod_xsendfile, lighttpd).
+
+Ver DEPLOYMENT.md (Entrega de fotos y comprobantes por el proxy).
+"""
+import os
+import mimetypes
+from urllib.parse import quote
+
+from flask import current_app, send_file, abort
+from werkzeug.security import safe_join
+
+ARCHIVOS_MODO = os.getenv('ARCHIVOS_MODO', 'python').lower()
+# Location internal de nginx que mapea a BASE_DIR (ej: /_archivos/fotos/... -> /app/fotos/...)
+ARCHIVOS_ACCEL_PREFIJO = os.getenv('ARCHIVOS_ACCEL_PREFIJO', '/_archivos').rstrip('/')
+# Los nombres incluyen fecha/hora y no se reescriben: el navegador puede reutilizarlos
+ARCHIVOS_MAX_AGE = int(os.getenv('ARCHIVOS_MAX_AGE', '86400'))
+
+
+def servir_archivo(directorio: str, carpeta: str, nombre: str):
+    """
+    Respuesta con el archivo `nombre` dentro de `directorio`. `carpeta` es
+    el nombre de ese directorio bajo la location internal del proxy.
+    Responde 404 si no existe o si la ruta sale del directorio.
+    """
+    ruta = safe_join(directorio, nombre)
+    if ruta is None or not os.path.isfile(ruta):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+
+    if ARCHIVOS_MODO == 'x-accel':
+        respuesta = current_app.response_class(mimetype=mimetype)
+        relativa = os.path.relpath(ruta, directorio).replace(os.sep, '/')
+        respuesta.headers['X-Accel-Redirect'] = quote(f'{ARCHIVOS_ACCEL_PREFIJO}/{carpeta}/{relativa}')
+    elif ARCHIVOS_MODO == 'x-sendfile':
+        respuesta = current_app.response_class(mimetype=mimetype)
+        respuesta.headers['X-Sendfile'] = ruta
+    else:
+        respuesta = send_file(ruta, mimetype=mimetype, conditional=True, etag=True,
+                              max_age=ARCHIVOS_MAX_AGE)
+
+    respuesta.headers['Cache-Control'] = f'private, max-age={ARCHIVOS_MAX_AGE}'
+    return respuesta
@@ -0,0 +1,110 @@
+"""
+Cache HTTP condicional: ETag, Last-Modified y 304 Not Modified.
+
+Los listados, las APIs JSON y los PDF se validan con tokens baratos:
+la version de las tablas de las que dependen (secuencias version_<tabla>,
+incrementadas por triggers al commit) o la huella de la boleta en el caso del PDF.
+Si el navegador ya tiene la version vigente se responde 304 sin
+renderizar el template ni consultar los datos.
+
+Las respuestas son privadas y se revalidan siempre (no-cache): el
+navegador guarda la copia pero pregunta en cada navegacion.
+"""
+import os
+import hashlib
+from datetime import date
+from functools import wraps
+
+from flask import request, session, current_app, make_response
+
+from src.models import obtener_versiones_datos
+
+# 0 desactiva las respuestas 304 (los validadores se siguen enviando)
+CACHE_HTTP_ACTIVO = os.getenv('CACHE_HTTP_ACTIVO', '1') == '1'
+
+
+def _version_aplicacion() -> str:
+    """
+    Huella del codigo y templates desplegados: un despliegue nuevo invalida
+    las copias de los navegadores. Es igual en todos los workers.
+    """
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ultima = 0.0
+    for carpeta in ('web', 'src'):
+        for directorio, _, archivos in os.walk(os.path.join(raiz, carpeta)):
+            for archivo in archivos:
+                if archivo.endswith(('.py', '.html')):
+                    ultima = max(ultima, os.path.getmtime(os.path.join(directorio, archivo)))
+    return os.getenv('APP_VERSION', '') + str(int(ultima))
+
+
+VERSION_APLICACION = _version_aplicacion()
+
+
+def calcular_etag(*partes) -> str:
+    """ETag a partir de cualquier conjunto de valores."""
+    return hashlib.sha1(repr((VERSION_APLICACION,) + partes).encode('utf-8')).hexdigest()[:20]
+
+
+def no_modificado(etag: str, ultima_modificacion=None) -> bool:
+    """True si el navegador ya tiene esta version (If-None-Match / If-Modified-Since)."""
+    if not CACHE_HTTP_ACTIVO or request.method not in ('GET', 'HEAD'):
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if ultima_modificacion is not None and request.if_modified_since:
+        return ultima_modificacion.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def aplicar_validadores(respuesta, etag: str, ultima_modificacion=None, debil: bool = False):
+    """Agrega ETag, Last-Modified y Cache-Control a una respuesta."""
+    respuesta.set_etag(etag, weak=debil)
+    if ultima_modificacion is not None:
+        respuesta.last_modified = ultima_modificacion
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+def respuesta_no_modificada(etag: str, ultima_modificacion=None, debil: bool = False):
+    """Respuesta 304 vacia con los mismos validadores."""
+    return aplicar_validadores(current_app.response_class(status=304), etag, ultima_modificacion, debil)
+
+
+def condicional(*tablas):
+    """
+    Decorador para vistas GET cuyo contenido depende solo de los parametros
+    de la URL, del usuario y de las tablas indicadas.
+
+    El ETag (debil) combina la ruta completa, el usuario de la sesion, la
+    fecha (hay filtros que por defecto usan el mes anterior) y la version
+    de cada tabla. Con un mensaje flash pendiente se responde completo.
+
+    Uso (despues de admin_required / registrador_required):
+        @condicional('boletas', 'clientes')
+    """
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            versiones = obtener_versiones_datos(tablas)
+            etag = calcular_etag(
+                request.endpoint, request.full_path,
+                session.get('usuario_id'), session.get('rol'), session.get('cliente_id'),
+                date.today().isoformat(),
+                tuple(versiones[tabla]['version'] for tabla in tablas)
+            )
+            fechas = [v['actualizado_at'] for v in versiones.values() if v['actualizado_at']]
+            ultima_modificacion = max(fechas) if fechas else None
+
+            if no_modificado(etag, ultima_modificacion):
+                return respuesta_no_modificada(etag, ultima_modificacion, debil=True)
+
+            respuesta = make_response(f(*args, **kwargs))
+            if respuesta.status_code == 200:
+                aplicar_validadores(respuesta, etag, ultima_modificacion, debil=True)
+            return respuesta
+        return decorated_function
+    return decorador
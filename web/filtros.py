@@ -0,0 +1,79 @@
+"""
+Filtros de plantilla Jinja de la aplicacion.
+
+Se registran en la app web y en la app minima del worker dedicado de la
+cola de envios (que renderiza el PDF de las boletas).
+"""
+
+
+def registrar_filtros(app):
+    """Registra los filtros de plantilla en la app Flask."""
+
+    @app.template_filter('mes_nombre')
+    def mes_nombre(mes):
+        """Convierte número de mes a nombre."""
+        meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+                 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+        return meses[mes] if 1 <= mes <= 12 else str(mes)
+
+    @app.template_filter('nombre_mes')
+    def nombre_mes(mes):
+        """Convierte número de mes a nombre corto (Ene, Feb, etc.)."""
+        meses = ['', 'Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun',
+                 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+        try:
+            idx = int(mes)
+            return meses[idx] if 1 <= idx <= 12 else str(mes)
+        except (ValueError, TypeError):
+            return str(mes)
+
+    @app.template_filter('fecha_formato')
+    def fecha_formato(fecha):
+        """Convierte fecha a formato dd/mm/yyyy."""
+        if not fecha:
+            return '-'
+        # Si es objeto date o datetime
+        if hasattr(fecha, 'strftime'):
+            return fecha.strftime('%d/%m/%Y')
+        if isinstance(fecha, str):
+            # Si viene como yyyy-mm-dd
+            if '-' in fecha and len(fecha) == 10:
+                partes = fecha.split('-')
+                if len(partes) == 3:
+                    return f"{partes[2]}/{partes[1]}/{partes[0]}"
+        return str(fecha)
+
+    @app.template_filter('formato_pesos')
+    def formato_pesos(monto):
+        """Formatea un monto en pesos con separador de miles (punto)."""
+        try:
+            # Convertir a float y formatear sin decimales
+            valor = float(monto)
+            # Formatear con separador de miles usando coma
+            formateado = "{:,.0f}".format(valor)
+            # Reemplazar coma por punto (formato chileno)
+            return formateado.replace(',', '.')
+        except (ValueError, TypeError):
+            return str(monto)
+
+    @app.template_filter('formato_fecha_hora')
+    def formato_fecha_hora(fecha):
+        """Convierte datetime a formato dd/mm/yyyy HH:MM."""
+        if not fecha:
+            return '-'
+        # Si es objeto datetime
+        if hasattr(fecha, 'strftime'):
+            return fecha.strftime('%d/%m/%Y %H:%M')
+        if isinstance(fecha, str):
+            # Si viene como yyyy-mm-dd HH:MM:SS
+            if 'T' in fecha or ' ' in fecha:
+                try:
+                    from datetime import datetime
+                    if 'T' in fecha:
+                        dt = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
+                    else:
+                        dt = datetime.strptime(fecha[:19], '%Y-%m-%d %H:%M:%S')
+                    return dt.strftime('%d/%m/%Y %H:%M')
+                except:
+                    pass
+        return str(fecha)
@@ -0,0 +1,161 @@
+"""
+Rutas de reportes analiticos (consumo y recaudacion) sobre el cubo columnar
+"""
+import re
+from datetime import date
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+
+from web.auth import admin_required
+from web.cache_http import calcular_etag, no_modificado, respuesta_no_modificada, aplicar_validadores
+from src.services.analitica_service import (
+    DIMENSIONES,
+    codificar_periodo,
+    etiqueta_periodo,
+    obtener_cubo,
+    refrescar_cubo_async,
+    refresco_en_curso
+)
+
+analitica_bp = Blueprint('analitica', __name__)
+
+PERIODO_VALIDO = re.compile(r'(\d{4})-(\d{2})')
+
+
+def _periodo_param(nombre: str):
+    """Lee un parametro 'AAAA-MM' como periodo codificado (None si no viene o es invalido)."""
+    coincidencia = PERIODO_VALIDO.fullmatch(request.args.get(nombre, '').strip())
+    if not coincidencia or not 1 <= int(coincidencia.group(2)) <= 12:
+        return None
+    return codificar_periodo(int(coincidencia.group(1)), int(coincidencia.group(2)))
+
+
+def _rango(cubo):
+    """Rango de periodos pedido; por defecto los ultimos 12 periodos del cubo."""
+    hasta = _periodo_param('hasta')
+    if hasta is None:
+        hasta = cubo.meta.get('periodo_max') or codificar_periodo(date.today().year, date.today().month)
+    desde = _periodo_param('desde')
+    if desde is None:
+        desde = hasta - 11
+    return desde, hasta
+
+
+def _cubo_o_generar():
+    """Cubo vigente; si aun no existe lanza su construccion y retorna None."""
+    cubo = obtener_cubo()
+    if cubo is None and not refresco_en_curso():
+        refrescar_cubo_async()
+    return cubo
+
+
+def _json_cubo(cubo, datos):
+    """Respuesta JSON validada por la fecha de generacion del cubo (ETag/304)."""
+    etag = calcular_etag(cubo.meta['generado'], request.full_path)
+    if no_modificado(etag):
+        return respuesta_no_modificada(etag)
+    return aplicar_validadores(jsonify({'generado': cubo.meta['generado'], 'datos': datos}), etag)
+
+
+@analitica_bp.route('/')
+@admin_required
+def index():
+    """Pagina de reportes: resumen mensual, mayores consumidores e interanual."""
+    cubo = _cubo_o_generar()
+    if cubo is None:
+        return render_template('analitica/index.html', cubo=None)
+
+    desde, hasta = _rango(cubo)
+    anio = request.args.get('anio', type=int) or hasta // 12
+
+    return render_template(
+        'analitica/index.html',
+        cubo=cubo,
+        desde=etiqueta_periodo(desde),
+        hasta=etiqueta_periodo(hasta),
+        anio=anio,
+        mensual=cubo.mensual(desde, hasta),
+        top=cubo.top_consumidores(desde, hasta, limite=10),
+        interanual=cubo.interanual(anio),
+        refrescando=refresco_en_curso()
+    )
+
+
+@analitica_bp.route('/refrescar', methods=['POST'])
+@admin_required
+def refrescar():
+    """Reconstruye el cubo en segundo plano."""
+    if refresco_en_curso():
+        flash('El cubo ya se esta actualizando', 'info')
+    else:
+        refrescar_cubo_async()
+        flash('Actualizando datos de reportes. Recarga la pagina en unos segundos.', 'success')
+    return redirect(url_for('analitica.index'))
+
+
+# =============================================================================
+# API JSON
+# =============================================================================
+
+@analitica_bp.route('/api/mensual')
+@admin_required
+def api_mensual():
+    """Resumen por periodo (?desde=AAAA-MM&hasta=AAAA-MM&cliente_id=)."""
+    cubo = _cubo_o_generar()
+    if cubo is None:
+        return jsonify({'error': 'El cubo analitico se esta generando'}), 503
+    desde, hasta = _rango(cubo)
+    return _json_cubo(cubo, cubo.mensual(desde, hasta, request.args.get('cliente_id', type=int)))
+
+
+@analitica_bp.route('/api/top')
+@admin_required
+def api_top():
+    """Mayores consumidores (?desde&hasta&limite=10&por=cliente|medidor)."""
+    cubo = _cubo_o_generar()
+    if cubo is None:
+        return jsonify({'error': 'El cubo analitico se esta generando'}), 503
+    desde, hasta = _rango(cubo)
+    por = 'medidor_id' if request.args.get('por') == 'medidor' else 'cliente_id'
+    limite = min(request.args.get('limite', 10, type=int), 500)
+    return _json_cubo(cubo, cubo.top_consumidores(desde, hasta, limite, por))
+
+
+@analitica_bp.route('/api/interanual')
+@admin_required
+def api_interanual():
+    """Mes a mes de un anio frente al anterior (?anio=&cliente_id=)."""
+    cubo = _cubo_o_generar()
+    if cubo is None:
+        return jsonify({'error': 'El cubo analitico se esta generando'}), 503
+    anio = request.args.get('anio', type=int) or (cubo.meta.get('periodo_max') or 0) // 12 or date.today().year
+    return _json_cubo(cubo, cubo.interanual(anio, request.args.get('cliente_id', type=int)))
+
+
+@analitica_bp.route('/api/consulta')
+@admin_required
+def api_consulta():
+    """
+    Consulta libre: ?hecho=boletas|lecturas|pagos&por=anio,mes&rollup=1
+    con filtros desde, hasta, cliente_id y medidor_id.
+    """
+    cubo = _cubo_o_generar()
+    if cubo is None:
+        return jsonify({'error': 'El cubo analitico se esta generando'}), 503
+
+    hecho = request.args.get('hecho', 'boletas')
+    por = [d for d in request.args.get('por', 'periodo').split(',') if d]
+    filtros = {
+        'desde': _periodo_param('desde'),
+        'hasta': _periodo_param('hasta'),
+        'cliente_id': request.args.get('cliente_id', type=int),
+        'medidor_id': request.args.get('medidor_id', type=int)
+    }
+    try:
+        if request.args.get('rollup', type=int) == 1:
+            datos = cubo.rollup(hecho, por, **filtros)
+        else:
+            datos = cubo.filas(cubo.agrupar(hecho, por, **filtros))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'dimensiones': DIMENSIONES}), 400
+    return _json_cubo(cubo, datos)
@@ -2,31 +2,40 @@
 Rutas para gestion de boletas - Sistema desacoplado
 """
 import os
+import json
+import math
+import base64
+from decimal import Decimal, InvalidOperation
 from datetime import date, timedelta
 from io import BytesIO
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
 from werkzeug.utils import secure_filename
-from weasyprint import HTML
 
 from web.auth import admin_required, get_current_user
+from web.cache_http import condicional, calcular_etag, no_modificado, respuesta_no_modificada, aplicar_validadores
+from web.routes.exportaciones import responder_exportacion
 from src.models_boletas import (
     obtener_configuracion, guardar_configuracion,
     crear_boleta, obtener_boleta, obtener_boleta_por_lectura,
-    listar_boletas, desmarcar_boleta_pagada,
+    listar_boletas, contar_boletas, clave_cursor_boletas, desmarcar_boleta_pagada,
+    ORDEN_BOLETAS, TIPOS_CLAVE_BOLETAS,
     guardar_comprobante, eliminar_boleta,
     obtener_lectura_anterior, calcular_consumo,
     obtener_lecturas_sin_boleta, obtener_anios_disponibles,
     obtener_estadisticas_boletas,
-    registrar_envio_boleta, obtener_envios_boleta
+    obtener_envios_boleta,
+    iterar_boletas
 )
-from src.models import listar_clientes, listar_medidores, obtener_lectura, obtener_estadisticas_pagos
+from src.models import listar_medidores, obtener_lectura, obtener_estadisticas_pagos
 from src.models_pagos import (
     listar_pagos, obtener_pago, aprobar_pago, rechazar_pago,
     registrar_pago_directo, listar_saldos_clientes, ajustar_saldo_cliente,
     obtener_resumen_cuenta_cliente, obtener_saldo_cliente
 )
-from src.services.mensajes_service import enviar_boleta_whatsapp, MensajesError
-from src.models_configuracion import obtener_datos_bancarios
+from src.services.cola_envios_service import encolar_boleta_whatsapp, encolar_boleta_email
+from src.services.pdf_service import (
+    obtener_pdf_boleta, obtener_pdf_periodo, obtener_contexto_pdf_boleta, version_pdf_boleta
+)
 
 boletas_bp = Blueprint('boletas', __name__)
 
@@ -37,10 +46,71 @@ COMPROBANTES_DIR = os.path.join(BASE_DIR, 'comprobantes')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
 
 
+# Columnas ordenables de la tabla de boletas (indice de th.sortable -> clave de orden)
+COLUMNAS_ORDEN_BOLETAS = ['numero', 'cliente', 'periodo', 'consumo', 'total', 'pendiente', 'estado']
+
+# Texto del estado de pago en las exportaciones (boletas.pagada)
+ESTADOS_EXPORTACION = {0: 'Pendiente', 1: 'En revision', 2: 'Pagada'}
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _codificar_cursor(valores):
+    """Cursor de paginacion (valores de la clave de orden) como token para la URL."""
+    datos = json.dumps(valores, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+
+def _valor_cursor_valido(valor, tipo) -> bool:
+    """True si el valor de un cursor es del tipo de su clave de orden."""
+    if isinstance(valor, bool):
+        return False
+    if tipo is int:
+        return isinstance(valor, int)
+    if tipo is float:
+        # Los NUMERIC se codifican como texto (json default=str)
+        if isinstance(valor, str):
+            try:
+                valor = Decimal(valor)
+            except InvalidOperation:
+                return False
+            return valor.is_finite()
+        return isinstance(valor, (int, float)) and math.isfinite(valor)
+    return isinstance(valor, str) and '\x00' not in valor
+
+
+def _decodificar_cursor(token, orden=None):
+    """
+    Lee un token de cursor; None si no viene, es invalido o no corresponde
+    a la clave de orden (largo o tipo de algun valor), en cuyo caso la
+    pagina se resuelve como si no hubiera cursor.
+    """
+    if not token:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+
+    claves = (ORDEN_BOLETAS.get(orden) or ORDEN_BOLETAS['periodo']) + ['b.id']
+    if not isinstance(valores, list) or len(valores) != len(claves):
+        return None
+    if not all(_valor_cursor_valido(v, TIPOS_CLAVE_BOLETAS[c]) for v, c in zip(valores, claves)):
+        return None
+    return valores
+
+
+def _url_pagina(page, **cursor):
+    """URL del listado actual en otra pagina, con cursor de seek opcional."""
+    args = request.args.to_dict()
+    args.pop('despues', None)
+    args.pop('antes', None)
+    args.update(cursor, page=page)
+    return url_for(request.endpoint, **args)
+
+
 # =============================================================================
 # CONFIGURACION
 # =============================================================================
@@ -82,6 +152,8 @@ def historial_pagos():
 
 @boletas_bp.route('/')
 @admin_required
+@condicional('boletas', 'resumen_envios_boleta', 'medidores', 'clientes', 'lecturas',
+             'configuracion_sistema')
 def listar():
     """Lista boletas con filtros y paginacion."""
     # Calcular mes anterior como valor por defecto (solo si no hay filtros en URL)
@@ -112,9 +184,13 @@ def listar():
     else:
         mes = mes_default  # Primera carga: mes anterior
 
-    # Obtener parametros de ordenamiento
+    # Obtener parametros de ordenamiento (indice de columna, ver COLUMNAS_ORDEN_BOLETAS)
     sort_by = request.args.get('sort_by', type=str)
     sort_order = request.args.get('sort_order', type=str)
+    orden = None
+    if sort_by and sort_by.isdigit() and int(sort_by) < len(COLUMNAS_ORDEN_BOLETAS):
+        orden = COLUMNAS_ORDEN_BOLETAS[int(sort_by)]
+    direccion = 'asc' if sort_order == 'asc' else 'desc'
 
     # Paginacion
     page = request.args.get('page', 1, type=int)
@@ -123,39 +199,47 @@ def listar():
     if page < 1:
         page = 1
 
-    todas_boletas = listar_boletas(
+    filtros_boletas = dict(
         cliente_id=cliente_id,
         medidor_id=medidor_id,
         pagada=pagada,
         sin_comprobante=sin_comprobante,
         anio=anio,
-        mes=mes,
-        enviada=enviada
+        mes=mes
     )
 
-    # Calcular paginacion
-    total = len(todas_boletas)
+    # Estadísticas con los mismos filtros aplicados; su total sirve de conteo
+    # salvo que se filtre por envio (una sola consulta de conteo)
+    stats = obtener_estadisticas_boletas(**filtros_boletas)
+    if enviada is None:
+        total = (stats or {}).get('total') or 0
+    else:
+        total = contar_boletas(enviada=enviada, **filtros_boletas)
+
     total_pages = max(1, (total + per_page - 1) // per_page)
     if page > total_pages:
         page = total_pages
-
     start = (page - 1) * per_page
     end = start + per_page
-    boletas = todas_boletas[start:end]
+
+    # Pagina siguiente/anterior por seek (cursor), ultima pagina recorriendo
+    # el orden al reves; solo un salto a una pagina intermedia usa OFFSET
+    despues = _decodificar_cursor(request.args.get('despues'), orden)
+    antes = _decodificar_cursor(request.args.get('antes'), orden)
+    consulta = dict(orden=orden, direccion=direccion, limite=per_page)
+    if despues:
+        consulta['despues'] = despues
+    elif antes:
+        consulta['antes'] = antes
+    elif page > 1 and page == total_pages:
+        consulta.update(desde_final=True, limite=total - start)
+    else:
+        consulta['offset'] = start
+
+    boletas = listar_boletas(enviada=enviada, **filtros_boletas, **consulta)
 
     # Datos para filtros
-    clientes = listar_clientes()
     anios = obtener_anios_disponibles()
-    # Estadísticas con los mismos filtros aplicados
-    stats = obtener_estadisticas_boletas(
-        cliente_id=cliente_id,
-        medidor_id=medidor_id,
-        pagada=pagada,
-        sin_comprobante=sin_comprobante,
-        anio=anio,
-        mes=mes
-    )
-
     # Medidores del cliente seleccionado
     medidores = []
     if cliente_id:
@@ -169,10 +253,16 @@ def listar():
         'start': start + 1,
         'end': min(end, total)
     }
+    if boletas:
+        if page < total_pages:
+            pagination['url_siguiente'] = _url_pagina(
+                page + 1, despues=_codificar_cursor(clave_cursor_boletas(boletas[-1], orden)))
+        if page > 1:
+            pagination['url_anterior'] = _url_pagina(
+                page - 1, antes=_codificar_cursor(clave_cursor_boletas(boletas[0], orden)))
 
     return render_template('boletas/lista.html',
                            boletas=boletas,
-                           clientes=clientes,
                            medidores=medidores,
                            anios=anios,
                            stats=stats,
@@ -291,12 +381,10 @@ def crear():
     mes = request.args.get('mes', type=int)
 
     lecturas = obtener_lecturas_sin_boleta(anio=anio, mes=mes, cliente_id=cliente_id)
-    clientes = listar_clientes()
     anios = obtener_anios_disponibles()
 
     return render_template('boletas/crear.html',
                            lecturas=lecturas,
-                           clientes=clientes,
                            anios=anios,
                            config=config,
                            filtros={
@@ -379,12 +467,10 @@ def crear_masivo():
     mes = request.args.get('mes', type=int)
 
     lecturas = obtener_lecturas_sin_boleta(anio=anio, mes=mes, cliente_id=cliente_id)
-    clientes = listar_clientes()
     anios = obtener_anios_disponibles()
 
     return render_template('boletas/crear_masivo.html',
                            lecturas=lecturas,
-                           clientes=clientes,
                            anios=anios,
                            config=config,
                            filtros={
@@ -605,7 +691,7 @@ def _obtener_o_crear_pago_para_boleta(boleta):
     monto_total = sum(Decimal(str(b['saldo_pendiente'] or b['total'])) for b in boletas_relacionadas)
 
     # Crear pago
-    numero_pago = generar_numero_pago()
+    numero_pago = generar_numero_pago(cursor)
     cursor.execute('''
         INSERT INTO pagos (numero_pago, cliente_id, monto_total, monto_aplicado,
                           comprobante_path, metodo_pago, estado, fecha_envio)
@@ -701,77 +787,47 @@ def descargar(boleta_id):
         flash('Boleta no encontrada', 'error')
         return redirect(url_for('boletas.listar'))
 
-    # Nombres de meses en espanol
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
+    # La huella de los datos del PDF sirve de ETag: si no cambio, 304 sin renderizar
+    contexto = obtener_contexto_pdf_boleta(boleta)
+    etag = calcular_etag('pdf_boleta', version_pdf_boleta(boleta, contexto))
+    if no_modificado(etag):
+        return respuesta_no_modificada(etag, debil=True)
 
-    # Obtener la lectura actual asociada para la foto del medidor y fecha
-    lectura_actual = None
-    foto_lectura = None
-    fecha_lectura_actual = None
-    if boleta['lectura_id']:
-        lectura_actual = obtener_lectura(boleta['lectura_id'])
-        if lectura_actual:
-            if lectura_actual.get('foto_path') and lectura_actual.get('foto_path') != '':
-                # Convertir ruta relativa a absoluta para WeasyPrint
-                # foto_path viene como 'medidor_X/...' sin prefijo de carpeta
-                foto_lectura = os.path.join(BASE_DIR, 'fotos', lectura_actual['foto_path'])
-            fecha_lectura_actual = lectura_actual.get('fecha_lectura')
-
-    # Obtener la lectura anterior y su fecha
-    fecha_lectura_anterior = None
-    if boleta['lectura_anterior'] is not None:
-        # Buscar la lectura anterior por medidor_id y periodo
-        medidor_id = boleta['medidor_id']
-        anio = boleta['periodo_anio']
-        mes = boleta['periodo_mes']
-
-        # Calcular periodo anterior
-        if mes == 1:
-            mes_anterior = 12
-            anio_anterior = anio - 1
-        else:
-            mes_anterior = mes - 1
-            anio_anterior = anio
+    pdf_file = BytesIO(obtener_pdf_boleta(boleta, contexto))
 
-        # Buscar lectura anterior
-        from src.database import get_connection
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT fecha_lectura FROM lecturas
-            WHERE medidor_id = %s AND anio = %s AND mes = %s
-        ''', (medidor_id, anio_anterior, mes_anterior))
-        lectura_ant = cursor.fetchone()
-        conn.close()
+    # Devolver PDF como descarga
+    return aplicar_validadores(send_file(
+        pdf_file,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'boleta_{boleta["numero_boleta"]}.pdf'
+    ), etag, debil=True)
 
-        if lectura_ant:
-            fecha_lectura_anterior = lectura_ant['fecha_lectura']
 
-    # Renderizar template HTML
-    datos_bancarios = obtener_datos_bancarios()
-    html_string = render_template('boletas/boleta_pdf.html',
-                                   boleta=boleta,
-                                   meses=meses,
-                                   foto_lectura=foto_lectura,
-                                   fecha_lectura_actual=fecha_lectura_actual,
-                                   fecha_lectura_anterior=fecha_lectura_anterior,
-                                   datos_bancarios=datos_bancarios)
+@boletas_bp.route('/periodo/<int:anio>/<int:mes>/pdf')
+@admin_required
+@condicional('boletas', 'lecturas', 'medidores', 'clientes', 'configuracion_sistema')
+def descargar_periodo(anio, mes):
+    """Descarga un unico PDF con todas las boletas del periodo, listo para imprimir."""
+    if mes < 1 or mes > 12:
+        flash('Periodo invalido', 'error')
+        return redirect(url_for('boletas.listar'))
 
-    # Generar PDF usando WeasyPrint
-    pdf_file = BytesIO()
-    HTML(string=html_string, base_url=BASE_DIR).write_pdf(pdf_file)
-    pdf_file.seek(0)
+    try:
+        ruta_pdf = obtener_pdf_periodo(anio, mes)
+    except Exception as e:
+        flash(f'Error al generar PDF del periodo: {str(e)}', 'error')
+        return redirect(url_for('boletas.listar', anio=anio, mes=mes))
+
+    if not ruta_pdf:
+        flash('No hay boletas en el periodo seleccionado', 'warning')
+        return redirect(url_for('boletas.listar', anio=anio, mes=mes))
 
-    # Devolver PDF como descarga
     return send_file(
-        pdf_file,
+        ruta_pdf,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'boleta_{boleta["numero_boleta"]}.pdf'
+        download_name=f'boletas_{anio}_{mes:02d}.pdf'
     )
 
 
@@ -803,170 +859,68 @@ def eliminar(boleta_id):
 @boletas_bp.route('/exportar')
 @admin_required
 def exportar():
-    """Exporta boletas filtradas a Excel."""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    from datetime import datetime
-
+    """Exporta boletas filtradas a Excel (o CSV con formato=csv)."""
     # Obtener parametros de filtro (los mismos que listar)
-    cliente_id = request.args.get('cliente_id', type=int)
-    medidor_id = request.args.get('medidor_id', type=int)
-    pagada = request.args.get('pagada', type=int)
-    sin_comprobante = request.args.get('sin_comprobante', type=int) == 1
-    anio = request.args.get('anio', type=int)
-    mes = request.args.get('mes', type=int)
-
-    # Obtener boletas con filtros
-    boletas = listar_boletas(
-        cliente_id=cliente_id,
-        medidor_id=medidor_id,
-        pagada=pagada,
-        sin_comprobante=sin_comprobante,
-        anio=anio,
-        mes=mes
-    )
-
-    # Obtener estadísticas con filtros
-    stats = obtener_estadisticas_boletas(
-        cliente_id=cliente_id,
-        medidor_id=medidor_id,
-        pagada=pagada,
-        sin_comprobante=sin_comprobante,
-        anio=anio,
-        mes=mes
-    )
-
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Boletas"
-
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-
-    # Título y fecha
-    ws.merge_cells('A1:H1')
-    ws['A1'] = 'REPORTE DE BOLETAS'
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal="center")
-
-    ws.merge_cells('A2:H2')
-    ws['A2'] = f'Generado: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws['A2'].alignment = Alignment(horizontal="center")
-
-    # Filtros aplicados (si existen)
-    row = 3
-    if any([cliente_id, medidor_id, pagada is not None, sin_comprobante, anio, mes]):
-        ws.merge_cells(f'A{row}:H{row}')
-        filtros_texto = []
-        if anio:
-            filtros_texto.append(f'Año: {anio}')
-        if mes:
-            filtros_texto.append(f'Mes: {mes}')
-        if pagada == 0:
-            filtros_texto.append('Estado: Pendientes')
-        elif pagada == 1:
-            filtros_texto.append('Estado: Pagadas')
-        if sin_comprobante:
-            filtros_texto.append('Sin comprobante')
-
-        ws[f'A{row}'] = 'Filtros aplicados: ' + ' | '.join(filtros_texto)
-        ws[f'A{row}'].font = Font(italic=True)
-        ws[f'A{row}'].alignment = Alignment(horizontal="center")
-        row += 1
-
-    # Estadísticas
-    row += 1
-    ws.merge_cells(f'A{row}:H{row}')
-    ws[f'A{row}'] = 'RESUMEN'
-    ws[f'A{row}'].font = Font(bold=True, size=12)
-    ws[f'A{row}'].alignment = Alignment(horizontal="center")
-    ws[f'A{row}'].fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-
-    row += 1
-    stats_data = [
-        ['Total Boletas:', stats.get('total', 0)],
-        ['Pagadas:', stats.get('pagadas', 0)],
-        ['Pendientes:', stats.get('pendientes', 0)],
-        ['Sin Comprobante:', stats.get('sin_comprobante', 0)],
-        ['Monto Por Cobrar:', f"${stats.get('monto_pendiente', 0):,.0f}"]
-    ]
-
-    for label, value in stats_data:
-        ws[f'A{row}'] = label
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = value
-        row += 1
-
-    # Espacio
-    row += 1
-
-    # Encabezados de tabla
-    headers = ['N° Boleta', 'Cliente', 'Medidor', 'Período', 'Consumo (m³)', 'Total', 'Estado', 'Comprobante']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    # Datos
-    row += 1
-    for boleta in boletas:
-        ws.cell(row=row, column=1, value=boleta.get('numero_boleta', '')).border = border
-        ws.cell(row=row, column=2, value=boleta.get('cliente_nombre', '')).border = border
-        ws.cell(row=row, column=3, value=boleta.get('numero_medidor', '')).border = border
-        ws.cell(row=row, column=4, value=f"{boleta.get('periodo_mes', '')}/{boleta.get('periodo_anio', '')}").border = border
-        ws.cell(row=row, column=5, value=boleta.get('consumo_m3', 0)).border = border
-
-        total_cell = ws.cell(row=row, column=6, value=boleta.get('total', 0))
-        total_cell.border = border
-        total_cell.number_format = '$#,##0'
-
-        estado = 'Pagada' if boleta.get('pagada') == 1 else 'Pendiente'
-        estado_cell = ws.cell(row=row, column=7, value=estado)
-        estado_cell.border = border
-        if boleta.get('pagada') == 1:
-            estado_cell.fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-        else:
-            estado_cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-
-        comprobante = 'Sí' if boleta.get('comprobante_path') else 'No'
-        ws.cell(row=row, column=8, value=comprobante).border = border
-
-        row += 1
-
-    # Ajustar anchos de columna
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 30
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 15
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 15
-
-    # Preparar respuesta
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # Nombre del archivo con timestamp
-    filename = f'boletas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-
-    return response
+    filtros = {
+        'cliente_id': request.args.get('cliente_id', type=int),
+        'medidor_id': request.args.get('medidor_id', type=int),
+        'pagada': request.args.get('pagada', type=int),
+        'sin_comprobante': request.args.get('sin_comprobante', type=int) == 1,
+        'anio': request.args.get('anio', type=int),
+        'mes': request.args.get('mes', type=int)
+    }
+    stats = obtener_estadisticas_boletas(**filtros) or {}
+
+    filtros_texto = []
+    if filtros['anio']:
+        filtros_texto.append(f"Año: {filtros['anio']}")
+    if filtros['mes']:
+        filtros_texto.append(f"Mes: {filtros['mes']}")
+    if filtros['pagada'] is not None:
+        filtros_texto.append(f"Estado: {ESTADOS_EXPORTACION.get(filtros['pagada'], filtros['pagada'])}")
+    if filtros['sin_comprobante']:
+        filtros_texto.append('Sin comprobante')
+
+    def filas():
+        for boleta in iterar_boletas(**filtros):
+            yield [
+                boleta['numero_boleta'],
+                boleta['cliente_nombre'],
+                boleta['numero_medidor'],
+                f"{boleta['periodo_mes']}/{boleta['periodo_anio']}",
+                boleta['consumo_m3'],
+                boleta['total'],
+                ESTADOS_EXPORTACION.get(boleta['pagada'], ''),
+                'Sí' if boleta['tiene_comprobante'] else 'No'
+            ]
+
+    return responder_exportacion({
+        'nombre': 'boletas',
+        'hoja': 'Boletas',
+        'titulo': 'REPORTE DE BOLETAS',
+        'lineas': ['Filtros aplicados: ' + ' | '.join(filtros_texto)] if filtros_texto else [],
+        'resumen': [
+            ('Total Boletas:', stats.get('total') or 0),
+            ('Pagadas:', stats.get('pagadas') or 0),
+            ('En Revision:', stats.get('en_revision') or 0),
+            ('Pendientes:', stats.get('pendientes') or 0),
+            ('Sin Comprobante:', stats.get('sin_comprobante') or 0),
+            ('Monto Por Cobrar:', f"${stats.get('monto_pendiente') or 0:,.0f}")
+        ],
+        'columnas': [
+            {'header': 'N° Boleta', 'width': 15},
+            {'header': 'Cliente', 'width': 30},
+            {'header': 'Medidor', 'width': 15},
+            {'header': 'Período', 'width': 12},
+            {'header': 'Consumo (m³)', 'width': 15},
+            {'header': 'Total', 'width': 15, 'estilo': 'exp_moneda'},
+            {'header': 'Estado', 'width': 15,
+             'estilos': {'Pagada': 'exp_exito', 'En revision': 'exp_alerta', 'Pendiente': 'exp_error'}},
+            {'header': 'Comprobante', 'width': 15}
+        ],
+        'filas': filas,
+        'total': stats.get('total') or 0
+    }, request.args.get('formato', 'xlsx'))
 
 
 # =============================================================================
@@ -975,6 +929,7 @@ def exportar():
 
 @boletas_bp.route('/api/medidores/<int:cliente_id>')
 @admin_required
+@condicional('medidores', 'clientes', 'lecturas')
 def api_medidores(cliente_id):
     """Retorna medidores de un cliente en formato JSON."""
     from flask import jsonify
@@ -1021,12 +976,10 @@ def pagos_lista():
     cliente_id = request.args.get('cliente_id', type=int)
 
     pagos = listar_pagos(cliente_id=cliente_id, estado=estado)
-    clientes = listar_clientes()
     stats = obtener_estadisticas_pagos(estado=estado, cliente_id=cliente_id)
 
     return render_template('boletas/pagos_lista.html',
                           pagos=pagos,
-                          clientes=clientes,
                           stats=stats,
                           filtros={
                               'estado': estado,
@@ -1166,7 +1119,6 @@ def registrar_pago_admin():
 
     # GET: Mostrar formulario
     cliente_id = request.args.get('cliente_id', type=int)
-    clientes = listar_clientes()
     today = datetime.now().strftime('%Y-%m-%d')
 
     # Obtener boletas pendientes del cliente seleccionado
@@ -1175,7 +1127,6 @@ def registrar_pago_admin():
         boletas_pendientes = listar_boletas(cliente_id=cliente_id, pagada=0)
 
     return render_template('boletas/registrar_pago.html',
-                          clientes=clientes,
                           boletas_pendientes=boletas_pendientes,
                           cliente_id=cliente_id,
                           today=today)
@@ -1293,7 +1244,7 @@ def api_boletas_pendientes(cliente_id):
 @boletas_bp.route('/<int:boleta_id>/enviar-whatsapp', methods=['POST'])
 @admin_required
 def enviar_whatsapp(boleta_id):
-    """Envia una boleta por WhatsApp al telefono del cliente con PDF adjunto."""
+    """Encola el envio de una boleta por WhatsApp al telefono del cliente con PDF adjunto."""
     from flask import jsonify
     from src.database import get_connection
     from src.models import obtener_cliente
@@ -1337,106 +1288,19 @@ def enviar_whatsapp(boleta_id):
         return redirect(url_for('boletas.detalle', boleta_id=boleta_id))
 
     try:
-        # Generar PDF de la boleta (misma logica que descargar())
-        meses = {
-            1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-            5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-            9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-        }
-
-        # Obtener la lectura actual asociada para la foto y fecha
-        lectura_actual = None
-        foto_lectura = None
-        fecha_lectura_actual = None
-        if boleta['lectura_id']:
-            lectura_actual = obtener_lectura(boleta['lectura_id'])
-            if lectura_actual:
-                if lectura_actual.get('foto_path') and lectura_actual.get('foto_path') != '':
-                    foto_lectura = os.path.join(BASE_DIR, 'fotos', lectura_actual['foto_path'])
-                fecha_lectura_actual = lectura_actual.get('fecha_lectura')
-
-        # Obtener fecha de lectura anterior
-        fecha_lectura_anterior = None
-        if boleta['lectura_anterior'] is not None:
-            medidor_id = boleta['medidor_id']
-            anio = boleta['periodo_anio']
-            mes = boleta['periodo_mes']
-
-            if mes == 1:
-                mes_anterior = 12
-                anio_anterior = anio - 1
-            else:
-                mes_anterior = mes - 1
-                anio_anterior = anio
-
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT fecha_lectura FROM lecturas
-                WHERE medidor_id = %s AND anio = %s AND mes = %s
-            ''', (medidor_id, anio_anterior, mes_anterior))
-            lectura_ant = cursor.fetchone()
-            conn.close()
-
-            if lectura_ant:
-                fecha_lectura_anterior = lectura_ant['fecha_lectura']
-
-        # Renderizar template HTML
-        datos_bancarios = obtener_datos_bancarios()
-        html_string = render_template('boletas/boleta_pdf.html',
-                                       boleta=boleta,
-                                       meses=meses,
-                                       foto_lectura=foto_lectura,
-                                       fecha_lectura_actual=fecha_lectura_actual,
-                                       fecha_lectura_anterior=fecha_lectura_anterior,
-                                       datos_bancarios=datos_bancarios)
-
-        # Generar PDF usando WeasyPrint
-        pdf_file = BytesIO()
-        HTML(string=html_string, base_url=BASE_DIR).write_pdf(pdf_file)
-        pdf_file.seek(0)
-        pdf_bytes = pdf_file.getvalue()
-
-        # Construir URL del portal (opcional)
-        url_portal = None  # Se puede configurar si hay portal publico
-
-        # Enviar boleta con PDF adjunto
-        resultado = enviar_boleta_whatsapp(telefono, boleta, pdf_bytes=pdf_bytes, url_portal=url_portal)
-
-        # Registrar envio exitoso en historial
+        # Encolar el envio; el worker genera el PDF, envia y registra el historial
         usuario = get_current_user()
         usuario_id = usuario['id'] if usuario else None
-        registrar_envio_boleta(
-            boleta_id=boleta_id,
-            usuario_id=usuario_id,
-            canal='whatsapp',
-            destinatario=telefono,
-            estado='enviado'
-        )
+        encolar_boleta_whatsapp(boleta_id, telefono, usuario_id=usuario_id)
 
         if is_ajax:
             return jsonify({
                 'success': True,
-                'message': f'Boleta enviada por WhatsApp a {telefono}',
+                'message': f'Boleta en cola para envio por WhatsApp a {telefono}',
                 'telefono': telefono
             })
-        flash(f'Boleta con PDF enviada por WhatsApp a {telefono}', 'success')
+        flash(f'Boleta en cola para envio por WhatsApp a {telefono}', 'success')
 
-    except MensajesError as e:
-        # Registrar envio fallido en historial
-        usuario = get_current_user()
-        usuario_id = usuario['id'] if usuario else None
-        registrar_envio_boleta(
-            boleta_id=boleta_id,
-            usuario_id=usuario_id,
-            canal='whatsapp',
-            destinatario=telefono,
-            estado='fallido',
-            mensaje_error=str(e)
-        )
-        if is_ajax:
-            return jsonify({'success': False, 'error': str(e)}), 400
-        flash(f'Error al enviar WhatsApp: {str(e)}', 'error')
     except Exception as e:
         if is_ajax:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -1448,8 +1312,7 @@ def enviar_whatsapp(boleta_id):
 @boletas_bp.route('/enviar-whatsapp-masivo', methods=['POST'])
 @admin_required
 def enviar_whatsapp_masivo():
-    """Envia multiples boletas por WhatsApp con PDF adjunto."""
-    from flask import jsonify
+    """Encola el envio de multiples boletas por WhatsApp con PDF adjunto."""
     from src.database import get_connection
     from src.models import obtener_cliente
 
@@ -1458,15 +1321,11 @@ def enviar_whatsapp_masivo():
         flash('Debe seleccionar al menos una boleta', 'error')
         return redirect(url_for('boletas.listar'))
 
+    usuario = get_current_user()
+    usuario_id = usuario['id'] if usuario else None
     enviadas = 0
     errores = []
 
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
-
     for boleta_id in boletas_ids:
         try:
             boleta_id = int(boleta_id)
@@ -1496,66 +1355,127 @@ def enviar_whatsapp_masivo():
                 errores.append(f'Boleta {boleta["numero_boleta"]}: sin telefono')
                 continue
 
-            # Generar PDF de la boleta
-            lectura_actual = None
-            foto_lectura = None
-            fecha_lectura_actual = None
-            if boleta['lectura_id']:
-                lectura_actual = obtener_lectura(boleta['lectura_id'])
-                if lectura_actual:
-                    if lectura_actual.get('foto_path') and lectura_actual.get('foto_path') != '':
-                        foto_lectura = os.path.join(BASE_DIR, 'fotos', lectura_actual['foto_path'])
-                    fecha_lectura_actual = lectura_actual.get('fecha_lectura')
-
-            fecha_lectura_anterior = None
-            if boleta['lectura_anterior'] is not None:
-                med_id = boleta['medidor_id']
-                anio = boleta['periodo_anio']
-                mes = boleta['periodo_mes']
-
-                if mes == 1:
-                    mes_anterior = 12
-                    anio_anterior = anio - 1
-                else:
-                    mes_anterior = mes - 1
-                    anio_anterior = anio
-
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT fecha_lectura FROM lecturas
-                    WHERE medidor_id = %s AND anio = %s AND mes = %s
-                ''', (med_id, anio_anterior, mes_anterior))
-                lectura_ant = cursor.fetchone()
-                conn.close()
-
-                if lectura_ant:
-                    fecha_lectura_anterior = lectura_ant['fecha_lectura']
-
-            datos_bancarios = obtener_datos_bancarios()
-            html_string = render_template('boletas/boleta_pdf.html',
-                                           boleta=boleta,
-                                           meses=meses,
-                                           foto_lectura=foto_lectura,
-                                           fecha_lectura_actual=fecha_lectura_actual,
-                                           fecha_lectura_anterior=fecha_lectura_anterior,
-                                           datos_bancarios=datos_bancarios)
-
-            pdf_file = BytesIO()
-            HTML(string=html_string, base_url=BASE_DIR).write_pdf(pdf_file)
-            pdf_file.seek(0)
-            pdf_bytes = pdf_file.getvalue()
-
-            enviar_boleta_whatsapp(telefono, boleta, pdf_bytes=pdf_bytes)
+            encolar_boleta_whatsapp(boleta_id, telefono, usuario_id=usuario_id)
             enviadas += 1
 
-        except MensajesError as e:
-            errores.append(f'Boleta {boleta_id}: {str(e)}')
         except Exception as e:
             errores.append(f'Boleta {boleta_id}: error inesperado')
 
     if enviadas > 0:
-        flash(f'{enviadas} boleta(s) con PDF enviada(s) por WhatsApp', 'success')
+        flash(f'{enviadas} boleta(s) en cola para envio por WhatsApp', 'success')
+    if errores:
+        flash(f'{len(errores)} error(es): {"; ".join(errores[:3])}{"..." if len(errores) > 3 else ""}', 'warning')
+
+    return redirect(url_for('boletas.listar'))
+
+
+# =============================================================================
+# ENVIO DE BOLETAS POR EMAIL
+# =============================================================================
+
+def _obtener_cliente_boleta(boleta):
+    """Cliente dueño del medidor de una boleta (o None)."""
+    from src.database import get_connection
+    from src.models import obtener_cliente
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT cliente_id FROM medidores WHERE id = %s', (boleta['medidor_id'],))
+    medidor = cursor.fetchone()
+    conn.close()
+
+    return obtener_cliente(medidor['cliente_id']) if medidor else None
+
+
+@boletas_bp.route('/<int:boleta_id>/enviar-email', methods=['POST'])
+@admin_required
+def enviar_email(boleta_id):
+    """Encola el envio de una boleta por email al cliente con PDF adjunto."""
+    from flask import jsonify
+    from src.services.email_service import email_valido
+
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+    def responder_error(mensaje, status):
+        if is_ajax:
+            return jsonify({'success': False, 'error': mensaje}), status
+        flash(mensaje, 'error')
+        return redirect(url_for('boletas.detalle', boleta_id=boleta_id))
+
+    boleta = obtener_boleta(boleta_id)
+    if not boleta:
+        if is_ajax:
+            return jsonify({'success': False, 'error': 'Boleta no encontrada'}), 404
+        flash('Boleta no encontrada', 'error')
+        return redirect(url_for('boletas.listar'))
+
+    cliente = _obtener_cliente_boleta(boleta)
+    if not cliente:
+        return responder_error('Cliente no encontrado', 404)
+
+    email = (cliente.get('email') or '').strip()
+    if not email_valido(email):
+        return responder_error('El cliente no tiene un email valido registrado', 400)
+
+    try:
+        # El worker de la cola genera el PDF, envia por SMTP y registra el historial
+        usuario = get_current_user()
+        encolar_boleta_email(boleta_id, email, usuario_id=usuario['id'] if usuario else None)
+    except Exception as e:
+        return responder_error(f'Error inesperado: {str(e)}', 500)
+
+    if is_ajax:
+        return jsonify({
+            'success': True,
+            'message': f'Boleta en cola para envio por email a {email}',
+            'email': email
+        })
+    flash(f'Boleta en cola para envio por email a {email}', 'success')
+    return redirect(url_for('boletas.detalle', boleta_id=boleta_id))
+
+
+@boletas_bp.route('/enviar-email-masivo', methods=['POST'])
+@admin_required
+def enviar_email_masivo():
+    """Encola el envio de multiples boletas por email con PDF adjunto."""
+    from src.services.email_service import email_valido
+
+    boletas_ids = request.form.getlist('boletas')
+    if not boletas_ids:
+        flash('Debe seleccionar al menos una boleta', 'error')
+        return redirect(url_for('boletas.listar'))
+
+    usuario = get_current_user()
+    usuario_id = usuario['id'] if usuario else None
+    encoladas = 0
+    errores = []
+
+    for boleta_id in boletas_ids:
+        try:
+            boleta_id = int(boleta_id)
+            boleta = obtener_boleta(boleta_id)
+            if not boleta:
+                errores.append(f'Boleta {boleta_id}: no encontrada')
+                continue
+
+            cliente = _obtener_cliente_boleta(boleta)
+            if not cliente:
+                errores.append(f'Boleta {boleta["numero_boleta"]}: cliente no encontrado')
+                continue
+
+            email = (cliente.get('email') or '').strip()
+            if not email_valido(email):
+                errores.append(f'Boleta {boleta["numero_boleta"]}: sin email')
+                continue
+
+            encolar_boleta_email(boleta_id, email, usuario_id=usuario_id)
+            encoladas += 1
+
+        except Exception:
+            errores.append(f'Boleta {boleta_id}: error inesperado')
+
+    if encoladas > 0:
+        flash(f'{encoladas} boleta(s) en cola para envio por email', 'success')
     if errores:
         flash(f'{len(errores)} error(es): {"; ".join(errores[:3])}{"..." if len(errores) > 3 else ""}', 'warning')
 
@@ -1,14 +1,18 @@
 """
 Rutas para gestión de clientes
 """
-from io import BytesIO
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 
 from web.auth import admin_required
+from web.cache_http import condicional
+from web.routes.exportaciones import responder_exportacion
 from src.models import (
     listar_clientes, obtener_cliente, actualizar_cliente,
     crear_cliente, eliminar_cliente, buscar_cliente_por_nombre,
-    obtener_estadisticas_clientes
+    obtener_estadisticas_clientes, iterar_clientes
+)
+from src.services.clientes_indice_service import (
+    indice_clientes, buscar_clientes, CLIENTES_BUSQUEDA_LIMITE
 )
 
 clientes_bp = Blueprint('clientes', __name__)
@@ -16,6 +20,7 @@ clientes_bp = Blueprint('clientes', __name__)
 
 @clientes_bp.route('/')
 @admin_required
+@condicional('clientes', 'medidores')
 def listar():
     """Lista todos los clientes con filtros."""
     busqueda = request.args.get('busqueda', '').strip() or None
@@ -23,12 +28,22 @@ def listar():
     filtro_telefono = request.args.get('filtro_telefono', '').strip() or None
     recibe_whatsapp = request.args.get('recibe_whatsapp', '').strip() or None
 
+    aproximada = request.args.get('aproximada') == '1'
+
     clientes = listar_clientes(busqueda=busqueda, con_medidores=con_medidores,
-                               filtro_telefono=filtro_telefono, recibe_whatsapp=recibe_whatsapp)
+                               filtro_telefono=filtro_telefono, recibe_whatsapp=recibe_whatsapp,
+                               aproximada=aproximada)
+
+    # Sin coincidencias exactas: reintentar con nombres parecidos
+    if busqueda and not clientes and not aproximada:
+        aproximada = True
+        clientes = listar_clientes(busqueda=busqueda, con_medidores=con_medidores,
+                                   filtro_telefono=filtro_telefono, recibe_whatsapp=recibe_whatsapp,
+                                   aproximada=True)
 
     # Estadísticas
     stats = obtener_estadisticas_clientes(busqueda=busqueda, con_medidores=con_medidores,
-                                          filtro_telefono=filtro_telefono)
+                                          filtro_telefono=filtro_telefono, aproximada=aproximada)
 
     # Dict de filtros para chips
     filtros = {
@@ -42,6 +57,7 @@ def listar():
                            clientes=clientes,
                            stats=stats,
                            filtros=filtros,
+                           busqueda_aproximada=bool(busqueda) and aproximada,
                            busqueda=busqueda or '',
                            con_medidores=con_medidores or '',
                            filtro_telefono=filtro_telefono or '',
@@ -69,6 +85,7 @@ def crear():
             return redirect(url_for('clientes.crear'))
 
         cliente_id = crear_cliente(nombre, nombre_completo, rut, telefono, email)
+        indice_clientes.invalidar()
         flash('Cliente creado exitosamente', 'success')
         return redirect(url_for('clientes.detalle', cliente_id=cliente_id))
 
@@ -124,6 +141,7 @@ def editar(cliente_id):
         actualizar_cliente(cliente_id, nombre=nombre, nombre_completo=nombre_completo,
                           rut=rut, telefono=telefono, email=email,
                           recibe_boleta_whatsapp=recibe_boleta_whatsapp)
+        indice_clientes.invalidar()
         flash('Cliente actualizado', 'success')
 
         # Si viene del modal en la lista, volver a la lista con filtros
@@ -154,6 +172,7 @@ def eliminar(cliente_id):
     exito, motivo = eliminar_cliente(cliente_id)
 
     if exito:
+        indice_clientes.invalidar()
         flash('Cliente eliminado exitosamente', 'success')
     elif motivo == "medidores":
         flash('No se puede eliminar el cliente porque tiene medidores asociados', 'error')
@@ -163,15 +182,26 @@ def eliminar(cliente_id):
     return redirect(url_for('clientes.listar'))
 
 
+@clientes_bp.route('/api/buscar')
+@admin_required
+def api_buscar():
+    """Clientes que coinciden con ?q= (nombre o RUT) para autocompletado."""
+    consulta = request.args.get('q', '').strip()
+    limite = min(request.args.get('limite', CLIENTES_BUSQUEDA_LIMITE, type=int) or CLIENTES_BUSQUEDA_LIMITE,
+                 CLIENTES_BUSQUEDA_LIMITE)
+    respuesta = jsonify([
+        {'id': c['id'], 'nombre': c['nombre'], 'nombre_completo': c['nombre_completo'], 'rut': c['rut']}
+        for c in buscar_clientes(consulta, limite)
+    ])
+    # Las mismas teclas se repiten al corregir: permitir reutilizar la respuesta unos segundos
+    respuesta.headers['Cache-Control'] = 'private, max-age=30'
+    return respuesta
+
+
 @clientes_bp.route('/exportar')
 @admin_required
 def exportar():
-    """Exporta clientes filtrados a Excel con columnas seleccionables."""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    from openpyxl.utils import get_column_letter
-    from datetime import datetime
-
+    """Exporta clientes filtrados a Excel (o CSV con formato=csv) con columnas seleccionables."""
     # Obtener parametros de filtro
     busqueda = request.args.get('busqueda', '').strip() or None
     con_medidores = request.args.get('con_medidores', '').strip() or None
@@ -200,106 +230,41 @@ def exportar():
     if not columnas:
         columnas = ['id', 'nombre']
 
-    num_cols = len(columnas)
-
-    # Obtener clientes con filtros
-    clientes = listar_clientes(busqueda=busqueda, con_medidores=con_medidores,
-                               filtro_telefono=filtro_telefono)
-
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Clientes"
-
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-
-    # Título y fecha
-    last_col_letter = get_column_letter(num_cols)
-    ws.merge_cells(f'A1:{last_col_letter}1')
-    ws['A1'] = 'LISTADO DE CLIENTES'
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal="center")
-
-    ws.merge_cells(f'A2:{last_col_letter}2')
-    ws['A2'] = f'Generado: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws['A2'].alignment = Alignment(horizontal="center")
-
-    # Filtros aplicados
-    row = 3
-    if any([busqueda, con_medidores, filtro_telefono]):
-        ws.merge_cells(f'A{row}:{last_col_letter}{row}')
-        filtros_texto = []
-        if busqueda:
-            filtros_texto.append(f'Busqueda: {busqueda}')
-        if con_medidores == 'si':
-            filtros_texto.append('Con medidores')
-        elif con_medidores == 'no':
-            filtros_texto.append('Sin medidores')
-        if filtro_telefono == 'sin':
-            filtros_texto.append('Sin telefono')
-        elif filtro_telefono == 'con':
-            filtros_texto.append('Con telefono')
-
-        ws[f'A{row}'] = 'Filtros aplicados: ' + ' | '.join(filtros_texto)
-        ws[f'A{row}'].font = Font(italic=True)
-        ws[f'A{row}'].alignment = Alignment(horizontal="center")
-        row += 1
-
-    # Resumen
-    row += 1
-    ws.merge_cells(f'A{row}:{last_col_letter}{row}')
-    ws[f'A{row}'] = f'Total: {len(clientes)} cliente(s)'
-    ws[f'A{row}'].font = Font(bold=True)
-    ws[f'A{row}'].alignment = Alignment(horizontal="center")
-    ws[f'A{row}'].fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-
-    # Espacio
-    row += 2
-
-    # Encabezados de tabla (solo columnas seleccionadas)
-    for col_idx, col_key in enumerate(columnas, 1):
-        cell = ws.cell(row=row, column=col_idx, value=columnas_config[col_key]['header'])
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    # Datos (solo columnas seleccionadas)
-    row += 1
-    for cliente in clientes:
-        for col_idx, col_key in enumerate(columnas, 1):
-            field = columnas_config[col_key]['field']
-            valor = cliente.get(field, '')
-            if valor is None or valor == '':
-                valor = '-' if col_key != 'medidores' else 0
-            cell = ws.cell(row=row, column=col_idx, value=valor)
-            cell.border = border
-        row += 1
-
-    # Ajustar anchos de columna
-    for col_idx, col_key in enumerate(columnas, 1):
-        col_letter = get_column_letter(col_idx)
-        ws.column_dimensions[col_letter].width = columnas_config[col_key]['width']
-
-    # Preparar respuesta
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # Nombre del archivo con timestamp
-    filename = f'clientes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-
-    return response
+    # Campo y valor para celdas vacias de cada columna, resueltos una vez
+    campos = [(columnas_config[c]['field'], 0 if c == 'medidores' else '-') for c in columnas]
+
+    def filas():
+        for cliente in iterar_clientes(busqueda=busqueda, con_medidores=con_medidores,
+                                       filtro_telefono=filtro_telefono):
+            fila = []
+            for campo, vacio in campos:
+                valor = cliente.get(campo)
+                fila.append(vacio if valor is None or valor == '' else valor)
+            yield fila
+
+    filtros_texto = []
+    if busqueda:
+        filtros_texto.append(f'Busqueda: {busqueda}')
+    if con_medidores == 'si':
+        filtros_texto.append('Con medidores')
+    elif con_medidores == 'no':
+        filtros_texto.append('Sin medidores')
+    if filtro_telefono == 'sin':
+        filtros_texto.append('Sin telefono')
+    elif filtro_telefono == 'con':
+        filtros_texto.append('Con telefono')
+
+    total = obtener_estadisticas_clientes(busqueda=busqueda, con_medidores=con_medidores,
+                                          filtro_telefono=filtro_telefono)['total']
+
+    return responder_exportacion({
+        'nombre': 'clientes',
+        'hoja': 'Clientes',
+        'titulo': 'LISTADO DE CLIENTES',
+        'lineas': (['Filtros aplicados: ' + ' | '.join(filtros_texto)] if filtros_texto else [])
+                  + [f'Total: {total} cliente(s)'],
+        'columnas': [{'header': columnas_config[c]['header'], 'width': columnas_config[c]['width']}
+                     for c in columnas],
+        'filas': filas,
+        'total': total
+    }, request.args.get('formato', 'xlsx'))
@@ -40,7 +40,8 @@ def sistema():
             'regla_periodo': request.form.get('regla_periodo', 'mes_anterior'),
             'dia_toma_lectura': int(request.form.get('dia_toma_lectura', 5)),
             'crear_lecturas_faltantes': request.form.get('crear_lecturas_faltantes') == 'on',
-            'valor_lectura_faltante': request.form.get('valor_lectura_faltante', 'ultima')
+            'valor_lectura_faltante': request.form.get('valor_lectura_faltante', 'ultima'),
+            'envio_automatico_whatsapp': request.form.get('envio_automatico_whatsapp') == 'on'
         }
 
         for clave, valor in configs.items():
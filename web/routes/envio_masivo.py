@@ -1,15 +1,22 @@
 """
 Rutas para envio masivo de boletas por WhatsApp
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, request, jsonify,
+    Response, stream_with_context, current_app
+)
 from web.auth import admin_required, get_current_user
 from src.services.envio_masivo_service import (
     obtener_preview_envio,
     iniciar_envio_masivo_async,
     obtener_log_envio,
     listar_logs_envio,
-    hay_proceso_en_curso
+    hay_proceso_en_curso,
+    obtener_estado_envio,
+    cargar_estado_envio
 )
+from src.services.progreso_service import clave_progreso, eventos_progreso
+from src.services.pipeline_envio_service import pipeline_activo, reanudar_pipeline_envio
 
 
 envio_masivo_bp = Blueprint('envio_masivo', __name__, url_prefix='/envio-masivo')
@@ -37,7 +44,7 @@ def index():
 @envio_masivo_bp.route('/ejecutar', methods=['POST'])
 @admin_required
 def ejecutar():
-    """Inicia el envio masivo de boletas en background."""
+    """Inicia el envio masivo de boletas (se encolan y las envia el worker)."""
     usuario = get_current_user()
     usuario_id = usuario['id'] if usuario else None
 
@@ -46,7 +53,7 @@ def ejecutar():
         return redirect(url_for('envio_masivo.index'))
 
     try:
-        log_id = iniciar_envio_masivo_async(usuario_id, current_app._get_current_object())
+        log_id = iniciar_envio_masivo_async(usuario_id)
         flash('Proceso de envio masivo iniciado. La pagina se actualizara automaticamente.', 'success')
         return redirect(url_for('envio_masivo.log_detalle', log_id=log_id))
     except ValueError as e:
@@ -61,22 +68,21 @@ def ejecutar():
 @admin_required
 def estado(log_id):
     """API endpoint para obtener estado del proceso (polling)."""
-    log = obtener_log_envio(log_id)
+    estado_envio = obtener_estado_envio(log_id)
 
-    if not log:
+    if not estado_envio:
         return jsonify({'error': 'Log no encontrado'}), 404
 
-    return jsonify({
-        'id': log['id'],
-        'estado': log['estado'],
-        'total_boletas': log['total_boletas'],
-        'total_enviables': log.get('total_enviables', 0),
-        'enviadas_exitosas': log['enviadas_exitosas'],
-        'enviadas_fallidas': log['enviadas_fallidas'],
-        'mensaje': log.get('mensaje', ''),
-        'duracion_segundos': float(log['duracion_segundos']) if log.get('duracion_segundos') else None,
-        'en_curso': log['estado'] == 'iniciado'
-    })
+    return jsonify({k: v for k, v in estado_envio.items() if k not in ('version', 'actualizado')})
+
+
+@envio_masivo_bp.route('/stream/<int:log_id>')
+@admin_required
+def stream(log_id):
+    """Stream SSE con el progreso del proceso (alternativa al polling)."""
+    eventos = eventos_progreso(clave_progreso('envio', log_id), lambda: cargar_estado_envio(log_id))
+    return Response(stream_with_context(eventos), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @envio_masivo_bp.route('/logs')
@@ -112,6 +118,25 @@ def log_detalle(log_id):
         9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
     }
 
+    clasificacion = log.get('clasificacion') or {}
+    puede_reanudar = (log['estado'] == 'iniciado'
+                      and clasificacion.get('pipeline') and clasificacion.get('abierto')
+                      and not pipeline_activo(log_id))
+
     return render_template('envio_masivo/log_detalle.html',
                            log=log,
-                           meses=meses)
+                           meses=meses,
+                           puede_reanudar=puede_reanudar)
+
+
+@envio_masivo_bp.route('/logs/<int:log_id>/reanudar', methods=['POST'])
+@admin_required
+def reanudar(log_id):
+    """Reanuda un envio del pipeline post-generacion que quedo interrumpido."""
+    try:
+        pendientes = reanudar_pipeline_envio(current_app._get_current_object(), log_id)
+        flash(f'Pipeline reanudado: {pendientes} boleta(s) pendientes de encolar', 'success')
+    except ValueError as e:
+        flash(str(e), 'warning')
+
+    return redirect(url_for('envio_masivo.log_detalle', log_id=log_id))
@@ -0,0 +1,98 @@
+"""
+Rutas de exportaciones a Excel/CSV: respuesta directa o en segundo plano
+"""
+import os
+import tempfile
+
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, jsonify, abort,
+    Response, stream_with_context, send_file
+)
+from web.auth import admin_required, get_current_user
+from web.archivos import servir_archivo
+from src.services.exportacion_service import (
+    EXPORTACIONES_DIR,
+    EXPORTACION_LIMITE_SINCRONO,
+    MIMETYPES,
+    nombre_archivo,
+    escribir_excel,
+    generar_csv,
+    iniciar_exportacion_async,
+    obtener_estado_exportacion,
+    ruta_exportacion
+)
+
+
+exportaciones_bp = Blueprint('exportaciones', __name__, url_prefix='/exportaciones')
+
+
+def responder_exportacion(exportacion: dict, formato: str = 'xlsx'):
+    """
+    Respuesta de una exportacion (ver exportacion_service).
+
+    - Sobre EXPORTACION_LIMITE_SINCRONO filas: se genera en segundo plano y
+      se redirige a la pagina que espera el archivo.
+    - CSV: streaming fila a fila desde el cursor.
+    - Excel: se escribe a un archivo temporal (el xlsx es un zip que se
+      cierra al final) y se envia con send_file; el archivo se borra al
+      cerrar la respuesta.
+    """
+    formato = 'csv' if formato == 'csv' else 'xlsx'
+
+    if exportacion['total'] > EXPORTACION_LIMITE_SINCRONO:
+        usuario = get_current_user()
+        token = iniciar_exportacion_async(exportacion, formato, usuario['id'] if usuario else None)
+        return redirect(url_for('exportaciones.estado', token=token))
+
+    nombre = nombre_archivo(exportacion, formato)
+    if formato == 'csv':
+        return Response(stream_with_context(generar_csv(exportacion)), mimetype=MIMETYPES['csv'],
+                        headers={'Content-Disposition': f'attachment; filename={nombre}',
+                                 'X-Accel-Buffering': 'no'})
+
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_excel(exportacion, archivo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return send_file(archivo, mimetype=MIMETYPES['xlsx'], as_attachment=True, download_name=nombre)
+
+
+@exportaciones_bp.route('/<token>')
+@admin_required
+def estado(token):
+    """Pagina de espera de una exportacion en segundo plano."""
+    exportacion = obtener_estado_exportacion(token)
+    if not exportacion:
+        flash('La exportacion no existe o ya expiro', 'error')
+        return redirect(url_for('index'))
+
+    return render_template('exportaciones/estado.html', exportacion=exportacion, token=token)
+
+
+@exportaciones_bp.route('/<token>/estado')
+@admin_required
+def estado_json(token):
+    """API de polling con el avance de la exportacion."""
+    exportacion = obtener_estado_exportacion(token)
+    if not exportacion:
+        return jsonify({'error': 'Exportacion no encontrada'}), 404
+
+    return jsonify({k: v for k, v in exportacion.items() if k not in ('version', 'actualizado', 'usuario_id')})
+
+
+@exportaciones_bp.route('/<token>/descargar')
+@admin_required
+def descargar(token):
+    """Descarga el archivo de una exportacion terminada."""
+    ruta = ruta_exportacion(token)
+    if not ruta:
+        abort(404)
+
+    nombre = os.path.basename(ruta)[len(token) + 1:]
+    respuesta = servir_archivo(EXPORTACIONES_DIR, 'exportaciones', os.path.basename(ruta))
+    respuesta.headers['Content-Type'] = MIMETYPES[nombre.rsplit('.', 1)[-1]]
+    respuesta.headers['Content-Disposition'] = f'attachment; filename={nombre}'
+    return respuesta
@@ -8,12 +8,13 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from werkzeug.utils import secure_filename
 
 from web.auth import admin_required
+from web.cache_http import condicional
 from src.models_boletas import obtener_boleta_por_lectura
 from src.models import (
     listar_lecturas, obtener_lectura, crear_lectura, actualizar_lectura,
     eliminar_lectura, contar_lecturas, obtener_anios_disponibles,
-    listar_clientes, listar_medidores, obtener_o_crear_medidor,
-    obtener_clientes_incompletos, obtener_fechas_comunes_por_periodo,
+    listar_medidores, obtener_o_crear_medidor,
+    obtener_fechas_comunes_por_periodo, LECTURAS_COMPLETITUD_DESDE, LECTURAS_COMPLETITUD_HASTA,
     crear_lecturas_multiple, obtener_estadisticas_lecturas,
     lectura_existe
 )
@@ -31,6 +32,7 @@ def allowed_file(filename):
 
 @lecturas_bp.route('/')
 @admin_required
+@condicional('lecturas', 'medidores', 'clientes')
 def listar():
     """Lista todas las lecturas con filtros."""
     # Calcular mes anterior como valor por defecto (solo si no hay filtros en URL)
@@ -73,19 +75,12 @@ def listar():
         anio=anio, mes=mes, cliente_id=cliente_id, medidor_id=medidor_id,
         limit=per_page, offset=offset,
         orden_col=orden_col, orden_dir=orden_dir,
-        solo_incompletos=incompletos
+        solo_incompletos=incompletos, con_foto=con_foto
     )
-    total = contar_lecturas(anio=anio, mes=mes, cliente_id=cliente_id, medidor_id=medidor_id, solo_incompletos=incompletos)
+    total = contar_lecturas(anio=anio, mes=mes, cliente_id=cliente_id, medidor_id=medidor_id,
+                            solo_incompletos=incompletos, con_foto=con_foto)
 
-    # Filtrar por foto si aplica
-    if con_foto == 1:
-        lecturas = [l for l in lecturas if l.get('foto_path') and l['foto_path'] != '' and l.get('foto_nombre') != 'sin_foto']
-        total = len(lecturas)
-    elif con_foto == 0:
-        lecturas = [l for l in lecturas if not l.get('foto_path') or l['foto_path'] == '' or l.get('foto_nombre') == 'sin_foto']
-        total = len(lecturas)
-
-    # Estadísticas
+    # Estadísticas (sin el filtro de foto: los chips muestran con y sin foto)
     stats = obtener_estadisticas_lecturas(
         anio=anio, mes=mes, cliente_id=cliente_id,
         medidor_id=medidor_id, solo_incompletos=incompletos
@@ -114,16 +109,13 @@ def listar():
 
     # Datos para filtros
     anios = obtener_anios_disponibles()
-    clientes = listar_clientes()
     medidores = listar_medidores(cliente_id) if cliente_id else listar_medidores()
-    clientes_incompletos = obtener_clientes_incompletos() if incompletos else []
 
     return render_template('lecturas/lista.html',
                            lecturas=lecturas,
                            anios=anios,
-                           clientes=clientes,
                            medidores=medidores,
-                           clientes_incompletos=clientes_incompletos,
+                           ventana_incompletos=(LECTURAS_COMPLETITUD_DESDE, LECTURAS_COMPLETITUD_HASTA),
                            filtros=filtros,
                            stats=stats,
                            pagination=pagination,
@@ -339,6 +331,7 @@ def crear_multiple():
 
 @lecturas_bp.route('/api/medidores')
 @admin_required
+@condicional('medidores', 'clientes')
 def api_medidores():
     """API para obtener medidores, opcionalmente filtrado por cliente."""
     cliente_id = request.args.get('cliente_id', type=int)
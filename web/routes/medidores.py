@@ -4,10 +4,11 @@ Rutas para gestión de medidores
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 
 from web.auth import admin_required
+from web.cache_http import condicional
 from src.models import (
     listar_medidores, obtener_medidor, listar_lecturas,
     crear_medidor, actualizar_medidor, eliminar_medidor,
-    listar_clientes, desactivar_medidor, reactivar_medidor,
+    desactivar_medidor, reactivar_medidor,
     obtener_estadisticas_medidores
 )
 
@@ -16,20 +17,31 @@ medidores_bp = Blueprint('medidores', __name__)
 
 @medidores_bp.route('/')
 @admin_required
+@condicional('medidores', 'clientes', 'lecturas')
 def listar():
     """Lista todos los medidores con filtros."""
     busqueda = request.args.get('busqueda', '').strip() or None
     estado = request.args.get('estado', '').strip() or None
     cliente_id = request.args.get('cliente_id', type=int) or None
 
-    medidores = listar_medidores(cliente_id=cliente_id, busqueda=busqueda, estado=estado)
-    clientes = listar_clientes()
-    stats = obtener_estadisticas_medidores(busqueda=busqueda, cliente_id=cliente_id, estado=estado)
+    aproximada = request.args.get('aproximada') == '1'
+
+    medidores = listar_medidores(cliente_id=cliente_id, busqueda=busqueda, estado=estado,
+                                 aproximada=aproximada)
+
+    # Sin coincidencias exactas: reintentar con textos parecidos
+    if busqueda and not medidores and not aproximada:
+        aproximada = True
+        medidores = listar_medidores(cliente_id=cliente_id, busqueda=busqueda, estado=estado,
+                                     aproximada=True)
+
+    stats = obtener_estadisticas_medidores(busqueda=busqueda, cliente_id=cliente_id, estado=estado,
+                                           aproximada=aproximada)
 
     return render_template('medidores/lista.html',
                            medidores=medidores,
-                           clientes=clientes,
                            stats=stats,
+                           busqueda_aproximada=bool(busqueda) and aproximada,
                            filtros={
                                'busqueda': busqueda or '',
                                'estado': estado or '',
@@ -55,8 +67,7 @@ def crear():
         flash('Medidor creado exitosamente', 'success')
         return redirect(url_for('medidores.detalle', medidor_id=medidor_id))
 
-    clientes = listar_clientes()
-    return render_template('medidores/crear.html', clientes=clientes)
+    return render_template('medidores/crear.html')
 
 
 @medidores_bp.route('/<int:medidor_id>')
@@ -97,8 +108,7 @@ def editar(medidor_id):
         flash('Medidor actualizado', 'success')
         return redirect(url_for('medidores.detalle', medidor_id=medidor_id))
 
-    clientes = listar_clientes()
-    return render_template('medidores/editar.html', medidor=medidor, clientes=clientes)
+    return render_template('medidores/editar.html', medidor=medidor)
 
 
 @medidores_bp.route('/<int:medidor_id>/eliminar', methods=['POST'])
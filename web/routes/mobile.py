@@ -7,6 +7,7 @@ import os
 from werkzeug.utils import secure_filename
 
 from web.auth import registrador_required
+from web.cache_http import condicional
 from src.models import (
     listar_clientes, listar_medidores, crear_lectura,
     obtener_lectura, actualizar_lectura, listar_lecturas,
@@ -71,6 +72,7 @@ def registro_lecturas():
 
 @mobile_bp.route('/api/medidores/<int:cliente_id>')
 @registrador_required
+@condicional('medidores', 'clientes', 'lecturas')
 def api_medidores_cliente(cliente_id):
     """
     API JSON: Retorna medidores activos de un cliente.
@@ -5,11 +5,10 @@ Permite a los clientes buscar por RUT, ver boletas pendientes y pagar
 from io import BytesIO
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, make_response, send_file
 from werkzeug.utils import secure_filename
-from weasyprint import HTML
 import os
 from datetime import date, datetime
-from src.database import get_connection, BASE_DIR
-from src.models import buscar_cliente_por_rut, listar_medidores, obtener_cliente, obtener_medidor, obtener_lectura
+from src.database import BASE_DIR
+from src.models import buscar_cliente_por_rut, listar_medidores, obtener_cliente, obtener_medidor
 from src.models_boletas import (
     obtener_boletas_pendientes_por_cliente,
     marcar_boletas_en_revision,
@@ -17,7 +16,8 @@ from src.models_boletas import (
     obtener_ultimo_rechazo,
     obtener_intento_en_revision
 )
-from src.models_configuracion import obtener_datos_bancarios
+from src.services.pdf_service import obtener_pdf_boleta, obtener_contexto_pdf_boleta, version_pdf_boleta
+from web.cache_http import calcular_etag, no_modificado, respuesta_no_modificada, aplicar_validadores
 
 portal_bp = Blueprint('portal', __name__)
 
@@ -247,75 +247,21 @@ def descargar_boleta(boleta_id):
         flash('Acceso denegado', 'error')
         return redirect(url_for('portal.mis_boletas'))
 
-    # Nombres de meses en espanol
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
-
-    # Obtener la lectura actual asociada para la foto del medidor y fecha
-    lectura_actual = None
-    foto_lectura = None
-    fecha_lectura_actual = None
-    if boleta['lectura_id']:
-        lectura_actual = obtener_lectura(boleta['lectura_id'])
-        if lectura_actual:
-            if lectura_actual.get('foto_path') and lectura_actual.get('foto_path') != '':
-                # foto_path viene como 'medidor_X/...' sin prefijo de carpeta
-                foto_lectura = os.path.join(BASE_DIR, 'fotos', lectura_actual['foto_path'])
-            fecha_lectura_actual = lectura_actual.get('fecha_lectura')
-
-    # Obtener la lectura anterior y su fecha
-    fecha_lectura_anterior = None
-    if boleta['lectura_anterior'] is not None:
-        medidor_id = boleta['medidor_id']
-        anio = boleta['periodo_anio']
-        mes = boleta['periodo_mes']
-
-        # Calcular periodo anterior
-        if mes == 1:
-            mes_anterior = 12
-            anio_anterior = anio - 1
-        else:
-            mes_anterior = mes - 1
-            anio_anterior = anio
-
-        # Buscar lectura anterior
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT fecha_lectura FROM lecturas
-            WHERE medidor_id = %s AND anio = %s AND mes = %s
-        ''', (medidor_id, anio_anterior, mes_anterior))
-        lectura_ant = cursor.fetchone()
-        conn.close()
-
-        if lectura_ant:
-            fecha_lectura_anterior = lectura_ant['fecha_lectura']
-
-    # Renderizar template HTML
-    datos_bancarios = obtener_datos_bancarios()
-    html_string = render_template('boletas/boleta_pdf.html',
-                                   boleta=boleta,
-                                   meses=meses,
-                                   foto_lectura=foto_lectura,
-                                   fecha_lectura_actual=fecha_lectura_actual,
-                                   fecha_lectura_anterior=fecha_lectura_anterior,
-                                   datos_bancarios=datos_bancarios)
-
-    # Generar PDF usando WeasyPrint
-    pdf_file = BytesIO()
-    HTML(string=html_string, base_url=BASE_DIR).write_pdf(pdf_file)
-    pdf_file.seek(0)
+    # La huella de los datos del PDF sirve de ETag: si no cambio, 304 sin renderizar
+    contexto = obtener_contexto_pdf_boleta(boleta)
+    etag = calcular_etag('pdf_boleta', version_pdf_boleta(boleta, contexto))
+    if no_modificado(etag):
+        return respuesta_no_modificada(etag, debil=True)
+
+    pdf_file = BytesIO(obtener_pdf_boleta(boleta, contexto))
 
     # Devolver PDF como descarga
-    return send_file(
+    return aplicar_validadores(send_file(
         pdf_file,
         mimetype='application/pdf',
         as_attachment=True,
         download_name=f'boleta_{boleta["numero_boleta"]}.pdf'
-    )
+    ), etag, debil=True)
 
 
 @portal_bp.route('/salir')
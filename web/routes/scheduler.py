@@ -2,7 +2,10 @@
 Rutas para el scheduler de generacion automatica
 """
 from datetime import time
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, jsonify, session,
+    Response, stream_with_context, current_app
+)
 from web.auth import admin_required
 from src.models_scheduler import (
     obtener_cron_config,
@@ -11,7 +14,14 @@ from src.models_scheduler import (
     obtener_log_generacion,
     contar_logs_generacion
 )
-from src.services.generacion_service import obtener_preview_generacion, ejecutar_generacion
+from src.services.generacion_service import (
+    obtener_preview_generacion,
+    iniciar_generacion_async,
+    cargar_estado_generacion
+)
+from src.services.progreso_service import (
+    clave_progreso, obtener_estado, eventos_progreso
+)
 from src.services.scheduler_service import (
     recargar_configuracion_cron,
     obtener_estado_scheduler,
@@ -88,24 +98,29 @@ def ejecutar():
     if request.method == 'POST':
         usuario_id = session.get('user_id')
         solo_boletas = request.form.get('solo_boletas') == 'on'
+        enviar_whatsapp = request.form.get('enviar_whatsapp') == 'on'
 
-        resultado = ejecutar_generacion(
-            usuario_id=usuario_id,
-            es_automatico=False,
-            solo_boletas=solo_boletas
-        )
-
-        if resultado['estado'] == 'error':
-            flash(f'Error en generacion: {resultado["mensaje"]}', 'error')
-        else:
-            flash(resultado['mensaje'], 'success')
-
-        return redirect(url_for('scheduler.log_detalle', log_id=resultado['log_id']))
+        try:
+            log_id = iniciar_generacion_async(
+                usuario_id=usuario_id,
+                solo_boletas=solo_boletas,
+                enviar_whatsapp=enviar_whatsapp,
+                app=current_app._get_current_object()
+            )
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('scheduler.ejecutar'))
+
+        flash('Generacion iniciada. La pagina se actualizara automaticamente.', 'success')
+        return redirect(url_for('scheduler.log_detalle', log_id=log_id))
 
     # GET: mostrar preview
+    from src.models_configuracion import obtener_configuracion
     preview = obtener_preview_generacion()
+    envio_automatico = obtener_configuracion('envio_automatico_whatsapp', False)
 
-    return render_template('scheduler/ejecutar.html', preview=preview)
+    return render_template('scheduler/ejecutar.html', preview=preview,
+                           envio_automatico=envio_automatico)
 
 
 @scheduler_bp.route('/logs')
@@ -147,6 +162,28 @@ def log_detalle(log_id):
     return render_template('scheduler/log_detalle.html', log=log)
 
 
+@scheduler_bp.route('/logs/<int:log_id>/estado')
+@admin_required
+def log_estado(log_id):
+    """API para obtener el progreso de una generacion (polling)."""
+    estado = obtener_estado(clave_progreso('generacion', log_id),
+                            lambda: cargar_estado_generacion(log_id))
+    if not estado:
+        return jsonify({'error': 'Log no encontrado'}), 404
+
+    return jsonify({k: v for k, v in estado.items() if k not in ('version', 'actualizado')})
+
+
+@scheduler_bp.route('/logs/<int:log_id>/stream')
+@admin_required
+def log_stream(log_id):
+    """Stream SSE con el progreso de una generacion."""
+    eventos = eventos_progreso(clave_progreso('generacion', log_id),
+                               lambda: cargar_estado_generacion(log_id))
+    return Response(stream_with_context(eventos), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @scheduler_bp.route('/api/preview')
 @admin_required
 def api_preview():
@@ -0,0 +1,80 @@
+"""
+Rutas para webhooks del proveedor de mensajes (sin sesion, con secreto compartido)
+"""
+import os
+import hmac
+from datetime import datetime, timezone
+
+from flask import Blueprint, request, jsonify
+
+from src.services.estados_entrega_service import registrar_estado
+
+
+webhooks_bp = Blueprint('webhooks', __name__, url_prefix='/webhooks')
+
+MENSAJES_WEBHOOK_SECRET = os.getenv('MENSAJES_WEBHOOK_SECRET', '')
+# Avisos maximos aceptados por solicitud
+MENSAJES_WEBHOOK_MAXIMO = int(os.getenv('MENSAJES_WEBHOOK_MAXIMO', '1000'))
+
+
+def _fecha_evento(valor):
+    """Fecha del aviso: epoch (s o ms) o ISO 8601; None si no se entiende."""
+    if valor in (None, ''):
+        return None
+    try:
+        numero = float(valor)
+        if numero > 1e11:
+            numero /= 1000
+        return datetime.fromtimestamp(numero)
+    except (TypeError, ValueError, OverflowError, OSError):
+        # OverflowError/OSError: epoch fuera de rango (ej: "inf", 1e300)
+        pass
+    try:
+        fecha = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc).astimezone().replace(tzinfo=None)
+        return fecha
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+@webhooks_bp.route('/mensajes/estado', methods=['POST'])
+def estado_mensajes():
+    """
+    Recibe avisos de estado de entrega del proveedor. Acepta un aviso, una
+    lista o {"events": [...]}, cada uno con messageId, status y opcionalmente
+    timestamp y error. Los avisos se guardan por lotes en segundo plano.
+    """
+    secreto = request.headers.get('X-Webhook-Secret') or request.args.get('token', '')
+    if not MENSAJES_WEBHOOK_SECRET:
+        return jsonify({'success': False, 'error': 'Webhook no configurado'}), 503
+    if not hmac.compare_digest(secreto.encode(), MENSAJES_WEBHOOK_SECRET.encode()):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    datos = request.get_json(silent=True)
+    if isinstance(datos, dict):
+        eventos = datos.get('events') or datos.get('data') or datos
+        # Un objeto en events/data (o el cuerpo mismo) es un solo aviso
+        if not isinstance(eventos, list):
+            eventos = [eventos]
+    elif isinstance(datos, list):
+        eventos = datos
+    else:
+        return jsonify({'success': False, 'error': 'JSON invalido'}), 400
+
+    if len(eventos) > MENSAJES_WEBHOOK_MAXIMO:
+        return jsonify({'success': False, 'error': 'Demasiados avisos en una solicitud'}), 413
+
+    aceptados = 0
+    for evento in eventos:
+        if not isinstance(evento, dict):
+            continue
+        if registrar_estado(
+            evento.get('messageId') or evento.get('id'),
+            evento.get('status'),
+            _fecha_evento(evento.get('timestamp')),
+            evento.get('error')
+        ):
+            aceptados += 1
+
+    return jsonify({'success': True, 'aceptados': aceptados, 'ignorados': len(eventos) - aceptados})
@@ -2,7 +2,7 @@
  * components.js - Reusable UI Components
  * Sistema de Lecturas de Medidores
  *
- * Provides: Toast, ConfirmModal, Loading, FilterBar
+ * Provides: Toast, ConfirmModal, Loading, FilterBar, ClienteBuscador
  */
 (function() {
     'use strict';
@@ -301,13 +301,170 @@
                     timer = setTimeout(submitWithLoading, debounceMs);
                 });
             });
+
+            form.querySelectorAll('[data-cliente-buscador] input[type="hidden"]').forEach(function(input) {
+                input.addEventListener('change', function() {
+                    clearTimeout(timer);
+                    timer = setTimeout(submitWithLoading, debounceMs);
+                });
+            });
+        }
+    };
+
+    // ==============================
+    // CLIENTE BUSCADOR (TYPEAHEAD)
+    // ==============================
+
+    var ClienteBuscador = {
+        // Respuestas por URL, compartidas por todos los buscadores de la pagina
+        _cache: {},
+
+        _buscar: function(url, callback) {
+            var self = this;
+            if (self._cache[url]) {
+                callback(self._cache[url]);
+                return;
+            }
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(function(response) { return response.ok ? response.json() : []; })
+                .then(function(clientes) {
+                    self._cache[url] = clientes;
+                    callback(clientes);
+                })
+                .catch(function() { callback([]); });
+        },
+
+        /**
+         * Initialize a [data-cliente-buscador] element: a text input that
+         * queries the server and writes the chosen id into the hidden input
+         * (dispatching 'change' on it).
+         * @param {HTMLElement} root
+         */
+        init: function(root) {
+            if (root.dataset.iniciado) return;
+            root.dataset.iniciado = '1';
+
+            var self = this;
+            var valor = root.querySelector('input[type="hidden"]');
+            var texto = root.querySelector('input[type="text"]');
+            var lista = root.querySelector('ul');
+            var seleccionado = texto.value;
+            var opciones = [];
+            var activo = -1;
+            var timer = null;
+
+            function cerrar() {
+                lista.classList.add('hidden');
+                texto.setAttribute('aria-expanded', 'false');
+                activo = -1;
+            }
+
+            function elegir(cliente) {
+                var anterior = valor.value;
+                valor.value = cliente ? cliente.id : '';
+                texto.value = cliente ? cliente.nombre : '';
+                seleccionado = texto.value;
+                cerrar();
+                if (String(anterior) !== String(valor.value)) {
+                    valor.dispatchEvent(new Event('change', { bubbles: true }));
+                }
+            }
+
+            function marcar(indice) {
+                var items = lista.querySelectorAll('a');
+                items.forEach(function(a, i) { a.classList.toggle('active', i === indice); });
+                activo = indice;
+                if (items[indice]) items[indice].scrollIntoView({ block: 'nearest' });
+            }
+
+            function mostrar(clientes) {
+                opciones = clientes;
+                lista.innerHTML = '';
+                if (!clientes.length) {
+                    lista.innerHTML = '<li class="disabled"><span>Sin resultados</span></li>';
+                }
+                clientes.forEach(function(cliente) {
+                    var li = document.createElement('li');
+                    var a = document.createElement('a');
+                    a.setAttribute('role', 'option');
+                    a.textContent = cliente.nombre;
+                    if (cliente.rut) {
+                        var rut = document.createElement('span');
+                        rut.className = 'text-base-content/50';
+                        rut.textContent = cliente.rut;
+                        a.appendChild(rut);
+                    }
+                    a.addEventListener('mousedown', function(e) {
+                        e.preventDefault();
+                        elegir(cliente);
+                    });
+                    li.appendChild(a);
+                    lista.appendChild(li);
+                });
+                lista.classList.remove('hidden');
+                texto.setAttribute('aria-expanded', 'true');
+                activo = -1;
+            }
+
+            function consultar() {
+                var url = root.dataset.url + '?q=' + encodeURIComponent(texto.value.trim());
+                self._buscar(url, function(clientes) {
+                    if (document.activeElement === texto) mostrar(clientes);
+                });
+            }
+
+            texto.addEventListener('focus', consultar);
+
+            texto.addEventListener('input', function() {
+                clearTimeout(timer);
+                timer = setTimeout(consultar, 200);
+            });
+
+            texto.addEventListener('keydown', function(e) {
+                if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                    e.preventDefault();
+                    if (!opciones.length) return;
+                    var paso = e.key === 'ArrowDown' ? 1 : -1;
+                    marcar((activo + paso + opciones.length) % opciones.length);
+                } else if (e.key === 'Enter' && !lista.classList.contains('hidden') && activo >= 0) {
+                    e.preventDefault();
+                    elegir(opciones[activo]);
+                } else if (e.key === 'Escape') {
+                    texto.value = seleccionado;
+                    cerrar();
+                }
+            });
+
+            texto.addEventListener('blur', function() {
+                // Texto borrado = "Todos"; texto a medio escribir vuelve a la seleccion
+                if (!texto.value.trim()) {
+                    elegir(null);
+                } else {
+                    texto.value = seleccionado;
+                    cerrar();
+                }
+            });
+        },
+
+        initAll: function(scope) {
+            var self = this;
+            (scope || document).querySelectorAll('[data-cliente-buscador]').forEach(function(root) {
+                self.init(root);
+            });
         }
     };
 
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', function() { ClienteBuscador.initAll(); });
+    } else {
+        ClienteBuscador.initAll();
+    }
+
     // Expose globally
     window.Toast = Toast;
     window.ConfirmModal = ConfirmModal;
     window.Loading = Loading;
     window.FilterBar = FilterBar;
+    window.ClienteBuscador = ClienteBuscador;
 
 })();
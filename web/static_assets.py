@@ -0,0 +1,71 @@
+"""
+Archivos estaticos con huella de contenido (generados por build_static.py).
+
+Si existe web/static/assets/manifest.json, url_for('static', filename=...)
+apunta a la copia con hash en el nombre y esta se sirve con Cache-Control
+inmutable de un anio: un cambio de contenido cambia la URL, asi que el
+navegador nunca vuelve a pedir una version que ya tiene. Se entrega la
+variante precomprimida (.br o .gz) segun Accept-Encoding.
+
+Sin manifest (desarrollo) no cambia nada.
+"""
+import os
+import json
+import logging
+import mimetypes
+
+from flask import request, send_from_directory, abort
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'assets')
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+UN_ANIO = 31536000
+
+# Preferencia de codificacion: (Accept-Encoding, extension del archivo precomprimido)
+CODIFICACIONES = [('br', '.br'), ('gzip', '.gz')]
+
+
+def cargar_manifest() -> dict:
+    """Manifest {ruta original: ruta con hash}, vacio si no se ejecuto el build."""
+    try:
+        with open(os.path.join(ASSETS_DIR, 'manifest.json'), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {}
+
+
+def registrar_assets(app):
+    """Activa las URLs con hash y la ruta que las sirve si hay manifest."""
+    manifest = cargar_manifest()
+    if not manifest:
+        return
+    publicados = set(manifest.values())
+
+    @app.url_defaults
+    def _url_con_hash(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = 'assets/' + manifest[values['filename']]
+
+    # Regla mas especifica que /static/<path:filename>, tiene prioridad
+    @app.route('/static/assets/<path:filename>', endpoint='static_assets')
+    def servir_asset(filename):
+        """Sirve un asset con hash, precomprimido si el navegador lo acepta."""
+        if filename not in publicados:
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for codificacion, extension in CODIFICACIONES:
+            if request.accept_encodings[codificacion] and os.path.isfile(os.path.join(ASSETS_DIR, filename + extension)):
+                respuesta = send_from_directory(ASSETS_DIR, filename + extension,
+                                                mimetype=mimetype, max_age=UN_ANIO)
+                respuesta.headers['Content-Encoding'] = codificacion
+                break
+        else:
+            respuesta = send_from_directory(ASSETS_DIR, filename, mimetype=mimetype, max_age=UN_ANIO)
+
+        respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+        respuesta.vary.add('Accept-Encoding')
+        return respuesta
+
+    logger.info(f"Assets estaticos con hash activos: {len(manifest)} archivos")